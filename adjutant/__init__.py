@@ -1,7 +1,43 @@
 """adjutant is a package for managing ML experiments over Discord in conjunction
-with WandB."""
+with WandB.
 
-from adjutant import adjutant_client
+The Discord client and its dependencies (discord.py and, unless a WandB API
+client is passed in, wandb) are imported on first access to Adjutant, so that
+tools and worker processes that only use other modules of the package, e.g.,
+adjutant.run_store or adjutant.worker_pool, start quickly. Submodules are
+likewise imported on first access, so adjutant.adjutant_client.Adjutant works
+after a plain import adjutant."""
+
+from typing import Any, List
+import importlib
+import importlib.util
 
 __version__ = '0.1.2'
-Adjutant = adjutant_client.Adjutant
+LAZY_ATTRIBUTES = {'Adjutant': ('adjutant.adjutant_client', 'Adjutant')}
+
+
+def __getattr__(name: str) -> Any:
+    """Returns the lazily imported attribute or submodule, importing its
+    module on first access.
+
+    :param name: The name of the attribute or submodule.
+    :return: The attribute or submodule.
+    """
+    if name in LAZY_ATTRIBUTES:
+        module_name, attribute = LAZY_ATTRIBUTES[name]
+        value = getattr(importlib.import_module(module_name), attribute)
+    elif not name.startswith('_') and \
+            importlib.util.find_spec(f'{__name__}.{name}') is not None:
+        value = importlib.import_module(f'{__name__}.{name}')
+    else:
+        raise AttributeError(f'module {__name__} has no attribute {name}')
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    """Returns the module's attributes, including those not yet imported.
+
+    :return: The names of the module's attributes.
+    """
+    return sorted(set(globals()) | set(LAZY_ATTRIBUTES))
@@ -1,32 +1,119 @@
 """Contains the Adjutant Discord client class."""
+# pylint: disable=too-many-lines
 
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, List, Sequence, Tuple, Union, \
+    TYPE_CHECKING
+import asyncio
+import io
+import itertools
 import logging
 import json
+import math
+import time
 from json.decoder import JSONDecodeError
-from subprocess import Popen
-import numpy as np
-import wandb
-from wandb.apis.public import Run
 import discord
 from discord.ext import tasks
 from discord import TextChannel, Message
+from adjutant.wandb_poller import WandbPoller, DEFAULT_MAX_WORKERS, \
+    DEFAULT_TIMEOUT_SECONDS
+from adjutant.run_record import RunRecord
+from adjutant.leaderboard import MINIMIZE
+from adjutant.project_monitor import ProjectMonitor
+from adjutant.poll_scheduler import PollScheduler
+from adjutant.poll_policy import PollPolicy, AdaptivePollPolicy
+from adjutant.message_dispatcher import MessageDispatcher, \
+    MAX_MESSAGE_LENGTH
+from adjutant.metrics import MetricsRegistry, MetricsServer
+from adjutant.job_scheduler import Job, JobScheduler, DEFAULT_MAX_SLOTS, \
+    JOB_QUEUED, JOB_STOPPED, JOB_FAILED
+from adjutant.early_stopping import EarlyStopper, get_run_history
+from adjutant.worker_pool import WorkerPool, DEFAULT_NUM_WORKERS
+from adjutant.job_queue import JobQueue, AgentLauncher
+from adjutant.sweep import Sweep, SWEEP_GRID, SWEEP_RANDOM
+from adjutant.run_table import RunQuery
+from adjutant.run_progress import ProgressTracker, RunProgress, \
+    get_new_history, DEFAULT_PROGRESS_METRICS
+from adjutant.plotting import CurveRenderer, is_plotting_available
+if TYPE_CHECKING:
+    import wandb
+    from wandb.apis.public import Run
 
 SECONDS_BETWEEN_WANDB_CHECKS = 60
+SECONDS_BETWEEN_EARLY_STOPPING_CHECKS = 30
+SECONDS_BETWEEN_PROGRESS_UPDATES = 600
 COMMAND_HELLO = '$hello'
 COMMAND_EXPERIMENT = '$experiment'
+COMMAND_TOP = '$top'
+COMMAND_QUEUE = '$queue'
+COMMAND_JOBS = '$jobs'
+COMMAND_CANCEL = '$cancel'
+COMMAND_SWEEP = '$sweep'
+COMMAND_STATS = '$stats'
+COMMAND_FIND = '$find'
+COMMAND_QUERY = '$query'
+COMMAND_PROGRESS = '$progress'
+COMMAND_PLOT = '$plot'
+COMMAND_COMPARE = '$compare'
+COMMAND_LOGS = '$logs'
+COMMAND_AGENTS = '$agents'
+COMMANDS = (COMMAND_HELLO, COMMAND_EXPERIMENT, COMMAND_TOP, COMMAND_QUEUE,
+            COMMAND_JOBS, COMMAND_CANCEL, COMMAND_SWEEP, COMMAND_STATS,
+            COMMAND_FIND, COMMAND_QUERY, COMMAND_PROGRESS, COMMAND_PLOT,
+            COMMAND_COMPARE, COMMAND_LOGS, COMMAND_AGENTS)
+FLAG_PREFIX = '--'
+FLAG_PRIORITY = 'priority'
+FLAG_SLOTS = 'slots'
+FLAG_RANDOM = 'random'
+FLAG_SEED = 'seed'
+FLAG_FORCE = 'force'
+FLAG_METRIC = 'metric'
+METRIC_SEPARATOR = ','
+CANCEL_SWEEP_ARG = 'sweep'
+MAX_SWEEP_TRIALS = 10000
+MAX_LISTED_JOBS = 10
+MAX_LISTED_RUNS = 10
+MAX_PLOTTED_RUNS = 8
+MAX_PLOTTED_METRICS = 6
+PLOT_HISTORY_MAX_POINTS = 8192
+PLOT_HISTORY_MAX_RUNS = 20
+PLOT_FILENAME = 'curves.png'
+PLOT_EXTRA = 'adjutant-discord[plot]'
+DEFAULT_LOG_TAIL_LINES = 20
+MAX_LOG_TAIL_LINES = 200
+CODE_BLOCK_FENCE = '```'
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 25
 
 
 class Adjutant(discord.Client):
     """The Adjutant Discord client."""
-    _wandb_api: wandb.Api
+    # pylint: disable=too-many-instance-attributes
+    _wandb_api: 'wandb.Api'
     _wandb_entity: str
     _wandb_project_title: str
+    _wandb_poller: WandbPoller
+    _monitor: ProjectMonitor
+    _monitors: Dict[str, ProjectMonitor]
+    _poll_scheduler: PollScheduler
+    _dispatcher: MessageDispatcher
+    metrics: MetricsRegistry
+    _metrics_server: Optional[MetricsServer]
     _run_experiment_script: Optional[str]
+    _job_scheduler: Optional[JobScheduler]
+    _worker_pool: Optional[WorkerPool]
+    _agent_launcher: Optional[AgentLauncher]
+    _early_stopper: Optional[EarlyStopper]
+    _progress_tracker: ProgressTracker
+    _plot_tracker: ProgressTracker
+    _curve_renderer: CurveRenderer
+    _sweeps: Dict[int, Sweep]
+    _sweep_messages: Dict[int, Message]
+    _sweep_tasks: Dict[int, asyncio.Task]
+    _sweep_ids: itertools.count
     channel_name: str
     channel: Optional[TextChannel]
-    _reported_runs: Dict[str, Run]
 
+    # pylint: disable=too-many-arguments,too-many-locals
     def __init__(
             self,
             wandb_entity: str,
@@ -34,6 +121,25 @@ class Adjutant(discord.Client):
             *args,
             run_experiment_script: Optional[str] = None,
             channel_name: str = 'general',
+            max_wandb_workers: int = DEFAULT_MAX_WORKERS,
+            wandb_timeout_seconds: Optional[float] = DEFAULT_TIMEOUT_SECONDS,
+            incremental_discovery: bool = True,
+            state_filename: Optional[str] = None,
+            leaderboard_metrics: Optional[Dict[str, str]] = None,
+            max_job_slots: int = DEFAULT_MAX_SLOTS,
+            early_stopper: Optional[EarlyStopper] = None,
+            experiment_entry_point: Optional[str] = None,
+            num_warm_workers: int = DEFAULT_NUM_WORKERS,
+            additional_projects: Optional[Sequence[ProjectMonitor]] = None,
+            poll_policy: Optional[PollPolicy] = None,
+            metrics_port: Optional[int] = None,
+            wandb_api: Optional['wandb.Api'] = None,
+            default_hyperparams: Optional[Dict[str, Any]] = None,
+            ignored_hyperparams: Sequence[str] = (),
+            progress_metrics: Sequence[str] = DEFAULT_PROGRESS_METRICS,
+            progress_update_seconds: Optional[float] = None,
+            log_directory: Optional[str] = None,
+            agent_queue_filename: Optional[str] = None,
             **kwargs) -> None:
         """Instantiates the object.
 
@@ -46,122 +152,1019 @@ class Adjutant(discord.Client):
             JSON-formatted command line argument. This script may also request
             another entity, e.g. Kubernetes, to initiate the experiment on its
             behalf rather than actually running the experiment itself.
-        :param channel_name: The name of the channel in which to post updates.
+        :param channel_name: The name of the channel in which to post updates
+            and to which to respond to commands.
+        :param max_wandb_workers: The maximum number of WandB queries that may
+            run concurrently in background threads.
+        :param wandb_timeout_seconds: The number of seconds after which a
+            periodic WandB check is abandoned, or None to wait indefinitely.
+        :param incremental_discovery: If True, periodic WandB checks only fetch
+            the runs that finished since the previous check. If False, every
+            check fetches all finished runs in the project.
+        :param state_filename: The path to a SQLite database in which to keep
+            the reported runs and the discovery watermark between restarts. If
+            the database exists, Adjutant starts from it without rescanning
+            the project and then reports any runs that finished while it was
+            offline. If None, the state is kept in memory only and the project
+            is rescanned on every start.
+        :param leaderboard_metrics: The summary metrics by which runs can be
+            ranked with COMMAND_TOP, in addition to those in
+            DEFAULT_LEADERBOARD_METRICS. The keys are the metric names and the
+            values are leaderboard.MINIMIZE if lower values are better or
+            leaderboard.MAXIMIZE if higher values are better.
+        :param max_job_slots: The number of slots available to experiments
+            launched with run_experiment_script. Each experiment occupies one
+            slot unless it requests more, so by default this is the maximum
+            number of concurrently running experiments. Further experiments
+            wait in a queue.
+        :param early_stopper: If provided, the live WandB histories of running
+            experiments are checked every SECONDS_BETWEEN_EARLY_STOPPING_CHECKS
+            seconds, and experiments that fall behind the others in their
+            group are terminated to free their slots. Experiments find their
+            runs through the WANDB_RUN_ID environment variable, which wandb.init
+            uses as the run ID.
+        :param experiment_entry_point: An alternative to run_experiment_script
+            of the form module:function, e.g., mnist_model:run_experiment. The
+            function takes a hyperparameter dict. Experiments run in worker
+            processes that have already imported the module, so they skip
+            interpreter startup and the module's imports, e.g., TensorFlow.
+            The module must be importable from the working directory, and the
+            script that runs Adjutant must guard its entry point with
+            if __name__ == '__main__'.
+        :param num_warm_workers: The number of idle, pre-warmed worker
+            processes to keep when experiment_entry_point is provided.
+        :param additional_projects: Other WandB projects whose finished runs to
+            post, each to its own channels. All projects share this client's
+            Discord connection, WandB API client, and WandB worker threads, and
+            their first checks are spread evenly across
+            SECONDS_BETWEEN_WANDB_CHECKS. Monitors of the same project are
+            merged, so each project is queried once per check however many
+            channels it posts to.
+        :param poll_policy: The policy that decides how long to wait between
+            consecutive WandB checks of a project. If None, an
+            AdaptivePollPolicy starting at SECONDS_BETWEEN_WANDB_CHECKS checks
+            more often while runs are finishing or launched experiments are
+            queued or running, less often while the project is idle, and backs
+            off when WandB fails or rate-limits.
+        :param metrics_port: If provided, the port on which to serve the
+            metrics shown by COMMAND_STATS in the Prometheus text format, at
+            http://127.0.0.1:<port>/metrics.
+        :param wandb_api: The WandB API client to use. If None, a new
+            wandb.Api is created, which requires WandB credentials.
+        :param default_hyperparams: The hyperparameter values that experiments
+            use when they are not given. A COMMAND_EXPERIMENT whose
+            hyperparameters, filled in with these defaults, match those of a
+            finished run in the primary project is answered with that run's
+            results instead of being launched, unless it has the --force flag.
+        :param ignored_hyperparams: The hyperparameters that do not affect
+            results, e.g., output paths, and so are left out when comparing
+            experiments with finished runs.
+        :param progress_metrics: The history metrics shown by COMMAND_PROGRESS,
+            and by default by COMMAND_PLOT and COMMAND_COMPARE.
+        :param progress_update_seconds: If provided, the progress of running
+            experiments is posted at this interval.
+        :param log_directory: If provided, the output of each launched
+            experiment is written to a rotating log file in this directory, in
+            addition to the recent lines that COMMAND_LOGS shows.
+        :param agent_queue_filename: An alternative to run_experiment_script
+            and experiment_entry_point: the path to a job queue database
+            shared with agents on training hosts, which pull experiments from
+            it and report their exit codes back; see adjutant/agent.py. Each
+            host's slots are managed by its agent, so max_job_slots should be
+            at least the total number of slots of all agents. Experiment
+            output stays on the agents' hosts.
         """
         super().__init__(*args, **kwargs)
-        self._wandb_api = wandb.Api()
+        self.metrics = MetricsRegistry()
+        self._metrics_server = MetricsServer(self.metrics, metrics_port) \
+            if metrics_port is not None else None
+        self._wandb_api = wandb_api if wandb_api is not None else \
+            Adjutant._create_wandb_api()
         self._wandb_entity = wandb_entity
         self._wandb_project_title = wandb_project_title
+        self._wandb_poller = WandbPoller(
+            max_workers=max_wandb_workers,
+            timeout_seconds=wandb_timeout_seconds)
         self._run_experiment_script = run_experiment_script
+        self._worker_pool = None
+        self._agent_launcher = None
+        self._job_scheduler = self._create_job_scheduler(
+            run_experiment_script, experiment_entry_point,
+            agent_queue_filename, max_job_slots, num_warm_workers,
+            log_directory)
+        self._early_stopper = early_stopper
+        self._progress_tracker = ProgressTracker(progress_metrics)
+        self._plot_tracker = ProgressTracker(
+            None, PLOT_HISTORY_MAX_POINTS, PLOT_HISTORY_MAX_RUNS)
+        self._curve_renderer = CurveRenderer()
+        self._sweeps = {}
+        self._sweep_messages = {}
+        self._sweep_tasks = {}
+        self._sweep_ids = itertools.count(1)
         self.channel_name = channel_name
         self.channel = None
-        self._reported_runs = self._get_project_runs()
+        self._monitor = ProjectMonitor(
+            wandb_entity, wandb_project_title,
+            channel_name=channel_name,
+            incremental_discovery=incremental_discovery,
+            state_filename=state_filename,
+            leaderboard_metrics=leaderboard_metrics,
+            default_hyperparams=default_hyperparams,
+            ignored_hyperparams=ignored_hyperparams)
+        self._monitors = {self._monitor.path: self._monitor}
+        self._poll_scheduler = PollScheduler(
+            self._check_project,
+            SECONDS_BETWEEN_WANDB_CHECKS,
+            policy=poll_policy or AdaptivePollPolicy(
+                SECONDS_BETWEEN_WANDB_CHECKS))
+        self._poll_scheduler.add(self._monitor.path)
+        self._dispatcher = MessageDispatcher(metrics=self.metrics)
+        for monitor in additional_projects or []:
+            if monitor.path in self._monitors:
+                for name in monitor.channel_names:
+                    self._monitors[monitor.path].add_channel_name(name)
+                monitor.close()
+            else:
+                self._monitors[monitor.path] = monitor
+                self._poll_scheduler.add(monitor.path)
+        for monitor in self._monitors.values():
+            monitor.metrics = self.metrics
+        if self._job_scheduler:
+            self._register_job_metrics(self._job_scheduler)
         # pylint: disable=no-member
-        self.check_wandb_for_new_runs.start()
+        if self._early_stopper and self._job_scheduler:
+            self.check_early_stopping.start()
+        if progress_update_seconds is not None and self._job_scheduler:
+            self.post_progress.change_interval(seconds=progress_update_seconds)
+            self.post_progress.start()
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def _create_job_scheduler(
+            self,
+            run_experiment_script: Optional[str],
+            experiment_entry_point: Optional[str],
+            agent_queue_filename: Optional[str],
+            max_job_slots: int,
+            num_warm_workers: int,
+            log_directory: Optional[str]) -> Optional[JobScheduler]:
+        """Returns the job scheduler that launches experiments in the way the
+        caller chose, creating the worker pool or agent launcher it needs.
+        See __init__ for the parameters.
+
+        :return: The job scheduler, or None if experiments cannot be launched.
+        """
+        if sum(map(bool, (run_experiment_script, experiment_entry_point,
+                          agent_queue_filename))) > 1:
+            raise ValueError('Provide at most one of run_experiment_script, '
+                             'experiment_entry_point, and '
+                             'agent_queue_filename.')
+        if run_experiment_script:
+            return JobScheduler(
+                run_experiment_script,
+                max_slots=max_job_slots,
+                on_job_done=self._on_job_done,
+                log_directory=log_directory)
+        if experiment_entry_point:
+            self._worker_pool = WorkerPool(experiment_entry_point,
+                                           num_workers=num_warm_workers)
+            self._worker_pool.start()
+            return JobScheduler(
+                max_slots=max_job_slots,
+                on_job_done=self._on_job_done,
+                launcher=self._worker_pool.launch,
+                log_directory=log_directory)
+        if agent_queue_filename:
+            self._agent_launcher = AgentLauncher(
+                JobQueue(agent_queue_filename))
+            return JobScheduler(
+                max_slots=max_job_slots,
+                on_job_done=self._on_job_done,
+                launcher=self._agent_launcher.launch,
+                max_log_lines=None)
+        return None
 
-    def _get_channel(self) -> Optional[TextChannel]:
-        """Returns the channel whose name is self.channel_name, or None if no
-        such channel exists.
+    @staticmethod
+    def _create_wandb_api() -> 'wandb.Api':
+        """Returns a new WandB API client. wandb is imported here rather than
+        at the top of the module because it takes seconds to import and is not
+        needed when the caller passes its own client.
+
+        :return: The WandB API client.
+        """
+        # pylint: disable=import-outside-toplevel,redefined-outer-name
+        import wandb
+        return wandb.Api()
 
-        :return: The channel whose name is self.channel_name, or None if no such
-            channel exists.
+    def _register_job_metrics(self, job_scheduler: JobScheduler) -> None:
+        """Registers gauges for the job scheduler's queue and launches.
+
+        :param job_scheduler: The job scheduler.
         """
+        self.metrics.gauge(
+            'adjutant_jobs_queued', 'The number of queued experiments.',
+            lambda: len(job_scheduler.get_queued_jobs()))
+        self.metrics.gauge(
+            'adjutant_jobs_running', 'The number of running experiments.',
+            lambda: len(job_scheduler.get_running_jobs()))
+        self.metrics.gauge(
+            'adjutant_jobs_launched',
+            'The number of experiment processes launched since startup.',
+            lambda: job_scheduler.num_launched)
+
+    def _get_channel(
+            self,
+            channel_name: Optional[str] = None) -> Optional[TextChannel]:
+        """Returns the channel with the given name, or None if no such channel
+        exists.
+
+        :param channel_name: The name of the channel. If None, uses
+            self.channel_name.
+        :return: The channel with the given name, or None if no such channel
+            exists.
+        """
+        channel_name = channel_name or self.channel_name
         for channel in self.get_all_channels():
-            if channel.name == self.channel_name:
+            if channel.name == channel_name:
                 return channel
         return None
 
-    def _get_project_runs(self) -> Dict[str, Run]:
-        """Returns the dict of all Runs for this project. The keys are the names
-        of the runs and the values are the corresponding Run objects.
+    def _get_project_runs(
+            self,
+            filters: Optional[Dict[str, Any]] = None) -> Dict[str, 'Run']:
+        """Returns the dict of all Runs for the primary project that match the
+        given filters. The keys are the names of the runs and the values are
+        the corresponding Run objects.
 
-        :return: The dict of all Runs for this project.
+        :param filters: The WandB run filters to apply to the query, in the
+            MongoDB query format accepted by wandb.Api.runs. If None, all
+            finished runs are returned.
+        :return: The dict of all Runs for the project that match the filters.
         """
-        self._wandb_api.flush()
-        runs = self._wandb_api.runs(
-            f'{self._wandb_entity}/{self._wandb_project_title}')
-        runs = filter(lambda run: run.state == 'finished', runs)
-        return {run.name: run for run in runs}
+        return self._monitor.get_project_runs(self._wandb_api, filters)
 
     @staticmethod
-    def _get_run_with_best_val_loss(runs: Dict[str, Run]) -> Run:
+    def _get_run_with_best_val_loss(
+            runs: Dict[str, Union['Run', RunRecord]]
+    ) -> Union['Run', RunRecord]:
         """Returns the Run with the best (i.e., lowest) validation loss.
 
         :param runs: The dict of Runs to filter. The keys are the names of the
-            runs and the values are the corresponding Run objects.
+            runs and the values are the corresponding Run or RunRecord
+            objects.
         :return: The Run with the best (i.e., lowest) validation loss.
         """
         runs = filter(lambda run: 'best_val_loss' in run.summary, runs.values())
         return min(runs, key=lambda run: run.summary['best_val_loss'])
 
     async def on_ready(self) -> None:
-        """Runs once the client has successfully logged in. Logs the event and
-        sets self.channel to the one requested by the user."""
+        """Runs once the client has successfully logged in. Logs the event,
+        sets self.channel to the one requested by the user, records the runs
+        of any project that has not been scanned yet, posts a summary of each
+        project, and starts the periodic WandB checks. A project whose first
+        scan fails is logged and scanned again on its next periodic check."""
         logging.info('Logged in as %s, %s', self.user.name, self.user.id)
+        self.channel = self._get_channel()
+        for monitor in self._monitors.values():
+            monitor.channels = [channel for channel in map(
+                self._get_channel, monitor.channel_names) if channel]
+        if self._metrics_server:
+            await self._metrics_server.start()
+        results = await asyncio.gather(*(
+            self._initialize_project(monitor)
+            for monitor in self._monitors.values()), return_exceptions=True)
+        for monitor, result in zip(self._monitors.values(), results):
+            if isinstance(result, Exception):
+                logging.error('Could not scan project %s', monitor.path,
+                              exc_info=result)
+                continue
+            message = Adjutant._get_project_summary(monitor)
+            for channel in monitor.channels:
+                self._dispatcher.notify(channel, message)
+        self._poll_scheduler.start()
+
+    @staticmethod
+    def _get_project_summary(monitor: ProjectMonitor) -> str:
+        """Returns the message announcing that Adjutant is monitoring the
+        project.
+
+        :param monitor: The project's monitor.
+        :return: The message announcing that Adjutant is monitoring the
+            project.
+        """
         best_run_info = ''
-        try:
-            best_run = Adjutant._get_run_with_best_val_loss(self._reported_runs)
-        except ValueError:
-            best_run = None
-        if best_run:
-            best_val_loss = best_run.summary.get('best_val_loss', np.inf)
+        best = monitor.leaderboards['best_val_loss'].best()
+        if best:
+            best_run_name, best_val_loss = best
             best_run_info = (
-                f'Best run: {best_run.name}, best val loss: '
-                f'{best_val_loss:.3f}\nLink to run: {best_run.url}')
-        self.channel = self._get_channel()
-        await self.channel.send(
-            f'Adjutant starting! Found {len(self._reported_runs)} runs for '
-            f'project {self._wandb_entity}/{self._wandb_project_title}.\n'
-            f'{best_run_info}')
-
-    @tasks.loop(seconds=SECONDS_BETWEEN_WANDB_CHECKS)
-    async def check_wandb_for_new_runs(self) -> None:
-        """Checks WandB for new runs for this project and posts the results of
-        those runs."""
-        runs = self._get_project_runs()
-        new_run_names = set(runs.keys()).difference(
-            set(self._reported_runs.keys()))
-        for run_name in new_run_names:
-            run = runs[run_name]
-            self._reported_runs[run_name] = run
-            best_val_loss = run.summary.get('best_val_loss', np.inf)
-            await self.channel.send(
-                f'Run {run.name} finished! Best val loss: {best_val_loss:.3f}\n'
-                f'Link to run: {run.url}')
-
-    @check_wandb_for_new_runs.before_loop
-    async def _before_check_wandb_for_new_runs(self) -> None:
-        """Prevents the check_wandb_for_new_runs loop from running before the
+                f'Best run: {best_run_name}, best val loss: '
+                f'{best_val_loss:.3f}\nLink to run: '
+                f'{monitor.reported_runs[best_run_name].url}')
+        return (f'Adjutant starting! Found {len(monitor.reported_runs)} runs '
+                f'for project {monitor.path}.\n{best_run_info}')
+
+    async def _initialize_project(self, monitor: ProjectMonitor) -> None:
+        """Records all finished runs for the project as reported without
+        posting them, unless that has already happened. Runs on a cold start,
+        when the project's run store is empty. The full scan is not subject to
+        the periodic check timeout because it only happens once.
+
+        :param monitor: The project's monitor.
+        """
+        async with monitor.check_lock:
+            if monitor.is_initialized():
+                return
+            runs, latest_heartbeat = await self._wandb_poller.run_with_timeout(
+                None, monitor.initialize_run_store, self._wandb_api)
+            monitor.add_reported_runs(runs)
+            monitor.advance_watermark(latest_heartbeat)
+
+    async def _check_project(self, path: str) -> bool:
+        """Checks WandB for new runs for the project and posts the results of
+        those runs. The WandB queries run in a background thread so that the
+        bot keeps responding to commands while they are in progress. Errors,
+        including timeouts, propagate to the poll scheduler, which backs off.
+
+        :param path: The project's WandB path.
+        :return: True if the project is busy, i.e., runs finished since the
+            last check or, for the primary project, launched experiments are
+            queued or running; False otherwise.
+        """
+        labels = {'project': path}
+        outcome = 'error'
+        try:
+            with self.metrics.histogram(
+                    'adjutant_wandb_poll_seconds',
+                    'The duration of each WandB check.', labels).time():
+                is_busy = await self._poll_project(self._monitors[path])
+            outcome = 'ok'
+        finally:
+            self.metrics.counter(
+                'adjutant_wandb_polls_total', 'The number of WandB checks.',
+                {**labels, 'outcome': outcome}).inc()
+        return is_busy
+
+    async def _poll_project(self, monitor: ProjectMonitor) -> bool:
+        """Records the project's runs if it has not been scanned yet, and
+        otherwise reports its newly finished runs.
+
+        :param monitor: The project's monitor.
+        :return: True if the project is busy, False otherwise.
+        """
+        if not monitor.is_initialized():
+            await self._initialize_project(monitor)
+            return False
+        async with monitor.check_lock:
+            num_reported = await self._report_new_runs(monitor)
+        return num_reported > 0 or (
+            monitor is self._monitor and self._has_jobs_in_flight())
+
+    def _has_jobs_in_flight(self) -> bool:
+        """Returns True if any launched experiment is queued or running, False
+        otherwise.
+
+        :return: True if any launched experiment is queued or running, False
+            otherwise.
+        """
+        if not self._job_scheduler:
+            return False
+        return bool(self._job_scheduler.get_queued_jobs() or
+                    self._job_scheduler.get_running_jobs())
+
+    async def _report_new_runs(self, monitor: ProjectMonitor) -> int:
+        """Posts the results of the project's runs that finished since the last
+        check, then saves them to the run store. The discovery watermark only
+        moves forward once the runs it covers have been saved.
+
+        :param monitor: The project's monitor.
+        :return: The number of runs reported.
+        :raises asyncio.TimeoutError: If the WandB query times out.
+        """
+        new_runs, latest_heartbeat = await self._wandb_poller.run(
+            monitor.get_new_project_runs,
+            self._wandb_api,
+            set(monitor.reported_runs.keys()),
+            monitor.get_discovery_filters())
+        num_reported = 0
+        for run_name, run in new_runs.items():
+            if run_name in monitor.reported_runs:
+                continue
+            num_reported += 1
+            best_val_loss = run.summary.get('best_val_loss', math.inf)
+            for channel in monitor.channels:
+                self._dispatcher.notify(
+                    channel,
+                    f'Run {run.name} finished! Best val loss: '
+                    f'{best_val_loss:.3f}\nLink to run: {run.url}')
+            monitor.save_reported_run(run)
+        monitor.advance_watermark(latest_heartbeat)
+        return num_reported
+
+    @tasks.loop(seconds=SECONDS_BETWEEN_EARLY_STOPPING_CHECKS)
+    async def check_early_stopping(self) -> None:
+        """Stops the running experiments that the early stopper finds
+        unpromising. Errors are logged rather than raised so that the loop
+        keeps running."""
+        try:
+            await self._early_stopper.check(self._job_scheduler,
+                                            self._fetch_job_history)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Could not check for early stopping')
+
+    @check_early_stopping.before_loop
+    async def _before_check_early_stopping(self) -> None:
+        """Prevents the check_early_stopping loop from running before the
         client has logged in."""
         await self.wait_until_ready()
 
+    async def _fetch_job_history(
+            self,
+            job: Job,
+            metric: str,
+            min_step: int) -> List[Tuple[int, Any]]:
+        """Returns the metric values that a job's WandB run has logged from
+        min_step onward. The query runs in a background thread.
+
+        :param job: The job.
+        :param metric: The metric.
+        :param min_step: The first step to fetch.
+        :return: The list of (step, value) tuples in step order. Empty if the
+            run does not exist yet or the query failed or timed out.
+        """
+        try:
+            return await self._wandb_poller.run(
+                get_run_history, self._wandb_api,
+                f'{self._wandb_entity}/{self._wandb_project_title}/'
+                f'{job.run_id}', metric, min_step)
+        except asyncio.TimeoutError:
+            logging.warning('Timed out fetching the history of job %d', job.id)
+            return []
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Could not fetch the history of job %d', job.id)
+            return []
+
+    @tasks.loop(seconds=SECONDS_BETWEEN_PROGRESS_UPDATES)
+    async def post_progress(self) -> None:
+        """Posts the progress of the running experiments, if any. Errors are
+        logged rather than raised so that the loop keeps running."""
+        if self._job_scheduler.get_running_jobs():
+            try:
+                message = await self._get_jobs_progress_message()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Could not get the progress of the jobs')
+                return
+            self._dispatcher.notify(self.channel, message)
+
+    @post_progress.before_loop
+    async def _before_post_progress(self) -> None:
+        """Prevents the post_progress loop from running before the client has
+        logged in."""
+        await self.wait_until_ready()
+
+    def _get_run_path(self, run_id: str) -> str:
+        """Returns the WandB path of a run in the primary project.
+
+        :param run_id: The run's ID.
+        :return: The path to the run, of the form entity/project/run_id.
+        """
+        return f'{self._wandb_entity}/{self._wandb_project_title}/{run_id}'
+
+    async def _fetch_new_history(
+            self,
+            run_path: str,
+            metrics: Optional[Sequence[str]],
+            min_step: int) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """Returns a run's state and the history rows it has logged from
+        min_step onward. The query runs in a background thread.
+
+        :param run_path: The path to the run.
+        :param metrics: The metrics to keep from each row, or None for all of
+            them.
+        :param min_step: The first step to fetch.
+        :return: A 2-tuple of the run's state (None if the run does not exist
+            yet or the query failed or timed out) and its new rows in step
+            order.
+        """
+        try:
+            return await self._wandb_poller.run(
+                get_new_history, self._wandb_api, run_path, metrics, min_step)
+        except asyncio.TimeoutError:
+            logging.warning('Timed out fetching the history of %s', run_path)
+            return None, []
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Could not fetch the history of %s', run_path)
+            return None, []
+
+    async def _update_progress(self, run_id: str) -> RunProgress:
+        """Fetches the run's new history rows and returns its progress.
+
+        :param run_id: The run's ID.
+        :return: The run's progress.
+        """
+        return await self._progress_tracker.update(
+            self._get_run_path(run_id), self._fetch_new_history)
+
+    async def _get_jobs_progress_message(self) -> str:
+        """Returns the message summarizing the progress of every running job.
+        The jobs' histories are updated concurrently.
+
+        :return: The message listing one line per running job.
+        """
+        jobs = self._job_scheduler.get_running_jobs()
+        if not jobs:
+            return 'No experiments are running.'
+        progresses = await asyncio.gather(
+            *(self._update_progress(job.run_id) for job in jobs))
+        lines = [f'Progress of {len(jobs)} running job(s):']
+        lines.extend(f'Job {job.id} ({job.run_id}): {progress.summarize()}'
+                     for job, progress in zip(jobs, progresses))
+        return '\n'.join(lines)
+
+    async def _get_progress_message(self, text: str) -> str:
+        """Returns the message answering a COMMAND_PROGRESS post: the progress
+        of every running job, or the detailed progress of one job (by job ID)
+        or run (by WandB run ID).
+
+        :param text: The text of the user's message, starting with
+            COMMAND_PROGRESS.
+        :return: The message describing the progress.
+        """
+        args = text[len(COMMAND_PROGRESS):].split()
+        if not args:
+            if not self._job_scheduler:
+                return f'Usage: {COMMAND_PROGRESS} <run id>'
+            return await self._get_jobs_progress_message()
+        if len(args) > 1:
+            return f'Usage: {COMMAND_PROGRESS} [<job id> or <run id>]'
+        run_id = args[0]
+        if run_id.isdigit() and self._job_scheduler:
+            job = self._job_scheduler.get_job(int(run_id))
+            if job is None:
+                return f'There is no job {run_id}.'
+            run_id = job.run_id
+        progress = await self._update_progress(run_id)
+        if progress.state is None and not progress.num_rows:
+            return f'Run {run_id} has not logged to WandB yet.'
+        return progress.describe()
+
+    def _resolve_run_id(self, arg: str) -> str:
+        """Returns the WandB run ID to which a command argument refers: a job
+        ID, the name of a finished run in the primary project, or a run ID.
+
+        :param arg: The argument.
+        :return: The run ID.
+        """
+        if arg.isdigit() and self._job_scheduler:
+            job = self._job_scheduler.get_job(int(arg))
+            if job is not None:
+                return job.run_id
+        run = self._monitor.reported_runs.get(arg)
+        return run.id if run is not None else arg
+
+    def _get_plotted_metrics(self, progresses: List[RunProgress],
+                             metrics: Sequence[str]) -> List[str]:
+        """Returns the metrics to plot: the requested metrics that any of the
+        runs logged, or by default the progress metrics that any of them
+        logged, or else every metric that they logged.
+
+        :param progresses: The runs' progress.
+        :param metrics: The requested metrics, or the empty sequence for the
+            default.
+        :return: At most MAX_PLOTTED_METRICS metrics.
+        """
+        logged = set().union(*(progress.histories for progress in progresses))
+        if not metrics:
+            metrics = [metric for metric in self._progress_tracker.metrics
+                       if metric in logged] or sorted(logged)
+        return [metric for metric in metrics
+                if metric in logged][:MAX_PLOTTED_METRICS]
+
+    async def _handle_plot(self, args: Sequence[str],
+                           metrics: Sequence[str]) -> None:
+        """Replies with a PNG image of the runs' metric curves. Each run's
+        history is cached locally and only the rows logged since it was last
+        plotted are fetched, and images are cached by each run's ID and last
+        step, so repeated requests for unchanged runs neither query WandB for
+        old rows nor redraw. Drawing happens in a worker process.
+
+        :param args: The runs, each as a job ID, run name, or run ID.
+        :param metrics: The metrics to plot, or the empty sequence for the
+            default.
+        """
+        if not is_plotting_available():
+            await self._reply(f'Plotting requires matplotlib; install '
+                              f'{PLOT_EXTRA} to enable it.')
+            return
+        run_ids = list(dict.fromkeys(
+            self._resolve_run_id(arg) for arg in args))[:MAX_PLOTTED_RUNS]
+        progresses = await asyncio.gather(*(
+            self._plot_tracker.update(self._get_run_path(run_id),
+                                      self._fetch_new_history)
+            for run_id in run_ids))
+        missing = [run_id for run_id, progress in zip(run_ids, progresses)
+                   if not progress.num_rows]
+        if missing:
+            await self._reply(f'No history on WandB yet for: '
+                              f'{", ".join(missing)}.')
+            return
+        metrics = self._get_plotted_metrics(progresses, metrics)
+        if not metrics:
+            await self._reply('None of the requested metrics were logged.')
+            return
+        series = {run_id: {metric: progress.histories[metric].get_points()
+                           for metric in metrics
+                           if metric in progress.histories}
+                  for run_id, progress in zip(run_ids, progresses)}
+        key = (tuple((progress.run_path, progress.next_step)
+                     for progress in progresses), tuple(metrics))
+        image = await self._curve_renderer.render(
+            key, series, metrics, title=' vs. '.join(run_ids))
+        await self._reply(
+            ', '.join(f'{run_id}: {progress.summarize()}'
+                      for run_id, progress in zip(run_ids, progresses)),
+            file=discord.File(io.BytesIO(image), filename=PLOT_FILENAME))
+
+    async def _handle_plot_command(self, text: str) -> None:
+        """Responds to a COMMAND_PLOT or COMMAND_COMPARE post.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_PLOT or COMMAND_COMPARE.
+        """
+        if text.startswith(COMMAND_PLOT):
+            args = text[len(COMMAND_PLOT):].split()
+            if not args:
+                await self._reply(f'Usage: {COMMAND_PLOT} <job id, run name, '
+                                  f'or run id> [metric ...]')
+                return
+            await self._handle_plot(args[:1], args[1:])
+            return
+        flags, args = Adjutant._split_flags(text[len(COMMAND_COMPARE):])
+        args = args.split()
+        if not args:
+            await self._reply(f'Usage: {COMMAND_COMPARE} [{FLAG_PREFIX}'
+                              f'{FLAG_METRIC} m1,m2] <run> <run> ...')
+            return
+        metric_flag = flags.get(FLAG_METRIC) or ''
+        await self._handle_plot(
+            args, [metric for metric in metric_flag.split(METRIC_SEPARATOR)
+                   if metric])
+
+    async def close(self) -> None:
+        """Stops the periodic WandB checks and closes the connection to
+        Discord."""
+        # pylint: disable=no-member
+        self._poll_scheduler.stop()
+        self._dispatcher.close()
+        self.check_early_stopping.cancel()
+        self.post_progress.cancel()
+        self._curve_renderer.close()
+        self._wandb_poller.shutdown()
+        if self._worker_pool:
+            self._worker_pool.close()
+        if self._agent_launcher:
+            self._agent_launcher.close()
+        if self._metrics_server:
+            self._metrics_server.close()
+        await super().close()
+        for monitor in self._monitors.values():
+            monitor.close()
+
+    async def _reply(self, content: str,
+                     file: Optional[discord.File] = None) -> Message:
+        """Posts a response to a command in self.channel, ahead of any queued
+        notifications, and waits until it is posted.
+
+        :param content: The text of the response.
+        :param file: The file to attach to the response, or None.
+        :return: The posted message.
+        """
+        return await self._dispatcher.send(self.channel, content, file=file)
+
+    @staticmethod
+    def _split_flags(args: str) -> Tuple[Dict[str, Optional[str]], str]:
+        """Returns the flags at the start of a command's arguments, along with
+        the rest of the arguments. Flags have the form --name or --name value.
+
+        :param args: The text of the user's message after the command.
+        :return: A 2-tuple of the dict of flags, whose keys are the flag names
+            without the leading dashes and whose values are the flag values
+            (None for flags without values), and the rest of the arguments.
+        """
+        flags = {}
+        tokens = args.split(maxsplit=1)
+        while tokens and tokens[0].startswith(FLAG_PREFIX):
+            name = tokens[0][len(FLAG_PREFIX):]
+            tokens = tokens[1].split(maxsplit=1) if len(tokens) > 1 else []
+            value = None
+            if tokens and not tokens[0].startswith((FLAG_PREFIX, '{')):
+                value = tokens[0]
+                tokens = tokens[1].split(maxsplit=1) if len(tokens) > 1 else []
+            flags[name] = value
+        return flags, ' '.join(tokens)
+
     @staticmethod
     def _get_hyperparams(text: str) -> Dict:
         """Returns the hyperparameter dictionary from the text of the user's
         post. Returns the empty dict if the text contains an improperly
-        formatted dictionary or no dictionary at all.
+        formatted dictionary or no dictionary at all. Flags before the
+        dictionary are ignored.
 
         :param text: The text of the user's message, starting with
             COMMAND_EXPERIMENT.
         :return: The hyperparameter dictionary from the text of the user's post
             (may be the empty dict).
         """
-        args = text[len(COMMAND_EXPERIMENT):].strip()
+        _, args = Adjutant._split_flags(text[len(COMMAND_EXPERIMENT):])
         try:
             hyperparams = json.loads(args)
         except JSONDecodeError:
             hyperparams = {}
         return hyperparams
 
-    def run_experiment(self, hyperparams: Dict) -> None:
-        """Runs an experiment in a subprocess.
+    @staticmethod
+    def _get_experiment_flags(text: str) -> Dict[str, Optional[str]]:
+        """Returns the flags in a COMMAND_EXPERIMENT post.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_EXPERIMENT.
+        :return: The dict of flags, whose keys are the flag names without the
+            leading dashes and whose values are the flag values (None for flags
+            without values).
+        """
+        flags, _ = Adjutant._split_flags(text[len(COMMAND_EXPERIMENT):])
+        return flags
+
+    @staticmethod
+    def _get_top_args(text: str) -> Tuple[int, Optional[str]]:
+        """Returns the number of runs and the metric requested in a COMMAND_TOP
+        post. Either argument may be omitted, in either order.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_TOP.
+        :return: A 2-tuple of the number of runs to show (between 1 and
+            MAX_TOP_K) and the metric by which to rank them (None if not
+            given).
+        """
+        k = DEFAULT_TOP_K
+        metric = None
+        for arg in text[len(COMMAND_TOP):].split():
+            if arg.isdigit():
+                k = min(max(int(arg), 1), MAX_TOP_K)
+            else:
+                metric = arg
+        return k, metric
+
+    def _get_leaderboard_message(self, k: int, metric: Optional[str]) -> str:
+        """Returns the message listing the k best runs by the metric. Only the
+        in-memory leaderboards are read; WandB is not queried.
+
+        :param k: The number of runs to list.
+        :param metric: The metric by which to rank the runs, or None for the
+            first leaderboard metric.
+        :return: The message listing the k best runs by the metric.
+        """
+        leaderboards = self._monitor.leaderboards
+        if metric is None:
+            metric = next(iter(leaderboards))
+        if metric not in leaderboards:
+            return (f'No leaderboard for {metric}. Available metrics: '
+                    f'{", ".join(leaderboards)}.')
+        leaderboard = leaderboards[metric]
+        top = leaderboard.top(k)
+        if not top:
+            return f'No runs have reported {metric} yet.'
+        better = 'lower' if leaderboard.direction == MINIMIZE else 'higher'
+        lines = [f'Top {len(top)} runs by {metric} ({better} is better):']
+        for rank, (run_name, value) in enumerate(top, start=1):
+            lines.append(f'{rank}. {run_name}: {value:.4g} '
+                         f'<{self._monitor.reported_runs[run_name].url}>')
+        return '\n'.join(lines)
+
+    async def run_experiment(
+            self,
+            hyperparams: Dict,
+            priority: int = 0,
+            slots: int = 1) -> Job:
+        """Queues an experiment to run in a subprocess as soon as there are
+        enough free job slots.
 
         :param hyperparams: The hyperparameters to pass to the experiment
             function.
+        :param priority: The priority of the experiment. Experiments with higher
+            priority start first.
+        :param slots: The number of job slots that the experiment occupies.
+        :return: The experiment's job.
+        """
+        return await self._job_scheduler.submit(
+            hyperparams, priority=priority, slots=slots)
+
+    async def _on_job_done(self, job: Job) -> None:
+        """Posts the outcome of a finished, failed, cancelled, or stopped job.
+
+        :param job: The completed job.
+        """
+        if job.group is not None:
+            # Grouped jobs, e.g., sweep trials, are reported by their group.
+            return
+        outcome = f'Job {job.id} {job.status}'
+        if job.status == JOB_STOPPED:
+            outcome += (f' early because its {self._early_stopper.metric} fell '
+                        f'behind other runs')
+        elif job.exit_code is not None:
+            outcome += f' with exit code {job.exit_code}'
+        if job.status == JOB_FAILED and job.log is not None and \
+                job.log.num_lines:
+            outcome += f'; see its output with {COMMAND_LOGS} {job.id}'
+        self._dispatcher.notify(self.channel, f'{outcome}.')
+
+    @staticmethod
+    def _get_jobs_message(title: str, jobs: List[Job]) -> str:
+        """Returns a message listing the most recent jobs.
+
+        :param title: The title of the list.
+        :param jobs: The jobs to list, oldest first.
+        :return: A message listing at most MAX_LISTED_JOBS of the jobs.
+        """
+        if not jobs:
+            return f'{title}: none.'
+        lines = [f'{title} ({len(jobs)}):']
+        if len(jobs) > MAX_LISTED_JOBS:
+            lines.append(f'... {len(jobs) - MAX_LISTED_JOBS} more')
+            jobs = jobs[-MAX_LISTED_JOBS:]
+        lines.extend(job.describe() for job in jobs)
+        return '\n'.join(lines)
+
+    def _get_duplicate_message(self, hyperparams: Dict) -> Optional[str]:
+        """Returns the message describing the finished runs or the queued or
+        running job with the same hyperparameters, after filling in the
+        defaults, or None if there are none. Only the in-memory config index
+        and job list are read; WandB is not queried.
+
+        :param hyperparams: The requested hyperparameters.
+        :return: The message describing the earlier experiments with the same
+            hyperparameters, or None if there are none.
+        """
+        config_index = self._monitor.config_index
+        run_names = config_index.get_matching_runs(hyperparams)
+        if run_names:
+            runs = {name: self._monitor.reported_runs[name]
+                    for name in run_names}
+            lines = [f'{len(runs)} finished run(s) already used these '
+                     f'hyperparameters.']
+            try:
+                best_run = Adjutant._get_run_with_best_val_loss(runs)
+                lines.append(f'Best: {best_run.name} with validation loss '
+                             f'{best_run.summary["best_val_loss"]:.4g}.')
+            except ValueError:
+                best_run = runs[run_names[-1]]
+                lines.append(f'Latest: {best_run.name}.')
+            lines.append(f'Link to run: <{best_run.url}>')
+        else:
+            config_hash = config_index.get_hash(hyperparams)
+            job = next((job for job in self._job_scheduler.get_jobs()
+                        if not job.is_done and
+                        config_index.get_hash(job.hyperparams) == config_hash),
+                       None)
+            if job is None:
+                return None
+            lines = [f'Job {job.id} with these hyperparameters is already '
+                     f'{job.status}.']
+        lines.append(f'Post again with --{FLAG_FORCE} to run it anyway.')
+        return '\n'.join(lines)
+
+    async def _handle_experiment(self, text: str) -> None:
+        """Responds to a COMMAND_EXPERIMENT post by queueing the experiment.
+        If a finished run or an unfinished job already used the same
+        hyperparameters, describes it instead, unless the post has the --force
+        flag.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_EXPERIMENT.
+        """
+        hyperparams = Adjutant._get_hyperparams(text)
+        flags = Adjutant._get_experiment_flags(text)
+        if FLAG_FORCE not in flags:
+            duplicate_message = self._get_duplicate_message(hyperparams)
+            if duplicate_message:
+                await self._reply(duplicate_message)
+                return
+        try:
+            priority = int(flags.get(FLAG_PRIORITY) or 0)
+            slots = int(flags.get(FLAG_SLOTS) or 1)
+            job = await self.run_experiment(
+                hyperparams, priority=priority, slots=slots)
+        except ValueError as err:
+            await self._reply(f'Cannot launch experiment: {err}')
+            return
+        if job.status == JOB_QUEUED:
+            queued_jobs = self._job_scheduler.get_queued_jobs()
+            await self._reply(
+                f'Queued new experiment as job {job.id} (position '
+                f'{queued_jobs.index(job) + 1} in queue) with the following '
+                f'hyperparameters.\n{json.dumps(hyperparams, indent=4)}')
+        else:
+            await self._reply(
+                f'Running new experiment as job {job.id} with the following '
+                f'hyperparameters.\n{json.dumps(hyperparams, indent=4)}')
+
+    async def _handle_cancel(self, text: str) -> None:
+        """Responds to a COMMAND_CANCEL post by cancelling the requested job or
+        sweep.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_CANCEL.
+        """
+        args = text[len(COMMAND_CANCEL):].split()
+        if len(args) == 2 and args[0] == CANCEL_SWEEP_ARG and \
+                args[1].isdigit():
+            sweep = self._sweeps.get(int(args[1]))
+            if sweep is None:
+                await self._reply(f'There is no sweep {args[1]}.')
+            else:
+                await self._reply(f'Cancelling sweep {args[1]}.')
+                await sweep.cancel(self._job_scheduler)
+        elif len(args) != 1 or not args[0].isdigit():
+            await self._reply(
+                f'Usage: {COMMAND_CANCEL} <job id> or {COMMAND_CANCEL} '
+                f'{CANCEL_SWEEP_ARG} <sweep id>')
+        elif await self._job_scheduler.cancel(int(args[0])):
+            await self._reply(f'Cancelling job {args[0]}.')
+        else:
+            await self._reply(f'Job {args[0]} is not queued or running.')
+
+    def _get_sweep(self, text: str) -> Sweep:
+        """Returns the sweep described by a COMMAND_SWEEP post. The post holds a
+        JSON-formatted sweep specification (see sweep.parse_sweep_spec),
+        optionally preceded by the flags --random <num samples>, --seed
+        <seed>, and --priority <priority>. Without --random, every
+        combination of candidate values is run.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_SWEEP.
+        :return: The sweep, which has not started.
+        :raises ValueError: If the post does not describe a valid sweep.
+        """
+        flags, args = Adjutant._split_flags(text[len(COMMAND_SWEEP):])
+        mode = SWEEP_RANDOM if FLAG_RANDOM in flags else SWEEP_GRID
+        num_samples = None
+        if mode == SWEEP_RANDOM:
+            if not (flags[FLAG_RANDOM] or '').isdigit():
+                raise ValueError(f'--{FLAG_RANDOM} needs a number of samples.')
+            num_samples = int(flags[FLAG_RANDOM])
+        seed = int(flags[FLAG_SEED]) if flags.get(FLAG_SEED) else None
+        priority = int(flags.get(FLAG_PRIORITY) or 0)
+        sweep = Sweep(next(self._sweep_ids), json.loads(args), mode,
+                      num_samples, seed=seed, priority=priority,
+                      on_update=self._on_sweep_update)
+        if sweep.num_trials > MAX_SWEEP_TRIALS:
+            raise ValueError(f'the sweep has {sweep.num_trials} trials; the '
+                             f'limit is {MAX_SWEEP_TRIALS}.')
+        return sweep
+
+    async def _handle_sweep(self, text: str) -> None:
+        """Responds to a COMMAND_SWEEP post by starting the sweep and posting
+        its status message, which is edited in place as trials complete.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_SWEEP.
+        """
+        try:
+            sweep = self._get_sweep(text)
+        except ValueError as err:
+            await self._reply(
+                f'Cannot start sweep: {err}\nUsage: {COMMAND_SWEEP} '
+                f'[--{FLAG_RANDOM} <num samples>] [--{FLAG_SEED} <seed>] '
+                f'[--{FLAG_PRIORITY} <priority>] {{"key": [value, ...], '
+                f'"other_key": {{"range": [start, stop, step]}}}}')
+            return
+        self._sweeps[sweep.id] = sweep
+        self._sweep_messages[sweep.id] = await self._reply(sweep.describe())
+        self._sweep_tasks[sweep.id] = asyncio.ensure_future(
+            self._run_sweep(sweep))
+
+    async def _run_sweep(self, sweep: Sweep) -> None:
+        """Runs the sweep to completion, then forgets it, its status message,
+        and its early stopping bracket.
+
+        :param sweep: The sweep.
+        """
+        try:
+            await sweep.run(self._job_scheduler)
+        finally:
+            if self._early_stopper:
+                self._early_stopper.forget_group(sweep.group)
+            self._sweeps.pop(sweep.id, None)
+            self._sweep_messages.pop(sweep.id, None)
+            self._sweep_tasks.pop(sweep.id, None)
+
+    async def _on_sweep_update(self, sweep: Sweep) -> None:
+        """Queues an edit of the sweep's status message to show its progress,
+        subject to the channel's rate limit.
+
+        :param sweep: The sweep.
         """
-        # We don't use the context manager because it waits for the subprocess.
-        # pylint: disable=consider-using-with
-        Popen([self._run_experiment_script, json.dumps(hyperparams)])
+        message = self._sweep_messages.get(sweep.id)
+        if message is not None:
+            self._dispatcher.edit(self.channel, message, sweep.describe())
 
     async def on_message(self, message: Message) -> None:
         """Runs every time a message is posted (including by this bot). Responds
@@ -172,15 +1175,227 @@ class Adjutant(discord.Client):
         """
         if message.author == self.user or message.channel != self.channel:
             return
-        if message.content.startswith(COMMAND_HELLO):
-            await self.channel.send('Hello!')
-        elif message.content.startswith(COMMAND_EXPERIMENT):
-            if not self._run_experiment_script:
-                await self.channel.send('No experiment script provided; '
-                                        'cannot launch experiment.')
-            else:
-                hyperparams = Adjutant._get_hyperparams(message.content)
-                await self.channel.send(
-                    f'Running new experiment with the following '
-                    f'hyperparameters.\n{json.dumps(hyperparams, indent=4)}')
-                self.run_experiment(hyperparams)
+        command = next((command for command in COMMANDS
+                        if message.content.startswith(command)), None)
+        if command is None:
+            return
+        labels = {'command': command}
+        self.metrics.counter('adjutant_commands_total',
+                             'The number of commands handled.', labels).inc()
+        with self.metrics.histogram(
+                'adjutant_command_seconds',
+                'The time taken to handle each command, including sending '
+                'its response.', labels).time():
+            await self._handle_command(message.content)
+
+    async def _handle_command(self, text: str) -> None:
+        """Responds to a user command.
+
+        :param text: The text of the user's message, starting with one of
+            COMMANDS.
+        """
+        if text.startswith(COMMAND_HELLO):
+            await self._reply('Hello!')
+        elif text.startswith((COMMAND_EXPERIMENT, COMMAND_QUEUE, COMMAND_JOBS,
+                              COMMAND_CANCEL, COMMAND_SWEEP, COMMAND_LOGS)):
+            await self._handle_job_command(text)
+        elif text.startswith(COMMAND_TOP):
+            k, metric = Adjutant._get_top_args(text)
+            await self._reply(self._get_leaderboard_message(k, metric))
+        elif text.startswith(COMMAND_STATS):
+            await self._reply(self._get_stats_message())
+        elif text.startswith(COMMAND_FIND):
+            await self._reply(self._get_find_message(text))
+        elif text.startswith(COMMAND_QUERY):
+            await self._reply(self._get_query_message(text))
+        elif text.startswith(COMMAND_PROGRESS):
+            await self._reply(await self._get_progress_message(text))
+        elif text.startswith((COMMAND_PLOT, COMMAND_COMPARE)):
+            await self._handle_plot_command(text)
+        elif text.startswith(COMMAND_AGENTS):
+            await self._reply(await self._get_agents_message())
+
+    async def _handle_job_command(self, text: str) -> None:
+        """Responds to a user command that launches or manages experiments.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_EXPERIMENT, COMMAND_QUEUE, COMMAND_JOBS, COMMAND_CANCEL,
+            COMMAND_SWEEP, or COMMAND_LOGS.
+        """
+        if not self._job_scheduler:
+            await self._reply('No experiment script provided; '
+                              'cannot launch experiment.')
+        elif text.startswith(COMMAND_EXPERIMENT):
+            await self._handle_experiment(text)
+        elif text.startswith(COMMAND_QUEUE):
+            await self._reply(Adjutant._get_jobs_message(
+                'Queued jobs', self._job_scheduler.get_queued_jobs()))
+        elif text.startswith(COMMAND_SWEEP):
+            await self._handle_sweep(text)
+        elif text.startswith(COMMAND_JOBS):
+            jobs = [job for job in self._job_scheduler.get_jobs()
+                    if job.status != JOB_QUEUED]
+            await self._reply(
+                Adjutant._get_jobs_message('Jobs', jobs))
+        elif text.startswith(COMMAND_LOGS):
+            await self._reply(self._get_logs_message(text))
+        else:
+            await self._handle_cancel(text)
+
+    def _get_logs_message(self, text: str) -> str:
+        """Returns the message answering a COMMAND_LOGS post: the last lines
+        of a job's captured output, as many as fit in one message.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_LOGS.
+        :return: The message showing the job's output.
+        """
+        args = text[len(COMMAND_LOGS):].split()
+        if not 1 <= len(args) <= 2 or not all(arg.isdigit() for arg in args):
+            return f'Usage: {COMMAND_LOGS} <job id> [number of lines]'
+        job = self._job_scheduler.get_job(int(args[0]))
+        if job is None:
+            return f'There is no job {args[0]}.'
+        if job.log is None:
+            return f'Job {job.id} has no captured output.'
+        num_lines = min(max(int(args[1]), 1), MAX_LOG_TAIL_LINES) \
+            if len(args) > 1 else DEFAULT_LOG_TAIL_LINES
+        # Fences in the output would end the code block early.
+        lines = [line.replace(CODE_BLOCK_FENCE, "'''")
+                 for line in job.log.get_tail(num_lines)]
+        if not lines:
+            return f'Job {job.id} ({job.status}) has not printed anything.'
+        while True:
+            header = f'Last {len(lines)} of {job.log.num_lines} lines of ' \
+                     f'job {job.id} ({job.status}):'
+            message = '\n'.join([header, CODE_BLOCK_FENCE, *lines,
+                                 CODE_BLOCK_FENCE])
+            if len(message) <= MAX_MESSAGE_LENGTH or len(lines) == 1:
+                return message
+            lines = lines[1:]
+
+    async def _get_agents_message(self) -> str:
+        """Returns the message answering a COMMAND_AGENTS post: each agent's
+        used slots and the time since its last heartbeat.
+
+        :return: The message listing the agents.
+        """
+        if not self._agent_launcher:
+            return 'No agent queue provided; experiments run on this host.'
+        agents = await self._agent_launcher.get_agents()
+        if not agents:
+            return 'No agents are connected.'
+        now = time.time()
+        lines = [f'{agent.name}: {agent.used_slots}/{agent.max_slots} slots '
+                 f'used, last seen {now - agent.heartbeat_at:.0f}s ago'
+                 for agent in agents]
+        return '\n'.join([f'Agents ({len(agents)}):', *lines])
+
+    def _get_find_message(self, text: str) -> str:
+        """Returns the message listing the finished runs whose hyperparameters
+        include every key and value in a COMMAND_FIND post, best validation
+        loss first. Only the in-memory config index is read; WandB is not
+        queried.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_FIND.
+        :return: The message listing at most MAX_LISTED_RUNS matching runs.
+        """
+        try:
+            query = json.loads(text[len(COMMAND_FIND):] or '{}')
+        except JSONDecodeError:
+            query = None
+        if not isinstance(query, dict):
+            return f'Usage: {COMMAND_FIND} {{"key": value, ...}}'
+        run_names = self._monitor.config_index.find(query)
+        if not run_names:
+            return 'No finished runs match.'
+        runs = sorted(
+            (self._monitor.reported_runs[name] for name in run_names),
+            key=lambda run: (run.summary.get('best_val_loss') is None,
+                             run.summary.get('best_val_loss'), run.name))
+        lines = [f'{len(runs)} matching run(s), best validation loss first:']
+        for run in runs[:MAX_LISTED_RUNS]:
+            val_loss = run.summary.get('best_val_loss')
+            val_loss = 'n/a' if val_loss is None else f'{val_loss:.4g}'
+            lines.append(f'{run.name}: {val_loss} <{run.url}>')
+        if len(runs) > MAX_LISTED_RUNS:
+            lines.append(f'... {len(runs) - MAX_LISTED_RUNS} more')
+        return '\n'.join(lines)
+
+    def _get_stats_message(self) -> str:
+        """Returns the message summarizing the metrics.
+
+        :return: The message summarizing the metrics.
+        """
+        uptime = int(self.metrics.uptime_seconds)
+        lines = [f'Uptime: {uptime // 3600}h {uptime // 60 % 60}m '
+                 f'{uptime % 60}s']
+        lines.extend(self.metrics.summarize())
+        if self._metrics_server and self._metrics_server.port:
+            lines.append(f'Prometheus metrics: http://'
+                         f'{self._metrics_server.host}:'
+                         f'{self._metrics_server.port}/metrics')
+        return '\n'.join(lines)
+
+    def _get_query_message(self, text: str) -> str:
+        """Returns the message answering a COMMAND_QUERY post from the primary
+        project's run table (see run_table.RunQuery for the syntax). Only the
+        in-memory run table is read; WandB is not queried.
+
+        :param text: The text of the user's message, starting with
+            COMMAND_QUERY.
+        :return: The message listing the matching runs, or their aggregates.
+        """
+        run_table = self._monitor.run_table
+        try:
+            query = RunQuery(text[len(COMMAND_QUERY):])
+            rows = run_table.select(query)
+            if query.is_aggregate:
+                return Adjutant._get_aggregate_message(
+                    query, run_table.aggregate(query, rows))
+            fields = list(dict.fromkeys(
+                [field for field, _, _ in query.conditions] +
+                ([query.sort_field] if query.sort_field else [])))
+            if not fields and 'best_val_loss' in run_table.fields:
+                fields = ['best_val_loss']
+            lines = [f'{len(rows)} matching run(s).']
+            for row in rows[:query.limit]:
+                run = self._monitor.reported_runs[run_table.get_name(row)]
+                values = ' '.join(f'{field}={run_table.format(row, field)}'
+                                  for field in fields)
+                lines.append(f'{run.name}: {values} <{run.url}>')
+        except ValueError as err:
+            return (f'Cannot run query: {err}\nUsage: {COMMAND_QUERY} '
+                    f'[field<op>value ...] [sort:[-]field] [limit:n] '
+                    f'[agg:field] [by:field]')
+        if len(rows) > query.limit:
+            lines.append(f'... {len(rows) - query.limit} more')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _get_aggregate_message(
+            query: RunQuery,
+            groups: List[Tuple[str, int, Optional[float], Optional[float],
+                               Optional[float]]]) -> str:
+        """Returns the message listing the aggregates of a COMMAND_QUERY.
+
+        :param query: The query.
+        :param groups: The groups, as returned by RunTable.aggregate.
+        :return: The message listing at most query.limit groups.
+        """
+        if not groups:
+            return 'No runs match.'
+        title = f'Runs by {query.group_by_field}' if query.group_by_field \
+            else 'Matching runs'
+        if query.aggregate_field:
+            title += f', {query.aggregate_field}'
+        lines = [f'{title}:']
+        for label, count, mean, minimum, maximum in groups[:query.limit]:
+            line = f'{label}: n={count}'
+            if mean is not None:
+                line += f' mean={mean:.4g} min={minimum:.4g} max={maximum:.4g}'
+            lines.append(line)
+        if len(groups) > query.limit:
+            lines.append(f'... {len(groups) - query.limit} more groups')
+        return '\n'.join(lines)
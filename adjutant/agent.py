@@ -0,0 +1,279 @@
+"""Contains the Agent class, which runs on a training host and runs the
+experiments that it claims from a JobQueue shared with Adjutant. Run one agent
+per host with python -m adjutant.agent; see main for the options."""
+
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import concurrent.futures
+import logging
+import os
+import signal
+import socket
+import sqlite3
+from adjutant.job_scheduler import Job, JobScheduler, DEFAULT_MAX_SLOTS
+from adjutant.job_queue import JobQueue, QueuedJob, DEFAULT_POLL_SECONDS, \
+    create_queue_executor
+from adjutant.job_logs import DEFAULT_MAX_LOG_LINES
+from adjutant.worker_pool import WorkerPool, DEFAULT_NUM_WORKERS
+
+
+def get_default_agent_name() -> str:
+    """Returns a name that is unique among the agents on all hosts.
+
+    :return: The name, of the form host:pid.
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class Agent:
+    """Pulls experiments from a JobQueue and runs them on this host in a local
+    JobScheduler. Every poll_seconds, the agent sends a heartbeat, terminates
+    the jobs that Adjutant has cancelled, and claims as many queued jobs as fit
+    in its free slots; it reports each job's final status and exit code back
+    to the queue as soon as the job exits, retrying on later polls if the
+    report fails. Since agents pull work rather than
+    being assigned it, adding hosts adds throughput without any change to
+    Adjutant. Queue I/O runs in a dedicated thread, so heartbeats are never
+    delayed by the experiments, however many slots the agent has."""
+    # pylint: disable=too-many-instance-attributes
+    queue: JobQueue
+    name: str
+    max_slots: int
+    poll_seconds: float
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _worker_pool: Optional[WorkerPool]
+    _scheduler: JobScheduler
+    _queue_ids: Dict[str, int]
+    _jobs: Dict[int, Job]
+    _unfinished: Dict[int, Tuple[str, Optional[int]]]
+    _used_slots: int
+    _stopping: asyncio.Event
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            queue: JobQueue,
+            script: Optional[str] = None,
+            entry_point: Optional[str] = None,
+            *,
+            name: Optional[str] = None,
+            max_slots: int = DEFAULT_MAX_SLOTS,
+            poll_seconds: float = DEFAULT_POLL_SECONDS,
+            num_warm_workers: int = DEFAULT_NUM_WORKERS,
+            log_directory: Optional[str] = None) -> None:
+        """Instantiates the object. Call run to start pulling experiments.
+
+        :param queue: The queue shared with Adjutant and the other agents.
+        :param script: The filename of an executable script that runs an
+            experiment with the given hyperparameters as a JSON-formatted
+            command line argument. Exactly one of script and entry_point must
+            be provided.
+        :param entry_point: The experiment's entry point, of the form
+            module:function, to run in pre-warmed worker processes; see
+            WorkerPool.
+        :param name: The agent's unique name. If None, host:pid is used.
+        :param max_slots: The number of slots on this host.
+        :param poll_seconds: The number of seconds between polls of the queue.
+        :param num_warm_workers: The number of idle, pre-warmed worker
+            processes to keep when entry_point is provided.
+        :param log_directory: If provided, the output of each experiment is
+            written to a rotating log file in this directory.
+        """
+        if (script is None) == (entry_point is None):
+            raise ValueError('Exactly one of script and entry_point must be '
+                             'provided.')
+        if poll_seconds <= 0:
+            raise ValueError('poll_seconds must be positive.')
+        self.queue = queue
+        self.name = name or get_default_agent_name()
+        self.max_slots = max_slots
+        self.poll_seconds = poll_seconds
+        self._executor = create_queue_executor()
+        self._worker_pool = WorkerPool(entry_point,
+                                       num_workers=num_warm_workers) \
+            if entry_point is not None else None
+        self._scheduler = JobScheduler(
+            script,
+            max_slots=max_slots,
+            on_job_done=self._on_job_done,
+            launcher=self._worker_pool.launch if self._worker_pool else None,
+            max_log_lines=DEFAULT_MAX_LOG_LINES if log_directory else None,
+            log_directory=log_directory)
+        # Keyed by run ID, which is known before the local job ID.
+        self._queue_ids = {}
+        self._jobs = {}
+        # Keyed by queue ID; the completions that could not be reported yet.
+        self._unfinished = {}
+        self._used_slots = 0
+        self._stopping = asyncio.Event()
+
+    @property
+    def used_slots(self) -> int:
+        """Returns the number of slots that claimed jobs occupy.
+
+        :return: The number of slots that claimed jobs occupy.
+        """
+        return self._used_slots
+
+    async def run(self) -> None:
+        """Pulls and runs experiments until stop is called, then terminates
+        the running experiments, reports them as cancelled, and leaves the
+        queue."""
+        if self._worker_pool:
+            self._worker_pool.start()
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self._poll()
+                except sqlite3.Error:
+                    logging.exception('Could not poll the job queue')
+                try:
+                    await asyncio.wait_for(self._stopping.wait(),
+                                           self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            for job in self._scheduler.get_running_jobs():
+                await self._scheduler.cancel(job.id)
+            await self._scheduler.wait_until_idle()
+            await self._finish_unfinished()
+            await loop.run_in_executor(self._executor, self.queue.remove_agent,
+                                       self.name)
+        finally:
+            if self._worker_pool:
+                self._worker_pool.close()
+            self._executor.shutdown(wait=False)
+
+    def stop(self) -> None:
+        """Makes run return once the running experiments have been
+        terminated."""
+        self._stopping.set()
+
+    async def _poll(self) -> None:
+        """Sends a heartbeat, terminates the jobs that were cancelled or are no
+        longer assigned to this agent, and starts newly claimed ones. First
+        retries the completions that could not be reported."""
+        await self._finish_unfinished()
+        cancels, claimed = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._sync, self._used_slots, list(self._jobs))
+        for queue_id in cancels:
+            job = self._jobs.get(queue_id)
+            if job is not None and not job.cancel_requested:
+                logging.info('Stopping job %d, which was cancelled or is no '
+                             'longer assigned to this agent', queue_id)
+                await self._scheduler.cancel(job.id)
+        for queued_job in claimed:
+            logging.info('Starting job %d', queued_job.id)
+            self._used_slots += queued_job.slots
+            self._queue_ids[queued_job.run_id] = queued_job.id
+            job = await self._scheduler.submit(
+                queued_job.hyperparams, priority=queued_job.priority,
+                slots=queued_job.slots, run_id=queued_job.run_id)
+            if not job.is_done:
+                self._jobs[queued_job.id] = job
+
+    def _sync(self, used_slots: int,
+              queue_ids: List[int]) -> Tuple[List[int], List[QueuedJob]]:
+        """Runs in the queue thread. Sends a heartbeat, finds the running jobs
+        to terminate, and claims jobs for the free slots.
+
+        :param used_slots: The number of slots that claimed jobs occupy.
+        :param queue_ids: The queue IDs of the jobs running on this agent.
+        :return: A 2-tuple of the IDs of the jobs to terminate and the newly
+            claimed jobs.
+        """
+        self.queue.heartbeat(self.name, self.max_slots, used_slots)
+        cancels = self.queue.get_cancel_requests(self.name, queue_ids)
+        claimed = self.queue.claim(self.name, self.max_slots - used_slots,
+                                   self.max_slots) \
+            if used_slots < self.max_slots and not self._stopping.is_set() \
+            else []
+        return cancels, claimed
+
+    async def _on_job_done(self, job: Job) -> None:
+        """Reports the job's final status and exit code to the queue.
+
+        :param job: The completed job.
+        """
+        queue_id = self._queue_ids.pop(job.run_id)
+        self._jobs.pop(queue_id, None)
+        self._used_slots -= job.slots
+        logging.info('Job %d %s with exit code %s', queue_id, job.status,
+                     job.exit_code)
+        self._unfinished[queue_id] = (job.status, job.exit_code)
+        await self._finish(queue_id)
+
+    async def _finish(self, queue_id: int) -> None:
+        """Reports an unfinished completion to the queue. If the report fails,
+        it is kept to be retried on the next poll.
+
+        :param queue_id: The job's queue ID.
+        """
+        if queue_id not in self._unfinished:
+            # Reported by a concurrent retry.
+            return
+        status, exit_code = self._unfinished[queue_id]
+        try:
+            # Ignored by the queue if the job was already failed as lost.
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.queue.finish, queue_id, status,
+                exit_code)
+        except sqlite3.Error:
+            logging.exception('Could not report that job %d %s; will retry',
+                              queue_id, status)
+            return
+        self._unfinished.pop(queue_id, None)
+
+    async def _finish_unfinished(self) -> None:
+        """Retries the completions that could not be reported."""
+        for queue_id in list(self._unfinished):
+            await self._finish(queue_id)
+
+
+def main() -> None:
+    """Runs an agent until it receives SIGINT or SIGTERM."""
+    parser = argparse.ArgumentParser(
+        description='Runs experiments from an Adjutant job queue on this '
+                    'host.')
+    parser.add_argument('--queue', required=True,
+                        help='The path to the job queue database shared with '
+                             'Adjutant.')
+    experiment = parser.add_mutually_exclusive_group(required=True)
+    experiment.add_argument('--script',
+                            help='An executable script that runs an '
+                                 'experiment with JSON hyperparameters.')
+    experiment.add_argument('--entry-point',
+                            help='The experiment function, of the form '
+                                 'module:function.')
+    parser.add_argument('--slots', type=int, default=DEFAULT_MAX_SLOTS,
+                        help='The number of slots on this host.')
+    parser.add_argument('--name', help='The unique name of the agent.')
+    parser.add_argument('--poll-seconds', type=float,
+                        default=DEFAULT_POLL_SECONDS,
+                        help='The number of seconds between polls.')
+    parser.add_argument('--log-directory',
+                        help='The directory in which to write experiment '
+                             'output.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    async def run_agent() -> None:
+        agent = Agent(JobQueue(args.queue), args.script, args.entry_point,
+                      name=args.name, max_slots=args.slots,
+                      poll_seconds=args.poll_seconds,
+                      log_directory=args.log_directory)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, agent.stop)
+        logging.info('Agent %s started', agent.name)
+        try:
+            await agent.run()
+        finally:
+            agent.queue.close()
+    asyncio.run(run_agent())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Contains the ConfigIndex class, which maps canonical hyperparameter
+configurations to the finished runs that used them."""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import json
+import sys
+
+INTERNAL_KEY_PREFIX = '_'
+
+
+def canonicalize_value(value: Any) -> Any:
+    """Returns the value in a canonical form, so that equal hyperparameters
+    compare and serialize equally however they were written: integral floats
+    become ints (e.g., 10.0 and 10), tuples become lists, and dict keys become
+    strings.
+
+    :param value: The hyperparameter value, as decoded from JSON.
+    :return: The canonical value.
+    """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return [canonicalize_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): canonicalize_value(item)
+                for key, item in value.items()}
+    return value
+
+
+def dumps_canonical(value: Any) -> str:
+    """Returns the canonical JSON serialization of the value, with sorted keys
+    and no whitespace.
+
+    :param value: The canonical value.
+    :return: The JSON string.
+    """
+    return json.dumps(value, sort_keys=True, separators=(',', ':'),
+                      default=str)
+
+
+def _discard(index: Dict[Any, Set[str]], key: Any, run_name: str) -> None:
+    """Removes the run from the index entry, and the entry if it becomes empty.
+
+    :param index: The index.
+    :param key: The entry's key.
+    :param run_name: The name of the run.
+    """
+    index[key].discard(run_name)
+    if not index[key]:
+        del index[key]
+
+
+class ConfigIndex:
+    """Indexes runs by their hyperparameter configurations. Each configuration
+    is first merged over the training defaults and stripped of internal keys
+    (those starting with INTERNAL_KEY_PREFIX, e.g., WandB's _wandb) and ignored
+    keys, so that an experiment request that omits a default value matches a
+    run that logged it. Lookups of a whole configuration go through its hash;
+    lookups of some of its keys go through an inverted index from each
+    (key, value) pair to the runs that have it."""
+    defaults: Dict[str, Any]
+    ignored_keys: Set[str]
+    _runs_by_hash: Dict[str, Set[str]]
+    _runs_by_item: Dict[Tuple[str, str], Set[str]]
+    _hash_by_run: Dict[str, str]
+    _items_by_hash: Dict[str, Tuple[Tuple[str, str], ...]]
+
+    def __init__(
+            self,
+            defaults: Optional[Dict[str, Any]] = None,
+            ignored_keys: Iterable[str] = ()) -> None:
+        """Instantiates the object.
+
+        :param defaults: The hyperparameter values that experiments use when
+            they are not given.
+        :param ignored_keys: The hyperparameters that do not affect results,
+            e.g., output paths, and so are left out of comparisons.
+        """
+        self.defaults = dict(defaults or {})
+        self.ignored_keys = set(ignored_keys)
+        self._runs_by_hash = {}
+        self._runs_by_item = {}
+        self._hash_by_run = {}
+        self._items_by_hash = {}
+
+    def __len__(self) -> int:
+        """Returns the number of indexed runs.
+
+        :return: The number of indexed runs.
+        """
+        return len(self._hash_by_run)
+
+    def canonicalize(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the configuration merged over the defaults, without internal
+        or ignored keys, and with canonical values.
+
+        :param config: The hyperparameter configuration.
+        :return: The canonical configuration.
+        """
+        merged = {**self.defaults, **config}
+        return {str(key): canonicalize_value(value)
+                for key, value in merged.items()
+                if not str(key).startswith(INTERNAL_KEY_PREFIX) and
+                key not in self.ignored_keys}
+
+    def get_hash(self, config: Dict[str, Any]) -> str:
+        """Returns the hash of the canonical configuration.
+
+        :param config: The hyperparameter configuration.
+        :return: The SHA-256 hex digest of the canonical configuration's
+            canonical JSON serialization.
+        """
+        return hashlib.sha256(dumps_canonical(
+            self.canonicalize(config)).encode('utf-8')).hexdigest()
+
+    def add(self, run_name: str, config: Dict[str, Any]) -> None:
+        """Indexes the run, replacing any previous entry for it.
+
+        :param run_name: The name of the run.
+        :param config: The run's hyperparameter configuration.
+        """
+        self.remove(run_name)
+        canonical = self.canonicalize(config)
+        # Runs with the same config share one hash string and item tuple.
+        config_hash = sys.intern(hashlib.sha256(
+            dumps_canonical(canonical).encode('utf-8')).hexdigest())
+        if config_hash not in self._items_by_hash:
+            self._items_by_hash[config_hash] = tuple(
+                (key, dumps_canonical(value))
+                for key, value in canonical.items())
+        self._hash_by_run[run_name] = config_hash
+        self._runs_by_hash.setdefault(config_hash, set()).add(run_name)
+        for item in self._items_by_hash[config_hash]:
+            self._runs_by_item.setdefault(item, set()).add(run_name)
+
+    def remove(self, run_name: str) -> None:
+        """Removes the run from the index, if present.
+
+        :param run_name: The name of the run.
+        """
+        config_hash = self._hash_by_run.pop(run_name, None)
+        if config_hash is None:
+            return
+        for item in self._items_by_hash[config_hash]:
+            _discard(self._runs_by_item, item, run_name)
+        _discard(self._runs_by_hash, config_hash, run_name)
+        if config_hash not in self._runs_by_hash:
+            del self._items_by_hash[config_hash]
+
+    def get_matching_runs(self, config: Dict[str, Any]) -> List[str]:
+        """Returns the runs whose canonical configuration equals that of the
+        given configuration.
+
+        :param config: The hyperparameter configuration, e.g., from an
+            experiment request.
+        :return: The names of the matching runs, sorted.
+        """
+        return sorted(self._runs_by_hash.get(self.get_hash(config), ()))
+
+    def find(self, query: Dict[str, Any]) -> Set[str]:
+        """Returns the runs whose canonical configuration has every key and
+        value in the query. The defaults are not merged into the query, but
+        they are part of each run's configuration, so a run that did not log
+        a key matches the key's default value.
+
+        :param query: The hyperparameter values to match.
+        :return: The names of the matching runs.
+        """
+        if not query:
+            return set(self._hash_by_run)
+        candidates = sorted(
+            (self._runs_by_item.get(
+                (str(key), dumps_canonical(canonicalize_value(value))), set())
+             for key, value in query.items()), key=len)
+        return set(candidates[0]).intersection(*candidates[1:])
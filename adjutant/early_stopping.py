@@ -0,0 +1,298 @@
+"""Contains the SuccessiveHalving class, which decides when to stop
+unpromising trials by asynchronous successive halving (ASHA), and the
+EarlyStopper class, which applies it to running jobs using their live WandB
+histories."""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, \
+    TYPE_CHECKING
+import asyncio
+import bisect
+import math
+from adjutant.job_scheduler import Job, JobScheduler, JOB_STOPPED
+from adjutant.leaderboard import MINIMIZE, MAXIMIZE
+if TYPE_CHECKING:
+    from wandb.apis.public import Api, Run
+
+DEFAULT_METRIC = 'val_loss'
+DEFAULT_MIN_STEP = 1
+DEFAULT_REDUCTION_FACTOR = 3
+STEP_KEY = '_step'
+
+
+class SuccessiveHalving:
+    """Asynchronous successive halving over one bracket of trials. Rungs are
+    placed at steps min_step * reduction_factor ** k. When a trial reaches a
+    rung, its metric value there is compared with those of all trials that
+    reached the rung before it, and the trial is stopped unless it is in the
+    best 1 / reduction_factor of them. Because decisions never wait for other
+    trials to catch up, a slot freed by a stopped trial can be reused
+    immediately."""
+    direction: str
+    min_step: int
+    reduction_factor: int
+    max_step: Optional[int]
+    _rung_keys: List[List[float]]
+    _next_rungs: Dict[Any, int]
+    _last_values: Dict[Any, float]
+
+    def __init__(
+            self,
+            direction: str = MINIMIZE,
+            min_step: int = DEFAULT_MIN_STEP,
+            reduction_factor: int = DEFAULT_REDUCTION_FACTOR,
+            max_step: Optional[int] = None) -> None:
+        """Instantiates the object.
+
+        :param direction: MINIMIZE if lower metric values are better, MAXIMIZE
+            if higher values are better.
+        :param min_step: The step of the first rung.
+        :param reduction_factor: The factor by which the rungs' steps grow and
+            the fraction of trials kept at each rung shrinks. Must be at least
+            2.
+        :param max_step: The step beyond which there are no more rungs, or None
+            for no limit.
+        """
+        if direction not in (MINIMIZE, MAXIMIZE):
+            raise ValueError(f'direction must be {MINIMIZE!r} or '
+                             f'{MAXIMIZE!r}, not {direction!r}.')
+        if min_step < 1:
+            raise ValueError('min_step must be at least 1.')
+        if reduction_factor < 2:
+            raise ValueError('reduction_factor must be at least 2.')
+        self.direction = direction
+        self.min_step = min_step
+        self.reduction_factor = reduction_factor
+        self.max_step = max_step
+        self._rung_keys = []
+        self._next_rungs = {}
+        self._last_values = {}
+
+    def get_rung_step(self, rung: int) -> Optional[int]:
+        """Returns the step of the rung.
+
+        :param rung: The index of the rung, starting at 0.
+        :return: The step of the rung, or None if it is beyond max_step.
+        """
+        step = self.min_step * self.reduction_factor ** rung
+        if self.max_step is not None and step > self.max_step:
+            return None
+        return step
+
+    def _get_key(self, value: Any) -> float:
+        """Returns the sort key for a metric value, so that better values sort
+        first in either direction. Values that are not finite numbers sort
+        last.
+
+        :param value: The metric value.
+        :return: The sort key.
+        """
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+                not math.isfinite(value):
+            return math.inf
+        return value if self.direction == MINIMIZE else -value
+
+    def _is_promoted(self, rung: int, value: Any) -> bool:
+        """Records a trial's value at the rung and returns True if the trial is
+        in the best 1 / reduction_factor of the trials at the rung so far.
+
+        :param rung: The index of the rung.
+        :param value: The trial's metric value at the rung.
+        :return: True if the trial may continue, False if it should stop.
+        """
+        while len(self._rung_keys) <= rung:
+            self._rung_keys.append([])
+        keys = self._rung_keys[rung]
+        key = self._get_key(value)
+        bisect.insort(keys, key)
+        num_kept = max(1, len(keys) // self.reduction_factor)
+        return key <= keys[num_kept - 1] and key != math.inf
+
+    def report(self, trial: Any, step: int, value: Any) -> bool:
+        """Records a trial's metric value at a step and returns True if the
+        trial should stop. A trial's reports must be in step order.
+
+        :param trial: The trial's unique identifier.
+        :param step: The step at which the value was logged.
+        :param value: The trial's metric value.
+        :return: True if the trial should stop, False otherwise.
+        """
+        rung = self._next_rungs.get(trial, 0)
+        should_stop = False
+        rung_step = self.get_rung_step(rung)
+        while rung_step is not None and step >= rung_step:
+            # The value at a rung is the last one logged at or before it.
+            rung_value = value if step == rung_step or \
+                trial not in self._last_values else self._last_values[trial]
+            rung += 1
+            if not self._is_promoted(rung - 1, rung_value):
+                should_stop = True
+                break
+            rung_step = self.get_rung_step(rung)
+        self._next_rungs[trial] = rung
+        self._last_values[trial] = value
+        return should_stop
+
+    def forget(self, trial: Any) -> None:
+        """Drops a finished trial's progress. Its values at the rungs it
+        reached are still used to judge the other trials.
+
+        :param trial: The trial's unique identifier.
+        """
+        self._next_rungs.pop(trial, None)
+        self._last_values.pop(trial, None)
+
+
+def get_run(api: 'Api', run_path: str) -> Optional['Run']:
+    """Returns a run, or None if it does not exist. This function makes a
+    blocking WandB API call and is meant to run in a background thread.
+
+    :param api: The WandB API.
+    :param run_path: The path to the run, of the form entity/project/run_id.
+    :return: The run, or None if it does not exist yet, e.g., because the
+        experiment is still starting.
+    """
+    # wandb is imported here rather than at the top of the module because it
+    # takes seconds to import, and the caller has already imported it to make
+    # the API client.
+    # pylint: disable=import-outside-toplevel
+    from wandb.errors import CommError
+    try:
+        return api.run(run_path)
+    except (ValueError, CommError):
+        # Newer versions of wandb raise a ValueError subclass for missing runs.
+        return None
+
+
+def get_run_history(
+        api: 'Api',
+        run_path: str,
+        metric: str,
+        min_step: int) -> List[Tuple[int, Any]]:
+    """Returns a run's logged values of the metric from min_step onward. This
+    function makes blocking WandB API calls and is meant to run in a background
+    thread.
+
+    :param api: The WandB API.
+    :param run_path: The path to the run, of the form entity/project/run_id.
+    :param metric: The metric.
+    :param min_step: The first step to fetch.
+    :return: The list of (step, value) tuples in step order. Empty if the run
+        does not exist yet, e.g., because the experiment is still starting.
+    """
+    run = get_run(api, run_path)
+    if run is None:
+        return []
+    return [(row[STEP_KEY], row[metric])
+            for row in run.scan_history(keys=[STEP_KEY, metric],
+                                        min_step=min_step)]
+
+
+class EarlyStopper:
+    """Stops running jobs whose metric histories show that they are unlikely
+    to beat the other trials in their group. Each job group, e.g., a sweep, is
+    its own successive halving bracket; standalone jobs share one bracket. Only
+    the new part of each job's history is fetched on each check."""
+    metric: str
+    _direction: str
+    _min_step: int
+    _reduction_factor: int
+    _max_step: Optional[int]
+    _brackets: Dict[Optional[str], SuccessiveHalving]
+    _cursors: Dict[int, int]
+
+    def __init__(
+            self,
+            metric: str = DEFAULT_METRIC,
+            direction: str = MINIMIZE,
+            min_step: int = DEFAULT_MIN_STEP,
+            reduction_factor: int = DEFAULT_REDUCTION_FACTOR,
+            max_step: Optional[int] = None) -> None:
+        """Instantiates the object.
+
+        :param metric: The history metric by which to compare trials.
+        :param direction: MINIMIZE if lower metric values are better, MAXIMIZE
+            if higher values are better.
+        :param min_step: The step of the first rung.
+        :param reduction_factor: The factor by which the rungs' steps grow and
+            the fraction of trials kept at each rung shrinks.
+        :param max_step: The step beyond which there are no more rungs, or None
+            for no limit.
+        """
+        # Fail fast on invalid arguments rather than on the first check.
+        _ = SuccessiveHalving(direction, min_step, reduction_factor, max_step)
+        self.metric = metric
+        self._direction = direction
+        self._min_step = min_step
+        self._reduction_factor = reduction_factor
+        self._max_step = max_step
+        self._brackets = {}
+        self._cursors = {}
+
+    def get_bracket(self, group: Optional[str]) -> SuccessiveHalving:
+        """Returns the successive halving bracket for the job group, creating
+        it if necessary.
+
+        :param group: The job group, or None for standalone jobs.
+        :return: The successive halving bracket for the job group.
+        """
+        if group not in self._brackets:
+            self._brackets[group] = SuccessiveHalving(
+                self._direction, self._min_step, self._reduction_factor,
+                self._max_step)
+        return self._brackets[group]
+
+    def forget_group(self, group: str) -> None:
+        """Drops the bracket of a job group whose jobs have all finished, e.g.,
+        a completed sweep.
+
+        :param group: The job group.
+        """
+        self._brackets.pop(group, None)
+
+    def observe(self, job: Job, rows: List[Tuple[int, Any]]) -> bool:
+        """Records the new rows of a job's history and returns True if the job
+        should stop.
+
+        :param job: The job.
+        :param rows: The (step, value) tuples logged since the last
+            observation, in step order.
+        :return: True if the job should stop, False otherwise.
+        """
+        bracket = self.get_bracket(job.group)
+        for step, value in rows:
+            self._cursors[job.id] = step + 1
+            if bracket.report(job.id, step, value):
+                return True
+        return False
+
+    async def check(
+            self,
+            scheduler: JobScheduler,
+            fetch_history: Callable[[Job, str, int],
+                                    Awaitable[List[Tuple[int, Any]]]]
+    ) -> List[Job]:
+        """Fetches the new history of every running job and stops the jobs that
+        fall below the cutoff at a rung.
+
+        :param scheduler: The scheduler running the jobs.
+        :param fetch_history: A coroutine function that takes a job, the
+            metric, and the first step to fetch, and returns the job's new
+            (step, value) tuples in step order.
+        :return: The jobs that were stopped.
+        """
+        jobs = scheduler.get_running_jobs()
+        histories = await asyncio.gather(
+            *(fetch_history(job, self.metric, self._cursors.get(job.id, 0))
+              for job in jobs))
+        stopped = []
+        for job, rows in zip(jobs, histories):
+            if self.observe(job, rows) and \
+                    await scheduler.cancel(job.id, status=JOB_STOPPED):
+                stopped.append(job)
+        running_ids = {job.id for job in scheduler.get_running_jobs()}
+        for job_id in self._cursors.keys() - running_ids:
+            for bracket in self._brackets.values():
+                bracket.forget(job_id)
+        self._cursors = {job_id: cursor for job_id, cursor
+                         in self._cursors.items() if job_id in running_ids}
+        return stopped
@@ -0,0 +1,241 @@
+"""Contains the JobLog class, which captures a running job's output from
+non-blocking pipes into a bounded ring buffer of lines, optionally also
+writing it to a rotating log file."""
+
+from typing import BinaryIO, Deque, List, Optional
+import asyncio
+import collections
+import logging
+import os
+
+DEFAULT_MAX_LOG_LINES = 1000
+DEFAULT_MAX_LINE_LENGTH = 1000
+DEFAULT_MAX_LOG_FILE_BYTES = 10 * 2 ** 20
+DEFAULT_LOG_FILE_BACKUPS = 3
+DEFAULT_DRAIN_TIMEOUT_SECONDS = 5
+READ_CHUNK_BYTES = 2 ** 16
+TRUNCATION_MARKER = ' [truncated]'
+LINE_SEPARATOR = b'\n'
+CARRIAGE_RETURN = b'\r'
+ENCODING = 'utf-8'
+
+
+class RotatingLogFile:
+    """An append-only log file that is rotated when it grows past max_bytes:
+    the file is renamed with the suffix .1, older backups are renamed with the
+    next suffix, and at most backup_count backups are kept."""
+    filename: str
+    max_bytes: int
+    backup_count: int
+    _file: Optional[BinaryIO]
+    _size: int
+
+    def __init__(
+            self,
+            filename: str,
+            max_bytes: int = DEFAULT_MAX_LOG_FILE_BYTES,
+            backup_count: int = DEFAULT_LOG_FILE_BACKUPS) -> None:
+        """Instantiates the object and opens the file for appending.
+
+        :param filename: The path to the log file.
+        :param max_bytes: The size past which the file is rotated.
+        :param backup_count: The number of rotated files to keep.
+        """
+        if max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1.')
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        # pylint: disable=consider-using-with
+        self._file = open(filename, 'ab')
+        self._size = self._file.tell()
+
+    def write(self, data: bytes) -> None:
+        """Appends the data, rotating the file first if it would grow past
+        max_bytes.
+
+        :param data: The data, ending at a line break.
+        """
+        if self._file is None:
+            return
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def flush(self) -> None:
+        """Flushes the file's buffer to the operating system."""
+        if self._file is not None:
+            self._file.flush()
+
+    def _rotate(self) -> None:
+        """Renames the file and its backups and starts a new file."""
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f'{self.filename}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.filename}.{index + 1}')
+        if self.backup_count:
+            os.replace(self.filename, f'{self.filename}.1')
+        # pylint: disable=consider-using-with
+        self._file = open(self.filename, 'wb')
+        self._size = 0
+
+    def close(self) -> None:
+        """Closes the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class JobLog:
+    """The captured output of one job. Streams are read in the background in
+    chunks, so the event loop never blocks on a pipe and a chatty job cannot
+    fill the pipe and stall. Only the last max_lines lines are kept, each
+    truncated to max_line_length bytes, so memory stays bounded however much
+    the job prints. A carriage return starts the current line over, as on a
+    terminal, so progress bars keep only their latest state."""
+    # pylint: disable=too-many-instance-attributes
+    max_lines: int
+    max_line_length: int
+    lines: Deque[str]
+    num_lines: int
+    num_bytes: int
+    _log_file: Optional[RotatingLogFile]
+    _readers: List[asyncio.Task]
+
+    def __init__(
+            self,
+            max_lines: int = DEFAULT_MAX_LOG_LINES,
+            max_line_length: int = DEFAULT_MAX_LINE_LENGTH,
+            log_file: Optional[RotatingLogFile] = None) -> None:
+        """Instantiates the object.
+
+        :param max_lines: The number of most recent lines to keep in memory.
+        :param max_line_length: The maximum number of bytes kept per line.
+        :param log_file: The file to which to also write every line, or None.
+        """
+        if max_lines < 1:
+            raise ValueError('max_lines must be at least 1.')
+        if max_line_length < 1:
+            raise ValueError('max_line_length must be at least 1.')
+        self.max_lines = max_lines
+        self.max_line_length = max_line_length
+        self.lines = collections.deque(maxlen=max_lines)
+        self.num_lines = 0
+        self.num_bytes = 0
+        self._log_file = log_file
+        self._readers = []
+
+    def add_line(self, line: bytes) -> None:
+        """Records one line of output.
+
+        :param line: The line, without its line break.
+        """
+        truncated = len(line) > self.max_line_length
+        text = line[:self.max_line_length].decode(ENCODING, errors='replace')
+        if truncated:
+            text += TRUNCATION_MARKER
+        self.lines.append(text)
+        self.num_lines += 1
+        if self._log_file is not None:
+            self._log_file.write(text.encode(ENCODING) + LINE_SEPARATOR)
+
+    def get_tail(self, num_lines: int) -> List[str]:
+        """Returns the most recent lines.
+
+        :param num_lines: The maximum number of lines to return.
+        :return: At most num_lines lines, oldest first.
+        """
+        if num_lines < 1:
+            return []
+        start = max(0, len(self.lines) - num_lines)
+        return [self.lines[index] for index in range(start, len(self.lines))]
+
+    def attach(self, stream: asyncio.StreamReader) -> None:
+        """Starts reading the stream in the background until it ends.
+
+        :param stream: The stream, e.g., a subprocess's stdout.
+        """
+        self._readers.append(asyncio.ensure_future(self._read(stream)))
+
+    async def _read(self, stream: asyncio.StreamReader) -> None:
+        """Records the stream's lines until it ends. At most one byte more
+        than max_line_length of the current line is held in memory, so that
+        truncation is still detected.
+
+        :param stream: The stream.
+        """
+        partial = bytearray()
+        # Whether a carriage return was read since the last line break. It
+        # only takes effect when more text follows, so that \r\n line breaks
+        # split across reads do not erase their line.
+        is_returned = False
+        while True:
+            chunk = await stream.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            self.num_bytes += len(chunk)
+            segments = chunk.split(LINE_SEPARATOR)
+            for index, segment in enumerate(segments):
+                for part_index, part in enumerate(
+                        segment.split(CARRIAGE_RETURN)):
+                    is_returned = is_returned or part_index > 0
+                    if not part:
+                        continue
+                    if is_returned:
+                        partial.clear()
+                        is_returned = False
+                    partial += part[:self.max_line_length + 1 - len(partial)]
+                if index < len(segments) - 1:
+                    self.add_line(bytes(partial))
+                    partial.clear()
+                    is_returned = False
+            if self._log_file is not None:
+                self._log_file.flush()
+        if partial:
+            self.add_line(bytes(partial))
+
+    async def drain(
+            self,
+            timeout_seconds: float = DEFAULT_DRAIN_TIMEOUT_SECONDS) -> None:
+        """Waits until the attached streams end, e.g., after the job's process
+        exits, then closes the log file. Streams still open after the timeout,
+        e.g., because the job left a child process running, are abandoned.
+
+        :param timeout_seconds: The maximum number of seconds to wait.
+        """
+        if self._readers:
+            _, pending = await asyncio.wait(self._readers,
+                                            timeout=timeout_seconds)
+            for reader in pending:
+                logging.warning('Abandoning output stream still open after '
+                                '%s seconds', timeout_seconds)
+                reader.cancel()
+            self._readers = []
+        self.close()
+
+    def close(self) -> None:
+        """Stops reading and closes the log file. The kept lines remain
+        available."""
+        for reader in self._readers:
+            reader.cancel()
+        self._readers = []
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+
+async def open_pipe_reader(fd: int) -> asyncio.StreamReader:
+    """Returns a stream that reads the pipe without blocking the event loop.
+    The stream takes ownership of the file descriptor.
+
+    :param fd: The read end of the pipe.
+    :return: The stream.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader),
+        os.fdopen(fd, 'rb', buffering=0))
+    return reader
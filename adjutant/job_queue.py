@@ -0,0 +1,521 @@
+"""Contains the JobQueue class, a SQLite database shared by Adjutant and its
+agents, through which Adjutant queues experiments and agents on training hosts
+claim them, heartbeat, and report their exit codes, and the AgentLauncher
+class, which lets a JobScheduler launch experiments through the queue."""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from adjutant.job_scheduler import Job, JOB_QUEUED, JOB_RUNNING, \
+    JOB_FINISHED, JOB_FAILED, JOB_CANCELLED, JOB_STOPPED
+
+BUSY_TIMEOUT_SECONDS = 30
+QUEUE_THREAD_NAME_PREFIX = 'adjutant-job-queue'
+DEFAULT_POLL_SECONDS = 2
+DEFAULT_AGENT_TIMEOUT_SECONDS = 60
+LOST_EXIT_CODE = -1
+CANCELLED_EXIT_CODE = -15
+DONE_STATUSES = (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED, JOB_STOPPED)
+# SQLite's default limit on the number of parameters in one query is 999.
+MAX_QUERY_PARAMETERS = 500
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS jobs ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+    'hyperparams TEXT NOT NULL, '
+    'run_id TEXT NOT NULL, '
+    'priority INTEGER NOT NULL, '
+    'slots INTEGER NOT NULL, '
+    'status TEXT NOT NULL, '
+    'agent TEXT, '
+    'exit_code INTEGER, '
+    'cancel_requested INTEGER NOT NULL DEFAULT 0, '
+    'submitted_at REAL NOT NULL, '
+    'started_at REAL, '
+    'finished_at REAL)',
+    'CREATE INDEX IF NOT EXISTS queued_jobs ON jobs (status, priority, id)',
+    'CREATE TABLE IF NOT EXISTS agents ('
+    'name TEXT PRIMARY KEY, '
+    'max_slots INTEGER NOT NULL, '
+    'used_slots INTEGER NOT NULL, '
+    'heartbeat_at REAL NOT NULL)'
+)
+
+
+def create_queue_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Returns a single-thread executor in which to run JobQueue calls. The
+    calls are serialized by the queue's lock anyway, and a dedicated thread
+    keeps heartbeats and reports flowing however busy the event loop's
+    default executor is.
+
+    :return: The executor.
+    """
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix=QUEUE_THREAD_NAME_PREFIX)
+
+
+class QueuedJob:
+    """An experiment in a JobQueue, as seen by the agent that claimed it."""
+    # pylint: disable=too-few-public-methods
+    id: int
+    hyperparams: Dict
+    run_id: str
+    priority: int
+    slots: int
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, job_id: int, hyperparams: Dict, run_id: str,
+                 priority: int, slots: int) -> None:
+        """Instantiates the object.
+
+        :param job_id: The job's ID in the queue.
+        :param hyperparams: The hyperparameters with which to run the
+            experiment.
+        :param run_id: The WandB run ID that the experiment must use.
+        :param priority: The priority of the job.
+        :param slots: The number of the agent's slots that the job occupies.
+        """
+        self.id = job_id
+        self.hyperparams = hyperparams
+        self.run_id = run_id
+        self.priority = priority
+        self.slots = slots
+
+
+class AgentInfo:
+    """The latest heartbeat of an agent."""
+    # pylint: disable=too-few-public-methods
+    name: str
+    max_slots: int
+    used_slots: int
+    heartbeat_at: float
+
+    def __init__(self, name: str, max_slots: int, used_slots: int,
+                 heartbeat_at: float) -> None:
+        """Instantiates the object.
+
+        :param name: The agent's unique name, e.g., host:pid.
+        :param max_slots: The number of slots on the agent's host.
+        :param used_slots: The number of slots its running jobs occupy.
+        :param heartbeat_at: The time of the heartbeat, in seconds since the
+            epoch.
+        """
+        self.name = name
+        self.max_slots = max_slots
+        self.used_slots = used_slots
+        self.heartbeat_at = heartbeat_at
+
+
+class JobQueue:
+    """A queue of experiments in a SQLite database that several processes,
+    possibly on several hosts, open at once. Adjutant submits jobs; each agent
+    claims as many of the highest-priority queued jobs as fit in its free
+    slots in one short transaction, so no job is claimed twice and agents
+    never wait on each other for long. The database file must be on a
+    filesystem with working locks, e.g., a local disk or a shared volume
+    that supports POSIX locks. All methods are safe to call from any
+    thread. Async callers should run the methods in an executor of their own,
+    e.g., create_queue_executor, rather than the event loop's default
+    executor, so that queue I/O never waits behind unrelated work."""
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, filename: str) -> None:
+        """Instantiates the object, creating the database if it does not exist.
+
+        :param filename: The path to the SQLite database file.
+        """
+        # Transactions are managed explicitly, so that claims can take the
+        # write lock before reading.
+        self._connection = sqlite3.connect(
+            filename, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None,
+            check_same_thread=False)
+        self._lock = threading.Lock()
+        # WAL lets agents read while another process writes.
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._transaction():
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Holds the lock and a write transaction, committing on success and
+        rolling back on error.
+
+        :return: A context manager that yields the connection.
+        """
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def submit(self, hyperparams: Dict, run_id: str, priority: int = 0,
+               slots: int = 1) -> int:
+        """Queues an experiment.
+
+        :param hyperparams: The hyperparameters with which to run the
+            experiment.
+        :param run_id: The WandB run ID that the experiment must use.
+        :param priority: The priority of the job. Jobs with higher priority are
+            claimed first; jobs with equal priority in submission order.
+        :param slots: The number of an agent's slots that the job occupies.
+        :return: The job's ID in the queue.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                'INSERT INTO jobs (hyperparams, run_id, priority, slots, '
+                'status, submitted_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (json.dumps(hyperparams), run_id, priority, slots, JOB_QUEUED,
+                 time.time()))
+        return cursor.lastrowid
+
+    def claim(self, agent: str, free_slots: int,
+              max_slots: int) -> List[QueuedJob]:
+        """Claims queued jobs for the agent, highest priority first, until the
+        next job does not fit in its free slots. Jobs that need more slots than
+        the agent has in total are left for other agents.
+
+        :param agent: The agent's name.
+        :param free_slots: The number of the agent's free slots.
+        :param max_slots: The total number of the agent's slots.
+        :return: The claimed jobs, which are now running on the agent.
+        """
+        claimed = []
+        with self._transaction() as connection:
+            rows = connection.execute(
+                'SELECT id, hyperparams, run_id, priority, slots FROM jobs '
+                'WHERE status = ? AND slots <= ? ORDER BY priority DESC, id',
+                (JOB_QUEUED, max_slots))
+            for row in rows:
+                if row[4] > free_slots:
+                    break
+                free_slots -= row[4]
+                claimed.append(QueuedJob(row[0], json.loads(row[1]),
+                                         *row[2:]))
+            now = time.time()
+            connection.executemany(
+                'UPDATE jobs SET status = ?, agent = ?, started_at = ? '
+                'WHERE id = ?',
+                [(JOB_RUNNING, agent, now, job.id) for job in claimed])
+        return claimed
+
+    def finish(self, job_id: int, status: str,
+               exit_code: Optional[int]) -> None:
+        """Records the final status and exit code of a claimed job.
+
+        :param job_id: The job's ID in the queue.
+        :param status: The job's final status.
+        :param exit_code: The exit code of the job's process, or None if it did
+            not run.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, exit_code = ?, finished_at = ? '
+                'WHERE id = ? AND status = ?',
+                (status, exit_code, time.time(), job_id, JOB_RUNNING))
+
+    def request_cancel(self, job_ids: Iterable[int]) -> None:
+        """Cancels queued jobs and asks the agents running the others to
+        terminate them.
+
+        :param job_ids: The IDs of the jobs in the queue.
+        """
+        job_ids = [(job_id,) for job_id in job_ids]
+        with self._transaction() as connection:
+            connection.executemany(
+                'UPDATE jobs SET status = ?, exit_code = ?, finished_at = ? '
+                'WHERE id = ? AND status = ?',
+                [(JOB_CANCELLED, CANCELLED_EXIT_CODE, time.time(), job_id,
+                  JOB_QUEUED) for job_id, in job_ids])
+            connection.executemany(
+                'UPDATE jobs SET cancel_requested = 1 WHERE id = ?', job_ids)
+
+    def get_cancel_requests(self, agent: str,
+                            job_ids: Iterable[int]) -> List[int]:
+        """Returns which of the jobs that the agent is running it should
+        terminate: those that Adjutant cancelled, and those that are no longer
+        running on the agent, e.g., because they were failed when the agent
+        was considered lost.
+
+        :param agent: The agent's name.
+        :param job_ids: The IDs of the jobs in the queue that the agent is
+            running.
+        :return: The IDs of the jobs to terminate.
+        """
+        job_ids = list(job_ids)
+        cancels = []
+        with self._lock:
+            for start in range(0, len(job_ids), MAX_QUERY_PARAMETERS):
+                batch = job_ids[start:start + MAX_QUERY_PARAMETERS]
+                placeholders = ', '.join('?' * len(batch))
+                cancels.extend(row[0] for row in self._connection.execute(
+                    f'SELECT id FROM jobs WHERE id IN ({placeholders}) AND '
+                    f'(status != ? OR agent IS NOT ? OR cancel_requested = 1)',
+                    (*batch, JOB_RUNNING, agent)))
+        return cancels
+
+    def get_states(
+            self, job_ids: Iterable[int]
+    ) -> Dict[int, Tuple[str, Optional[int], Optional[str]]]:
+        """Returns the current state of each job.
+
+        :param job_ids: The IDs of the jobs in the queue.
+        :return: A dict whose keys are the job IDs and whose values are 3-tuples
+            of each job's status, exit code, and agent.
+        """
+        job_ids = list(job_ids)
+        states = {}
+        with self._lock:
+            for start in range(0, len(job_ids), MAX_QUERY_PARAMETERS):
+                batch = job_ids[start:start + MAX_QUERY_PARAMETERS]
+                placeholders = ', '.join('?' * len(batch))
+                for row in self._connection.execute(
+                        f'SELECT id, status, exit_code, agent FROM jobs '
+                        f'WHERE id IN ({placeholders})', batch):
+                    states[row[0]] = row[1:]
+        return states
+
+    def heartbeat(self, agent: str, max_slots: int, used_slots: int) -> None:
+        """Records that the agent is alive and how many slots it uses.
+
+        :param agent: The agent's name.
+        :param max_slots: The total number of the agent's slots.
+        :param used_slots: The number of slots its running jobs occupy.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO agents (name, max_slots, used_slots, '
+                'heartbeat_at) VALUES (?, ?, ?, ?)',
+                (agent, max_slots, used_slots, time.time()))
+
+    def remove_agent(self, agent: str) -> None:
+        """Forgets an agent that is shutting down.
+
+        :param agent: The agent's name.
+        """
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM agents WHERE name = ?', (agent,))
+
+    def get_agents(self) -> List[AgentInfo]:
+        """Returns the latest heartbeat of every agent.
+
+        :return: The agents, sorted by name.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT name, max_slots, used_slots, heartbeat_at FROM agents '
+                'ORDER BY name').fetchall()
+        return [AgentInfo(*row) for row in rows]
+
+    def fail_lost_jobs(self, timeout_seconds: float) -> List[int]:
+        """Marks as failed the running jobs of agents that have not sent a
+        heartbeat in timeout_seconds, e.g., because their host went down, and
+        forgets those agents. The jobs are not retried, since they may have
+        partly run.
+
+        :param timeout_seconds: The number of seconds after which an agent is
+            considered lost.
+        :return: The IDs of the failed jobs.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            lost = [row[0] for row in connection.execute(
+                'SELECT name FROM agents WHERE heartbeat_at < ?',
+                (now - timeout_seconds,))]
+            if not lost:
+                return []
+            placeholders = ', '.join('?' * len(lost))
+            job_ids = [row[0] for row in connection.execute(
+                f'SELECT id FROM jobs WHERE status = ? AND agent IN '
+                f'({placeholders})', (JOB_RUNNING, *lost))]
+            connection.executemany(
+                'UPDATE jobs SET status = ?, exit_code = ?, finished_at = ? '
+                'WHERE id = ?',
+                [(JOB_FAILED, LOST_EXIT_CODE, now, job_id)
+                 for job_id in job_ids])
+            connection.execute(
+                f'DELETE FROM agents WHERE name IN ({placeholders})', lost)
+        return job_ids
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class RemoteJobProcess:
+    """An experiment queued for or running on an agent. Has the same interface
+    as asyncio.subprocess.Process, so JobScheduler can reap and terminate
+    it."""
+    queue_id: int
+    returncode: Optional[int]
+    _launcher: 'AgentLauncher'
+    _exited: asyncio.Future
+
+    def __init__(self, queue_id: int, launcher: 'AgentLauncher') -> None:
+        """Instantiates the object.
+
+        :param queue_id: The job's ID in the queue.
+        :param launcher: The launcher that polls the queue for the job's exit.
+        """
+        self.queue_id = queue_id
+        self.returncode = None
+        self._launcher = launcher
+        self._exited = asyncio.get_running_loop().create_future()
+
+    def terminate(self) -> None:
+        """Cancels the job if no agent has claimed it, or asks its agent to
+        terminate it."""
+        self._launcher.request_cancel(self.queue_id)
+
+    def set_exit_code(self, exit_code: int) -> None:
+        """Records the job's exit code and wakes up anyone waiting on it.
+
+        :param exit_code: The exit code reported by the job's agent.
+        """
+        self.returncode = exit_code
+        if not self._exited.done():
+            self._exited.set_result(exit_code)
+
+    async def wait(self) -> int:
+        """Waits for the job to exit and returns its exit code.
+
+        :return: The job's exit code.
+        """
+        return await asyncio.shield(self._exited)
+
+
+class AgentLauncher:
+    """Launches experiments by submitting them to a JobQueue, from which agents
+    on training hosts claim them; see adjutant/agent.py. One background task
+    polls the queue every poll_seconds for the exit codes of all outstanding
+    jobs, sends any cancellations, and fails the jobs of agents that have not
+    sent a heartbeat in agent_timeout_seconds. Use launch as a JobScheduler's
+    launcher, with the scheduler's max_slots at least the total number of
+    slots of the agents, so that the agents are never starved."""
+    queue: JobQueue
+    poll_seconds: float
+    agent_timeout_seconds: float
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _processes: Dict[int, RemoteJobProcess]
+    _cancels: Set[int]
+    _poller: Optional[asyncio.Task]
+
+    def __init__(
+            self,
+            queue: JobQueue,
+            poll_seconds: float = DEFAULT_POLL_SECONDS,
+            agent_timeout_seconds: float = DEFAULT_AGENT_TIMEOUT_SECONDS
+    ) -> None:
+        """Instantiates the object.
+
+        :param queue: The queue shared with the agents.
+        :param poll_seconds: The number of seconds between polls of the queue.
+        :param agent_timeout_seconds: The number of seconds without a heartbeat
+            after which an agent is considered lost and its running jobs fail
+            with LOST_EXIT_CODE.
+        """
+        if poll_seconds <= 0:
+            raise ValueError('poll_seconds must be positive.')
+        if agent_timeout_seconds <= 0:
+            raise ValueError('agent_timeout_seconds must be positive.')
+        self.queue = queue
+        self.poll_seconds = poll_seconds
+        self.agent_timeout_seconds = agent_timeout_seconds
+        self._executor = create_queue_executor()
+        self._processes = {}
+        self._cancels = set()
+        self._poller = None
+
+    async def launch(self, job: Job) -> RemoteJobProcess:
+        """Queues the job for the agents.
+
+        :param job: The job to start.
+        :return: The handle through which to wait for and terminate the job.
+        :raises OSError: If the job could not be queued.
+        """
+        try:
+            queue_id = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.queue.submit, job.hyperparams,
+                job.run_id, job.priority, job.slots)
+        except sqlite3.Error as err:
+            raise OSError(f'Could not queue job {job.id}: {err}') from err
+        process = RemoteJobProcess(queue_id, self)
+        self._processes[queue_id] = process
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+        return process
+
+    async def get_agents(self) -> List[AgentInfo]:
+        """Returns the latest heartbeat of every agent.
+
+        :return: The agents, sorted by name.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.queue.get_agents)
+
+    def request_cancel(self, queue_id: int) -> None:
+        """Cancels the job on the next poll.
+
+        :param queue_id: The job's ID in the queue.
+        """
+        self._cancels.add(queue_id)
+
+    async def _poll(self) -> None:
+        """Polls the queue until no launched jobs are outstanding."""
+        loop = asyncio.get_running_loop()
+        while self._processes:
+            await asyncio.sleep(self.poll_seconds)
+            cancels, self._cancels = self._cancels, set()
+            try:
+                states = await loop.run_in_executor(
+                    self._executor, self._sync, cancels,
+                    list(self._processes))
+            except sqlite3.Error:
+                logging.exception('Could not poll the job queue')
+                self._cancels |= cancels
+                continue
+            for queue_id, (status, exit_code, _) in states.items():
+                if status not in DONE_STATUSES:
+                    continue
+                process = self._processes.pop(queue_id, None)
+                if process is None:
+                    continue
+                if exit_code is None:
+                    exit_code = CANCELLED_EXIT_CODE \
+                        if status == JOB_CANCELLED else LOST_EXIT_CODE
+                process.set_exit_code(exit_code)
+
+    def _sync(
+            self, cancels: Set[int], queue_ids: List[int]
+    ) -> Dict[int, Tuple[str, Optional[int], Optional[str]]]:
+        """Runs in the queue thread. Sends the cancellations, fails the
+        jobs of lost agents, and returns the state of each outstanding job.
+
+        :param cancels: The IDs of the jobs to cancel.
+        :param queue_ids: The IDs of the outstanding jobs.
+        :return: The state of each job, as returned by JobQueue.get_states.
+        """
+        if cancels:
+            self.queue.request_cancel(cancels)
+        for queue_id in self.queue.fail_lost_jobs(self.agent_timeout_seconds):
+            logging.warning('Job %d failed because its agent was lost',
+                            queue_id)
+        return self.queue.get_states(queue_ids)
+
+    def close(self) -> None:
+        """Stops polling and closes the queue. Jobs already queued or running
+        on agents are not affected."""
+        if self._poller is not None:
+            self._poller.cancel()
+        self._executor.shutdown(wait=False)
+        self.queue.close()
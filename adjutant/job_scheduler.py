@@ -0,0 +1,485 @@
+"""Contains the JobScheduler class, which queues experiment launches and runs
+them as asynchronous subprocesses under a concurrency limit."""
+
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, \
+    Protocol, Tuple
+import asyncio
+import collections
+import functools
+import heapq
+import itertools
+import json
+import logging
+import os
+import secrets
+import time
+from adjutant.job_logs import JobLog, RotatingLogFile, DEFAULT_MAX_LOG_LINES
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_STOPPED = 'stopped'
+RUN_ID_ENVIRONMENT_VAR = 'WANDB_RUN_ID'
+DEFAULT_MAX_SLOTS = 1
+DEFAULT_JOB_HISTORY = 100
+# Job IDs restart from 1 with each scheduler, so the run ID keeps the files
+# of different runs apart.
+LOG_FILENAME_FORMAT = 'job-{job_id}-{run_id}.log'
+
+
+class JobProcess(Protocol):
+    """The interface of a running job's process, which both
+    asyncio.subprocess.Process and worker_pool.WorkerProcess implement."""
+    returncode: Optional[int]
+
+    def terminate(self) -> None:
+        """Asks the process to stop."""
+
+    async def wait(self) -> int:
+        """Waits for the process to exit and returns its exit code."""
+
+
+class Job:
+    """An experiment submitted to a JobScheduler."""
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    id: int
+    hyperparams: Dict
+    priority: int
+    slots: int
+    status: str
+    exit_code: Optional[int]
+    submitted_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    process: Optional[JobProcess]
+    cancel_requested: bool
+    cancel_status: str
+    group: Optional[str]
+    run_id: str
+    log: Optional[JobLog]
+    _done: asyncio.Event
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+            self,
+            job_id: int,
+            hyperparams: Dict,
+            priority: int = 0,
+            slots: int = 1,
+            group: Optional[str] = None,
+            run_id: Optional[str] = None) -> None:
+        """Instantiates the object.
+
+        :param job_id: The unique ID of the job.
+        :param hyperparams: The hyperparameters with which to run the
+            experiment.
+        :param priority: The priority of the job. Jobs with higher priority are
+            started first; jobs with equal priority are started in submission
+            order.
+        :param slots: The number of the scheduler's slots that the job occupies
+            while it runs.
+        :param group: The name of the group of related jobs, e.g., a sweep, to
+            which the job belongs, or None if it is a standalone job.
+        :param run_id: The WandB run ID that the experiment must use, or None
+            to generate a new one.
+        """
+        self.id = job_id
+        self.hyperparams = hyperparams
+        self.priority = priority
+        self.slots = slots
+        self.status = JOB_QUEUED
+        self.exit_code = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.process = None
+        self.cancel_requested = False
+        self.cancel_status = JOB_CANCELLED
+        self.group = group
+        # Passed to the experiment as WANDB_RUN_ID, so that wandb.init uses it
+        # and Adjutant can find the job's run on WandB.
+        self.run_id = run_id or f'adj{secrets.token_hex(5)}{job_id}'
+        # Set when the job starts, if its scheduler captures output.
+        self.log = None
+        self._done = asyncio.Event()
+
+    @property
+    def is_done(self) -> bool:
+        """Returns True if the job has finished, failed, been cancelled, or been
+        stopped early, False otherwise.
+
+        :return: True if the job has finished, failed, been cancelled, or been
+            stopped early, False otherwise.
+        """
+        return self.status in (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED,
+                               JOB_STOPPED)
+
+    async def wait(self) -> None:
+        """Waits until the job has finished, failed, or been cancelled."""
+        await self._done.wait()
+
+    def mark_done(self, status: str, exit_code: Optional[int]) -> None:
+        """Records the job's final status and wakes up anyone waiting on it.
+
+        :param status: The job's final status.
+        :param exit_code: The exit code of the job's process, or None if it did
+            not run.
+        """
+        self.status = status
+        self.exit_code = exit_code
+        self.finished_at = time.time()
+        self.process = None
+        self._done.set()
+
+    def describe(self) -> str:
+        """Returns a one-line, human-readable description of the job.
+
+        :return: A one-line, human-readable description of the job.
+        """
+        description = f'Job {self.id} [{self.status}'
+        if self.exit_code is not None:
+            description += f', exit code {self.exit_code}'
+        if self.started_at is not None:
+            end = self.finished_at or time.time()
+            description += f', {end - self.started_at:.0f}s'
+        return f'{description}]: {json.dumps(self.hyperparams)}'
+
+
+class JobScheduler:
+    """Runs experiments as asynchronous subprocesses. At most max_slots slots'
+    worth of jobs run at once; the rest wait in a priority queue. Each running
+    job's subprocess is awaited in the background, so its exit code is
+    recorded as soon as it exits and no zombie processes accumulate."""
+    # pylint: disable=too-many-instance-attributes
+    _script: Optional[str]
+    _launcher: Callable[[Job], Awaitable[JobProcess]]
+    max_slots: int
+    _used_slots: int
+    _queue: List[Tuple[int, int, Job]]
+    _jobs: Dict[int, Job]
+    _finished_job_ids: Deque[int]
+    _job_ids: itertools.count
+    _queue_sequence: itertools.count
+    _reapers: Dict[int, asyncio.Task]
+    _on_job_done: Optional[Callable[[Job], Awaitable[None]]]
+    max_log_lines: Optional[int]
+    log_directory: Optional[str]
+    num_launched: int
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+            self,
+            script: Optional[str] = None,
+            max_slots: int = DEFAULT_MAX_SLOTS,
+            job_history: int = DEFAULT_JOB_HISTORY,
+            on_job_done: Optional[Callable[[Job], Awaitable[None]]] = None,
+            launcher: Optional[Callable[[Job], Awaitable[JobProcess]]] = None,
+            max_log_lines: Optional[int] = DEFAULT_MAX_LOG_LINES,
+            log_directory: Optional[str] = None
+    ) -> None:
+        """Instantiates the object.
+
+        :param script: The filename of an executable script that runs a new
+            experiment with the given hyperparameters as a JSON-formatted
+            command line argument. Exactly one of script and launcher must be
+            provided.
+        :param max_slots: The number of slots available to running jobs. With
+            the default of one slot per job, this is the maximum number of
+            concurrently running jobs.
+        :param job_history: The number of completed jobs to remember.
+        :param on_job_done: A coroutine function to call with each job that
+            finishes, fails, is cancelled, or is stopped early.
+        :param launcher: A coroutine function that starts a job's experiment
+            and returns its JobProcess, e.g., WorkerPool.launch. Raises OSError
+            if the experiment cannot be started.
+        :param max_log_lines: The number of most recent lines of each job's
+            combined stdout and stderr to keep in its Job.log, or None to let
+            jobs write to this process's stdout and stderr instead. Launchers
+            other than the script must attach the job's output streams to
+            Job.log themselves.
+        :param log_directory: If provided, each job's captured output is also
+            written to LOG_FILENAME_FORMAT in this directory, which is rotated
+            when it grows past job_logs.DEFAULT_MAX_LOG_FILE_BYTES.
+        """
+        if max_slots < 1:
+            raise ValueError('max_slots must be at least 1.')
+        if (script is None) == (launcher is None):
+            raise ValueError('Exactly one of script and launcher must be '
+                             'provided.')
+        self._script = script
+        self._launcher = launcher or self._launch_script
+        self.max_slots = max_slots
+        self._used_slots = 0
+        self._queue = []
+        self._jobs = {}
+        self._finished_job_ids = collections.deque(maxlen=job_history)
+        self._job_ids = itertools.count(1)
+        self._queue_sequence = itertools.count()
+        self._reapers = {}
+        self._on_job_done = on_job_done
+        self.max_log_lines = max_log_lines
+        self.log_directory = log_directory
+        if log_directory is not None:
+            os.makedirs(log_directory, exist_ok=True)
+        self.num_launched = 0
+
+    def get_job(self, job_id: int) -> Optional[Job]:
+        """Returns the job with the given ID.
+
+        :param job_id: The ID of the job.
+        :return: The job with the given ID, or None if there is no such job or
+            it has been forgotten.
+        """
+        return self._jobs.get(job_id)
+
+    def get_queued_jobs(self) -> List[Job]:
+        """Returns the queued jobs in the order in which they will start.
+
+        :return: The queued jobs in the order in which they will start.
+        """
+        return [job for _, _, job in sorted(self._queue)
+                if job.status == JOB_QUEUED]
+
+    def get_running_jobs(self) -> List[Job]:
+        """Returns the running jobs in the order in which they started.
+
+        :return: The running jobs in the order in which they started.
+        """
+        return sorted((job for job in self._jobs.values()
+                       if job.status == JOB_RUNNING),
+                      key=lambda job: job.started_at)
+
+    def get_jobs(self) -> List[Job]:
+        """Returns all remembered jobs in submission order.
+
+        :return: All remembered jobs in submission order.
+        """
+        return sorted(self._jobs.values(), key=lambda job: job.id)
+
+    async def submit(
+            self,
+            hyperparams: Dict,
+            priority: int = 0,
+            slots: int = 1,
+            group: Optional[str] = None,
+            run_id: Optional[str] = None) -> Job:
+        """Queues an experiment and starts it immediately if there are enough
+        free slots.
+
+        :param hyperparams: The hyperparameters with which to run the
+            experiment.
+        :param priority: The priority of the job. Jobs with higher priority are
+            started first.
+        :param slots: The number of slots that the job occupies while it runs.
+        :param group: The name of the group of related jobs to which the job
+            belongs, if any.
+        :param run_id: The WandB run ID that the experiment must use, or None
+            to generate a new one.
+        :return: The submitted job.
+        """
+        if not 1 <= slots <= self.max_slots:
+            raise ValueError(f'slots must be between 1 and {self.max_slots}.')
+        job = Job(next(self._job_ids), hyperparams, priority=priority,
+                  slots=slots, group=group, run_id=run_id)
+        self._jobs[job.id] = job
+        heapq.heappush(self._queue,
+                       (-priority, next(self._queue_sequence), job))
+        await self._dispatch()
+        return job
+
+    async def cancel(self, job_id: int, status: str = JOB_CANCELLED) -> bool:
+        """Cancels a queued job, or terminates a running one. A terminated job
+        is marked with the given status once its process exits.
+
+        :param job_id: The ID of the job to cancel.
+        :param status: The job's final status: JOB_CANCELLED, or JOB_STOPPED if
+            it is being stopped early because it is not promising.
+        :return: True if the job was queued or running, False otherwise.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.is_done:
+            return False
+        job.cancel_requested = True
+        job.cancel_status = status
+        if job.status == JOB_QUEUED:
+            # The queue entry is discarded when it reaches the front.
+            self._complete(job, status, None)
+            await self._dispatch()
+            await self._notify(job)
+        elif job.process is not None and job.process.returncode is None:
+            job.process.terminate()
+        return True
+
+    async def _dispatch(self) -> None:
+        """Starts queued jobs, highest priority first, until the next job does
+        not fit in the free slots."""
+        while self._queue:
+            job = self._queue[0][2]
+            if job.status != JOB_QUEUED:
+                heapq.heappop(self._queue)
+                continue
+            if self._used_slots + job.slots > self.max_slots:
+                return
+            heapq.heappop(self._queue)
+            await self._start(job)
+
+    async def _start(self, job: Job) -> None:
+        """Starts the job's subprocess and begins awaiting its exit in the
+        background.
+
+        :param job: The job to start.
+        """
+        # Reserve the slots before yielding so that a concurrent dispatch
+        # cannot oversubscribe them.
+        self._used_slots += job.slots
+        job.status = JOB_RUNNING
+        try:
+            job.log = self._create_log(job)
+            job.process = await self._launcher(job)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Could not start job %d', job.id)
+            self._used_slots -= job.slots
+            if job.log is not None:
+                job.log.close()
+            self._complete(job, JOB_FAILED, None)
+            await self._notify(job)
+            return
+        job.started_at = time.time()
+        self.num_launched += 1
+        reaper = asyncio.ensure_future(self._reap(job))
+        reaper.add_done_callback(
+            functools.partial(self._on_reaper_done, job))
+        self._reapers[job.id] = reaper
+        if job.cancel_requested:
+            job.process.terminate()
+
+    def _create_log(self, job: Job) -> Optional[JobLog]:
+        """Returns the log in which to capture the job's output.
+
+        :param job: The job to start.
+        :return: The job's log, or None if output is not captured.
+        """
+        if self.max_log_lines is None:
+            return None
+        log_file = None
+        if self.log_directory is not None:
+            log_file = RotatingLogFile(os.path.join(
+                self.log_directory,
+                LOG_FILENAME_FORMAT.format(job_id=job.id, run_id=job.run_id)))
+        return JobLog(self.max_log_lines, log_file=log_file)
+
+    async def _launch_script(self, job: Job) -> JobProcess:
+        """Runs the script in a subprocess with the job's hyperparameters.
+        If the job has a log, the subprocess's stdout and stderr are piped
+        into it.
+
+        :param job: The job to start.
+        :return: The subprocess.
+        """
+        output = asyncio.subprocess.PIPE if job.log is not None else None
+        process = await asyncio.create_subprocess_exec(
+            self._script, json.dumps(job.hyperparams),
+            env={**os.environ, RUN_ID_ENVIRONMENT_VAR: job.run_id},
+            stdout=output, stderr=output)
+        if job.log is not None:
+            job.log.attach(process.stdout)
+            job.log.attach(process.stderr)
+        return process
+
+    async def _reap(self, job: Job) -> None:
+        """Waits for the job's subprocess to exit, records its exit code, and
+        starts queued jobs in the freed slots. The slots are released and the
+        job completed even if waiting fails or this task is cancelled.
+
+        :param job: The running job.
+        """
+        exit_code = None
+        try:
+            exit_code = await job.process.wait()
+            if job.log is not None:
+                # Read the output that the process wrote just before exiting.
+                await job.log.drain()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Could not wait for job %d to exit', job.id)
+        finally:
+            self._release(job, exit_code)
+        await self._dispatch_and_notify(job)
+
+    def _on_reaper_done(self, job: Job, reaper: asyncio.Task) -> None:
+        """Completes the job if its reaper was cancelled, possibly before it
+        started, and dispatches and notifies in a new task, since the reaper
+        could not.
+
+        :param job: The job.
+        :param reaper: The job's finished reaper task.
+        """
+        if not reaper.cancelled():
+            return
+        if not job.is_done:
+            self._release(job, None)
+        asyncio.ensure_future(self._dispatch_and_notify(job))
+
+    def _release(self, job: Job, exit_code: Optional[int]) -> None:
+        """Frees the slots of a job whose process has exited and records its
+        final status.
+
+        :param job: The job.
+        :param exit_code: The exit code of the job's process, or None if it is
+            unknown.
+        """
+        self._used_slots -= job.slots
+        self._reapers.pop(job.id, None)
+        if job.log is not None:
+            job.log.close()
+        if job.cancel_requested:
+            status = job.cancel_status
+        elif exit_code == 0:
+            status = JOB_FINISHED
+        else:
+            status = JOB_FAILED
+        self._complete(job, status, exit_code)
+
+    async def _dispatch_and_notify(self, job: Job) -> None:
+        """Starts queued jobs in the slots that the completed job freed, then
+        calls the on_job_done callback.
+
+        :param job: The completed job.
+        """
+        await self._dispatch()
+        await self._notify(job)
+
+    def _complete(self, job: Job, status: str,
+                  exit_code: Optional[int]) -> None:
+        """Marks the job as done and forgets the oldest completed job if the
+        history is full.
+
+        :param job: The job.
+        :param status: The job's final status.
+        :param exit_code: The exit code of the job's process, or None if it did
+            not run.
+        """
+        job.mark_done(status, exit_code)
+        if len(self._finished_job_ids) == self._finished_job_ids.maxlen:
+            self._jobs.pop(self._finished_job_ids[0], None)
+        self._finished_job_ids.append(job.id)
+
+    async def _notify(self, job: Job) -> None:
+        """Calls the on_job_done callback, if any, with the completed job.
+
+        :param job: The completed job.
+        """
+        if self._on_job_done is None:
+            return
+        try:
+            await self._on_job_done(job)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Error in on_job_done callback for job %d',
+                              job.id)
+
+    async def wait_until_idle(self) -> None:
+        """Waits until no jobs are running or queued."""
+        while self._reapers:
+            await asyncio.gather(*self._reapers.values(),
+                                 return_exceptions=True)
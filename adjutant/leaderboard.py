@@ -0,0 +1,123 @@
+"""Contains the Leaderboard class, an incrementally maintained ranking of runs
+by a summary metric."""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+import bisect
+import math
+
+MINIMIZE = 'min'
+MAXIMIZE = 'max'
+
+
+class Leaderboard:
+    """Ranks runs by one summary metric. Entries are kept in a sorted list, so
+    adding a run costs one binary search plus an insertion, and reading the
+    top k runs costs O(k) without touching any other runs."""
+    metric: str
+    direction: str
+    _entries: List[Tuple[float, str]]
+    _keys_by_name: Dict[str, float]
+
+    def __init__(self, metric: str, direction: str = MINIMIZE) -> None:
+        """Instantiates the object.
+
+        :param metric: The name of the summary metric by which to rank runs.
+        :param direction: MINIMIZE if lower values are better, MAXIMIZE if
+            higher values are better.
+        """
+        if direction not in (MINIMIZE, MAXIMIZE):
+            raise ValueError(f'direction must be {MINIMIZE!r} or '
+                             f'{MAXIMIZE!r}, not {direction!r}.')
+        self.metric = metric
+        self.direction = direction
+        self._entries = []
+        self._keys_by_name = {}
+
+    def __len__(self) -> int:
+        """Returns the number of ranked runs.
+
+        :return: The number of ranked runs.
+        """
+        return len(self._entries)
+
+    def _get_key(self, value: float) -> float:
+        """Returns the sort key for a metric value, so that the best runs sort
+        first in either direction. The mapping is its own inverse, so it also
+        converts sort keys back to metric values.
+
+        :param value: The metric value.
+        :return: The sort key.
+        """
+        return value if self.direction == MINIMIZE else -value
+
+    @staticmethod
+    def _is_rankable(value: object) -> bool:
+        """Returns True if the value is a finite number, False otherwise.
+
+        :param value: The metric value.
+        :return: True if the value is a finite number, False otherwise.
+        """
+        return not isinstance(value, bool) and \
+            isinstance(value, (int, float)) and math.isfinite(value)
+
+    def add(self, name: str, value: object) -> bool:
+        """Ranks the run with the given metric value, replacing any previous
+        value for the same run. Values that are not finite numbers are not
+        ranked.
+
+        :param name: The name of the run.
+        :param value: The run's value for the metric.
+        :return: True if the run was ranked, False otherwise.
+        """
+        self.remove(name)
+        if not Leaderboard._is_rankable(value):
+            return False
+        key = self._get_key(float(value))
+        bisect.insort(self._entries, (key, name))
+        self._keys_by_name[name] = key
+        return True
+
+    def add_many(self, values: Iterable[Tuple[str, object]]) -> None:
+        """Ranks many runs at once with a single sort, which is faster than
+        calling add for each run when building the leaderboard from scratch.
+
+        :param values: The (run name, metric value) tuples to rank.
+        """
+        latest_values = dict(values)
+        for name in latest_values:
+            self.remove(name)
+        for name, value in latest_values.items():
+            if Leaderboard._is_rankable(value):
+                key = self._get_key(float(value))
+                self._entries.append((key, name))
+                self._keys_by_name[name] = key
+        self._entries.sort()
+
+    def remove(self, name: str) -> None:
+        """Removes the run from the ranking if it is present.
+
+        :param name: The name of the run.
+        """
+        key = self._keys_by_name.pop(name, None)
+        if key is None:
+            return
+        index = bisect.bisect_left(self._entries, (key, name))
+        del self._entries[index]
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        """Returns the k best runs, best first.
+
+        :param k: The number of runs to return.
+        :return: The list of (run name, metric value) tuples for the k best
+            runs. Shorter than k if fewer runs are ranked.
+        """
+        return [(name, self._get_key(key)) for key, name in self._entries[:k]]
+
+    def best(self) -> Optional[Tuple[str, float]]:
+        """Returns the best run.
+
+        :return: The (run name, metric value) tuple for the best run, or None if
+            no runs are ranked.
+        """
+        top = self.top(1)
+        return top[0] if top else None
@@ -0,0 +1,446 @@
+"""Contains the MessageDispatcher class, which queues Adjutant's outgoing Discord
+messages, packs bulk notifications into as few messages as possible, and keeps
+each channel under Discord's rate limit."""
+
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol
+import asyncio
+import logging
+import time
+from collections import deque
+from adjutant.metrics import MetricsRegistry
+
+MAX_MESSAGE_LENGTH = 2000
+DEFAULT_MAX_MESSAGES_PER_WINDOW = 5
+DEFAULT_RATE_LIMIT_WINDOW_SECONDS = 5
+DEFAULT_LATENCY_SAMPLES = 1000
+WAIT_UNTIL_EMPTY_POLL_SECONDS = 0.01
+NOTIFICATION_SEPARATOR = '\n'
+
+
+class MessageChannel(Protocol):
+    """The subset of discord.TextChannel that the dispatcher uses."""
+    # pylint: disable=too-few-public-methods
+
+    async def send(self, content: str, file: Any = None) -> Any:
+        """Posts a message in the channel.
+
+        :param content: The text of the message.
+        :param file: The discord.File to attach, or None.
+        :return: The posted message.
+        """
+
+
+def split_message(content: str,
+                  max_length: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Returns the message split into parts no longer than max_length. Parts
+    end at line breaks where possible.
+
+    :param content: The text of the message.
+    :param max_length: The maximum length of each part.
+    :return: The parts of the message, in order.
+    """
+    parts = []
+    while len(content) > max_length:
+        cut = content.rfind('\n', 0, max_length + 1)
+        if cut <= 0:
+            parts.append(content[:max_length])
+            content = content[max_length:]
+        else:
+            parts.append(content[:cut])
+            content = content[cut + 1:]
+    parts.append(content)
+    return parts
+
+
+class SlidingWindowRateLimiter:
+    """Allows at most max_messages sends in any window_seconds-long window."""
+    max_messages: int
+    window_seconds: float
+    _clock: Callable[[], float]
+    _send_times: Deque[float]
+
+    def __init__(
+            self,
+            max_messages: int = DEFAULT_MAX_MESSAGES_PER_WINDOW,
+            window_seconds: float = DEFAULT_RATE_LIMIT_WINDOW_SECONDS,
+            clock: Callable[[], float] = time.monotonic) -> None:
+        """Instantiates the object.
+
+        :param max_messages: The maximum number of sends per window.
+        :param window_seconds: The length of the window in seconds.
+        :param clock: The function that returns the current time in seconds.
+        """
+        if max_messages < 1:
+            raise ValueError('max_messages must be at least 1.')
+        self.max_messages = max_messages
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._send_times = deque(maxlen=max_messages)
+
+    def get_wait_seconds(self) -> float:
+        """Returns the number of seconds until another send is allowed.
+
+        :return: The number of seconds until another send is allowed; 0 if a
+            send is allowed now.
+        """
+        if len(self._send_times) < self.max_messages:
+            return 0.0
+        return max(0.0, self._send_times[0] + self.window_seconds -
+                   self._clock())
+
+    def record_send(self) -> None:
+        """Records a send at the current time."""
+        self._send_times.append(self._clock())
+
+
+class _OutgoingMessage:
+    """A message waiting to be sent."""
+    # pylint: disable=too-few-public-methods
+    content: str
+    enqueue_time: float
+    future: Optional[asyncio.Future]
+    file: Any
+    target: Any
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, content: str, enqueue_time: float,
+                 future: Optional[asyncio.Future] = None,
+                 file: Any = None, target: Any = None) -> None:
+        """Instantiates the object.
+
+        :param content: The text of the message.
+        :param enqueue_time: The time at which the message was queued.
+        :param future: The future to resolve with the posted message, or None
+            if nobody waits for it.
+        :param file: The discord.File to attach, or None.
+        :param target: The posted discord.Message whose text to replace with
+            the content, or None to post a new message.
+        """
+        self.content = content
+        self.enqueue_time = enqueue_time
+        self.future = future
+        self.file = file
+        self.target = target
+
+
+class _ChannelQueue:
+    """The messages waiting to be sent in one channel."""
+    # pylint: disable=too-few-public-methods
+    replies: Deque[_OutgoingMessage]
+    notifications: Deque[_OutgoingMessage]
+    rate_limiter: SlidingWindowRateLimiter
+    not_empty: asyncio.Event
+    is_sending: bool
+    task: Optional[asyncio.Task]
+
+    def __init__(self, rate_limiter: SlidingWindowRateLimiter) -> None:
+        """Instantiates the object.
+
+        :param rate_limiter: The channel's rate limiter.
+        """
+        self.replies = deque()
+        self.notifications = deque()
+        self.rate_limiter = rate_limiter
+        self.not_empty = asyncio.Event()
+        self.is_sending = False
+        self.task = None
+
+    def __len__(self) -> int:
+        """Returns the number of queued messages.
+
+        :return: The number of queued messages.
+        """
+        return len(self.replies) + len(self.notifications)
+
+
+class MessageDispatcher:
+    """Sends messages to Discord channels from per-channel queues.
+
+    Interactive replies, i.e., responses to commands, are sent before any
+    queued notifications in the same channel, each as its own message, and
+    the caller can await the posted message. Notifications, e.g., finished
+    runs, are fire-and-forget: consecutive notifications to a channel are
+    joined with line breaks and packed into as few messages of at most
+    MAX_MESSAGE_LENGTH characters as possible, so a sweep whose 100 runs
+    finish at once costs a handful of sends rather than 100. Each channel has
+    its own rate limiter and its own sender task, so a busy channel never
+    delays the others. Messages longer than MAX_MESSAGE_LENGTH are split.
+    Edits of posted messages, e.g., a sweep's status, wait in the reply queue
+    and count against the same rate limit."""
+    # pylint: disable=too-many-instance-attributes
+    max_message_length: int
+    max_messages_per_window: int
+    window_seconds: float
+    num_messages_sent: int
+    num_items_sent: int
+    num_send_errors: int
+    max_queue_depth: int
+    metrics: Optional[MetricsRegistry]
+    _clock: Callable[[], float]
+    _queues: Dict[MessageChannel, _ChannelQueue]
+    _latencies: Deque[float]
+
+    def __init__(
+            self,
+            max_message_length: int = MAX_MESSAGE_LENGTH,
+            max_messages_per_window: int = DEFAULT_MAX_MESSAGES_PER_WINDOW,
+            window_seconds: float = DEFAULT_RATE_LIMIT_WINDOW_SECONDS,
+            clock: Callable[[], float] = time.monotonic,
+            metrics: Optional[MetricsRegistry] = None) -> None:
+        """Instantiates the object.
+
+        :param max_message_length: The maximum length of one message.
+        :param max_messages_per_window: The maximum number of messages sent to
+            one channel per window.
+        :param window_seconds: The length of the rate limit window in seconds.
+        :param clock: The function that returns the current time in seconds.
+        :param metrics: The registry in which to record the queue depth, the
+            numbers of messages and items sent, and send latencies, or None.
+        """
+        self.max_message_length = max_message_length
+        self.max_messages_per_window = max_messages_per_window
+        self.window_seconds = window_seconds
+        self.num_messages_sent = 0
+        self.num_items_sent = 0
+        self.num_send_errors = 0
+        self.max_queue_depth = 0
+        self._clock = clock
+        self._queues = {}
+        self._latencies = deque(maxlen=DEFAULT_LATENCY_SAMPLES)
+        self.metrics = metrics
+        if metrics:
+            metrics.gauge('adjutant_discord_queue_depth',
+                          'The number of Discord messages waiting to be sent.',
+                          lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self) -> int:
+        """Returns the number of messages waiting in all channels.
+
+        :return: The number of messages waiting in all channels.
+        """
+        return sum(len(queue) for queue in self._queues.values())
+
+    def get_latency_percentile(self, percentile: float) -> Optional[float]:
+        """Returns the given percentile of the recent send latencies, measured
+        from when a message was queued to when Discord accepted it.
+
+        :param percentile: The percentile, between 0 and 100.
+        :return: The latency in seconds, or None if nothing has been sent.
+        """
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        index = round(percentile / 100 * (len(latencies) - 1))
+        return latencies[index]
+
+    async def send(self, channel: MessageChannel, content: str,
+                   file: Any = None) -> Any:
+        """Queues an interactive reply ahead of any notifications and waits
+        until it is posted.
+
+        :param channel: The channel in which to post.
+        :param content: The text of the message. Longer messages are split.
+        :param file: The discord.File to attach, or None. If the message is
+            split, the file is attached to the last part.
+        :return: The posted message (the last part, if the message was split).
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        queue = self._get_queue(channel)
+        parts = split_message(content, self.max_message_length)
+        for index, part in enumerate(parts):
+            futures.append(loop.create_future())
+            queue.replies.append(_OutgoingMessage(
+                part, self._clock(), futures[-1],
+                file if index == len(parts) - 1 else None))
+        self._on_enqueue(queue)
+        results = await asyncio.gather(*futures)
+        return results[-1]
+
+    def notify(self, channel: MessageChannel, content: str) -> None:
+        """Queues a notification to be packed with others and posted when the
+        channel's rate limit allows. Must be called from the event loop.
+
+        :param channel: The channel in which to post.
+        :param content: The text of the notification.
+        """
+        queue = self._get_queue(channel)
+        for part in split_message(content, self.max_message_length):
+            queue.notifications.append(_OutgoingMessage(part, self._clock()))
+        self._on_enqueue(queue)
+
+    def edit(self, channel: MessageChannel, message: Any,
+             content: str) -> None:
+        """Queues a replacement of a posted message's text ahead of any
+        notifications. Edits count against the channel's rate limit like
+        sends, and a queued edit of the same message is replaced rather than
+        sent twice, so frequent progress updates cost one edit per rate limit
+        slot. Errors are logged, not raised. Must be called from the event
+        loop.
+
+        :param channel: The channel in which the message was posted.
+        :param message: The posted discord.Message.
+        :param content: The new text of the message. Longer text is cut to
+            max_message_length characters.
+        """
+        content = split_message(content, self.max_message_length)[0]
+        queue = self._get_queue(channel)
+        for item in queue.replies:
+            if item.target is message:
+                item.content = content
+                return
+        queue.replies.append(_OutgoingMessage(content, self._clock(),
+                                              target=message))
+        self._on_enqueue(queue)
+
+    async def wait_until_empty(self) -> None:
+        """Waits until every queued message has been sent."""
+        while any(len(queue) or queue.is_sending
+                  for queue in self._queues.values()):
+            await asyncio.sleep(WAIT_UNTIL_EMPTY_POLL_SECONDS)
+
+    def close(self) -> None:
+        """Stops sending. Queued messages are dropped."""
+        for queue in self._queues.values():
+            if queue.task:
+                queue.task.cancel()
+            for item in queue.replies:
+                if item.future and not item.future.done():
+                    item.future.cancel()
+        self._queues = {}
+
+    def _get_queue(self, channel: MessageChannel) -> _ChannelQueue:
+        """Returns the channel's queue, creating it and its sender task if
+        needed.
+
+        :param channel: The channel.
+        :return: The channel's queue.
+        """
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = _ChannelQueue(SlidingWindowRateLimiter(
+                self.max_messages_per_window, self.window_seconds,
+                self._clock))
+            queue.task = asyncio.ensure_future(self._send_forever(
+                channel, queue))
+            self._queues[channel] = queue
+        return queue
+
+    def _on_enqueue(self, queue: _ChannelQueue) -> None:
+        """Wakes the channel's sender and updates the queue depth metrics.
+
+        :param queue: The channel's queue.
+        """
+        queue.not_empty.set()
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _pop_batch(self, queue: _ChannelQueue) -> List[_OutgoingMessage]:
+        """Removes and returns the messages to send next: the oldest reply or
+        edit, or else as many of the oldest notifications as fit in one message.
+
+        :param queue: The channel's queue.
+        :return: The messages to send together, oldest first.
+        """
+        if queue.replies:
+            return [queue.replies.popleft()]
+        batch = [queue.notifications.popleft()]
+        length = len(batch[0].content)
+        while queue.notifications:
+            length += len(NOTIFICATION_SEPARATOR) + \
+                len(queue.notifications[0].content)
+            if length > self.max_message_length:
+                break
+            batch.append(queue.notifications.popleft())
+        return batch
+
+    async def _send_forever(self, channel: MessageChannel,
+                            queue: _ChannelQueue) -> None:
+        """Sends the channel's queued messages as its rate limit allows.
+
+        :param channel: The channel.
+        :param queue: The channel's queue.
+        """
+        while True:
+            await queue.not_empty.wait()
+            wait_seconds = queue.rate_limiter.get_wait_seconds()
+            while wait_seconds > 0:
+                await asyncio.sleep(wait_seconds)
+                wait_seconds = queue.rate_limiter.get_wait_seconds()
+            # Pick the batch only now, so replies queued while waiting go
+            # first.
+            batch = self._pop_batch(queue)
+            if not queue:
+                queue.not_empty.clear()
+            queue.rate_limiter.record_send()
+            queue.is_sending = True
+            try:
+                await self._send_batch(channel, batch)
+            finally:
+                queue.is_sending = False
+
+    async def _send_batch(self, channel: MessageChannel,
+                          batch: List[_OutgoingMessage]) -> None:
+        """Posts the batch as one message and resolves its futures.
+
+        :param channel: The channel.
+        :param batch: The messages to send together.
+        """
+        content = NOTIFICATION_SEPARATOR.join(item.content for item in batch)
+        start = self._clock()
+        try:
+            # Replies and edits are sent alone, so only a one-message batch
+            # has a file or a target.
+            if batch[0].target is not None:
+                await batch[0].target.edit(content=content)
+                message = batch[0].target
+            elif batch[0].file is not None:
+                message = await channel.send(content, file=batch[0].file)
+            else:
+                message = await channel.send(content)
+        except Exception as err:  # pylint: disable=broad-except
+            self.num_send_errors += 1
+            if self.metrics:
+                self.metrics.counter(
+                    'adjutant_discord_send_errors_total',
+                    'The number of failed Discord sends.').inc()
+            logging.exception('Failed to send or edit a message in %s',
+                              channel)
+            for item in batch:
+                if item.future and not item.future.done():
+                    item.future.set_exception(err)
+            return
+        now = self._clock()
+        self.num_messages_sent += 1
+        self.num_items_sent += len(batch)
+        for item in batch:
+            self._latencies.append(now - item.enqueue_time)
+            if item.future and not item.future.done():
+                item.future.set_result(message)
+        if self.metrics:
+            self._record_send(now - start, batch, now)
+
+    def _record_send(self, send_seconds: float,
+                     batch: List[_OutgoingMessage], now: float) -> None:
+        """Records a successful send in self.metrics.
+
+        :param send_seconds: The number of seconds Discord took to accept the
+            message.
+        :param batch: The messages sent together.
+        :param now: The time at which the send completed.
+        """
+        self.metrics.counter('adjutant_discord_messages_sent_total',
+                             'The number of Discord messages sent.').inc()
+        self.metrics.counter(
+            'adjutant_discord_items_sent_total',
+            'The number of replies and notifications sent, counting each '
+            'notification packed into a message separately.').inc(len(batch))
+        self.metrics.histogram(
+            'adjutant_discord_send_seconds',
+            'The time Discord took to accept each message.').observe(
+                send_seconds)
+        latency = self.metrics.histogram(
+            'adjutant_discord_delivery_seconds',
+            'The time from queueing each reply or notification to its send.')
+        for item in batch:
+            latency.observe(now - item.enqueue_time)
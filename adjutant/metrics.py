@@ -0,0 +1,467 @@
+"""Contains lightweight counters, gauges and latency histograms, and an optional
+HTTP endpoint that serves them in the Prometheus text format."""
+
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, \
+    Union
+import asyncio
+import bisect
+import contextlib
+import logging
+import math
+import threading
+import time
+
+DEFAULT_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                           10.0, 30.0, 60.0)
+METRICS_PATH = '/metrics'
+DEFAULT_METRICS_HOST = '127.0.0.1'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+MAX_REQUEST_HEADER_LINES = 100
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels,
+                   extra: Optional[Tuple[str, str]] = None) -> str:
+    """Returns the labels in Prometheus text format.
+
+    :param labels: The labels as sorted (name, value) pairs.
+    :param extra: An additional (name, value) pair to append, e.g., a
+        histogram bucket's upper bound.
+    :return: The labels in braces, or the empty string if there are none.
+    """
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in
+                          zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    """Returns the value in Prometheus text format.
+
+    :param value: The value.
+    :return: The value as a string.
+    """
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing count. Safe to increment from worker
+    threads."""
+    # pylint: disable=too-few-public-methods
+    value: float
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        """Adds to the count.
+
+        :param amount: The non-negative amount to add.
+        """
+        if amount < 0:
+            raise ValueError('Counters cannot decrease.')
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value that is read from a function whenever the metrics are
+    collected, e.g., a queue's current depth."""
+    # pylint: disable=too-few-public-methods
+    _get_value: Callable[[], float]
+
+    def __init__(self, get_value: Callable[[], float]) -> None:
+        """Instantiates the object.
+
+        :param get_value: The function that returns the current value.
+        """
+        self._get_value = get_value
+
+    @property
+    def value(self) -> float:
+        """Returns the current value.
+
+        :return: The current value.
+        """
+        return self._get_value()
+
+
+class Histogram:
+    """Counts observations, e.g., latencies in seconds, in cumulative buckets.
+    Memory is fixed by the number of buckets, however many observations are
+    made. Safe to observe from worker threads."""
+    buckets: Tuple[float, ...]
+    count: int
+    sum: float
+    _bucket_counts: List[int]
+    _lock: threading.Lock
+
+    def __init__(
+            self,
+            buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        """Instantiates the object.
+
+        :param buckets: The increasing upper bounds of the buckets. A final
+            +Inf bucket is always added.
+        """
+        buckets = tuple(buckets)
+        if list(buckets) != sorted(set(buckets)):
+            raise ValueError('Buckets must be strictly increasing.')
+        if not buckets or not math.isinf(buckets[-1]):
+            buckets += (math.inf,)
+        self.buckets = buckets
+        self.count = 0
+        self.sum = 0.0
+        self._bucket_counts = [0] * len(buckets)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Records an observation.
+
+        :param value: The observed value.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        """Returns a context manager that observes the number of seconds spent
+        in its body, including when the body raises an error.
+
+        :return: The context manager.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def get_cumulative_counts(self) -> List[int]:
+        """Returns the number of observations at or below each bucket's upper
+        bound.
+
+        :return: The cumulative counts, in bucket order.
+        """
+        with self._lock:
+            counts = list(self._bucket_counts)
+        cumulative = []
+        total = 0
+        for count in counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def get_quantile(self, quantile: float) -> Optional[float]:
+        """Returns an estimate of the quantile, interpolating linearly within
+        the bucket that contains it as Prometheus's histogram_quantile does.
+
+        :param quantile: The quantile, between 0 and 1.
+        :return: The estimated quantile, the largest finite bucket bound if it
+            falls in the +Inf bucket, or None if there are no observations.
+        """
+        cumulative = self.get_cumulative_counts()
+        if not cumulative[-1]:
+            return None
+        rank = quantile * cumulative[-1]
+        index = bisect.bisect_left(cumulative, rank)
+        if math.isinf(self.buckets[index]):
+            return self.buckets[-2] if len(self.buckets) > 1 else None
+        lower = self.buckets[index - 1] if index else 0.0
+        below = cumulative[index - 1] if index else 0
+        in_bucket = cumulative[index] - below
+        fraction = (rank - below) / in_bucket if in_bucket else 1.0
+        return lower + (self.buckets[index] - lower) * fraction
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class _MetricFamily:
+    """The metrics that share a name and differ only in their labels."""
+    # pylint: disable=too-few-public-methods
+    name: str
+    description: str
+    kind: str
+    children: Dict[Labels, Metric]
+
+    def __init__(self, name: str, description: str, kind: str) -> None:
+        """Instantiates the object.
+
+        :param name: The name of the metrics.
+        :param description: The description of the metrics.
+        :param kind: COUNTER, GAUGE, or HISTOGRAM.
+        """
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self.children = {}
+
+
+class MetricsRegistry:
+    """Holds named counters, gauges and histograms, optionally distinguished by
+    labels, and renders them for $stats or in the Prometheus text format.
+    Getting a metric that already exists returns it, so callers need not keep
+    references."""
+    _families: Dict[str, _MetricFamily]
+    _lock: threading.Lock
+    _start_time: float
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        self._families = {}
+        self._lock = threading.Lock()
+        self._start_time = time.monotonic()
+
+    @property
+    def uptime_seconds(self) -> float:
+        """Returns the number of seconds since the registry was created.
+
+        :return: The number of seconds since the registry was created.
+        """
+        return time.monotonic() - self._start_time
+
+    def counter(self, name: str, description: str,
+                labels: Optional[Dict[str, str]] = None) -> Counter:
+        """Returns the counter with the name and labels, creating it if needed.
+
+        :param name: The name of the counter, e.g., adjutant_commands_total.
+        :param description: The description of the counter.
+        :param labels: The labels that distinguish this counter from others
+            with the same name.
+        :return: The counter.
+        """
+        return self._get(name, description, COUNTER, labels, Counter)
+
+    def gauge(self, name: str, description: str,
+              get_value: Callable[[], float],
+              labels: Optional[Dict[str, str]] = None) -> Gauge:
+        """Registers a gauge whose value is read from a function. Registering
+        the name and labels again replaces the function.
+
+        :param name: The name of the gauge.
+        :param description: The description of the gauge.
+        :param get_value: The function that returns the gauge's value.
+        :param labels: The labels that distinguish this gauge from others with
+            the same name.
+        :return: The gauge.
+        """
+        family = self._get_family(name, description, GAUGE)
+        gauge = Gauge(get_value)
+        with self._lock:
+            family.children[self._get_labels(labels)] = gauge
+        return gauge
+
+    def histogram(self, name: str, description: str,
+                  labels: Optional[Dict[str, str]] = None,
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS
+                  ) -> Histogram:
+        """Returns the histogram with the name and labels, creating it if
+        needed.
+
+        :param name: The name of the histogram, e.g.,
+            adjutant_command_seconds.
+        :param description: The description of the histogram.
+        :param labels: The labels that distinguish this histogram from others
+            with the same name.
+        :param buckets: The bucket upper bounds, used if the histogram is
+            created.
+        :return: The histogram.
+        """
+        return self._get(name, description, HISTOGRAM, labels,
+                         lambda: Histogram(buckets))
+
+    @staticmethod
+    def _get_labels(labels: Optional[Dict[str, str]]) -> Labels:
+        """Returns the labels in canonical order.
+
+        :param labels: The labels, or None.
+        :return: The labels as sorted (name, value) pairs.
+        """
+        return tuple(sorted((labels or {}).items()))
+
+    def _get_family(self, name: str, description: str,
+                    kind: str) -> _MetricFamily:
+        """Returns the family with the name, creating it if needed.
+
+        :param name: The name of the metrics.
+        :param description: The description of the metrics.
+        :param kind: COUNTER, GAUGE, or HISTOGRAM.
+        :return: The family.
+        """
+        with self._lock:
+            family = self._families.setdefault(
+                name, _MetricFamily(name, description, kind))
+        if family.kind != kind:
+            raise ValueError(f'{name} is a {family.kind}, not a {kind}.')
+        return family
+
+    def _get(self, name: str, description: str, kind: str,
+             labels: Optional[Dict[str, str]],
+             create: Callable[[], Metric]) -> Metric:
+        """Returns the metric with the name and labels, creating it if needed.
+
+        :param name: The name of the metric.
+        :param description: The description of the metric.
+        :param kind: COUNTER or HISTOGRAM.
+        :param labels: The labels of the metric.
+        :param create: The function that creates the metric.
+        :return: The metric.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        family = self._get_family(name, description, kind)
+        key = self._get_labels(labels)
+        with self._lock:
+            if key not in family.children:
+                family.children[key] = create()
+            return family.children[key]
+
+    def _get_families(self) -> List[_MetricFamily]:
+        """Returns a snapshot of the families, sorted by name.
+
+        :return: The families.
+        """
+        with self._lock:
+            return [self._families[name] for name in sorted(self._families)]
+
+    def render_prometheus(self) -> str:
+        """Returns every metric in the Prometheus text exposition format.
+
+        :return: The metrics, one sample per line.
+        """
+        lines = []
+        for family in self._get_families():
+            lines.append(f'# HELP {family.name} {family.description}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for labels, metric in sorted(family.children.items()):
+                if isinstance(metric, Histogram):
+                    cumulative = metric.get_cumulative_counts()
+                    for bound, count in zip(metric.buckets, cumulative):
+                        bucket_labels = _format_labels(
+                            labels, ('le', _format_value(bound)))
+                        lines.append(
+                            f'{family.name}_bucket{bucket_labels} {count}')
+                    lines.append(f'{family.name}_sum{_format_labels(labels)} '
+                                 f'{_format_value(metric.sum)}')
+                    lines.append(f'{family.name}_count'
+                                 f'{_format_labels(labels)} {cumulative[-1]}')
+                else:
+                    lines.append(f'{family.name}{_format_labels(labels)} '
+                                 f'{_format_value(metric.value)}')
+        return '\n'.join(lines) + '\n'
+
+    def summarize(self) -> List[str]:
+        """Returns one human-readable line per metric, for $stats. Histograms
+        show their count, mean, and estimated median and 95th percentile.
+
+        :return: The lines, sorted by metric name.
+        """
+        lines = []
+        for family in self._get_families():
+            for labels, metric in sorted(family.children.items()):
+                name = f'{family.name}{_format_labels(labels)}'
+                if not isinstance(metric, Histogram):
+                    lines.append(f'{name}: {_format_value(metric.value)}')
+                elif metric.count:
+                    lines.append(
+                        f'{name}: n={metric.count} '
+                        f'mean={metric.sum / metric.count:.3f}s '
+                        f'p50={metric.get_quantile(0.5):.3f}s '
+                        f'p95={metric.get_quantile(0.95):.3f}s')
+                else:
+                    lines.append(f'{name}: n=0')
+        return lines
+
+
+class MetricsServer:
+    """Serves a registry's metrics over HTTP in the Prometheus text format, at
+    METRICS_PATH. The server is deliberately minimal: it answers each GET with
+    the current metrics and closes the connection."""
+    registry: MetricsRegistry
+    host: str
+    _requested_port: int
+    _server: Optional[asyncio.AbstractServer]
+
+    def __init__(self, registry: MetricsRegistry, port: int,
+                 host: str = DEFAULT_METRICS_HOST) -> None:
+        """Instantiates the object.
+
+        :param registry: The registry whose metrics to serve.
+        :param port: The port on which to listen, or 0 for any free port.
+        :param host: The address on which to listen. The default only accepts
+            connections from this host.
+        """
+        self.registry = registry
+        self.host = host
+        self._requested_port = port
+        self._server = None
+
+    @property
+    def port(self) -> Optional[int]:
+        """Returns the port on which the server is listening.
+
+        :return: The port, or None if the server is not running.
+        """
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        """Starts listening. Has no effect if the server is running."""
+        if self._server is None:
+            self._server = await asyncio.start_server(
+                self._handle, self.host, self._requested_port)
+
+    def close(self) -> None:
+        """Stops listening."""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        """Answers one HTTP request.
+
+        :param reader: The connection's reader.
+        :param writer: The connection's writer.
+        """
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            for _ in range(MAX_REQUEST_HEADER_LINES):
+                if await reader.readline() in (b'\r\n', b'\n', b''):
+                    break
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == 'GET' and \
+                    parts[1].split('?')[0] == METRICS_PATH:
+                status = '200 OK'
+                body = self.registry.render_prometheus().encode('utf-8')
+            else:
+                status = '404 Not Found'
+                body = b'Not found.\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                f'Content-Type: {PROMETHEUS_CONTENT_TYPE}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as err:
+            logging.debug('Metrics request failed: %s', err)
+        finally:
+            writer.close()
@@ -0,0 +1,226 @@
+"""Contains the CurveRenderer class, which renders metric curves to PNG images
+in a worker process and caches the images, and the functions that downsample
+and draw the curves. Rendering requires the optional matplotlib dependency."""
+
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import asyncio
+import collections
+import importlib.util
+import io
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+from adjutant.worker_pool import START_METHOD
+
+DEFAULT_MAX_PLOT_POINTS = 1000
+DEFAULT_IMAGE_CACHE_SIZE = 32
+MIN_LTTB_POINTS = 3
+FIGURE_WIDTH_INCHES = 8
+SUBPLOT_HEIGHT_INCHES = 3
+FIGURE_DPI = 100
+PNG_FORMAT = 'png'
+
+Series = Dict[str, Dict[str, List[Tuple[float, float]]]]
+
+
+def is_plotting_available() -> bool:
+    """Returns True if matplotlib is installed, False otherwise.
+
+    :return: True if matplotlib is installed, False otherwise.
+    """
+    return importlib.util.find_spec('matplotlib') is not None
+
+
+def downsample_lttb(
+        steps: np.ndarray,
+        values: np.ndarray,
+        max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns at most max_points of the curve, chosen by the
+    Largest-Triangle-Three-Buckets algorithm: the first and last points are
+    kept, the rest are divided into max_points - 2 buckets, and from each
+    bucket the point forming the largest triangle with the previously chosen
+    point and the mean of the next bucket is kept. Unlike taking every nth
+    point, this preserves spikes and the visual shape of the curve.
+
+    :param steps: The x coordinates, in increasing order.
+    :param values: The y coordinates.
+    :param max_points: The maximum number of points to keep.
+    :return: A 2-tuple of the kept x and y coordinates.
+    """
+    # pylint: disable=too-many-locals
+    num_points = len(steps)
+    if num_points <= max_points or max_points < MIN_LTTB_POINTS:
+        return steps, values
+    num_buckets = max_points - 2
+    # Bucket i covers points edges[i] to edges[i + 1]; the first and last
+    # points are their own buckets.
+    edges = (np.arange(num_buckets + 1) * (num_points - 2) /
+             num_buckets).astype(int) + 1
+    kept = np.empty(max_points, dtype=int)
+    kept[0] = 0
+    kept[-1] = num_points - 1
+    previous = 0
+    for bucket in range(num_buckets):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 1 < num_buckets:
+            next_start, next_end = end, edges[bucket + 2]
+        else:
+            next_start, next_end = num_points - 1, num_points
+        mean_step = steps[next_start:next_end].mean()
+        mean_value = values[next_start:next_end].mean()
+        areas = np.abs(
+            (steps[previous] - mean_step) *
+            (values[start:end] - values[previous]) -
+            (steps[previous] - steps[start:end]) *
+            (mean_value - values[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return steps[kept], values[kept]
+
+
+def render_curves(
+        series: Series,
+        metrics: Sequence[str],
+        max_points: int = DEFAULT_MAX_PLOT_POINTS,
+        title: Optional[str] = None) -> bytes:
+    """Returns a PNG image with one subplot per metric and one curve per run.
+    Long curves are downsampled with downsample_lttb first. This function is
+    CPU-bound and meant to run in a worker process.
+
+    :param series: The curves to draw. The keys are the runs' labels and the
+        values map each metric to its (step, value) points in step order.
+    :param metrics: The metrics to draw, one subplot each.
+    :param max_points: The maximum number of points per curve.
+    :param title: The title of the figure, or None for no title.
+    :return: The PNG image.
+    """
+    # Imported here so that the optional dependency is only needed to plot,
+    # and only loaded in the worker process.
+    # pylint: disable=import-outside-toplevel
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(FIGURE_WIDTH_INCHES,
+                             SUBPLOT_HEIGHT_INCHES * len(metrics)))
+    axes = figure.subplots(len(metrics), 1, squeeze=False)[:, 0]
+    for axis, metric in zip(axes, metrics):
+        for label, histories in series.items():
+            points = histories.get(metric)
+            if not points:
+                continue
+            steps, values = np.array(points, dtype=float).T
+            steps, values = downsample_lttb(steps, values, max_points)
+            axis.plot(steps, values, label=label)
+        axis.set_ylabel(metric)
+        axis.set_xlabel('step')
+        axis.grid(True, alpha=0.3)
+        if axis.get_lines():
+            axis.legend()
+    if title:
+        figure.suptitle(title)
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=PNG_FORMAT, dpi=FIGURE_DPI)
+    return buffer.getvalue()
+
+
+def _warm_up() -> None:
+    """Imports matplotlib in the worker process, so that the first render does
+    not wait for it."""
+    # pylint: disable=import-outside-toplevel,unused-import
+    import matplotlib.figure  # noqa: F401
+
+
+class CurveRenderer:
+    """Renders curves with render_curves in a worker process, so that drawing
+    never blocks the event loop, and caches the most recent images by key.
+    Concurrent requests for the same key share one render."""
+    max_points: int
+    cache_size: int
+    num_renders: int
+    num_cache_hits: int
+    _executor: Optional[ProcessPoolExecutor]
+    _cache: 'collections.OrderedDict[Hashable, bytes]'
+    _pending: Dict[Hashable, 'asyncio.Future[bytes]']
+
+    def __init__(
+            self,
+            max_points: int = DEFAULT_MAX_PLOT_POINTS,
+            cache_size: int = DEFAULT_IMAGE_CACHE_SIZE) -> None:
+        """Instantiates the object. The worker process starts on the first
+        call to start or render.
+
+        :param max_points: The maximum number of points per curve.
+        :param cache_size: The maximum number of images to cache.
+        """
+        if cache_size < 0:
+            raise ValueError('cache_size must be nonnegative.')
+        self.max_points = max_points
+        self.cache_size = cache_size
+        self.num_renders = 0
+        self.num_cache_hits = 0
+        self._executor = None
+        self._cache = collections.OrderedDict()
+        self._pending = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Returns the worker process's executor, starting it if necessary.
+
+        :return: The executor.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context(START_METHOD))
+        return self._executor
+
+    def start(self) -> None:
+        """Starts the worker process and has it import matplotlib."""
+        self._get_executor().submit(_warm_up)
+
+    async def render(
+            self,
+            key: Hashable,
+            series: Series,
+            metrics: Sequence[str],
+            title: Optional[str] = None) -> bytes:
+        """Returns the PNG image of the curves, from the cache if an image with
+        the same key was rendered recently. The key must identify the
+        curves' data, e.g., by each run's ID and last step.
+
+        :param key: The cache key.
+        :param series: The curves, as taken by render_curves.
+        :param metrics: The metrics to draw.
+        :param title: The title of the figure, or None for no title.
+        :return: The PNG image.
+        """
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+            self.num_cache_hits += 1
+            return image
+        if key in self._pending:
+            self.num_cache_hits += 1
+            return await asyncio.shield(self._pending[key])
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._get_executor(), render_curves, series, tuple(metrics),
+            self.max_points, title)
+        self._pending[key] = future
+        self.num_renders += 1
+        try:
+            image = await future
+        finally:
+            del self._pending[key]
+        if self.cache_size:
+            self._cache[key] = image
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return image
+
+    def close(self) -> None:
+        """Stops the worker process. Renders in progress are cancelled."""
+        # Executor.shutdown only takes cancel_futures from Python 3.9.
+        for future in self._pending.values():
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,246 @@
+"""Contains the policies that decide how long to wait between consecutive WandB
+checks of a project."""
+
+from typing import Callable, Dict, Optional, Protocol
+import random
+import time
+
+DEFAULT_INTERVAL_SECONDS = 60
+DEFAULT_MIN_INTERVAL_SECONDS = 15
+DEFAULT_MAX_INTERVAL_SECONDS = 600
+DEFAULT_IDLE_GROWTH_FACTOR = 1.5
+DEFAULT_RECENT_ACTIVITY_SECONDS = 300
+DEFAULT_MAX_BACKOFF_SECONDS = 900
+DEFAULT_JITTER = 0.5
+HTTP_TOO_MANY_REQUESTS = 429
+RETRY_AFTER_HEADER = 'Retry-After'
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Returns the number of seconds the server asked clients to wait if the
+    error, or any error that caused it, is an HTTP 429 (Too Many Requests)
+    response. WandB wraps the requests library's HTTPError, so the response is
+    found by following the chain of causes.
+
+    :param error: The error raised by a WandB query.
+    :return: The Retry-After delay in seconds (0 if the response did not
+        include one), or None if the error is not a rate-limit response.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        response = getattr(error, 'response', None)
+        if getattr(response, 'status_code', None) == HTTP_TOO_MANY_REQUESTS:
+            headers = getattr(response, 'headers', None) or {}
+            try:
+                return max(0.0, float(headers.get(RETRY_AFTER_HEADER, 0)))
+            except ValueError:
+                # Retry-After may also be an HTTP date; treat it as no hint.
+                return 0.0
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class PollPolicy(Protocol):
+    """Decides how long to wait after one check of a project before starting
+    the next. One policy serves every project of a client, keyed by project
+    path."""
+    # pylint: disable=too-few-public-methods
+
+    def get_delay(
+            self,
+            key: str,
+            is_busy: bool,
+            error: Optional[BaseException] = None) -> float:
+        """Returns the number of seconds from the start of the check that just
+        finished to the start of the next check of the same project.
+
+        :param key: The project path.
+        :param is_busy: Whether the check found activity, e.g., newly finished
+            runs or launched experiments still in flight. Ignored if the check
+            failed.
+        :param error: The error that the check raised, or None if it
+            succeeded.
+        :return: The number of seconds until the next check.
+        """
+
+
+class FixedPollPolicy:
+    """Checks every project at a constant interval, whether or not the previous
+    check succeeded."""
+    # pylint: disable=too-few-public-methods
+    interval_seconds: float
+
+    def __init__(
+            self,
+            interval_seconds: float = DEFAULT_INTERVAL_SECONDS) -> None:
+        """Instantiates the object.
+
+        :param interval_seconds: The number of seconds between checks.
+        """
+        if interval_seconds <= 0:
+            raise ValueError('interval_seconds must be positive.')
+        self.interval_seconds = interval_seconds
+
+    def get_delay(
+            self,
+            key: str,
+            is_busy: bool,
+            error: Optional[BaseException] = None) -> float:
+        """Returns the fixed interval.
+
+        :param key: Ignored.
+        :param is_busy: Ignored.
+        :param error: Ignored.
+        :return: The fixed interval.
+        """
+        # pylint: disable=unused-argument
+        return self.interval_seconds
+
+
+class _ProjectPollState:
+    """The adaptive policy's state for one project."""
+    # pylint: disable=too-few-public-methods
+    interval_seconds: float
+    last_activity_time: Optional[float]
+    num_consecutive_errors: int
+
+    def __init__(self, interval_seconds: float) -> None:
+        """Instantiates the object.
+
+        :param interval_seconds: The project's starting interval.
+        """
+        self.interval_seconds = interval_seconds
+        self.last_activity_time = None
+        self.num_consecutive_errors = 0
+
+
+class AdaptivePollPolicy:
+    """Checks busy projects often and idle projects rarely, and backs off
+    when WandB fails or rate-limits.
+
+    A check that finds activity resets the project to the minimum interval,
+    where it stays until recent_activity_seconds pass without activity. After
+    that, each quiet check multiplies the interval by idle_growth_factor, up to
+    the maximum. A failed check waits an exponentially growing, jittered
+    delay based on the current interval, so that many projects (or many
+    Adjutants) recovering from the same outage do not retry in lockstep. A
+    rate-limit response is never retried sooner than its Retry-After header
+    asks. The first successful check after errors resumes the interval the
+    project had before them."""
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    initial_interval_seconds: float
+    min_interval_seconds: float
+    max_interval_seconds: float
+    idle_growth_factor: float
+    recent_activity_seconds: float
+    max_backoff_seconds: float
+    jitter: float
+    _clock: Callable[[], float]
+    _rng: random.Random
+    _states: Dict[str, _ProjectPollState]
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            initial_interval_seconds: float = DEFAULT_INTERVAL_SECONDS,
+            min_interval_seconds: float = DEFAULT_MIN_INTERVAL_SECONDS,
+            max_interval_seconds: float = DEFAULT_MAX_INTERVAL_SECONDS,
+            *,
+            idle_growth_factor: float = DEFAULT_IDLE_GROWTH_FACTOR,
+            recent_activity_seconds: float = DEFAULT_RECENT_ACTIVITY_SECONDS,
+            max_backoff_seconds: float = DEFAULT_MAX_BACKOFF_SECONDS,
+            jitter: float = DEFAULT_JITTER,
+            clock: Callable[[], float] = time.monotonic,
+            seed: Optional[int] = None) -> None:
+        """Instantiates the object.
+
+        :param initial_interval_seconds: The interval before a project's first
+            check shows whether it is busy.
+        :param min_interval_seconds: The interval while a project is busy.
+        :param max_interval_seconds: The longest interval for an idle project.
+        :param idle_growth_factor: The factor by which each quiet check
+            lengthens the interval once the project has been idle for
+            recent_activity_seconds.
+        :param recent_activity_seconds: The number of seconds after the last
+            activity during which the project is still checked at the minimum
+            interval.
+        :param max_backoff_seconds: The longest delay after failed checks,
+            except that a longer Retry-After is always honored.
+        :param jitter: The fraction of each backoff delay that is randomized;
+            0 for no jitter, at most 1.
+        :param clock: The function that returns the current time in seconds.
+            Tests may pass a fake clock.
+        :param seed: The random seed for the jitter, or None for a random seed.
+        """
+        if not 0 < min_interval_seconds <= initial_interval_seconds <= \
+                max_interval_seconds:
+            raise ValueError('Intervals must satisfy 0 < min_interval_seconds '
+                             '<= initial_interval_seconds <= '
+                             'max_interval_seconds.')
+        if idle_growth_factor < 1:
+            raise ValueError('idle_growth_factor must be at least 1.')
+        if not 0 <= jitter <= 1:
+            raise ValueError('jitter must be between 0 and 1.')
+        self.initial_interval_seconds = initial_interval_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.idle_growth_factor = idle_growth_factor
+        self.recent_activity_seconds = recent_activity_seconds
+        self.max_backoff_seconds = max(max_backoff_seconds,
+                                       max_interval_seconds)
+        self.jitter = jitter
+        self._clock = clock
+        self._rng = random.Random(seed)
+        self._states = {}
+
+    def get_delay(
+            self,
+            key: str,
+            is_busy: bool,
+            error: Optional[BaseException] = None) -> float:
+        """Returns the number of seconds from the start of the check that just
+        finished to the start of the next check of the same project.
+
+        :param key: The project path.
+        :param is_busy: Whether the check found activity. Ignored if the check
+            failed.
+        :param error: The error that the check raised, or None if it
+            succeeded.
+        :return: The number of seconds until the next check.
+        """
+        state = self._states.setdefault(
+            key, _ProjectPollState(self.initial_interval_seconds))
+        if error is not None:
+            return self._get_backoff(state, error)
+        state.num_consecutive_errors = 0
+        now = self._clock()
+        if is_busy:
+            state.last_activity_time = now
+            state.interval_seconds = self.min_interval_seconds
+        elif state.last_activity_time is None or \
+                now - state.last_activity_time >= \
+                self.recent_activity_seconds:
+            state.interval_seconds = min(
+                state.interval_seconds * self.idle_growth_factor,
+                self.max_interval_seconds)
+        return state.interval_seconds
+
+    def _get_backoff(self, state: _ProjectPollState,
+                     error: BaseException) -> float:
+        """Records the failed check and returns the delay before the next one.
+
+        :param state: The project's state.
+        :param error: The error that the check raised.
+        :return: The number of seconds until the next check.
+        """
+        state.num_consecutive_errors += 1
+        # Cap the exponent so the multiplication cannot overflow.
+        exponent = min(state.num_consecutive_errors, 64)
+        backoff = min(state.interval_seconds * 2 ** exponent,
+                      self.max_backoff_seconds)
+        backoff *= 1 - self.jitter * self._rng.random()
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        return backoff
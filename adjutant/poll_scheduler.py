@@ -0,0 +1,103 @@
+"""Contains the PollScheduler class, which periodically polls many WandB
+projects from one process without bunching their queries together."""
+
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+from adjutant.poll_policy import PollPolicy, FixedPollPolicy
+
+
+class PollScheduler:
+    """Polls each of a set of keys, e.g., WandB project paths, repeatedly. The
+    keys' first polls are staggered evenly across the interval rather than all
+    starting at once, each key is registered at most once however many times it
+    is added, and a key's next poll never starts until its previous poll has
+    finished. The delay between a key's polls is chosen by a PollPolicy from
+    whether the poll found activity or failed. How many polls query WandB at
+    the same time is capped separately, by the WandbPoller they use."""
+    interval_seconds: float
+    policy: PollPolicy
+    _poll: Callable[[str], Awaitable[Optional[bool]]]
+    _keys: List[str]
+    _tasks: Dict[str, asyncio.Task]
+
+    def __init__(
+            self,
+            poll: Callable[[str], Awaitable[Optional[bool]]],
+            interval_seconds: float,
+            policy: Optional[PollPolicy] = None) -> None:
+        """Instantiates the object.
+
+        :param poll: The coroutine function that polls a key. It returns True
+            if the poll found activity, e.g., newly finished runs, and False or
+            None otherwise.
+        :param interval_seconds: The interval across which the keys' first
+            polls are spread.
+        :param policy: The policy that decides the number of seconds between
+            the starts of consecutive polls of the same key. If None, keys are
+            polled every interval_seconds.
+        """
+        if interval_seconds <= 0:
+            raise ValueError('interval_seconds must be positive.')
+        self.interval_seconds = interval_seconds
+        self.policy = policy or FixedPollPolicy(interval_seconds)
+        self._poll = poll
+        self._keys = []
+        self._tasks = {}
+
+    @property
+    def is_running(self) -> bool:
+        """Returns True if the scheduler has been started and not stopped,
+        False otherwise.
+
+        :return: True if the scheduler is running, False otherwise.
+        """
+        return bool(self._tasks)
+
+    def add(self, key: str) -> None:
+        """Registers the key to be polled. Adding a key twice has no effect.
+        Keys added while the scheduler is running are polled after it
+        restarts.
+
+        :param key: The key.
+        """
+        if key not in self._keys:
+            self._keys.append(key)
+
+    def start(self) -> None:
+        """Starts polling every key, the i-th of n keys first polling
+        i / n intervals from now. Has no effect if the scheduler is running."""
+        if self.is_running:
+            return
+        for index, key in enumerate(self._keys):
+            offset = self.interval_seconds * index / len(self._keys)
+            self._tasks[key] = asyncio.ensure_future(
+                self._poll_forever(key, offset))
+
+    def stop(self) -> None:
+        """Stops polling."""
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks = {}
+
+    async def _poll_forever(self, key: str, offset: float) -> None:
+        """Polls the key repeatedly, starting after the offset. Errors are
+        logged and reported to the policy, and do not stop future polls.
+
+        :param key: The key.
+        :param offset: The number of seconds to wait before the first poll.
+        """
+        await asyncio.sleep(offset)
+        while True:
+            start = time.monotonic()
+            try:
+                is_busy = bool(await self._poll(key))
+            except Exception as error:  # pylint: disable=broad-except
+                delay = self.policy.get_delay(key, False, error)
+                logging.warning('Error polling %s; retrying in %.1f seconds',
+                                key, delay, exc_info=True)
+            else:
+                delay = self.policy.get_delay(key, is_busy)
+            elapsed = time.monotonic() - start
+            await asyncio.sleep(max(0.0, delay - elapsed))
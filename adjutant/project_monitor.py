@@ -0,0 +1,278 @@
+"""Contains the ProjectMonitor class, which tracks the runs of one WandB project
+and the Discord channels to which its updates are posted."""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, \
+    TYPE_CHECKING
+import asyncio
+import math
+from adjutant.run_discovery import RunDiscovery, DISCOVERY_ORDER, \
+    get_latest_timestamp
+from adjutant.run_record import RunRecord
+from adjutant.run_store import RunStore, IN_MEMORY_FILENAME
+from adjutant.leaderboard import Leaderboard, MINIMIZE
+from adjutant.metrics import MetricsRegistry
+from adjutant.config_index import ConfigIndex
+from adjutant.run_table import RunTable, CONFIG_PREFIX, SUMMARY_PREFIX
+if TYPE_CHECKING:
+    import wandb
+    from wandb.apis.public import Run
+    from discord import TextChannel
+
+TRACKED_SUMMARY_METRICS = ('best_val_loss',)
+DEFAULT_LEADERBOARD_METRICS = {'best_val_loss': MINIMIZE}
+RUNS_PER_PAGE = 50
+
+
+class ProjectMonitor:
+    """Tracks one WandB project: the runs already reported, its leaderboards,
+    its discovery watermark and persisted state, and the names of the channels
+    in which its updates are posted. The methods that query WandB block and are
+    meant to run in a background thread; they take the API client as an
+    argument so that all of a client's projects can share one."""
+    # pylint: disable=too-many-instance-attributes
+    wandb_entity: str
+    wandb_project_title: str
+    channel_names: List[str]
+    channels: List['TextChannel']
+    reported_runs: Dict[str, RunRecord]
+    leaderboards: Dict[str, Leaderboard]
+    config_index: ConfigIndex
+    run_table: RunTable
+    check_lock: asyncio.Lock
+    metrics: Optional[MetricsRegistry]
+    _tracked_summary_metrics: Tuple[str, ...]
+    _run_store: RunStore
+    _run_discovery: RunDiscovery
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+            self,
+            wandb_entity: str,
+            wandb_project_title: str,
+            channel_name: str = 'general',
+            incremental_discovery: bool = True,
+            state_filename: Optional[str] = None,
+            leaderboard_metrics: Optional[Dict[str, str]] = None,
+            default_hyperparams: Optional[Dict[str, Any]] = None,
+            ignored_hyperparams: Iterable[str] = ()) -> None:
+        """Instantiates the object.
+
+        :param wandb_entity: The WandB entity name (username or account name)
+            under which exists the project.
+        :param wandb_project_title: The title of the project on WandB.
+        :param channel_name: The name of the channel in which to post the
+            project's updates.
+        :param incremental_discovery: If True, periodic WandB checks only fetch
+            the runs that finished since the previous check. If False, every
+            check fetches all finished runs in the project.
+        :param state_filename: The path to a SQLite database in which to keep
+            the project's reported runs and discovery watermark between
+            restarts, or None to keep them in memory only. Each project needs
+            its own database.
+        :param leaderboard_metrics: The summary metrics by which runs can be
+            ranked, in addition to those in DEFAULT_LEADERBOARD_METRICS. The
+            keys are the metric names and the values are leaderboard.MINIMIZE
+            or leaderboard.MAXIMIZE.
+        :param default_hyperparams: The hyperparameter values that the training
+            script uses when they are not given. Configs are compared after
+            filling in these values.
+        :param ignored_hyperparams: The hyperparameters that do not affect
+            results, e.g., output paths, and so are left out of config
+            comparisons.
+        """
+        self.wandb_entity = wandb_entity
+        self.wandb_project_title = wandb_project_title
+        self.channel_names = [channel_name]
+        self.channels = []
+        leaderboard_metrics = {**DEFAULT_LEADERBOARD_METRICS,
+                               **(leaderboard_metrics or {})}
+        self.leaderboards = {
+            metric: Leaderboard(metric, direction)
+            for metric, direction in leaderboard_metrics.items()}
+        self._tracked_summary_metrics = tuple(dict.fromkeys(
+            (*TRACKED_SUMMARY_METRICS, *leaderboard_metrics)))
+        self.config_index = ConfigIndex(default_hyperparams,
+                                        ignored_hyperparams)
+        self.run_table = RunTable()
+        self._run_store = RunStore(state_filename or IN_MEMORY_FILENAME)
+        self.reported_runs = {}
+        self.add_reported_runs(self._run_store.load_runs())
+        self._run_discovery = RunDiscovery(
+            incremental=incremental_discovery,
+            watermark=self._run_store.get_watermark())
+        self.check_lock = asyncio.Lock()
+        self.metrics = None
+
+    @property
+    def path(self) -> str:
+        """Returns the project's WandB path.
+
+        :return: The project's WandB path, of the form entity/project.
+        """
+        return f'{self.wandb_entity}/{self.wandb_project_title}'
+
+    def add_channel_name(self, channel_name: str) -> None:
+        """Also posts the project's updates in the named channel.
+
+        :param channel_name: The name of the channel.
+        """
+        if channel_name not in self.channel_names:
+            self.channel_names.append(channel_name)
+
+    def is_initialized(self) -> bool:
+        """Returns True if the project's runs have been recorded by a full
+        scan, False otherwise.
+
+        :return: True if the project's runs have been recorded by a full scan,
+            False otherwise.
+        """
+        return self._run_store.is_initialized()
+
+    def get_discovery_filters(self) -> Dict[str, Any]:
+        """Returns the WandB filters for the next periodic check.
+
+        :return: The WandB filters for the next periodic check.
+        """
+        return self._run_discovery.get_filters()
+
+    def get_project_runs(
+            self,
+            api: 'wandb.Api',
+            filters: Optional[Dict[str, Any]] = None) -> Dict[str, 'Run']:
+        """Returns the dict of all Runs for this project that match the given
+        filters. The keys are the names of the runs and the values are the
+        corresponding Run objects. Filtering happens on the WandB server, so
+        only matching runs are downloaded. If self.metrics is set, the numbers
+        of runs and pages fetched are counted.
+
+        :param api: The WandB API client.
+        :param filters: The WandB run filters to apply to the query, in the
+            MongoDB query format accepted by wandb.Api.runs. If None, all
+            finished runs are returned.
+        :return: The dict of all Runs for this project that match the filters.
+        """
+        if not filters:
+            filters = {'state': 'finished'}
+        api.flush()
+        runs = api.runs(self.path, filters=filters, order=DISCOVERY_ORDER,
+                        per_page=RUNS_PER_PAGE)
+        runs = {run.name: run for run in runs}
+        if self.metrics:
+            labels = {'project': self.path}
+            self.metrics.counter(
+                'adjutant_wandb_runs_fetched_total',
+                'The number of runs fetched from WandB.', labels).inc(
+                    len(runs))
+            self.metrics.counter(
+                'adjutant_wandb_pages_fetched_total',
+                'The number of pages of runs fetched from WandB.',
+                labels).inc(max(1, math.ceil(len(runs) / RUNS_PER_PAGE)))
+        return runs
+
+    def get_new_project_runs(
+            self,
+            api: 'wandb.Api',
+            reported_run_names: Set[str],
+            filters: Dict[str, Any]
+    ) -> Tuple[Dict[str, RunRecord], Optional[str]]:
+        """Returns the dict of finished runs for this project that match the
+        discovery filters and whose names are not in reported_run_names, along
+        with the latest heartbeat time of all matching runs. The summary of
+        each new run is read here so that reading it later does not block.
+
+        :param api: The WandB API client.
+        :param reported_run_names: The names of the runs that have already been
+            reported.
+        :param filters: The discovery filters to apply to the query.
+        :return: A 2-tuple of the dict of new runs for this project, keyed by
+            run name, and the latest heartbeat time of all matching runs (None
+            if no runs matched).
+        """
+        runs = self.get_project_runs(api, filters)
+        new_runs = {name: RunRecord.from_run(run,
+                                             self._tracked_summary_metrics)
+                    for name, run in runs.items()
+                    if name not in reported_run_names}
+        latest_heartbeat = get_latest_timestamp(
+            getattr(run, 'heartbeat_at', None) for run in runs.values())
+        return new_runs, latest_heartbeat
+
+    def initialize_run_store(
+            self,
+            api: 'wandb.Api') -> Tuple[Dict[str, RunRecord], Optional[str]]:
+        """Saves all finished runs for this project to the run store as already
+        reported, along with the discovery watermark.
+
+        :param api: The WandB API client.
+        :return: A 2-tuple of the dict of all finished runs for this project,
+            keyed by run name, and the latest heartbeat time of those runs.
+        """
+        runs, latest_heartbeat = self.get_new_project_runs(
+            api, set(), RunDiscovery(incremental=False).get_filters())
+        self._run_store.save_runs(runs.values())
+        self._run_store.set_watermark(latest_heartbeat)
+        self._run_store.mark_initialized()
+        return runs, latest_heartbeat
+
+    def add_reported_runs(self, runs: Dict[str, RunRecord]) -> None:
+        """Records the runs as reported and adds them to the leaderboards, the
+        config index, and the run table.
+
+        :param runs: The dict of runs to add. The keys are the names of the runs
+            and the values are the corresponding RunRecord objects.
+        """
+        self.reported_runs.update(runs)
+        for metric, leaderboard in self.leaderboards.items():
+            leaderboard.add_many((name, run.summary.get(metric))
+                                 for name, run in runs.items())
+        for name, run in runs.items():
+            self.config_index.add(name, run.config)
+        self.run_table.add_many((name, self._get_table_fields(run))
+                                for name, run in runs.items())
+
+    def add_reported_run(self, run: RunRecord) -> None:
+        """Records one run as reported and inserts it into the leaderboards,
+        the config index, and the run table without re-sorting them.
+
+        :param run: The run.
+        """
+        self.reported_runs[run.name] = run
+        for metric, leaderboard in self.leaderboards.items():
+            leaderboard.add(run.name, run.summary.get(metric))
+        self.config_index.add(run.name, run.config)
+        self.run_table.add(run.name, self._get_table_fields(run))
+
+    def _get_table_fields(self, run: RunRecord) -> Dict[str, Any]:
+        """Returns the run's fields in the run table: its canonical config, as
+        compared by the config index, and its tracked summary metrics.
+
+        :param run: The run.
+        :return: The run's fields, keyed by prefixed field name.
+        """
+        fields = {CONFIG_PREFIX + key: value for key, value in
+                  self.config_index.canonicalize(run.config).items()}
+        fields.update((SUMMARY_PREFIX + key, value)
+                      for key, value in run.summary.items())
+        return fields
+
+    def save_reported_run(self, run: RunRecord) -> None:
+        """Records the run as reported and saves it to the run store.
+
+        :param run: The run.
+        """
+        self.add_reported_run(run)
+        self._run_store.save_runs([run])
+
+    def advance_watermark(self, latest_heartbeat: Optional[str]) -> None:
+        """Moves the discovery watermark forward to the latest heartbeat seen
+        and persists it. Call only once the runs it covers have been saved.
+
+        :param latest_heartbeat: The latest heartbeat time of the runs found by
+            a check, or None if it found no runs.
+        """
+        self._run_discovery.advance([latest_heartbeat])
+        self._run_store.set_watermark(self._run_discovery.watermark)
+
+    def close(self) -> None:
+        """Closes the project's run store."""
+        self._run_store.close()
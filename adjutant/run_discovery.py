@@ -0,0 +1,105 @@
+"""Contains the RunDiscovery class, which lets Adjutant fetch only the runs that
+finished since its last WandB check."""
+
+from typing import Any, Dict, Iterable, Optional
+from datetime import datetime, timedelta
+
+FINISHED_STATE = 'finished'
+DEFAULT_OVERLAP_SECONDS = 300
+HEARTBEAT_FILTER_KEY = 'heartbeatAt'
+DISCOVERY_ORDER = '+heartbeat_at'
+
+
+def parse_wandb_timestamp(timestamp: str) -> datetime:
+    """Returns the datetime represented by a WandB timestamp string.
+
+    :param timestamp: A WandB timestamp in ISO 8601 format, e.g.,
+        '2021-09-18T17:07:44' or '2021-09-18T17:07:44Z'. WandB timestamps are
+        in UTC.
+    :return: The naive UTC datetime represented by the timestamp.
+    """
+    if timestamp.endswith('Z'):
+        timestamp = timestamp[:-1]
+    return datetime.fromisoformat(timestamp)
+
+
+def format_wandb_timestamp(timestamp: datetime) -> str:
+    """Returns the WandB timestamp string for a naive UTC datetime.
+
+    :param timestamp: The naive UTC datetime.
+    :return: The timestamp in ISO 8601 format with seconds precision.
+    """
+    return timestamp.isoformat(timespec='seconds')
+
+
+def get_latest_timestamp(timestamps: Iterable[Optional[str]]) -> Optional[str]:
+    """Returns the latest of the given WandB timestamps.
+
+    :param timestamps: The WandB timestamps. None values are ignored.
+    :return: The latest timestamp, or None if there are no timestamps.
+    """
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    if not timestamps:
+        return None
+    return max(timestamps, key=parse_wandb_timestamp)
+
+
+class RunDiscovery:
+    """Keeps a watermark on the latest heartbeat time of the finished runs seen
+    so far and builds WandB queries that only match runs that finished after
+    it. A run's last heartbeat is (approximately) when it finished, so the cost
+    of each query scales with recent activity rather than with the size of the
+    project's history."""
+    watermark: Optional[str]
+    incremental: bool
+    _overlap: timedelta
+
+    def __init__(
+            self,
+            incremental: bool = True,
+            overlap_seconds: float = DEFAULT_OVERLAP_SECONDS,
+            watermark: Optional[str] = None) -> None:
+        """Instantiates the object.
+
+        :param incremental: If True, queries only match runs whose heartbeat is
+            after the watermark. If False, every query matches all finished runs
+            in the project.
+        :param overlap_seconds: The number of seconds before the watermark that
+            queries still match. WandB may mark a run finished some time after
+            its last heartbeat, so a small overlap keeps late runs from being
+            skipped. Runs matched more than once must be deduplicated by the
+            caller.
+        :param watermark: The latest heartbeat timestamp seen previously, or
+            None if no runs have been seen.
+        """
+        self.incremental = incremental
+        self._overlap = timedelta(seconds=overlap_seconds)
+        self.watermark = watermark
+
+    def get_filters(self) -> Dict[str, Any]:
+        """Returns the WandB run filters that match the finished runs that may
+        not have been seen yet.
+
+        :return: The filters, in the MongoDB query format accepted by
+            wandb.Api.runs.
+        """
+        if not self.incremental or self.watermark is None:
+            return {'state': FINISHED_STATE}
+        since = parse_wandb_timestamp(self.watermark) - self._overlap
+        return {'$and': [
+            {'state': FINISHED_STATE},
+            {HEARTBEAT_FILTER_KEY: {'$gt': format_wandb_timestamp(since)}}]}
+
+    def advance(self, heartbeat_times: Iterable[Optional[str]]) -> None:
+        """Moves the watermark forward to the latest of the given heartbeat
+        times. The watermark never moves backward.
+
+        :param heartbeat_times: The heartbeat timestamps of fetched runs. None
+            values (runs with no heartbeat) are ignored.
+        """
+        latest = get_latest_timestamp(heartbeat_times)
+        if latest is None:
+            return
+        if self.watermark is None or parse_wandb_timestamp(
+                latest) > parse_wandb_timestamp(self.watermark):
+            self.watermark = latest
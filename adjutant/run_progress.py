@@ -0,0 +1,306 @@
+"""Contains the ProgressTracker class, which follows the live WandB histories
+of running experiments, fetching only the rows logged since the previous
+update and keeping a downsampled copy of each metric."""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, \
+    Sequence, Tuple, TYPE_CHECKING
+import asyncio
+import collections
+import math
+from adjutant.early_stopping import STEP_KEY, get_run
+if TYPE_CHECKING:
+    from wandb.apis.public import Api
+
+DEFAULT_PROGRESS_METRICS = ('loss', 'val_loss')
+FINAL_STATES = ('finished', 'failed', 'crashed', 'killed')
+INTERNAL_KEY_PREFIX = '_'
+DEFAULT_MAX_POINTS = 256
+DEFAULT_MAX_RUNS = 100
+SPARKLINE_CHARS = '▁▂▃▄▅▆▇█'
+SPARKLINE_WIDTH = 24
+
+
+def get_new_history(
+        api: 'Api',
+        run_path: str,
+        metrics: Optional[Sequence[str]],
+        min_step: int) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Returns a run's state and the metrics of the history rows it has logged
+    from min_step onward. This function makes blocking WandB API calls and is
+    meant to run in a background thread.
+
+    :param api: The WandB API.
+    :param run_path: The path to the run, of the form entity/project/run_id.
+    :param metrics: The metrics to keep from each row, or None for every
+        metric except WandB's internal ones (those starting with
+        INTERNAL_KEY_PREFIX, e.g., _runtime). Rows need not log all of them.
+    :param min_step: The first step to fetch.
+    :return: A 2-tuple of the run's state (None if the run does not exist
+        yet, e.g., because the experiment is still starting) and its new rows
+        in step order, each holding STEP_KEY and whichever metrics it logged.
+    """
+    run = get_run(api, run_path)
+    if run is None:
+        return None, []
+    if metrics is None:
+        rows = [{key: value for key, value in row.items()
+                 if key == STEP_KEY or not key.startswith(INTERNAL_KEY_PREFIX)}
+                for row in run.scan_history(min_step=min_step)
+                if STEP_KEY in row]
+    else:
+        keys = (STEP_KEY, *metrics)
+        rows = [{key: row[key] for key in keys if key in row}
+                for row in run.scan_history(min_step=min_step)
+                if STEP_KEY in row]
+    return getattr(run, 'state', None), rows
+
+
+def get_sparkline(values: Sequence[float],
+                  width: int = SPARKLINE_WIDTH) -> str:
+    """Returns a line of block characters tracing the values, averaged into at
+    most width buckets.
+
+    :param values: The values, in step order.
+    :param width: The maximum number of characters.
+    :return: The sparkline, or the empty string if there are no values.
+    """
+    if not values:
+        return ''
+    num_buckets = min(width, len(values))
+    buckets = [values[len(values) * index // num_buckets:
+                      len(values) * (index + 1) // num_buckets]
+               for index in range(num_buckets)]
+    means = [sum(bucket) / len(bucket) for bucket in buckets]
+    low, high = min(means), max(means)
+    if high == low:
+        return SPARKLINE_CHARS[0] * num_buckets
+    scale = (len(SPARKLINE_CHARS) - 1) / (high - low)
+    return ''.join(SPARKLINE_CHARS[round((mean - low) * scale)]
+                   for mean in means)
+
+
+class MetricHistory:
+    """The downsampled history of one metric. Every stride-th logged value is
+    kept; when more than max_points are kept, every other one is dropped and
+    the stride doubles, so memory stays bounded however long the run is while
+    the kept points still cover it evenly. The latest value and the extremes
+    are tracked exactly."""
+    # pylint: disable=too-many-instance-attributes
+    max_points: int
+    steps: List[int]
+    values: List[float]
+    stride: int
+    num_values: int
+    last: Optional[Tuple[int, float]]
+    minimum: float
+    maximum: float
+
+    def __init__(self, max_points: int = DEFAULT_MAX_POINTS) -> None:
+        """Instantiates the object.
+
+        :param max_points: The maximum number of values to keep. Must be at
+            least 2.
+        """
+        if max_points < 2:
+            raise ValueError('max_points must be at least 2.')
+        self.max_points = max_points
+        self.steps = []
+        self.values = []
+        self.stride = 1
+        self.num_values = 0
+        self.last = None
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def append(self, step: int, value: Any) -> bool:
+        """Records the value logged at the step. Values that are not finite
+        numbers are ignored.
+
+        :param step: The step.
+        :param value: The logged value.
+        :return: True if the value was recorded, False otherwise.
+        """
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+                not math.isfinite(value):
+            return False
+        if self.num_values % self.stride == 0:
+            self.steps.append(step)
+            self.values.append(value)
+            if len(self.values) > self.max_points:
+                self.steps = self.steps[::2]
+                self.values = self.values[::2]
+                self.stride *= 2
+        self.num_values += 1
+        self.last = (step, value)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        return True
+
+    def get_points(self) -> List[Tuple[int, float]]:
+        """Returns the kept (step, value) points, ending with the latest one.
+
+        :return: The kept points in step order.
+        """
+        points = list(zip(self.steps, self.values))
+        if self.last is not None and (not points or points[-1] != self.last):
+            points.append(self.last)
+        return points
+
+
+class RunProgress:
+    """The cached progress of one run: its state, the step from which to fetch
+    the next update, and the downsampled history of each metric."""
+    run_path: str
+    state: Optional[str]
+    next_step: int
+    num_rows: int
+    histories: Dict[str, MetricHistory]
+    lock: asyncio.Lock
+    _max_points: int
+
+    def __init__(self, run_path: str,
+                 max_points: int = DEFAULT_MAX_POINTS) -> None:
+        """Instantiates the object.
+
+        :param run_path: The path to the run, of the form
+            entity/project/run_id.
+        :param max_points: The maximum number of values to keep per metric.
+        """
+        self.run_path = run_path
+        self.state = None
+        self.next_step = 0
+        self.num_rows = 0
+        self.histories = {}
+        self.lock = asyncio.Lock()
+        self._max_points = max_points
+
+    def add_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """Records the new history rows and advances the cursor past them.
+
+        :param rows: The rows logged since the previous update, in step order,
+            as returned by get_new_history.
+        """
+        for row in rows:
+            step = row[STEP_KEY]
+            if step < self.next_step:
+                continue
+            for metric, value in row.items():
+                if metric == STEP_KEY:
+                    continue
+                if metric not in self.histories:
+                    self.histories[metric] = MetricHistory(self._max_points)
+                self.histories[metric].append(step, value)
+            self.next_step = step + 1
+            self.num_rows += 1
+
+    def summarize(self) -> str:
+        """Returns a one-line summary of the run's latest metrics.
+
+        :return: The one-line summary.
+        """
+        if not self.num_rows:
+            return f'{self.state or "not started"}, no history yet'
+        metrics = ', '.join(
+            f'{metric} {history.last[1]:.4g}'
+            for metric, history in sorted(self.histories.items())
+            if history.last is not None)
+        return f'{self.state or "unknown"}, step {self.next_step - 1}: ' \
+               f'{metrics}'
+
+    def describe(self) -> str:
+        """Returns a multi-line description of the run's progress with a
+        sparkline for each metric.
+
+        :return: The description.
+        """
+        lines = [f'{self.run_path}: {self.summarize()}']
+        for metric, history in sorted(self.histories.items()):
+            if history.last is None:
+                continue
+            lines.append(
+                f'{metric}: {get_sparkline(history.values)} last '
+                f'{history.last[1]:.4g}, min {history.minimum:.4g}, max '
+                f'{history.maximum:.4g} over {history.num_values} values')
+        return '\n'.join(lines)
+
+
+class ProgressTracker:
+    """Follows the progress of runs. Each update of a run fetches only the
+    history rows logged since the previous update of that run, runs in one of
+    FINAL_STATES are not fetched again, and at most max_runs runs are cached,
+    evicting the least recently updated one."""
+    metrics: Optional[Tuple[str, ...]]
+    max_points: int
+    max_runs: int
+    _runs: 'collections.OrderedDict[str, RunProgress]'
+
+    def __init__(
+            self,
+            metrics: Optional[Sequence[str]] = DEFAULT_PROGRESS_METRICS,
+            max_points: int = DEFAULT_MAX_POINTS,
+            max_runs: int = DEFAULT_MAX_RUNS) -> None:
+        """Instantiates the object.
+
+        :param metrics: The history metrics to follow, or None for all of
+            them.
+        :param max_points: The maximum number of values to keep per metric of
+            each run.
+        :param max_runs: The maximum number of runs to cache.
+        """
+        # Fail fast on invalid arguments rather than on the first update.
+        _ = MetricHistory(max_points)
+        if max_runs < 1:
+            raise ValueError('max_runs must be at least 1.')
+        self.metrics = tuple(metrics) if metrics is not None else None
+        self.max_points = max_points
+        self.max_runs = max_runs
+        self._runs = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        """Returns the number of cached runs.
+
+        :return: The number of cached runs.
+        """
+        return len(self._runs)
+
+    def get(self, run_path: str) -> Optional[RunProgress]:
+        """Returns the cached progress of the run without fetching anything.
+
+        :param run_path: The path to the run.
+        :return: The run's progress, or None if it is not cached.
+        """
+        return self._runs.get(run_path)
+
+    async def update(
+            self,
+            run_path: str,
+            fetch_history: Callable[[str, Optional[Sequence[str]], int],
+                                    Awaitable[Tuple[Optional[str],
+                                                    List[Dict[str, Any]]]]]
+    ) -> RunProgress:
+        """Fetches the run's new history rows and returns its progress.
+        Concurrent updates of the same run wait for each other, so no rows are
+        fetched twice.
+
+        :param run_path: The path to the run.
+        :param fetch_history: A coroutine function that takes the run path,
+            the metrics, and the first step to fetch, and returns the run's
+            state and new rows, like get_new_history.
+        :return: The run's progress.
+        """
+        progress = self._runs.get(run_path)
+        if progress is None:
+            progress = RunProgress(run_path, self.max_points)
+            self._runs[run_path] = progress
+        self._runs.move_to_end(run_path)
+        while len(self._runs) > self.max_runs:
+            self._runs.popitem(last=False)
+        async with progress.lock:
+            if progress.state in FINAL_STATES:
+                return progress
+            state, rows = await fetch_history(run_path, self.metrics,
+                                              progress.next_step)
+            if state is not None:
+                progress.state = state
+            progress.add_rows(rows)
+        return progress
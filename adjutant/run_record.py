@@ -0,0 +1,120 @@
+"""Contains the RunRecord class, a compact representation of a reported WandB
+run."""
+
+from typing import Any, Dict, Optional, Sequence, Tuple, TYPE_CHECKING
+import sys
+from adjutant.config_index import INTERNAL_KEY_PREFIX
+if TYPE_CHECKING:
+    from wandb.apis.public import Run
+
+
+class RunRecord:
+    """The subset of a WandB run that Adjutant keeps after reporting it: its
+    identifiers, state, timestamps, tracked summary metrics, and hyperparameter
+    config. Unlike a wandb.apis.public.Run, a record does not hold the run's
+    full summary, WandB's internal config entries, system metrics, or API
+    client, and it uses __slots__ instead of a
+    per-instance __dict__, so a long-lived bot can keep one for every run in a
+    large project."""
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = ('name', 'id', 'url', 'state', 'created_at', 'heartbeat_at',
+                 'summary', 'config')
+    name: str
+    id: str
+    url: str
+    state: str
+    created_at: Optional[str]
+    heartbeat_at: Optional[str]
+    summary: Dict[str, Any]
+    config: Dict[str, Any]
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+            self,
+            name: str,
+            run_id: str,
+            url: str,
+            state: str,
+            created_at: Optional[str],
+            heartbeat_at: Optional[str],
+            summary: Dict[str, Any],
+            config: Optional[Dict[str, Any]] = None) -> None:
+        """Instantiates the object.
+
+        :param name: The name of the run.
+        :param run_id: The unique ID of the run.
+        :param url: The URL of the run on WandB.
+        :param state: The state of the run, e.g., 'finished'.
+        :param created_at: The timestamp at which the run was created.
+        :param heartbeat_at: The timestamp of the run's last heartbeat.
+        :param summary: The tracked summary metrics of the run.
+        :param config: The hyperparameter config of the run, or None if it is
+            unknown.
+        """
+        self.name = name
+        self.id = run_id
+        self.url = url
+        # There are only a handful of distinct states; share their strings.
+        self.state = sys.intern(state)
+        self.created_at = created_at
+        self.heartbeat_at = heartbeat_at
+        self.summary = summary
+        self.config = config if config is not None else {}
+
+    @staticmethod
+    def from_run(run: 'Run', summary_keys: Sequence[str]) -> 'RunRecord':
+        """Returns the RunRecord for a WandB run. Reading the run's summary may
+        make a blocking WandB API call.
+
+        :param run: The WandB run.
+        :param summary_keys: The summary metrics to keep. Metrics that the run
+            did not log are omitted.
+        :return: The RunRecord for the WandB run.
+        """
+        summary = run.summary
+        config = getattr(run, 'config', None) or {}
+        return RunRecord(
+            name=run.name,
+            run_id=run.id,
+            url=run.url,
+            state=run.state,
+            created_at=getattr(run, 'created_at', None),
+            heartbeat_at=getattr(run, 'heartbeat_at', None),
+            summary={key: summary[key] for key in summary_keys
+                     if key in summary},
+            config={key: value for key, value in config.items()
+                    if not key.startswith(INTERNAL_KEY_PREFIX)})
+
+    def as_tuple(self) -> Tuple[Any, ...]:
+        """Returns the record's fields as a tuple, in __slots__ order.
+
+        :return: The record's fields as a tuple.
+        """
+        return tuple(getattr(self, field) for field in RunRecord.__slots__)
+
+    def __eq__(self, other: Any) -> bool:
+        """Returns True if other is a RunRecord with the same fields, False
+        otherwise.
+
+        :param other: The object to compare.
+        :return: True if other is a RunRecord with the same fields, False
+            otherwise.
+        """
+        if not isinstance(other, RunRecord):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self) -> int:
+        """Returns the hash of the record's name.
+
+        :return: The hash of the record's name.
+        """
+        return hash(self.name)
+
+    def __repr__(self) -> str:
+        """Returns the string representation of the record.
+
+        :return: The string representation of the record.
+        """
+        return f'RunRecord(name={self.name!r}, id={self.id!r}, ' \
+               f'state={self.state!r}, summary={self.summary!r})'
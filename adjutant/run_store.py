@@ -0,0 +1,142 @@
+"""Contains the RunStore class, which persists Adjutant's view of a WandB
+project to a local SQLite database so that it survives restarts."""
+
+from typing import Dict, Iterable, Optional
+import json
+import sqlite3
+import threading
+from adjutant.run_record import RunRecord
+
+IN_MEMORY_FILENAME = ':memory:'
+METADATA_WATERMARK = 'watermark'
+METADATA_INITIALIZED = 'initialized'
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS runs ('
+    'name TEXT PRIMARY KEY, '
+    'id TEXT, '
+    'url TEXT, '
+    'state TEXT, '
+    'created_at TEXT, '
+    'heartbeat_at TEXT, '
+    'summary TEXT NOT NULL, '
+    'config TEXT)',
+    'CREATE TABLE IF NOT EXISTS metadata ('
+    'key TEXT PRIMARY KEY, '
+    'value TEXT)'
+)
+
+
+class RunStore:
+    """Persists the runs Adjutant has reported, along with its discovery
+    watermark, to a SQLite database. All methods are safe to call from any
+    thread, so writes can happen in the same background thread as the WandB
+    queries that produce them."""
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+
+    def __init__(self, filename: str = IN_MEMORY_FILENAME) -> None:
+        """Instantiates the object, creating the database if it does not exist.
+
+        :param filename: The path to the SQLite database file. If
+            IN_MEMORY_FILENAME, the store lasts only as long as the object.
+        """
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            if filename != IN_MEMORY_FILENAME:
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+            self._migrate()
+
+    def _migrate(self) -> None:
+        """Adds the columns that databases created by earlier versions lack.
+        Call while holding the lock, inside a transaction."""
+        columns = {row[1] for row in self._connection.execute(
+            'PRAGMA table_info(runs)')}
+        if 'config' not in columns:
+            self._connection.execute('ALTER TABLE runs ADD COLUMN config TEXT')
+
+    def load_runs(self) -> Dict[str, RunRecord]:
+        """Returns all stored runs.
+
+        :return: The dict of all stored runs. The keys are the names of the
+            runs and the values are the corresponding RunRecord objects.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT name, id, url, state, created_at, heartbeat_at, '
+                'summary, config FROM runs').fetchall()
+        return {row[0]: RunRecord(*row[:6], json.loads(row[6]),
+                                  json.loads(row[7]) if row[7] else None)
+                for row in rows}
+
+    def save_runs(self, runs: Iterable[RunRecord]) -> None:
+        """Inserts or updates the given runs in a single transaction.
+
+        :param runs: The runs to save.
+        """
+        rows = [(run.name, run.id, run.url, run.state, run.created_at,
+                 run.heartbeat_at, json.dumps(run.summary),
+                 json.dumps(run.config, default=str)) for run in runs]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO runs (name, id, url, state, '
+                'created_at, heartbeat_at, summary, config) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def get_metadata(self, key: str) -> Optional[str]:
+        """Returns the stored metadata value for the key.
+
+        :param key: The metadata key.
+        :return: The stored value, or None if the key is not present.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value FROM metadata WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, key: str, value: Optional[str]) -> None:
+        """Stores the metadata value for the key.
+
+        :param key: The metadata key.
+        :param value: The value to store.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)',
+                (key, value))
+
+    def get_watermark(self) -> Optional[str]:
+        """Returns the stored discovery watermark.
+
+        :return: The stored discovery watermark, or None if there is none.
+        """
+        return self.get_metadata(METADATA_WATERMARK)
+
+    def set_watermark(self, watermark: Optional[str]) -> None:
+        """Stores the discovery watermark.
+
+        :param watermark: The discovery watermark.
+        """
+        self.set_metadata(METADATA_WATERMARK, watermark)
+
+    def is_initialized(self) -> bool:
+        """Returns True if the store has been populated with a full scan of the
+        project, False otherwise.
+
+        :return: True if the store has been populated with a full scan of the
+            project, False otherwise.
+        """
+        return self.get_metadata(METADATA_INITIALIZED) is not None
+
+    def mark_initialized(self) -> None:
+        """Records that the store has been populated with a full scan of the
+        project."""
+        self.set_metadata(METADATA_INITIALIZED, '1')
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
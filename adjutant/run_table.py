@@ -0,0 +1,504 @@
+"""Contains the RunTable class, a columnar in-memory index of the config and
+summary fields of reported runs, and the RunQuery class, which parses the
+filter, sort, and aggregate queries that it answers."""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import json
+from json.decoder import JSONDecodeError
+import numpy as np
+from adjutant.config_index import canonicalize_value, dumps_canonical
+
+CONFIG_PREFIX = 'config.'
+SUMMARY_PREFIX = 'summary.'
+INITIAL_CAPACITY = 1024
+MISSING_CODE = -1
+OPERATORS: Dict[str, Callable[[Any, Any], np.ndarray]] = {
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+    '!=': np.not_equal,
+    '==': np.equal,
+    '>': np.greater,
+    '<': np.less,
+    '=': np.equal}
+ORDERED_OPERATORS = ('>=', '<=', '>', '<')
+ARG_SORT = 'sort'
+ARG_LIMIT = 'limit'
+ARG_AGGREGATE = 'agg'
+ARG_GROUP_BY = 'by'
+ARG_SEPARATOR = ':'
+DESCENDING_PREFIX = '-'
+DEFAULT_QUERY_LIMIT = 10
+MAX_QUERY_LIMIT = 25
+
+
+def _is_number(value: Any) -> bool:
+    """Returns True if the value is stored as a number, False otherwise.
+    Booleans are stored as categories, since ordering them is rarely meant.
+
+    :param value: The field value.
+    :return: True if the value is stored as a number, False otherwise.
+    """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _get_category(value: Any) -> str:
+    """Returns the category under which a non-numeric value is stored: strings
+    as themselves and other values as canonical JSON, e.g., true or [64, 32].
+
+    :param value: The field value.
+    :return: The category.
+    """
+    if isinstance(value, str):
+        return value
+    return dumps_canonical(canonicalize_value(value))
+
+
+def _aggregate_by_key(
+        keys: np.ndarray,
+        values: np.ndarray,
+        get_label: Callable[[Any], str],
+        has_values: bool) -> List[Tuple[str, int, Optional[float],
+                                        Optional[float], Optional[float]]]:
+    """Returns the count of the values and their mean, minimum, and maximum
+    for each distinct key.
+
+    :param keys: The group key of each row.
+    :param values: The value of each row.
+    :param get_label: The function that returns a key's display label.
+    :param has_values: Whether the values are meaningful; if not, only counts
+        are returned.
+    :return: One 5-tuple per key of the key's label, the number of rows, and
+        the mean, minimum, and maximum value (None if not has_values).
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique_keys))
+    if not has_values:
+        return [(get_label(key), int(count), None, None, None)
+                for key, count in zip(unique_keys, counts)]
+    sums = np.bincount(inverse, weights=values, minlength=len(unique_keys))
+    minimums = np.full(len(unique_keys), np.inf)
+    maximums = np.full(len(unique_keys), -np.inf)
+    np.minimum.at(minimums, inverse, values)
+    np.maximum.at(maximums, inverse, values)
+    return [(get_label(key), int(counts[index]),
+             float(sums[index] / counts[index]), float(minimums[index]),
+             float(maximums[index]))
+            for index, key in enumerate(unique_keys)]
+
+
+class _Column:
+    """One field of a RunTable. Numeric values are stored in a float array,
+    with NaN where a run has no numeric value; other values are stored as
+    integer codes into a list of distinct categories, with MISSING_CODE where
+    a run has no such value. Each array is only allocated once the field has a
+    value of its kind."""
+    numbers: Optional[np.ndarray]
+    codes: Optional[np.ndarray]
+    categories: List[str]
+    _codes_by_category: Dict[str, int]
+    _capacity: int
+
+    def __init__(self, capacity: int) -> None:
+        """Instantiates the object.
+
+        :param capacity: The number of rows for which to allocate space.
+        """
+        self.numbers = None
+        self.codes = None
+        self.categories = []
+        self._codes_by_category = {}
+        self._capacity = capacity
+
+    def resize(self, capacity: int) -> None:
+        """Grows the column's arrays, filling the new rows with missing values.
+
+        :param capacity: The new number of rows, at least the current one.
+        """
+        if self.numbers is not None:
+            self.numbers = np.concatenate((self.numbers, np.full(
+                capacity - self._capacity, np.nan)))
+        if self.codes is not None:
+            self.codes = np.concatenate((self.codes, np.full(
+                capacity - self._capacity, MISSING_CODE, dtype=np.int32)))
+        self._capacity = capacity
+
+    def set(self, row: int, value: Any) -> None:
+        """Stores the row's value, replacing any previous value.
+
+        :param row: The row index.
+        :param value: The value, or None if the run has no value.
+        """
+        if self.numbers is not None:
+            self.numbers[row] = np.nan
+        if self.codes is not None:
+            self.codes[row] = MISSING_CODE
+        if value is None:
+            return
+        if _is_number(value):
+            if self.numbers is None:
+                self.numbers = np.full(self._capacity, np.nan)
+            self.numbers[row] = value
+            return
+        if self.codes is None:
+            self.codes = np.full(self._capacity, MISSING_CODE, dtype=np.int32)
+        category = _get_category(value)
+        code = self._codes_by_category.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self._codes_by_category[category] = code
+        self.codes[row] = code
+
+    def get_code(self, value: Any) -> int:
+        """Returns the code of the value's category.
+
+        :param value: The value.
+        :return: The code, or MISSING_CODE if no row has the value.
+        """
+        return self._codes_by_category.get(_get_category(value), MISSING_CODE)
+
+    def get_numbers(self, size: int) -> np.ndarray:
+        """Returns the numeric values of the first size rows.
+
+        :param size: The number of rows.
+        :return: The numeric values, with NaN where a row has none.
+        """
+        if self.numbers is None:
+            return np.full(size, np.nan)
+        return self.numbers[:size]
+
+    def get_codes(self, size: int) -> np.ndarray:
+        """Returns the category codes of the first size rows.
+
+        :param size: The number of rows.
+        :return: The codes, with MISSING_CODE where a row has no category.
+        """
+        if self.codes is None:
+            return np.full(size, MISSING_CODE, dtype=np.int32)
+        return self.codes[:size]
+
+    def format(self, row: int) -> str:
+        """Returns the row's value for display.
+
+        :param row: The row index.
+        :return: The row's value, or 'n/a' if it has none.
+        """
+        if self.numbers is not None and not np.isnan(self.numbers[row]):
+            return f'{self.numbers[row]:.4g}'
+        if self.codes is not None and self.codes[row] != MISSING_CODE:
+            return self.categories[self.codes[row]]
+        return 'n/a'
+
+
+class RunQuery:
+    """A parsed query over a RunTable: conditions that rows must all meet, and
+    either a sort order and limit for listing the matching runs or a field to
+    aggregate, optionally grouped by another field. Queries are written as
+    space-separated arguments, e.g., 'batch_size>=64 best_val_loss<0.1
+    sort:best_val_loss limit:5' or 'epochs>=10 agg:best_val_loss
+    by:batch_size'. A sort field starting with DESCENDING_PREFIX sorts in
+    descending order. Condition values are parsed as JSON where possible and
+    are otherwise strings."""
+    # pylint: disable=too-few-public-methods
+    conditions: List[Tuple[str, str, Any]]
+    sort_field: Optional[str]
+    descending: bool
+    limit: int
+    aggregate_field: Optional[str]
+    group_by_field: Optional[str]
+
+    def __init__(self, text: str) -> None:
+        """Instantiates the object.
+
+        :param text: The query.
+        :raises ValueError: If the query is malformed.
+        """
+        self.conditions = []
+        self.sort_field = None
+        self.descending = False
+        self.limit = DEFAULT_QUERY_LIMIT
+        self.aggregate_field = None
+        self.group_by_field = None
+        for arg in text.split():
+            name, separator, value = arg.partition(ARG_SEPARATOR)
+            if separator and name in (ARG_SORT, ARG_LIMIT, ARG_AGGREGATE,
+                                      ARG_GROUP_BY):
+                self._set_option(name, value)
+            else:
+                self.conditions.append(RunQuery._parse_condition(arg))
+
+    def _set_option(self, name: str, value: str) -> None:
+        """Sets the query option.
+
+        :param name: One of ARG_SORT, ARG_LIMIT, ARG_AGGREGATE, or
+            ARG_GROUP_BY.
+        :param value: The option's value.
+        :raises ValueError: If the value is empty or not a valid limit.
+        """
+        if not value:
+            raise ValueError(f'{name}{ARG_SEPARATOR} needs a value.')
+        if name == ARG_SORT:
+            self.descending = value.startswith(DESCENDING_PREFIX)
+            self.sort_field = value.lstrip(DESCENDING_PREFIX)
+        elif name == ARG_LIMIT:
+            if not value.isdigit():
+                raise ValueError(f'{ARG_LIMIT}{ARG_SEPARATOR} needs a number.')
+            self.limit = min(max(int(value), 1), MAX_QUERY_LIMIT)
+        elif name == ARG_AGGREGATE:
+            self.aggregate_field = value
+        else:
+            self.group_by_field = value
+
+    @staticmethod
+    def _parse_condition(arg: str) -> Tuple[str, str, Any]:
+        """Returns the field, operator, and value of a condition.
+
+        :param arg: The condition, e.g., 'batch_size>=64'.
+        :return: A 3-tuple of the field, the operator (a key of OPERATORS),
+            and the value.
+        :raises ValueError: If the condition is malformed.
+        """
+        for operator in OPERATORS:
+            field, found, value = arg.partition(operator)
+            if found:
+                if not field or not value:
+                    break
+                try:
+                    value = json.loads(value)
+                except JSONDecodeError:
+                    pass
+                return field, operator, value
+        raise ValueError(f'cannot parse condition {arg!r}.')
+
+    @property
+    def is_aggregate(self) -> bool:
+        """Returns True if the query aggregates rather than lists runs.
+
+        :return: True if the query aggregates rather than lists runs.
+        """
+        return self.aggregate_field is not None or \
+            self.group_by_field is not None
+
+
+class RunTable:
+    """Stores one field per column, as NumPy arrays that grow by doubling, so
+    appending a run is amortized O(number of fields) and a query touches only
+    the columns it names. Fields are named with CONFIG_PREFIX or
+    SUMMARY_PREFIX, but queries may omit the prefix when only one of the two
+    fields exists."""
+    _names: List[str]
+    _rows_by_name: Dict[str, int]
+    _columns: Dict[str, _Column]
+    _capacity: int
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        """Instantiates the object.
+
+        :param capacity: The number of rows for which to allocate space
+            initially.
+        """
+        self._names = []
+        self._rows_by_name = {}
+        self._columns = {}
+        self._capacity = max(capacity, 1)
+
+    def __len__(self) -> int:
+        """Returns the number of runs.
+
+        :return: The number of runs.
+        """
+        return len(self._names)
+
+    @property
+    def fields(self) -> List[str]:
+        """Returns the names of the fields, sorted.
+
+        :return: The names of the fields, sorted.
+        """
+        return sorted(self._columns)
+
+    def get_name(self, row: int) -> str:
+        """Returns the name of the run in the row.
+
+        :param row: The row index.
+        :return: The name of the run.
+        """
+        return self._names[row]
+
+    def add(self, run_name: str, fields: Dict[str, Any]) -> None:
+        """Stores the run's fields, replacing those of any previous run with
+        the same name.
+
+        :param run_name: The name of the run.
+        :param fields: The run's fields. The keys are field names, e.g.,
+            'config.batch_size', and the values are the run's values.
+        """
+        row = self._rows_by_name.get(run_name)
+        if row is None:
+            row = len(self._names)
+            if row == self._capacity:
+                self._capacity *= 2
+                for column in self._columns.values():
+                    column.resize(self._capacity)
+            self._names.append(run_name)
+            self._rows_by_name[run_name] = row
+        else:
+            for field, column in self._columns.items():
+                if field not in fields:
+                    column.set(row, None)
+        for field, value in fields.items():
+            column = self._columns.get(field)
+            if column is None:
+                column = self._columns[field] = _Column(self._capacity)
+            column.set(row, value)
+
+    def add_many(self, runs: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Stores the fields of each run.
+
+        :param runs: The runs, as 2-tuples of run name and fields.
+        """
+        for run_name, fields in runs:
+            self.add(run_name, fields)
+
+    def resolve_field(self, field: str) -> str:
+        """Returns the full name of a field given with or without its prefix.
+
+        :param field: The field name.
+        :return: The full field name.
+        :raises ValueError: If no field or more than one field has the name.
+        """
+        if field in self._columns:
+            return field
+        matches = [prefix + field for prefix in (CONFIG_PREFIX, SUMMARY_PREFIX)
+                   if prefix + field in self._columns]
+        if not matches:
+            raise ValueError(f'no run has the field {field!r}.')
+        if len(matches) > 1:
+            raise ValueError(f'{field!r} is ambiguous; use one of '
+                             f'{", ".join(matches)}.')
+        return matches[0]
+
+    def _get_mask(self, field: str, operator: str, value: Any) -> np.ndarray:
+        """Returns which rows meet the condition. Rows without a value for the
+        field never meet it.
+
+        :param field: The full field name.
+        :param operator: A key of OPERATORS.
+        :param value: The value to compare with.
+        :return: The boolean array with one entry per row.
+        :raises ValueError: If the operator orders a non-numeric value.
+        """
+        column = self._columns[field]
+        size = len(self)
+        compare = OPERATORS[operator]
+        if _is_number(value):
+            numbers = column.get_numbers(size)
+            return compare(numbers, value) & ~np.isnan(numbers)
+        if operator in ORDERED_OPERATORS:
+            raise ValueError(f'{operator} needs a number, not {value!r}.')
+        codes = column.get_codes(size)
+        return compare(codes, column.get_code(value)) & \
+            (codes != MISSING_CODE)
+
+    def _get_sort_keys(self, field: str, rows: np.ndarray,
+                       descending: bool) -> np.ndarray:
+        """Returns the keys by which to sort the rows: numbers before
+        categories, categories in lexicographic order, and missing values
+        last in either direction.
+
+        :param field: The full field name.
+        :param rows: The row indices.
+        :param descending: Whether to sort in descending order.
+        :return: A 2D array whose columns np.lexsort sorts by, last first.
+        """
+        column = self._columns[field]
+        numbers = column.get_numbers(len(self))[rows]
+        codes = column.get_codes(len(self))[rows]
+        ranks = np.empty(len(column.categories) + 1)
+        ranks[np.argsort(column.categories)] = np.arange(
+            len(column.categories))
+        ranks[MISSING_CODE] = np.nan
+        category_ranks = ranks[codes]
+        is_number = ~np.isnan(numbers)
+        values = np.where(is_number, numbers, category_ranks)
+        # 0 for numbers, 1 for categories, and 2 for missing values.
+        kinds = np.where(is_number, 0, np.where(np.isnan(values), 2, 1))
+        values = np.nan_to_num(values, nan=0.0)
+        if descending:
+            values = -values
+        return np.vstack((values, kinds))
+
+    def select(self, query: RunQuery) -> np.ndarray:
+        """Returns the rows that meet all of the query's conditions, in its
+        sort order if it has one and otherwise in the order the runs were
+        added.
+
+        :param query: The query.
+        :return: The row indices.
+        :raises ValueError: If the query names a missing or ambiguous field or
+            orders a non-numeric value.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for field, operator, value in query.conditions:
+            mask &= self._get_mask(self.resolve_field(field), operator, value)
+        rows = np.flatnonzero(mask)
+        if query.sort_field is not None:
+            keys = self._get_sort_keys(self.resolve_field(query.sort_field),
+                                       rows, query.descending)
+            rows = rows[np.lexsort(keys)]
+        return rows
+
+    def format(self, row: int, field: str) -> str:
+        """Returns the row's value of the field for display.
+
+        :param row: The row index.
+        :param field: The field name, with or without its prefix.
+        :return: The row's value, or 'n/a' if it has none.
+        """
+        return self._columns[self.resolve_field(field)].format(row)
+
+    def aggregate(
+            self,
+            query: RunQuery,
+            rows: np.ndarray) -> List[Tuple[str, int, Optional[float],
+                                            Optional[float],
+                                            Optional[float]]]:
+        """Returns the count of the rows and the mean, minimum, and maximum of
+        the query's aggregate field over them, in one group or in one group per
+        value of the query's group-by field. Rows without a numeric value for
+        the aggregate field, or without a value for the group-by field, are
+        left out.
+
+        :param query: The query.
+        :param rows: The row indices, e.g., from select.
+        :return: One 5-tuple per group of the group's value ('all' without a
+            group-by field), the number of rows, and the mean, minimum, and
+            maximum of the aggregate field (None without an aggregate field),
+            largest groups first.
+        :raises ValueError: If the query names a missing or ambiguous field.
+        """
+        size = len(self)
+        valid = np.ones(len(rows), dtype=bool)
+        values = np.zeros(len(rows))
+        if query.aggregate_field is not None:
+            values = self._columns[self.resolve_field(
+                query.aggregate_field)].get_numbers(size)[rows]
+            valid = ~np.isnan(values)
+        if query.group_by_field is None:
+            groups = [(np.zeros(len(rows), dtype=np.int64), valid,
+                       lambda key: 'all')]
+        else:
+            column = self._columns[self.resolve_field(query.group_by_field)]
+            numbers = column.get_numbers(size)[rows]
+            codes = column.get_codes(size)[rows]
+            groups = [(numbers, valid & ~np.isnan(numbers),
+                       lambda key: f'{key:.4g}'),
+                      (codes, valid & (codes != MISSING_CODE),
+                       lambda key: column.categories[key])]
+        has_values = query.aggregate_field is not None
+        results = []
+        for keys, group_valid, get_label in groups:
+            results.extend(_aggregate_by_key(
+                keys[group_valid], values[group_valid], get_label, has_values))
+        results.sort(key=lambda result: -result[1])
+        return results
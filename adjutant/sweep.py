@@ -0,0 +1,328 @@
+"""Contains functions that expand hyperparameter sweep specifications into
+trials, and the Sweep class, which launches those trials through a
+JobScheduler."""
+
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, \
+    Sequence, Union
+import asyncio
+import collections.abc
+import itertools
+import math
+import random
+import time
+from adjutant.job_scheduler import Job, JobScheduler, JOB_FINISHED, \
+    JOB_FAILED, JOB_CANCELLED, JOB_STOPPED
+
+SWEEP_GRID = 'grid'
+SWEEP_RANDOM = 'random'
+RANGE_KEY = 'range'
+DEFAULT_LAUNCH_INTERVAL_SECONDS = 1.0
+DEFAULT_UPDATE_INTERVAL_SECONDS = 5.0
+SWEEP_RUNNING = 'running'
+SWEEP_DONE = 'done'
+SWEEP_CANCELLED = 'cancelled'
+
+
+class InclusiveRange(collections.abc.Sequence):
+    """A lazily evaluated arithmetic sequence from start to stop, inclusive,
+    like Python's range but also for floats."""
+    start: Union[int, float]
+    stop: Union[int, float]
+    step: Union[int, float]
+    _length: int
+
+    def __init__(
+            self,
+            start: Union[int, float],
+            stop: Union[int, float],
+            step: Union[int, float] = 1) -> None:
+        """Instantiates the object.
+
+        :param start: The first value.
+        :param stop: The last value, if it is reached exactly by a whole number
+            of steps.
+        :param step: The difference between consecutive values. Must be
+            positive.
+        """
+        if step <= 0:
+            raise ValueError('range step must be positive.')
+        if stop < start:
+            raise ValueError('range stop must not be less than start.')
+        self.start = start
+        self.stop = stop
+        self.step = step
+        # The tolerance keeps float rounding from dropping the last value.
+        self._length = math.floor((stop - start) / step + 1e-9) + 1
+
+    def __len__(self) -> int:
+        """Returns the number of values in the range.
+
+        :return: The number of values in the range.
+        """
+        return self._length
+
+    def __getitem__(self, index: Any) -> Any:
+        """Returns the value at the index.
+
+        :param index: The index of the value. Slices are not supported.
+        :return: The value at the index.
+        """
+        if not isinstance(index, int):
+            raise TypeError('InclusiveRange indices must be integers.')
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('InclusiveRange index out of range.')
+        return self.start + index * self.step
+
+
+def parse_sweep_spec(spec: Dict[str, Any]) -> Dict[str, Sequence]:
+    """Returns the candidate values for each hyperparameter in a sweep
+    specification. A list gives the candidate values directly; a dict of the
+    form {"range": [start, stop]} or {"range": [start, stop, step]} gives the
+    values from start to stop inclusive; and any other value is fixed across
+    all trials.
+
+    :param spec: The sweep specification.
+    :return: The dict whose keys are the hyperparameter names and whose values
+        are sequences of candidate values.
+    """
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError('sweep specification must be a non-empty dict.')
+    candidates = {}
+    for key, value in spec.items():
+        if isinstance(value, list):
+            if not value:
+                raise ValueError(f'{key} has no candidate values.')
+            candidates[key] = value
+        elif isinstance(value, dict) and set(value) == {RANGE_KEY}:
+            bounds = value[RANGE_KEY]
+            if not isinstance(bounds, list) or not 2 <= len(bounds) <= 3 or \
+                    not all(isinstance(bound, (int, float)) and
+                            not isinstance(bound, bool) for bound in bounds):
+                raise ValueError(f'{key} range must be [start, stop] or '
+                                 f'[start, stop, step].')
+            candidates[key] = InclusiveRange(*bounds)
+        else:
+            candidates[key] = [value]
+    return candidates
+
+
+def count_grid(candidates: Dict[str, Sequence]) -> int:
+    """Returns the number of trials in the full grid over the candidates.
+
+    :param candidates: The candidate values for each hyperparameter.
+    :return: The number of trials in the full grid.
+    """
+    return math.prod(len(values) for values in candidates.values())
+
+
+def iter_grid(candidates: Dict[str, Sequence]) -> Iterator[Dict[str, Any]]:
+    """Yields every combination of candidate values, one at a time.
+
+    :param candidates: The candidate values for each hyperparameter.
+    :return: An iterator over the hyperparameter dicts of the trials.
+    """
+    keys = list(candidates)
+    for values in itertools.product(*candidates.values()):
+        yield dict(zip(keys, values))
+
+
+def iter_random(
+        candidates: Dict[str, Sequence],
+        num_samples: int,
+        seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yields num_samples combinations of candidate values, each value chosen
+    uniformly at random and independently of the others.
+
+    :param candidates: The candidate values for each hyperparameter.
+    :param num_samples: The number of trials.
+    :param seed: The random seed, or None for a nondeterministic sweep.
+    :return: An iterator over the hyperparameter dicts of the trials.
+    """
+    rng = random.Random(seed)
+    for _ in range(num_samples):
+        yield {key: rng.choice(values) for key, values in candidates.items()}
+
+
+class Sweep:
+    """Launches the trials of a hyperparameter sweep through a JobScheduler.
+    Trials are drawn from a lazy iterator and submitted one at a time, no more
+    often than once per launch interval and only when fewer trials are
+    outstanding than the scheduler has slots, so a large sweep never floods the
+    job queue. Progress is reported through a single throttled callback."""
+    # pylint: disable=too-many-instance-attributes
+    id: int
+    mode: str
+    num_trials: int
+    jobs: List[Job]
+    status: str
+    _trials: Iterator[Dict[str, Any]]
+    _launch_interval_seconds: float
+    _update_interval_seconds: float
+    _priority: int
+    _on_update: Optional[Callable[['Sweep'], Awaitable[None]]]
+    _last_update: float
+    _update_task: Optional[asyncio.Task]
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            sweep_id: int,
+            spec: Dict[str, Any],
+            mode: str = SWEEP_GRID,
+            num_samples: Optional[int] = None,
+            *,
+            seed: Optional[int] = None,
+            priority: int = 0,
+            launch_interval_seconds: float = DEFAULT_LAUNCH_INTERVAL_SECONDS,
+            update_interval_seconds: float = DEFAULT_UPDATE_INTERVAL_SECONDS,
+            on_update: Optional[Callable[['Sweep'], Awaitable[None]]] = None
+    ) -> None:
+        """Instantiates the object.
+
+        :param sweep_id: The unique ID of the sweep.
+        :param spec: The sweep specification; see parse_sweep_spec.
+        :param mode: SWEEP_GRID to run every combination of candidate values,
+            or SWEEP_RANDOM to run num_samples random combinations.
+        :param num_samples: The number of trials in a random sweep. Ignored for
+            grid sweeps.
+        :param seed: The random seed for a random sweep.
+        :param priority: The scheduler priority of the sweep's trials.
+        :param launch_interval_seconds: The minimum number of seconds between
+            trial launches.
+        :param update_interval_seconds: The minimum number of seconds between
+            calls to on_update, except for the final call.
+        :param on_update: A coroutine function to call with the sweep when its
+            progress changes.
+        """
+        candidates = parse_sweep_spec(spec)
+        if mode == SWEEP_GRID:
+            self.num_trials = count_grid(candidates)
+            self._trials = iter_grid(candidates)
+        elif mode == SWEEP_RANDOM:
+            if not num_samples or num_samples < 1:
+                raise ValueError('random sweeps need a positive number of '
+                                 'samples.')
+            self.num_trials = num_samples
+            self._trials = iter_random(candidates, num_samples, seed=seed)
+        else:
+            raise ValueError(f'mode must be {SWEEP_GRID!r} or '
+                             f'{SWEEP_RANDOM!r}, not {mode!r}.')
+        self.id = sweep_id
+        self.mode = mode
+        self.jobs = []
+        self.status = SWEEP_RUNNING
+        self._launch_interval_seconds = launch_interval_seconds
+        self._update_interval_seconds = update_interval_seconds
+        self._priority = priority
+        self._on_update = on_update
+        self._last_update = 0.0
+        self._update_task = None
+
+    @property
+    def group(self) -> str:
+        """Returns the job group name of the sweep's trials.
+
+        :return: The job group name of the sweep's trials.
+        """
+        return f'sweep-{self.id}'
+
+    def count_jobs(self, status: str) -> int:
+        """Returns the number of the sweep's launched trials with the status.
+
+        :param status: The job status.
+        :return: The number of the sweep's launched trials with the status.
+        """
+        return sum(1 for job in self.jobs if job.status == status)
+
+    def describe(self) -> str:
+        """Returns a one-line, human-readable summary of the sweep's progress.
+
+        :return: A one-line, human-readable summary of the sweep's progress.
+        """
+        done = sum(1 for job in self.jobs if job.is_done)
+        return (f'Sweep {self.id} ({self.mode}, {self.num_trials} trials) '
+                f'[{self.status}]: {len(self.jobs)} launched, '
+                f'{len(self.jobs) - done} queued or running, '
+                f'{self.count_jobs(JOB_FINISHED)} finished, '
+                f'{self.count_jobs(JOB_FAILED)} failed, '
+                f'{self.count_jobs(JOB_STOPPED)} stopped early, '
+                f'{self.count_jobs(JOB_CANCELLED)} cancelled.')
+
+    async def run(self, scheduler: JobScheduler) -> None:
+        """Launches all of the sweep's trials and waits for them to complete.
+
+        :param scheduler: The scheduler through which to launch the trials.
+        """
+        outstanding = asyncio.Semaphore(scheduler.max_slots)
+        watchers = []
+        next_launch = time.monotonic()
+        for hyperparams in self._trials:
+            if self.status == SWEEP_CANCELLED:
+                break
+            await outstanding.acquire()
+            await asyncio.sleep(max(0.0, next_launch - time.monotonic()))
+            if self.status == SWEEP_CANCELLED:
+                break
+            job = await scheduler.submit(
+                hyperparams, priority=self._priority, group=self.group)
+            next_launch = time.monotonic() + self._launch_interval_seconds
+            self.jobs.append(job)
+            watchers.append(asyncio.ensure_future(
+                self._watch(job, outstanding)))
+            self._request_update()
+        await asyncio.gather(*watchers)
+        if self.status != SWEEP_CANCELLED:
+            self.status = SWEEP_DONE
+        await self._update_now()
+
+    async def cancel(self, scheduler: JobScheduler) -> None:
+        """Stops launching trials and cancels the ones that are queued or
+        running.
+
+        :param scheduler: The scheduler through which the trials were launched.
+        """
+        self.status = SWEEP_CANCELLED
+        for job in self.jobs:
+            await scheduler.cancel(job.id)
+
+    async def _watch(self, job: Job, outstanding: asyncio.Semaphore) -> None:
+        """Waits for a trial to complete, then frees its place among the
+        outstanding trials.
+
+        :param job: The trial's job.
+        :param outstanding: The semaphore limiting the outstanding trials.
+        """
+        await job.wait()
+        outstanding.release()
+        self._request_update()
+
+    def _request_update(self) -> None:
+        """Calls on_update now, or schedules it for when the update interval
+        has elapsed if an update happened recently. Requests made while an
+        update is scheduled are merged into it."""
+        if self._on_update is None or self._update_task is not None:
+            return
+        delay = self._last_update + self._update_interval_seconds - \
+            time.monotonic()
+        self._update_task = asyncio.ensure_future(self._update_later(delay))
+
+    async def _update_later(self, delay: float) -> None:
+        """Calls on_update after the delay.
+
+        :param delay: The number of seconds to wait.
+        """
+        await asyncio.sleep(max(0.0, delay))
+        self._update_task = None
+        await self._update_now()
+
+    async def _update_now(self) -> None:
+        """Calls on_update immediately, replacing any scheduled update."""
+        if self._update_task is not None:
+            self._update_task.cancel()
+            self._update_task = None
+        if self._on_update is None:
+            return
+        self._last_update = time.monotonic()
+        await self._on_update(self)
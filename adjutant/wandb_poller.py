@@ -0,0 +1,126 @@
+"""Contains the WandbPoller class, which runs blocking WandB API queries off of
+the Discord event loop."""
+
+from typing import Any, Callable, Optional
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_TIMEOUT_SECONDS = 45
+
+
+class WandbPoller:
+    """Runs blocking WandB API queries in a bounded thread pool so that the
+    event loop remains free to handle Discord traffic while a query pages
+    through a large project."""
+    _executor: ThreadPoolExecutor
+    _slots: asyncio.Semaphore
+    _timeout_seconds: Optional[float]
+    _max_workers: int
+    _in_flight: int
+
+    def __init__(
+            self,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            timeout_seconds: Optional[float] = DEFAULT_TIMEOUT_SECONDS) -> None:
+        """Instantiates the object.
+
+        :param max_workers: The maximum number of WandB queries that may run at
+            the same time. Callers beyond this limit wait asynchronously for a
+            free slot.
+        :param timeout_seconds: The number of seconds after which a caller stops
+            waiting for a query, or None to wait indefinitely. A query that
+            times out keeps its slot until its worker thread returns, so a hung
+            API can never accumulate more than max_workers threads.
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1.')
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='wandb-poller')
+        self._slots = asyncio.Semaphore(max_workers)
+        self._timeout_seconds = timeout_seconds
+        self._max_workers = max_workers
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Returns the number of queries currently running in worker threads,
+        including those whose callers have already timed out.
+
+        :return: The number of queries currently running in worker threads.
+        """
+        return self._in_flight
+
+    @property
+    def max_workers(self) -> int:
+        """Returns the maximum number of concurrently running queries.
+
+        :return: The maximum number of concurrently running queries.
+        """
+        return self._max_workers
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs func(*args) in a worker thread and returns its result.
+
+        :param func: The blocking function to run, e.g., a WandB API query.
+        :param args: The positional arguments to pass to func.
+        :return: The return value of func(*args).
+        :raises asyncio.TimeoutError: If the query does not complete within the
+            timeout supplied on construction.
+        """
+        return await self.run_with_timeout(self._timeout_seconds, func, *args)
+
+    async def run_with_timeout(
+            self,
+            timeout_seconds: Optional[float],
+            func: Callable[..., Any],
+            *args: Any) -> Any:
+        """Runs func(*args) in a worker thread with the given timeout and
+        returns its result.
+
+        :param timeout_seconds: The number of seconds after which to stop
+            waiting for the query, or None to wait indefinitely.
+        :param func: The blocking function to run, e.g., a WandB API query.
+        :param args: The positional arguments to pass to func.
+        :return: The return value of func(*args).
+        :raises asyncio.TimeoutError: If the query does not complete within
+            timeout_seconds.
+        """
+        return await asyncio.wait_for(
+            self._run_in_slot(functools.partial(func, *args)),
+            timeout_seconds)
+
+    async def _run_in_slot(self, func: Callable[[], Any]) -> Any:
+        """Waits for a free slot, then runs func in a worker thread. The slot is
+        released when the worker thread returns, not when the caller stops
+        waiting.
+
+        :param func: The blocking function to run.
+        :return: The return value of func().
+        """
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, func)
+        except BaseException:
+            self._slots.release()
+            raise
+        self._in_flight += 1
+        future.add_done_callback(self._release_slot)
+        # Shielding lets cancellation (e.g., a timeout) abandon the wait
+        # without abandoning the bookkeeping on the worker thread's future.
+        return await asyncio.shield(future)
+
+    def _release_slot(self, _: asyncio.Future) -> None:
+        """Releases the slot held by a completed query.
+
+        :param _: The completed future.
+        """
+        self._in_flight -= 1
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        """Stops accepting new queries. Queries that are already running are
+        allowed to finish in the background."""
+        self._executor.shutdown(wait=False)
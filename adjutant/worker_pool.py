@@ -0,0 +1,289 @@
+"""Contains the WorkerPool class, which launches experiments in pre-warmed
+worker processes that have already imported the experiment's entry point."""
+
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import asyncio
+import collections
+import importlib
+import multiprocessing
+import os
+import sys
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from adjutant.job_scheduler import Job, RUN_ID_ENVIRONMENT_VAR
+from adjutant.job_logs import open_pipe_reader
+
+DEFAULT_NUM_WORKERS = 1
+ENTRY_POINT_SEPARATOR = ':'
+WORKER_READY = 'ready'
+STDOUT_FD = 1
+STDERR_FD = 2
+# Spawned workers do not inherit the parent's event loop, Discord connection,
+# or threads, which are unsafe to use after a fork.
+START_METHOD = 'spawn'
+
+
+def split_entry_point(entry_point: str) -> Tuple[str, str]:
+    """Returns the module and function names in the entry point.
+
+    :param entry_point: The entry point, of the form module:function, e.g.,
+        mnist_model:run_experiment.
+    :return: A 2-tuple of the module name and the function name.
+    """
+    module_name, separator, function_name = entry_point.partition(
+        ENTRY_POINT_SEPARATOR)
+    if not separator or not module_name or not function_name:
+        raise ValueError(f'entry point must have the form module:function, not '
+                         f'{entry_point!r}.')
+    return module_name, function_name
+
+
+def load_entry_point(entry_point: str) -> Callable[[Dict], Any]:
+    """Returns the function named by the entry point.
+
+    :param entry_point: The entry point, of the form module:function.
+    :return: The function, which takes a hyperparameter dict.
+    """
+    module_name, function_name = split_entry_point(entry_point)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+async def _wait_until_readable(fd: int) -> None:
+    """Waits until the file descriptor is readable, e.g., until a pipe has data
+    or a process sentinel is closed, without taking a thread from the
+    event loop's default executor, which long waits would exhaust.
+
+    :param fd: The file descriptor.
+    """
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+
+    def on_readable() -> None:
+        if not readable.done():
+            readable.set_result(None)
+    loop.add_reader(fd, on_readable)
+    try:
+        await readable
+    finally:
+        loop.remove_reader(fd)
+
+
+def _redirect_output(fd: int) -> None:
+    """Redirects this process's stdout and stderr to the file descriptor, and
+    makes stdout line-buffered so that output reaches the reader promptly.
+
+    :param fd: The write end of a pipe, which this function closes.
+    """
+    for stream in (sys.stdout, sys.stderr):
+        if stream is not None:
+            stream.flush()
+    os.dup2(fd, STDOUT_FD)
+    os.dup2(fd, STDERR_FD)
+    os.close(fd)
+    if sys.stdout is not None:
+        sys.stdout.reconfigure(line_buffering=True)
+
+
+def _run_worker(entry_point: str, connection: Connection) -> None:
+    """Runs in a worker process. Imports the entry point, reports that the
+    worker is ready, then runs the entry point with the first hyperparameters
+    received, with its output sent through the pipe that follows them if
+    the pool captures output. The worker's exit code is 0 if the entry point
+    returns, the SystemExit code if it exits, or 1 if it raises an exception.
+
+    :param entry_point: The entry point, of the form module:function.
+    :param connection: The worker's end of the pipe to the pool.
+    """
+    function = load_entry_point(entry_point)
+    connection.send(WORKER_READY)
+    try:
+        hyperparams, environment, is_output_captured = connection.recv()
+        if is_output_captured:
+            _redirect_output(reduction.recv_handle(connection))
+    except EOFError:
+        # The pool closed without using this worker.
+        return
+    connection.close()
+    os.environ.update(environment)
+    function(hyperparams)
+
+
+class WorkerProcess:
+    """A running experiment in a worker process. Has the same interface as
+    asyncio.subprocess.Process, so JobScheduler can reap and terminate it."""
+    _process: BaseProcess
+    _exit_waiter: Optional[asyncio.Task]
+
+    def __init__(self, process: BaseProcess) -> None:
+        """Instantiates the object.
+
+        :param process: The worker process running the experiment.
+        """
+        self._process = process
+        self._exit_waiter = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Returns the worker's process ID.
+
+        :return: The worker's process ID.
+        """
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        """Returns the worker's exit code.
+
+        :return: The worker's exit code, or None if it is still running.
+        """
+        return self._process.exitcode
+
+    def terminate(self) -> None:
+        """Sends SIGTERM to the worker."""
+        self._process.terminate()
+
+    async def wait(self) -> int:
+        """Waits for the worker to exit and returns its exit code. The event
+        loop watches the worker's sentinel, so no thread is held while the
+        experiment runs.
+
+        :return: The worker's exit code.
+        """
+        if self._exit_waiter is None:
+            # Shared, since the loop allows one reader per file descriptor.
+            self._exit_waiter = asyncio.ensure_future(
+                _wait_until_readable(self._process.sentinel))
+        await asyncio.shield(self._exit_waiter)
+        # The worker has exited, so this only reaps it.
+        self._process.join()
+        return self._process.exitcode
+
+
+class WorkerPool:
+    """Keeps num_workers idle worker processes that have already imported an
+    experiment's entry point, so that launching an experiment skips
+    interpreter startup and the entry point's imports, e.g., TensorFlow.
+    Each worker runs one experiment and exits, so experiments stay isolated
+    from each other and can be terminated like subprocesses; the pool starts a
+    replacement as soon as a worker is used."""
+    entry_point: str
+    num_workers: int
+    _context: multiprocessing.context.BaseContext
+    _idle: Deque[Tuple[BaseProcess, Connection]]
+
+    def __init__(
+            self,
+            entry_point: str,
+            num_workers: int = DEFAULT_NUM_WORKERS) -> None:
+        """Instantiates the object. Call start to start the workers.
+
+        :param entry_point: The experiment's entry point, of the form
+            module:function. The function takes a hyperparameter dict; see
+            examples/mnist/mnist_model.py. The module must be importable from
+            the working directory.
+        :param num_workers: The number of idle workers to keep warm.
+        """
+        if num_workers < 1:
+            raise ValueError('num_workers must be at least 1.')
+        _ = split_entry_point(entry_point)
+        self.entry_point = entry_point
+        self.num_workers = num_workers
+        self._context = multiprocessing.get_context(START_METHOD)
+        self._idle = collections.deque()
+
+    @property
+    def num_idle(self) -> int:
+        """Returns the number of idle workers, warm or still warming up.
+
+        :return: The number of idle workers.
+        """
+        return len(self._idle)
+
+    def _start_worker(self) -> None:
+        """Starts a new idle worker, which warms up in the background."""
+        parent_connection, child_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=_run_worker, args=(self.entry_point, child_connection),
+            daemon=True)
+        process.start()
+        child_connection.close()
+        self._idle.append((process, parent_connection))
+
+    def start(self) -> None:
+        """Starts idle workers until there are num_workers of them."""
+        while len(self._idle) < self.num_workers:
+            self._start_worker()
+
+    async def wait_until_warm(self) -> None:
+        """Waits until every idle worker has imported the entry point."""
+        await asyncio.gather(*(
+            _wait_until_readable(connection.fileno())
+            for _, connection in self._idle))
+
+    async def launch(self, job: Job) -> WorkerProcess:
+        """Runs the job's experiment in an idle worker, then starts a
+        replacement worker. If the job has a log, the worker's stdout and
+        stderr are piped into it.
+
+        :param job: The job to start.
+        :return: The worker running the experiment.
+        :raises OSError: If the worker could not import the entry point or
+            the job could not be handed to it.
+        """
+        if not self._idle:
+            self._start_worker()
+        process, connection = self._idle.popleft()
+        self.start()
+        try:
+            # Waits only if the worker is still warming up.
+            await _wait_until_readable(connection.fileno())
+            ready = connection.recv()
+            if ready != WORKER_READY:
+                raise EOFError
+            connection.send((job.hyperparams,
+                             {RUN_ID_ENVIRONMENT_VAR: job.run_id},
+                             job.log is not None))
+            if job.log is not None:
+                job.log.attach(await self._send_output_pipe(
+                    connection, process))
+        except (EOFError, OSError) as err:
+            # The worker may be blocked waiting for its output pipe, so close
+            # the connection and stop it before waiting for it to exit.
+            connection.close()
+            process.terminate()
+            await WorkerProcess(process).wait()
+            raise OSError(f'Could not start {self.entry_point} in a worker '
+                          f'(exit code {process.exitcode}): {err}') from err
+        finally:
+            connection.close()
+        return WorkerProcess(process)
+
+    @staticmethod
+    async def _send_output_pipe(connection: Connection,
+                                process: BaseProcess) -> asyncio.StreamReader:
+        """Creates a pipe, sends its write end to the worker for its output,
+        and returns a stream that reads the other end.
+
+        :param connection: The pool's end of the pipe to the worker.
+        :param process: The worker process.
+        :return: The stream of the worker's output.
+        """
+        read_fd, write_fd = os.pipe()
+        try:
+            reduction.send_handle(connection, write_fd, process.pid)
+        except OSError:
+            os.close(read_fd)
+            raise
+        finally:
+            os.close(write_fd)
+        return await open_pipe_reader(read_fd)
+
+    def close(self) -> None:
+        """Stops the idle workers. Workers running experiments are not
+        affected."""
+        while self._idle:
+            process, connection = self._idle.popleft()
+            connection.close()
+            process.terminate()
+            process.join()
@@ -0,0 +1 @@
+"""Contains performance benchmarks for adjutant."""
@@ -0,0 +1,96 @@
+"""Measures the import time of adjutant's modules with python -X importtime,
+and checks which heavy dependencies each one pulls in.
+
+Each module is imported in a fresh interpreter --repeats times and the median
+cumulative import time is reported, excluding interpreter startup. The light
+modules, which CLI tools, tests, and experiment worker processes import
+without the Discord client, must not import any of HEAVY_MODULES; the client
+module is reported for reference.
+
+With --max-ms, the benchmark exits with an error if a light module takes
+longer to import than the budget or imports a heavy module, so that CI catches
+import time regressions.
+
+Run from the project root with: python -m benchmarks.import_time
+"""
+
+from typing import Dict, List, Set, Tuple
+import argparse
+import statistics
+import subprocess
+import sys
+
+LIGHT_MODULES = ('adjutant', 'adjutant.run_store', 'adjutant.job_scheduler',
+                 'adjutant.worker_pool', 'adjutant.run_progress')
+REFERENCE_MODULES = ('adjutant.adjutant_client',)
+HEAVY_MODULES = ('wandb', 'discord', 'numpy', 'matplotlib')
+DEFAULT_REPEATS = 5
+IMPORT_TIME_PREFIX = 'import time:'
+US_PER_MS = 1000
+
+
+def parse_import_times(output: str) -> Dict[str, int]:
+    """Returns the cumulative import time of each module in the output of
+    python -X importtime.
+
+    :param output: The interpreter's stderr, one line per imported module of
+        the form "import time: self [us] | cumulative | name".
+    :return: The cumulative import time in microseconds, keyed by module name.
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        fields = line[len(IMPORT_TIME_PREFIX):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            # The header line.
+            continue
+        times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def measure_import(module: str) -> Tuple[float, Set[str]]:
+    """Imports the module in a fresh interpreter.
+
+    :param module: The name of the module.
+    :return: A 2-tuple of the module's cumulative import time in milliseconds
+        and the heavy modules that it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True)
+    times = parse_import_times(result.stderr)
+    heavy = {name for name in HEAVY_MODULES if name in times}
+    return times[module] / US_PER_MS, heavy
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='The number of imports of each module.')
+    parser.add_argument('--max-ms', type=float,
+                        help='Fail if a light module takes longer to import '
+                             'or imports a heavy module.')
+    args = parser.parse_args()
+    failures: List[str] = []
+    rows = [f'{"module":<28} {"import ms":>10}  heavy dependencies']
+    for module in LIGHT_MODULES + REFERENCE_MODULES:
+        measurements = [measure_import(module) for _ in range(args.repeats)]
+        import_ms = statistics.median(ms for ms, _ in measurements)
+        heavy = measurements[-1][1]
+        rows.append(f'{module:<28} {import_ms:>10.1f}  '
+                    f'{", ".join(sorted(heavy)) or "-"}')
+        if args.max_ms is None or module not in LIGHT_MODULES:
+            continue
+        if import_ms > args.max_ms:
+            failures.append(f'{module} took {import_ms:.1f} ms to import.')
+        if heavy:
+            failures.append(f'{module} imported {", ".join(sorted(heavy))}.')
+    print('\n'.join(rows))
+    if failures:
+        sys.exit('Over budget:\n' + '\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Measures launch-to-first-step latency of experiments started with a
+run_experiment_script, which starts a fresh interpreter for every experiment,
+compared with experiments started from a warm WorkerPool.
+
+The stand-in experiment imports a module, as a training script imports its
+framework, then records the time at which it would take its first training
+step. The default module is wandb, which every Adjutant experiment imports;
+pass --import-module tensorflow to include TensorFlow's import time.
+
+Run from the project root with: python -m benchmarks.launch_latency
+"""
+
+from typing import Awaitable, Callable, Dict, List
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import stat
+import statistics
+import sys
+import tempfile
+import time
+from adjutant.job_scheduler import JobScheduler
+from adjutant.worker_pool import WorkerPool
+
+DEFAULT_NUM_LAUNCHES = 5
+DEFAULT_IMPORT_MODULE = 'wandb'
+ENTRY_POINT = 'benchmarks.launch_latency:run_experiment'
+EXPERIMENT_FLAG = '--experiment'
+MS_PER_SECOND = 1000
+
+
+def run_experiment(hyperparams: Dict) -> None:
+    """Imports the requested module, then writes the time of the first
+    training step to the output file.
+
+    :param hyperparams: The hyperparameters, with keys import_module and
+        output_file.
+    """
+    importlib.import_module(hyperparams['import_module'])
+    with open(hyperparams['output_file'], 'w', encoding='utf-8') as outfile:
+        outfile.write(str(time.time()))
+
+
+def write_script(directory: str) -> str:
+    """Writes an executable run_experiment_script that runs this module's
+    experiment in a fresh interpreter.
+
+    :param directory: The directory in which to write the script.
+    :return: The path to the script.
+    """
+    script = os.path.join(directory, 'run_experiment.sh')
+    with open(script, 'w', encoding='utf-8') as outfile:
+        outfile.write(f'#!/bin/sh\nexec "{sys.executable}" -m '
+                      f'benchmarks.launch_latency {EXPERIMENT_FLAG} "$1"\n')
+    os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+    return script
+
+
+async def measure_latencies(
+        scheduler: JobScheduler,
+        num_launches: int,
+        import_module: str,
+        directory: str,
+        before_launch: Callable[[], Awaitable[None]]) -> List[float]:
+    """Launches experiments one at a time and returns the seconds from each
+    submission to its experiment's first step.
+
+    :param scheduler: The scheduler through which to launch the experiments.
+    :param num_launches: The number of experiments to launch.
+    :param import_module: The module that each experiment imports.
+    :param directory: The directory in which experiments write their output.
+    :param before_launch: A coroutine function awaited before each launch,
+        outside the measured time.
+    :return: The latency of each launch in seconds.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    latencies = []
+    for index in range(num_launches):
+        await before_launch()
+        output_file = os.path.join(directory, f'first_step_{index}.txt')
+        job = await scheduler.submit({'import_module': import_module,
+                                      'output_file': output_file})
+        await job.wait()
+        with open(output_file, 'r', encoding='utf-8') as infile:
+            latencies.append(float(infile.read()) - job.submitted_at)
+    return latencies
+
+
+async def run_benchmark(num_launches: int, import_module: str) -> None:
+    """Runs the benchmark and prints the results.
+
+    :param num_launches: The number of experiments to launch in each mode.
+    :param import_module: The module that each experiment imports.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        script_scheduler = JobScheduler(write_script(directory))
+
+        async def nothing() -> None:
+            pass
+        script_latencies = await measure_latencies(
+            script_scheduler, num_launches, import_module, directory, nothing)
+        pool = WorkerPool(ENTRY_POINT)
+        pool.start()
+        pool_scheduler = JobScheduler(launcher=pool.launch)
+        pool_latencies = await measure_latencies(
+            pool_scheduler, num_launches, import_module, directory,
+            pool.wait_until_warm)
+        pool.close()
+    rows = [f'{"mode":>8} {"median ms":>10} {"min ms":>8} {"max ms":>8}']
+    for mode, latencies in (('script', script_latencies),
+                            ('pool', pool_latencies)):
+        rows.append(f'{mode:>8} '
+                    f'{statistics.median(latencies) * MS_PER_SECOND:>10.1f} '
+                    f'{min(latencies) * MS_PER_SECOND:>8.1f} '
+                    f'{max(latencies) * MS_PER_SECOND:>8.1f}')
+    print(f'Launch-to-first-step latency importing {import_module}, '
+          f'{num_launches} launches:')
+    print('\n'.join(rows))
+    speedup = statistics.median(script_latencies) / statistics.median(
+        pool_latencies)
+    print(f'Speedup: {speedup:.1f}x')
+
+
+def main() -> None:
+    """Runs the benchmark, or the stand-in experiment when run by the
+    benchmark's run_experiment_script."""
+    if len(sys.argv) == 3 and sys.argv[1] == EXPERIMENT_FLAG:
+        run_experiment(json.loads(sys.argv[2]))
+        return
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--num-launches', type=int,
+                        default=DEFAULT_NUM_LAUNCHES,
+                        help='The number of experiments to launch per mode.')
+    parser.add_argument('--import-module', default=DEFAULT_IMPORT_MODULE,
+                        help='The module each experiment imports.')
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.num_launches, args.import_module))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""Measures how Adjutant scales with the number of runs in its WandB project and
+with the number of concurrent commands, offline, using the in-process fakes of
+wandb.Api and Discord channels in tests.fakes.
+
+For each project size, the benchmark reports the time and retained memory of
+the first full scan, the time of a periodic check that finds no new runs and
+of one that finds NEW_RUNS_PER_POLL new runs, and the median latency of $top,
+$stats, and a filtered and sorted $query over run configs and summaries. It
+then reports the latency of N $experiment commands posted at once. The fake
+WandB server blocks for --page-latency-ms per page of runs, and each fake
+Discord send takes --send-latency-ms. Discord's per-channel rate limit is only
+applied with --discord-rate-limit, since it would otherwise dominate the
+concurrent command latencies.
+
+With --max-poll-ms or --max-command-ms, the benchmark exits with an error if a
+periodic check or a command is slower than the budget, so that CI catches
+performance regressions.
+
+Run from the project root with: python -m benchmarks.offline_scaling
+"""
+# pylint: disable=protected-access
+
+from typing import Dict, List
+import argparse
+import asyncio
+import gc
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import discord
+from adjutant.adjutant_client import Adjutant
+from adjutant.message_dispatcher import MessageDispatcher
+from adjutant.run_discovery import format_wandb_timestamp
+from tests.fakes import FakeApi, FakeChannel, FakeMessage, FakeProjectRun
+
+DEFAULT_NUM_RUNS = (1_000, 10_000, 100_000)
+DEFAULT_NUM_EXPERIMENTS = 50
+DEFAULT_PAGE_LATENCY_MS = 0.0
+DEFAULT_SEND_LATENCY_MS = 20.0
+NEW_RUNS_PER_POLL = 10
+COMMAND_REPEATS = 20
+ENTITY = 'entity'
+PROJECT = 'project'
+PROJECT_PATH = f'{ENTITY}/{PROJECT}'
+USER = 'benchmark-user'
+FIRST_HEARTBEAT = datetime(2021, 9, 18)
+UNLIMITED_MESSAGES_PER_WINDOW = 10 ** 9
+MS_PER_SECOND = 1000
+BYTES_PER_MIB = 2 ** 20
+BATCH_SIZES = (16, 32, 64, 128)
+QUERY_COMMAND = '$query batch_size>=64 best_val_loss<0.1 sort:best_val_loss'
+BENCHMARK_COMMANDS = ('$top', '$stats', QUERY_COMMAND)
+
+
+def build_runs(start: int, stop: int) -> List[FakeProjectRun]:
+    """Returns finished runs whose heartbeats are one second apart and whose
+    configs cycle through BATCH_SIZES.
+
+    :param start: The index of the first run.
+    :param stop: The index after the last run.
+    :return: The runs, in heartbeat order.
+    """
+    return [FakeProjectRun(
+        f'run-{index}',
+        format_wandb_timestamp(FIRST_HEARTBEAT + timedelta(seconds=index)),
+        {'best_val_loss': 0.08 + index % 1000 / 10000},
+        config={'batch_size': BATCH_SIZES[index % len(BATCH_SIZES)],
+                'learning_rate': 0.001})
+        for index in range(start, stop)]
+
+
+def create_client(api: FakeApi, channel: FakeChannel,
+                  args: argparse.Namespace) -> Adjutant:
+    """Returns an Adjutant that uses the fakes and has not logged in.
+
+    :param api: The fake WandB API client.
+    :param channel: The fake channel, used for commands and notifications.
+    :param args: The command line arguments.
+    :return: The client.
+    """
+    client = Adjutant(ENTITY, PROJECT,
+                      intents=discord.Intents.default(),
+                      wandb_api=api,
+                      run_experiment_script=shutil.which('true'))
+    if not args.discord_rate_limit:
+        client._dispatcher = MessageDispatcher(
+            max_messages_per_window=UNLIMITED_MESSAGES_PER_WINDOW,
+            metrics=client.metrics)
+    client.channel = channel
+    client._monitor.channels = [channel]
+    return client
+
+
+async def time_command(client: Adjutant, channel: FakeChannel,
+                       text: str) -> float:
+    """Posts the command and returns the seconds until its response is sent.
+
+    :param client: The client.
+    :param channel: The channel in which to post.
+    :param text: The text of the command.
+    :return: The command's latency in seconds.
+    """
+    start = time.perf_counter()
+    await client.on_message(FakeMessage(text, channel, USER))
+    return time.perf_counter() - start
+
+
+async def measure_project(num_runs: int,
+                          args: argparse.Namespace) -> Dict[str, float]:
+    """Measures the first scan, periodic checks, and commands for a project.
+
+    :param num_runs: The number of finished runs in the project.
+    :param args: The command line arguments.
+    :return: The measurements, in milliseconds or MiB.
+    """
+    results = {}
+    api = FakeApi(projects={PROJECT_PATH: build_runs(0, num_runs)},
+                  page_latency_seconds=args.page_latency_ms / MS_PER_SECOND)
+    channel = FakeChannel(latency_seconds=args.send_latency_ms /
+                          MS_PER_SECOND)
+    # Measure memory with a separate client, since tracing slows allocation.
+    client = create_client(api, channel, args)
+    gc.collect()
+    tracemalloc.start()
+    await client._check_project(PROJECT_PATH)
+    gc.collect()
+    results['scan_mib'] = tracemalloc.get_traced_memory()[0] / BYTES_PER_MIB
+    tracemalloc.stop()
+    await client.close()
+    client = create_client(api, channel, args)
+    start = time.perf_counter()
+    await client._check_project(PROJECT_PATH)
+    results['scan_ms'] = (time.perf_counter() - start) * MS_PER_SECOND
+    start = time.perf_counter()
+    await client._check_project(PROJECT_PATH)
+    results['idle_poll_ms'] = (time.perf_counter() - start) * MS_PER_SECOND
+    api.projects[PROJECT_PATH].extend(
+        build_runs(num_runs, num_runs + NEW_RUNS_PER_POLL))
+    start = time.perf_counter()
+    await client._check_project(PROJECT_PATH)
+    results['new_runs_poll_ms'] = (time.perf_counter() - start) * \
+        MS_PER_SECOND
+    await client._dispatcher.wait_until_empty()
+    for command in BENCHMARK_COMMANDS:
+        latencies = [await time_command(client, channel, command)
+                     for _ in range(COMMAND_REPEATS)]
+        results[f'{command[1:].split()[0]}_ms'] = \
+            statistics.median(latencies) * MS_PER_SECOND
+    await client.close()
+    return results
+
+
+async def measure_concurrent_experiments(
+        num_experiments: int,
+        args: argparse.Namespace) -> List[float]:
+    """Posts $experiment commands at once and returns their latencies.
+
+    :param num_experiments: The number of commands.
+    :param args: The command line arguments.
+    :return: The latency of each command in seconds, sorted.
+    """
+    channel = FakeChannel(latency_seconds=args.send_latency_ms /
+                          MS_PER_SECOND)
+    client = create_client(FakeApi(), channel, args)
+    latencies = await asyncio.gather(*(
+        time_command(client, channel, f'$experiment {{"index": {index}}}')
+        for index in range(num_experiments)))
+    await client._job_scheduler.wait_until_idle()
+    await client.close()
+    return sorted(latencies)
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--num-runs', type=int, nargs='+',
+                        default=list(DEFAULT_NUM_RUNS),
+                        help='The project sizes to measure.')
+    parser.add_argument('--num-experiments', type=int,
+                        default=DEFAULT_NUM_EXPERIMENTS,
+                        help='The number of concurrent $experiment commands.')
+    parser.add_argument('--page-latency-ms', type=float,
+                        default=DEFAULT_PAGE_LATENCY_MS,
+                        help='The simulated WandB latency per page of runs.')
+    parser.add_argument('--send-latency-ms', type=float,
+                        default=DEFAULT_SEND_LATENCY_MS,
+                        help='The simulated Discord latency per message.')
+    parser.add_argument('--discord-rate-limit', action='store_true',
+                        help="Apply Discord's per-channel rate limit.")
+    parser.add_argument('--max-poll-ms', type=float,
+                        help='Fail if a periodic check takes longer.')
+    parser.add_argument('--max-command-ms', type=float,
+                        help='Fail if a command takes longer, excluding '
+                             'concurrent $experiment commands.')
+    args = parser.parse_args()
+    failures = []
+    rows = [f'{"runs":>8} {"scan ms":>9} {"scan MiB":>9} {"idle poll ms":>13} '
+            f'{"new runs poll ms":>17} {"$top ms":>8} {"$stats ms":>10} '
+            f'{"$query ms":>10}']
+    for num_runs in args.num_runs:
+        results = asyncio.run(measure_project(num_runs, args))
+        rows.append(f'{num_runs:>8} {results["scan_ms"]:>9.1f} '
+                    f'{results["scan_mib"]:>9.1f} '
+                    f'{results["idle_poll_ms"]:>13.1f} '
+                    f'{results["new_runs_poll_ms"]:>17.1f} '
+                    f'{results["top_ms"]:>8.2f} {results["stats_ms"]:>10.2f} '
+                    f'{results["query_ms"]:>10.2f}')
+        poll_ms = max(results['idle_poll_ms'], results['new_runs_poll_ms'])
+        if args.max_poll_ms is not None and poll_ms > args.max_poll_ms:
+            failures.append(f'{num_runs} runs: periodic check took '
+                            f'{poll_ms:.1f} ms.')
+        command_ms = max(results['top_ms'], results['stats_ms'],
+                         results['query_ms'])
+        if args.max_command_ms is not None and \
+                command_ms > args.max_command_ms:
+            failures.append(f'{num_runs} runs: command took '
+                            f'{command_ms:.1f} ms.')
+    print('\n'.join(rows))
+    latencies = asyncio.run(measure_concurrent_experiments(
+        args.num_experiments, args))
+    print(f'{args.num_experiments} concurrent $experiment commands: '
+          f'p50 {statistics.median(latencies) * MS_PER_SECOND:.1f} ms, '
+          f'max {latencies[-1] * MS_PER_SECOND:.1f} ms')
+    if failures:
+        print('Over budget:\n' + '\n'.join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
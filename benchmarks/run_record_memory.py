@@ -0,0 +1,179 @@
+"""Measures the memory needed to keep track of reported runs as a dict of
+RunRecord objects, compared with a dict of wandb.apis.public.Run objects.
+
+Constructing real Run objects requires a WandB connection, so the baseline is
+a stand-in object whose __dict__ holds the same data a Run retains after
+Adjutant reads its summary: the raw GraphQL attributes, the parsed config and
+summary, and the per-run bookkeeping fields.
+
+Run from the project root with: python -m benchmarks.run_record_memory
+"""
+
+from typing import Any, Callable, Dict, List
+import argparse
+import functools
+import gc
+import json
+import tracemalloc
+from adjutant.project_monitor import TRACKED_SUMMARY_METRICS
+from adjutant.run_record import RunRecord
+
+DEFAULT_NUM_RUNS = (10_000, 100_000)
+ENTITY = 'kostaleonard'
+PROJECT = 'mnist'
+BYTES_PER_MIB = 2 ** 20
+
+
+class RunStandIn:
+    """An object that holds the same data as a wandb.apis.public.Run that has
+    been listed by wandb.Api.runs and had its summary read."""
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+    def __init__(self, index: int) -> None:
+        """Instantiates the object.
+
+        :param index: The index of the run, used to derive unique values.
+        """
+        run_id = f'{index:08x}'
+        config = {
+            'epochs': {'desc': None, 'value': 10},
+            'batch_size': {'desc': None, 'value': 32 * (1 + index % 4)},
+            'num_layers': {'desc': None, 'value': 1 + index % 3},
+            'validation_split': {'desc': None, 'value': 0.2},
+            'learning_rate': {'desc': None, 'value': 0.001},
+            'use_wandb': {'desc': None, 'value': True},
+            'overfit_single_batch': {'desc': None, 'value': False},
+            '_wandb': {'desc': None, 'value': {
+                'python_version': '3.9.7', 'cli_version': '0.12.1',
+                'framework': 'keras', 'is_jupyter_run': False,
+                'is_kaggle_kernel': False, 't': {'1': [2, 3], '2': [2, 3]}}}}
+        summary = {
+            'epoch': 9,
+            'loss': 0.05 + index % 100 / 1000,
+            'accuracy': 0.98,
+            'val_loss': 0.09 + index % 100 / 1000,
+            'val_accuracy': 0.97,
+            'best_val_loss': 0.08 + index % 100 / 1000,
+            'best_epoch': 8,
+            '_step': 9,
+            '_runtime': 120 + index % 60,
+            '_timestamp': 1631985000 + index,
+            'graph': {'_type': 'graph-file', 'path': 'media/graph.graph.json',
+                      'sha256': f'{index:064x}', 'size': 1421},
+            '_wandb': {'runtime': 120 + index % 60}}
+        system_metrics = {f'system.cpu.{core}.cpu_percent': 12.5
+                          for core in range(8)}
+        system_metrics.update({'system.memory': 41.2, 'system.disk': 63.0,
+                               'system.proc.memory.rssMB': 2048.5})
+        self._attrs = {
+            'id': f'UnVuOnYxOn{run_id}',
+            'tags': [],
+            'name': run_id,
+            'displayName': f'eager-fox-{index}',
+            'sweepName': None,
+            'state': 'finished',
+            'config': json.dumps(config),
+            'group': None,
+            'jobType': None,
+            'commit': f'{index:040x}',
+            'readOnly': False,
+            'createdAt': '2021-09-18T17:07:44',
+            'heartbeatAt': '2021-09-18T17:09:44',
+            'description': None,
+            'notes': None,
+            'systemMetrics': json.dumps(system_metrics),
+            'summaryMetrics': json.dumps(summary),
+            'historyLineCount': 10,
+            'user': {'name': 'Leo Kosta', 'username': ENTITY}}
+        self.client = None
+        self._entity = ENTITY
+        self.project = PROJECT
+        self._files = {}
+        self._base_dir = '/tmp'
+        self.id = run_id
+        self.sweep = None
+        self.dir = f'/tmp/{ENTITY}/{PROJECT}/{run_id}'
+        self._summary = summary
+        self._state = 'finished'
+        self.config = {key: value['value'] for key, value in config.items()}
+        self.name = self._attrs['displayName']
+        self.url = f'https://wandb.ai/{ENTITY}/{PROJECT}/runs/{run_id}'
+        self.state = self._state
+        self.created_at = self._attrs['createdAt']
+        self.heartbeat_at = self._attrs['heartbeatAt']
+
+    @property
+    def summary(self) -> Dict[str, Any]:
+        """Returns the run's summary.
+
+        :return: The run's summary.
+        """
+        return self._summary
+
+
+def measure_bytes(build: Callable[[], Any]) -> int:
+    """Returns the number of bytes allocated by build that are still reachable
+    from its return value.
+
+    :param build: The function that builds the object to measure.
+    :return: The number of bytes held by the built object.
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return allocated
+
+
+def build_runs(num_runs: int) -> Dict[str, RunStandIn]:
+    """Returns the dict of num_runs Run stand-ins, keyed by run name.
+
+    :param num_runs: The number of runs.
+    :return: The dict of Run stand-ins.
+    """
+    runs = (RunStandIn(index) for index in range(num_runs))
+    return {run.name: run for run in runs}
+
+
+def build_records(num_runs: int) -> Dict[str, RunRecord]:
+    """Returns the dict of num_runs RunRecords, keyed by run name. The source
+    runs are converted and discarded one at a time, as Adjutant does.
+
+    :param num_runs: The number of runs.
+    :return: The dict of RunRecords.
+    """
+    records = (RunRecord.from_run(RunStandIn(index), TRACKED_SUMMARY_METRICS)
+               for index in range(num_runs))
+    return {record.name: record for record in records}
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--num-runs', type=int, nargs='+',
+                        default=list(DEFAULT_NUM_RUNS),
+                        help='The project sizes to measure.')
+    args = parser.parse_args()
+    rows: List[str] = [
+        f'{"runs":>8} {"Run MiB":>10} {"Run B/run":>10} '
+        f'{"RunRecord MiB":>14} {"RunRecord B/run":>16} {"ratio":>6}']
+    for num_runs in args.num_runs:
+        run_bytes = measure_bytes(
+            functools.partial(build_runs, num_runs))
+        record_bytes = measure_bytes(
+            functools.partial(build_records, num_runs))
+        rows.append(
+            f'{num_runs:>8} '
+            f'{run_bytes / BYTES_PER_MIB:>10.1f} '
+            f'{run_bytes // num_runs:>10} '
+            f'{record_bytes / BYTES_PER_MIB:>14.1f} '
+            f'{record_bytes // num_runs:>16} '
+            f'{run_bytes / record_bytes:>5.1f}x')
+    print('\n'.join(rows))
+
+
+if __name__ == '__main__':
+    main()
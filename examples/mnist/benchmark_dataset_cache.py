@@ -0,0 +1,151 @@
+"""Measures the memory and load time per experiment when N experiments on one
+host each load and normalize their own copy of the dataset, compared with
+memory-mapping a shared .npy cache.
+
+Memory is the growth in each experiment's proportional set size (PSS) after
+it loads the dataset and reads every element: pages shared by k processes
+count 1/k towards each, so shared page-cache pages are not double counted.
+PSS is read from /proc, so this benchmark only runs on Linux.
+
+By default the dataset is a random stand-in with the same shapes and dtypes as
+MNIST, so the benchmark does not need TensorFlow; pass --mnist to load the real
+dataset through mnist_model.get_dataset.
+
+Run from this directory with: python benchmark_dataset_cache.py
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+import time
+from multiprocessing.synchronize import Barrier
+from multiprocessing.queues import Queue
+from typing import Tuple
+import numpy as np
+from dataset_cache import Dataset, get_cached_dataset
+
+DEFAULT_NUM_TRIALS = 4
+NUM_TRAIN = 60_000
+NUM_TEST = 10_000
+IMAGE_SHAPE = (28, 28)
+NUM_CLASSES = 10
+MAX_PIXEL_VALUE = 255
+SMAPS_ROLLUP_FILE = '/proc/self/smaps_rollup'
+KIB_PER_MIB = 1024
+
+
+def build_stand_in_dataset() -> Dataset:
+    """Returns a random dataset with the shapes and dtypes of normalized MNIST.
+
+    :return: The dataset as (x_train, y_train), (x_test, y_test).
+    """
+    rng = np.random.default_rng(0)
+    arrays = []
+    for num_images in (NUM_TRAIN, NUM_TEST):
+        images = rng.integers(0, MAX_PIXEL_VALUE + 1,
+                              (num_images, *IMAGE_SHAPE), dtype=np.uint8)
+        labels = rng.integers(0, NUM_CLASSES, num_images, dtype=np.uint8)
+        arrays.append((images.astype(np.float32) / MAX_PIXEL_VALUE, labels))
+    return arrays[0], arrays[1]
+
+
+def build_mnist_dataset() -> Dataset:
+    """Returns the normalized MNIST dataset.
+
+    :return: The dataset as (x_train, y_train), (x_test, y_test).
+    """
+    # pylint: disable=import-outside-toplevel
+    from mnist_model import get_dataset
+    return get_dataset()
+
+
+def get_pss_kib() -> int:
+    """Returns the proportional set size of this process.
+
+    :return: The proportional set size of this process in KiB.
+    """
+    with open(SMAPS_ROLLUP_FILE, 'r', encoding='utf-8') as infile:
+        for line in infile:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    raise ValueError(f'No Pss in {SMAPS_ROLLUP_FILE}.')
+
+
+def run_trial(
+        use_mnist: bool,
+        cache_dir: str,
+        barrier: Barrier,
+        results: Queue) -> None:
+    """Loads the dataset as one experiment would, reads every element, then
+    reports its load time and memory once every trial has loaded.
+
+    :param use_mnist: Whether to load the real MNIST dataset.
+    :param cache_dir: The cache directory, or the empty string to load the
+        dataset in memory.
+    :param barrier: The barrier at which all trials wait before measuring
+        memory and before exiting.
+    :param results: The queue on which to put (load seconds, PSS MiB).
+    """
+    build = build_mnist_dataset if use_mnist else build_stand_in_dataset
+    start_pss = get_pss_kib()
+    start = time.perf_counter()
+    if cache_dir:
+        (x_train, _), (x_test, _) = get_cached_dataset(build, cache_dir)
+    else:
+        (x_train, _), (x_test, _) = build()
+    # Touch every page, as an epoch of training would.
+    _ = float(x_train.sum()) + float(x_test.sum())
+    load_seconds = time.perf_counter() - start
+    barrier.wait()
+    results.put((load_seconds, (get_pss_kib() - start_pss) / KIB_PER_MIB))
+    barrier.wait()
+
+
+def run_trials(num_trials: int, use_mnist: bool,
+               cache_dir: str) -> Tuple[float, float]:
+    """Runs concurrent trials and returns their mean load time and memory.
+
+    :param num_trials: The number of concurrent trials.
+    :param use_mnist: Whether to load the real MNIST dataset.
+    :param cache_dir: The cache directory, or the empty string to load the
+        dataset in memory.
+    :return: A 2-tuple of the mean load seconds and mean PSS MiB per trial.
+    """
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(num_trials)
+    results = context.Queue()
+    processes = [context.Process(target=run_trial,
+                                 args=(use_mnist, cache_dir, barrier, results))
+                 for _ in range(num_trials)]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    load_seconds, pss_mib = zip(*measurements)
+    return float(np.mean(load_seconds)), float(np.mean(pss_mib))
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--num-trials', type=int, default=DEFAULT_NUM_TRIALS,
+                        help='The number of concurrent experiments.')
+    parser.add_argument('--mnist', action='store_true',
+                        help='Load the real MNIST dataset (needs TensorFlow).')
+    args = parser.parse_args()
+    rows = [f'{"mode":>16} {"load s/trial":>13} {"PSS MiB/trial":>14}']
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Fill the cache first, as the first experiment on a host would.
+        run_trials(1, args.mnist, cache_dir)
+        for mode, trial_cache_dir in (('in-memory', ''),
+                                      ('memory-mapped', cache_dir)):
+            load_seconds, pss_mib = run_trials(
+                args.num_trials, args.mnist, trial_cache_dir)
+            rows.append(f'{mode:>16} {load_seconds:>13.3f} {pss_mib:>14.1f}')
+    print(f'{args.num_trials} concurrent trials:')
+    print('\n'.join(rows))
+
+
+if __name__ == '__main__':
+    main()
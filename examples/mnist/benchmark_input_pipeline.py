@@ -0,0 +1,109 @@
+"""Measures CPU-only training throughput in samples per second when
+train_model feeds the model in-memory NumPy arrays with validation_split,
+compared with the tf.data pipeline (train_args use_tf_data).
+
+Throughput is measured over the epochs after the first, so the one-time costs
+of tracing and warming the page cache are excluded. Each epoch's time
+includes its validation pass, but only training samples are counted.
+
+By default the dataset is a random stand-in with the same shapes and dtypes as
+MNIST; pass --mnist to use the real dataset.
+
+Run from this directory with: python benchmark_input_pipeline.py
+"""
+
+import os
+# Hide any GPUs before TensorFlow is imported.
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+# pylint: disable=wrong-import-position
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+from tensorflow.keras.callbacks import Callback
+from mnist_model import get_dataset, get_model, train_model
+from benchmark_dataset_cache import build_stand_in_dataset
+
+DEFAULT_EPOCHS = 3
+DEFAULT_BATCH_SIZE = 32
+VALIDATION_SPLIT = 0.2
+
+
+class EpochTimer(Callback):
+    """Records the duration of each training epoch."""
+    # pylint: disable=unused-argument
+    epoch_seconds: List[float]
+    _epoch_start: float
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        super().__init__()
+        self.epoch_seconds = []
+        self._epoch_start = 0.0
+
+    def on_epoch_begin(self, epoch: int,
+                       logs: Optional[Dict[str, Any]] = None) -> None:
+        """Starts timing the epoch.
+
+        :param epoch: The index of the epoch.
+        :param logs: Unused.
+        """
+        self._epoch_start = time.perf_counter()
+
+    def on_epoch_end(self, epoch: int,
+                     logs: Optional[Dict[str, Any]] = None) -> None:
+        """Records the epoch's duration.
+
+        :param epoch: The index of the epoch.
+        :param logs: Unused.
+        """
+        self.epoch_seconds.append(time.perf_counter() - self._epoch_start)
+
+
+def measure_throughput(use_tf_data: bool, use_mnist: bool, epochs: int,
+                       batch_size: int) -> float:
+    """Trains a new model and returns its steady-state training throughput.
+
+    :param use_tf_data: Whether to use the tf.data pipeline.
+    :param use_mnist: Whether to use the real MNIST dataset.
+    :param epochs: The number of epochs to train. Must be at least 2.
+    :param batch_size: The batch size.
+    :return: The number of training samples per second after the first epoch.
+    """
+    (x_train, y_train), _ = get_dataset() if use_mnist else \
+        build_stand_in_dataset()
+    timer = EpochTimer()
+    train_model(get_model(), x_train, y_train, train_args={
+        'epochs': epochs,
+        'batch_size': batch_size,
+        'validation_split': VALIDATION_SPLIT,
+        'use_wandb': False,
+        'use_tf_data': use_tf_data}, extra_callbacks=[timer])
+    num_samples = len(x_train) - int(len(x_train) * VALIDATION_SPLIT)
+    return num_samples * (epochs - 1) / sum(timer.epoch_seconds[1:])
+
+
+def main() -> None:
+    """Runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS,
+                        help='The number of epochs per path (at least 2).')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='The batch size.')
+    parser.add_argument('--mnist', action='store_true',
+                        help='Use the real MNIST dataset.')
+    args = parser.parse_args()
+    if args.epochs < 2:
+        parser.error('--epochs must be at least 2.')
+    rows = [f'{"input":>8} {"samples/s":>10}']
+    throughputs = {}
+    for name, use_tf_data in (('numpy', False), ('tf.data', True)):
+        throughputs[name] = measure_throughput(
+            use_tf_data, args.mnist, args.epochs, args.batch_size)
+        rows.append(f'{name:>8} {throughputs[name]:>10.0f}')
+    print(f'CPU-only training throughput, batch size {args.batch_size}:')
+    print('\n'.join(rows))
+    print(f'Speedup: {throughputs["tf.data"] / throughputs["numpy"]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
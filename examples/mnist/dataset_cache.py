@@ -0,0 +1,122 @@
+"""Caches a preprocessed dataset as .npy files that every experiment on the
+host memory-maps read-only, so concurrent experiments share one copy of the
+arrays in the page cache instead of each loading and normalizing its own."""
+
+import os
+import json
+import tempfile
+from typing import Any, Callable, Dict, Tuple
+import numpy as np
+
+Dataset = Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+ARRAY_NAMES = ('x_train', 'y_train', 'x_test', 'y_test')
+COMPLETE_MARKER = 'complete'
+# Bump when the cache layout changes, so that older caches are rebuilt.
+CACHE_FORMAT_VERSION = 2
+
+
+def _get_array_filename(cache_dir: str, name: str) -> str:
+    """Returns the path of the cached array.
+
+    :param cache_dir: The cache directory.
+    :param name: The name of the array, one of ARRAY_NAMES.
+    :return: The path of the cached array.
+    """
+    return os.path.join(cache_dir, f'{name}.npy')
+
+
+def _get_manifest(dataset: Dataset, version: str) -> Dict[str, Any]:
+    """Returns the description of the cached dataset that the completion
+    marker holds.
+
+    :param dataset: The dataset as (x_train, y_train), (x_test, y_test).
+    :param version: The version of the preprocessing that built the dataset.
+    :return: The cache format version, the dataset version, and the shape and
+        dtype of each array.
+    """
+    (x_train, y_train), (x_test, y_test) = dataset
+    return {'format_version': CACHE_FORMAT_VERSION,
+            'version': version,
+            'arrays': {name: {'shape': list(array.shape),
+                              'dtype': array.dtype.str}
+                       for name, array in zip(
+                           ARRAY_NAMES, (x_train, y_train, x_test, y_test))}}
+
+
+def is_cached(cache_dir: str, version: str = '') -> bool:
+    """Returns True if the cache directory holds a complete dataset in the
+    current format and of the given version, False otherwise. The arrays'
+    headers are checked against the manifest in the completion marker, so a
+    cache written by an older layout, or whose files were replaced, is not
+    reused.
+
+    :param cache_dir: The cache directory.
+    :param version: The version of the preprocessing that builds the
+        dataset.
+    :return: True if the cache directory holds a matching dataset, False
+        otherwise.
+    """
+    try:
+        with open(os.path.join(cache_dir, COMPLETE_MARKER), 'r',
+                  encoding='utf-8') as infile:
+            manifest = json.load(infile)
+        return manifest == _get_manifest(read_cache(cache_dir), version)
+    except (OSError, ValueError):
+        # A missing file, a marker from before manifests, or a bad header.
+        return False
+
+
+def write_cache(dataset: Dataset, cache_dir: str, version: str = '') -> None:
+    """Writes the dataset to the cache directory. Each file is written under a
+    temporary name and then renamed, so experiments that start while the cache
+    is being written never see a partial file, and concurrent writers of the
+    same dataset do not corrupt each other's output. The completion marker,
+    written last, holds the manifest that is_cached checks.
+
+    :param dataset: The dataset as (x_train, y_train), (x_test, y_test).
+    :param cache_dir: The cache directory.
+    :param version: The version of the preprocessing that built the dataset.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    (x_train, y_train), (x_test, y_test) = dataset
+    for name, array in zip(ARRAY_NAMES, (x_train, y_train, x_test, y_test)):
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.npy',
+                                         delete=False) as outfile:
+            np.save(outfile, np.ascontiguousarray(array))
+        os.replace(outfile.name, _get_array_filename(cache_dir, name))
+    with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.json',
+                                     delete=False,
+                                     encoding='utf-8') as outfile:
+        json.dump(_get_manifest(dataset, version), outfile)
+    os.replace(outfile.name, os.path.join(cache_dir, COMPLETE_MARKER))
+
+
+def read_cache(cache_dir: str) -> Dataset:
+    """Returns the cached dataset as read-only memory-mapped arrays. No data is
+    read until it is used, and pages that are already in the page cache, e.g.,
+    because another experiment is using them, are shared rather than copied.
+
+    :param cache_dir: The cache directory.
+    :return: The dataset as (x_train, y_train), (x_test, y_test).
+    """
+    x_train, y_train, x_test, y_test = (
+        np.load(_get_array_filename(cache_dir, name), mmap_mode='r')
+        for name in ARRAY_NAMES)
+    return (x_train, y_train), (x_test, y_test)
+
+
+def get_cached_dataset(build: Callable[[], Dataset], cache_dir: str,
+                       version: str = '') -> Dataset:
+    """Returns the dataset from the cache directory, first building and caching
+    it if the cache is empty, in an older format, or of another version.
+
+    :param build: The function that loads and preprocesses the dataset.
+    :param cache_dir: The cache directory.
+    :param version: The version of the preprocessing that build performs.
+        Change it whenever build changes, so that stale caches are rebuilt.
+    :return: The dataset as (x_train, y_train), (x_test, y_test), memory-mapped
+        read-only.
+    """
+    if not is_cached(cache_dir, version):
+        write_cache(build(), cache_dir, version)
+    return read_cache(cache_dir)
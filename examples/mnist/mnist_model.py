@@ -3,21 +3,25 @@
 import os
 import argparse
 import json
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, List, Tuple
 from datetime import datetime
 import numpy as np
+import tensorflow as tf
 from tensorflow.keras.datasets import mnist
 from tensorflow.keras.models import Model, Sequential
 from tensorflow.keras.layers import Flatten, Dense
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.losses import SparseCategoricalCrossentropy
-from tensorflow.keras.callbacks import TensorBoard, ModelCheckpoint, History
+from tensorflow.keras.callbacks import Callback, TensorBoard, \
+    ModelCheckpoint, History
 import wandb
 from wandb.keras import WandbCallback
+from dataset_cache import get_cached_dataset
 
 MNIST_INPUT_SHAPE = (28, 28)
 DEFAULT_TENSORBOARD_LOGDIR = os.path.join('logs', 'mnist')
 DEFAULT_MODEL_CHECKPOINT_FILENAME = os.path.join('models', 'mnist_model.h5')
+DEFAULT_DATASET_CACHE_DIR = os.path.join('data', 'mnist')
 DEFAULT_MODEL_ARGS = {'num_layers': 1}
 DEFAULT_TRAIN_ARGS = {'epochs': 10,
                       'batch_size': 32,
@@ -25,18 +29,29 @@ DEFAULT_TRAIN_ARGS = {'epochs': 10,
                       'use_wandb': True,
                       'tensorboard_logdir': None,
                       'model_checkpoint_filename': None,
-                      'overfit_single_batch': False}
+                      'overfit_single_batch': False,
+                      'use_tf_data': False,
+                      'shuffle_buffer_size': 10000}
 MAX_PIXEL_VALUE = 255
+# Change when get_dataset's preprocessing changes, so cached copies are rebuilt.
+DATASET_VERSION = 'normalized-float32-v1'
 WANDB_PROJECT_TITLE = 'mnist'
 
 
-def get_dataset() -> ((np.ndarray, np.ndarray), (np.ndarray, np.ndarray)):
+def get_dataset(cache_dir: Optional[str] = None) -> \
+        ((np.ndarray, np.ndarray), (np.ndarray, np.ndarray)):
     """Returns the dataset that will be fed into the model as 2 2-tuples:
     (x_train, y_train), (x_test, y_test). The returned dataset will be
     normalized.
 
+    :param cache_dir: If provided, the normalized dataset is cached in this
+        directory on first use and returned as read-only memory-mapped
+        arrays, so concurrent experiments on the same host share one copy.
+        If None, the dataset is loaded and normalized in memory.
     :return: (x_train, y_train), (x_test, y_test)
     """
+    if cache_dir:
+        return get_cached_dataset(get_dataset, cache_dir, DATASET_VERSION)
     (x_train, y_train), (x_test, y_test) = mnist.load_data()
     x_train = _normalize_images(x_train)
     x_test = _normalize_images(x_test)
@@ -80,10 +95,115 @@ def get_model(model_args: Optional[Dict[str, Any]] = None) -> Model:
     return model
 
 
+def split_validation_data(
+        x_train: np.ndarray,
+        y_train: np.ndarray,
+        validation_split: float) -> \
+        ((np.ndarray, np.ndarray), (np.ndarray, np.ndarray)):
+    """Returns the training data split into training and validation sets. As
+    with Keras' validation_split, the validation set is the last fraction of
+    the samples. The sets are views of the input arrays, not copies.
+
+    :param x_train: The normalized training images.
+    :param y_train: The training labels.
+    :param validation_split: The fraction of the samples to hold out.
+    :return: (x_fit, y_fit), (x_val, y_val)
+    """
+    num_fit = len(x_train) - int(len(x_train) * validation_split)
+    return ((x_train[:num_fit], y_train[:num_fit]),
+            (x_train[num_fit:], y_train[num_fit:]))
+
+
+def _to_model_inputs(images: tf.Tensor,
+                     labels: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    """Returns a batch of images and their labels as the model's input types.
+    Images that are still stored as uint8 pixels are normalized here.
+
+    :param images: The batch of images.
+    :param labels: The labels.
+    :return: The float32 images in the range [0, 1] and the labels.
+    """
+    if images.dtype == tf.uint8:
+        return tf.cast(images, tf.float32) / MAX_PIXEL_VALUE, labels
+    return tf.cast(images, tf.float32), labels
+
+
+def _get_batches(
+        images: np.ndarray,
+        labels: np.ndarray,
+        batch_size: int,
+        shuffle_buffer_size: Optional[int] = None) -> tf.data.Dataset:
+    """Returns a tf.data pipeline over the samples. The pipeline holds only
+    sample indices; each batch's rows are read from the arrays by a parallel
+    map when the batch is needed. The arrays are never copied into the
+    pipeline, so memory-mapped arrays from the dataset cache stay shared in
+    the page cache by all experiments on the host. Batches are prefetched
+    while the model trains on the current one.
+
+    :param images: The normalized images, e.g., a read-only memory map.
+    :param labels: The labels.
+    :param batch_size: The batch size.
+    :param shuffle_buffer_size: If provided, the number of samples from which
+        each sample is drawn at random, reshuffled every epoch.
+    :return: The pipeline.
+    """
+    def read_rows(indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Fancy indexing copies only this batch's rows out of the arrays.
+        return images[indices], labels[indices]
+
+    def read_batch(indices: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        batch_images, batch_labels = tf.numpy_function(
+            read_rows, [indices],
+            (tf.as_dtype(images.dtype), tf.as_dtype(labels.dtype)))
+        batch_images.set_shape((None, *images.shape[1:]))
+        batch_labels.set_shape((None, *labels.shape[1:]))
+        return _to_model_inputs(batch_images, batch_labels)
+
+    dataset = tf.data.Dataset.range(len(images))
+    if shuffle_buffer_size:
+        dataset = dataset.shuffle(shuffle_buffer_size,
+                                  reshuffle_each_iteration=True)
+    return dataset.batch(batch_size) \
+        .map(read_batch, num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+
+
+def get_tf_datasets(
+        x_train: np.ndarray,
+        y_train: np.ndarray,
+        batch_size: int,
+        validation_split: float,
+        shuffle_buffer_size: int) -> Tuple[tf.data.Dataset,
+                                           Optional[tf.data.Dataset]]:
+    """Returns tf.data pipelines for training and validation. The validation
+    set is split off once, here, rather than by every call to fit.
+
+    :param x_train: The normalized training images.
+    :param y_train: The training labels.
+    :param batch_size: The batch size.
+    :param validation_split: The fraction of the samples to use for
+        validation.
+    :param shuffle_buffer_size: The number of samples from which each training
+        sample is drawn at random.
+    :return: The training dataset, and the validation dataset (None if
+        validation_split is 0).
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    (x_fit, y_fit), (x_val, y_val) = split_validation_data(
+        x_train, y_train, validation_split)
+    train_dataset = _get_batches(x_fit, y_fit, batch_size,
+                                 shuffle_buffer_size=shuffle_buffer_size)
+    validation_dataset = None
+    if len(x_val):
+        validation_dataset = _get_batches(x_val, y_val, batch_size)
+    return train_dataset, validation_dataset
+
+
 def train_model(model: Model,
                 x_train: np.ndarray,
                 y_train: np.ndarray,
-                train_args: Optional[Dict[str, Any]] = None) -> History:
+                train_args: Optional[Dict[str, Any]] = None,
+                extra_callbacks: Optional[List[Callback]] = None) -> History:
     """Trains the model and returns the History object from training.
 
     :param model: The Keras Model.
@@ -91,14 +211,17 @@ def train_model(model: Model,
     :param y_train: The training labels.
     :param train_args: The training arguments. If unspecified, will use
         DEFAULT_TRAIN_ARGS. If specified, will be completed with
-        DEFAULT_TRAIN_ARGS if there are missing values.
+        DEFAULT_TRAIN_ARGS if there are missing values. If use_tf_data is
+        True, the data is fed through a tf.data pipeline (see
+        get_tf_datasets) instead of as in-memory arrays.
+    :param extra_callbacks: Additional Keras callbacks to use in training.
     :return: The training history.
     """
     if not train_args:
         train_args = DEFAULT_TRAIN_ARGS
     else:
         train_args = {**DEFAULT_TRAIN_ARGS, **train_args}
-    callbacks = []
+    callbacks = list(extra_callbacks or [])
     if train_args['use_wandb']:
         wandb.init(project=WANDB_PROJECT_TITLE, dir='.')
         callbacks.append(WandbCallback())
@@ -115,6 +238,14 @@ def train_model(model: Model,
     if train_args['overfit_single_batch']:
         x_train = x_train[:train_args['batch_size']]
         y_train = y_train[:train_args['batch_size']]
+    if train_args['use_tf_data']:
+        train_dataset, validation_dataset = get_tf_datasets(
+            x_train, y_train, train_args['batch_size'],
+            train_args['validation_split'], train_args['shuffle_buffer_size'])
+        return model.fit(train_dataset,
+                         epochs=train_args['epochs'],
+                         validation_data=validation_dataset,
+                         callbacks=callbacks)
     return model.fit(x=x_train,
                      y=y_train,
                      batch_size=train_args['batch_size'],
@@ -138,9 +269,12 @@ def run_experiment(hyperparams: Dict) -> None:
     """Trains a new model with the given hyperparameters.
 
     :param hyperparams: The hyperparameters to use in model creation and
-        training.
+        training. The optional key dataset_cache_dir overrides
+        DEFAULT_DATASET_CACHE_DIR; set it to null to disable the cache.
     """
-    (x_train, y_train), (x_test, y_test) = get_dataset()
+    (x_train, y_train), (x_test, y_test) = get_dataset(
+        cache_dir=hyperparams.get('dataset_cache_dir',
+                                  DEFAULT_DATASET_CACHE_DIR))
     model = get_model(hyperparams)
     _ = train_model(model, x_train, y_train, train_args=hyperparams)
     test_acc = eval_model(model, x_test, y_test)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""A stand-in for an experiment script. Takes a JSON-formatted dict of
+hyperparameters as its only argument, and supports the following keys, all
+optional:
+
+* sleep_seconds: The number of seconds to run before exiting.
+* exit_code: The exit code with which to exit.
+* output_file: A file to which to write the hyperparameters.
+* val_losses: A list of validation losses to log, one per step, as a
+  training script would log them to WandB.
+* step_seconds: The number of seconds each logged step takes.
+* history_dir: The directory in which to log the validation losses, to a
+  JSON Lines file named after the WANDB_RUN_ID environment variable. The
+  fake WandB API in tests/fakes.py reads the history from there.
+* stdout_lines: Lines to print to stdout.
+* stderr_lines: Lines to print to stderr.
+"""
+
+from typing import Dict
+import os
+import sys
+import json
+import time
+
+
+def run_experiment(hyperparams: Dict) -> None:
+    """Runs the stand-in experiment. Also serves as a worker pool entry point,
+    tests.dummy_experiment:run_experiment.
+
+    :param hyperparams: The hyperparameters.
+    """
+    if 'output_file' in hyperparams:
+        with open(hyperparams['output_file'], 'w', encoding='utf-8') as outfile:
+            outfile.write(json.dumps(hyperparams))
+    if 'history_dir' in hyperparams:
+        history_file = os.path.join(hyperparams['history_dir'],
+                                    f'{os.environ["WANDB_RUN_ID"]}.jsonl')
+        with open(history_file, 'w', encoding='utf-8') as outfile:
+            for step, val_loss in enumerate(hyperparams['val_losses']):
+                outfile.write(json.dumps({'_step': step,
+                                          'val_loss': val_loss}) + '\n')
+                outfile.flush()
+                time.sleep(hyperparams.get('step_seconds', 0))
+    for line in hyperparams.get('stdout_lines', []):
+        print(line)
+    for line in hyperparams.get('stderr_lines', []):
+        print(line, file=sys.stderr)
+    time.sleep(hyperparams.get('sleep_seconds', 0))
+    sys.exit(hyperparams.get('exit_code', 0))
+
+
+def main() -> None:
+    """Runs the program."""
+    run_experiment(json.loads(sys.argv[1]) if len(sys.argv) > 1 else {})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Contains fake versions of the WandB public API and Discord classes, so that
+Adjutant's interactions with WandB and Discord can be tested offline."""
+
+from typing import Any, Dict, Iterator, List, Optional
+import os
+import json
+import asyncio
+import math
+import time
+from adjutant.run_discovery import parse_wandb_timestamp, HEARTBEAT_FILTER_KEY
+
+MAX_DISCORD_MESSAGE_LENGTH = 2000
+
+
+class FakeRun:
+    """A fake wandb.apis.public.Run whose history is read from a JSON Lines
+    file, one logged row per line."""
+    # pylint: disable=too-few-public-methods
+    id: str
+    history_file: str
+    state: str
+
+    def __init__(self, run_id: str, history_file: str,
+                 state: str = 'running') -> None:
+        """Instantiates the object.
+
+        :param run_id: The unique ID of the run.
+        :param history_file: The JSON Lines file holding the run's history.
+        :param state: The state of the run.
+        """
+        self.id = run_id
+        self.history_file = history_file
+        self.state = state
+
+    def scan_history(
+            self,
+            keys: Optional[List[str]] = None,
+            page_size: int = 1000,
+            min_step: int = 0,
+            max_step: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Yields the run's logged rows, like Run.scan_history. Only rows that
+        contain all of the keys are yielded, and only those keys are included.
+
+        :param keys: The keys to fetch, or None for all keys.
+        :param page_size: Ignored.
+        :param min_step: The first step to fetch.
+        :param max_step: The step before which to stop, or None for no limit.
+        :return: An iterator over the matching rows.
+        """
+        # pylint: disable=unused-argument
+        with open(self.history_file, 'r', encoding='utf-8') as infile:
+            lines = infile.readlines()
+        for line in lines:
+            if not line.endswith('\n'):
+                # The writer has not finished this row yet.
+                break
+            row = json.loads(line)
+            if row['_step'] < min_step or \
+                    (max_step is not None and row['_step'] >= max_step):
+                continue
+            if keys is None:
+                yield row
+            elif all(key in row for key in keys):
+                yield {key: row[key] for key in keys}
+
+
+class FakeProjectRun:
+    """A fake wandb.apis.public.Run as listed by Api.runs, holding only the
+    fields that Adjutant reads when reporting a run."""
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    name: str
+    id: str
+    url: str
+    state: str
+    created_at: str
+    heartbeat_at: str
+    summary: Dict[str, Any]
+    config: Dict[str, Any]
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+            self,
+            name: str,
+            heartbeat_at: str,
+            summary: Optional[Dict[str, Any]] = None,
+            state: str = 'finished',
+            config: Optional[Dict[str, Any]] = None) -> None:
+        """Instantiates the object.
+
+        :param name: The name of the run, which is also used as its ID.
+        :param heartbeat_at: The timestamp of the run's last heartbeat, which
+            is also used as its creation time.
+        :param summary: The run's summary metrics.
+        :param state: The state of the run.
+        :param config: The run's config.
+        """
+        self.name = name
+        self.id = name
+        self.url = f'https://wandb.ai/fake/{name}'
+        self.state = state
+        self.created_at = heartbeat_at
+        self.heartbeat_at = heartbeat_at
+        self.summary = summary or {}
+        self.config = config or {}
+
+
+def _matches(run: FakeProjectRun, filters: Dict[str, Any]) -> bool:
+    """Returns True if the run matches the filters, False otherwise. Supports
+    the filters that RunDiscovery builds: state equality, heartbeat lower
+    bounds, and their conjunction.
+
+    :param run: The run.
+    :param filters: The WandB run filters.
+    :return: True if the run matches the filters, False otherwise.
+    """
+    for key, value in filters.items():
+        if key == '$and':
+            if not all(_matches(run, clause) for clause in value):
+                return False
+        elif key == HEARTBEAT_FILTER_KEY:
+            if parse_wandb_timestamp(run.heartbeat_at) <= \
+                    parse_wandb_timestamp(value['$gt']):
+                return False
+        elif getattr(run, key) != value:
+            return False
+    return True
+
+
+class FakeApi:
+    """A fake wandb.Api whose runs' histories are the files in a directory,
+    named <run id>.jsonl, and whose projects' runs are given lists."""
+    history_dir: str
+    projects: Dict[str, List[FakeProjectRun]]
+    page_latency_seconds: float
+    num_queries: int
+    num_pages: int
+
+    def __init__(
+            self,
+            history_dir: str = '',
+            projects: Optional[Dict[str, List[FakeProjectRun]]] = None,
+            page_latency_seconds: float = 0.0) -> None:
+        """Instantiates the object.
+
+        :param history_dir: The directory holding the runs' history files.
+        :param projects: The runs of each project, keyed by project path.
+        :param page_latency_seconds: The number of seconds that Api.runs
+            blocks for each page of matching runs, simulating the WandB server.
+        """
+        self.history_dir = history_dir
+        self.projects = projects or {}
+        self.page_latency_seconds = page_latency_seconds
+        self.num_queries = 0
+        self.num_pages = 0
+
+    def flush(self) -> None:
+        """Does nothing; the real Api clears its cache."""
+
+    def runs(
+            self,
+            path: str,
+            filters: Optional[Dict[str, Any]] = None,
+            order: str = '+heartbeat_at',
+            per_page: int = 50) -> List[FakeProjectRun]:
+        """Returns the project's runs that match the filters, like Api.runs.
+
+        :param path: The project path, of the form entity/project.
+        :param filters: The WandB run filters.
+        :param order: Ignored; runs are returned in the order given.
+        :param per_page: The number of runs per simulated page.
+        :return: The matching runs.
+        """
+        # pylint: disable=unused-argument
+        self.num_queries += 1
+        runs = [run for run in self.projects.get(path, [])
+                if _matches(run, filters or {})]
+        num_pages = max(1, math.ceil(len(runs) / per_page))
+        self.num_pages += num_pages
+        if self.page_latency_seconds:
+            time.sleep(self.page_latency_seconds * num_pages)
+        return runs
+
+    def run(self, path: str) -> FakeRun:
+        """Returns the run at the path, like Api.run.
+
+        :param path: The path to the run, of the form entity/project/run_id.
+        :return: The run.
+        """
+        run_id = path.split('/')[-1]
+        history_file = os.path.join(self.history_dir, f'{run_id}.jsonl')
+        if not os.path.exists(history_file):
+            raise ValueError(f'Could not find run {path}')
+        return FakeRun(run_id, history_file)
+
+
+class FakeMessage:
+    """A fake discord.Message."""
+    # pylint: disable=too-few-public-methods
+    content: str
+    channel: Optional['FakeChannel']
+    author: Optional[str]
+    file: Any
+
+    def __init__(self, content: str, channel: Optional['FakeChannel'] = None,
+                 author: Optional[str] = None, file: Any = None) -> None:
+        """Instantiates the object.
+
+        :param content: The text of the message.
+        :param channel: The channel in which the message was posted.
+        :param author: The author of the message.
+        :param file: The discord.File attached to the message, or None.
+        """
+        self.content = content
+        self.channel = channel
+        self.author = author
+        self.file = file
+
+    async def edit(self, content: str) -> None:
+        """Replaces the text of the message, like Message.edit.
+
+        :param content: The new text of the message.
+        """
+        self.content = content
+
+
+class FakeChannel:
+    """A fake discord.TextChannel that records the messages posted in it."""
+    # pylint: disable=too-few-public-methods
+    name: str
+    latency_seconds: float
+    messages: List[FakeMessage]
+    send_times: List[float]
+
+    def __init__(self, name: str = 'general',
+                 latency_seconds: float = 0.0) -> None:
+        """Instantiates the object.
+
+        :param name: The name of the channel.
+        :param latency_seconds: The number of seconds each send takes.
+        """
+        self.name = name
+        self.latency_seconds = latency_seconds
+        self.messages = []
+        self.send_times = []
+
+    async def send(self, content: str, file: Any = None) -> FakeMessage:
+        """Posts a message in the channel, like TextChannel.send.
+
+        :param content: The text of the message.
+        :param file: The discord.File to attach, or None.
+        :return: The posted message.
+        """
+        if len(content) > MAX_DISCORD_MESSAGE_LENGTH:
+            raise ValueError('Message too long.')
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        self.send_times.append(time.monotonic())
+        self.messages.append(FakeMessage(content, self, file=file))
+        return self.messages[-1]
@@ -3,11 +3,18 @@
 
 import os
 import json
-import time
+import asyncio
+from types import SimpleNamespace
+from typing import Any, List, Optional, Set, Tuple
 import pytest
+import discord
 from wandb.apis.public import Run
 from adjutant import adjutant_client
+from adjutant.early_stopping import EarlyStopper
+from adjutant.job_queue import JobQueue
+from adjutant.project_monitor import ProjectMonitor
 from tests.apis import is_discord_config_present, is_wandb_config_present
+from tests.fakes import FakeApi, FakeChannel, FakeProjectRun
 
 WANDB_ENTITY = 'kostaleonard'
 WANDB_PROJECT_TITLE = 'mnist'
@@ -15,8 +22,19 @@ DISCORD_TOKEN_ENVIRONMENT_VAR = 'DISCORD_ADJ_TOKEN'
 SETUP_TIMEOUT_SECONDS = 20
 NUM_KNOWN_PROJECT_RUNS = 60
 TEST_EXPERIMENT_SCRIPT = os.path.join('tests', 'write_arg.sh')
+DUMMY_EXPERIMENT_SCRIPT = os.path.join('tests', 'dummy_experiment.py')
+LONG_JOB_SECONDS = 30
 TEST_EXPERIMENT_OUTPUT_FILE = os.path.join('/', 'tmp', 'adj_write_arg_out.txt')
 KNOWN_BEST_VAL_LOSS = 0.08257
+FAKE_ENTITY = 'entity'
+FAKE_PROJECT = 'project'
+FAKE_RUNS = (
+    FakeProjectRun('a', '2021-09-18T17:00:00', {'best_val_loss': 0.3},
+                   config={'batch_size': 64, 'epochs': 10}),
+    FakeProjectRun('b', '2021-09-18T18:00:00', {'best_val_loss': 0.2},
+                   config={'batch_size': 64}),
+    FakeProjectRun('c', '2021-09-18T19:00:00', {'best_val_loss': 0.1},
+                   config={'batch_size': 128}))
 
 
 def test_adjutant_init_sets_public_fields() -> None:
@@ -99,20 +117,449 @@ def test_adjutant_run_experiment_runs_command() -> None:
     hyperparameter JSON string as the argument."""
     if not is_discord_config_present():
         return
-    adj = adjutant_client.Adjutant(
-        WANDB_ENTITY,
-        WANDB_PROJECT_TITLE,
-        run_experiment_script=TEST_EXPERIMENT_SCRIPT)
     hyperparams = {"hello": 1, "world": "abc"}
     try:
         os.remove(TEST_EXPERIMENT_OUTPUT_FILE)
     except FileNotFoundError:
         pass
-    adj.run_experiment(hyperparams)
-    # Wait for the new file to be created.
-    time.sleep(1)
+
+    async def main() -> None:
+        adj = adjutant_client.Adjutant(
+            WANDB_ENTITY,
+            WANDB_PROJECT_TITLE,
+            run_experiment_script=TEST_EXPERIMENT_SCRIPT)
+        await adj.run_experiment(hyperparams)
+        await adj._job_scheduler.wait_until_idle()
+    asyncio.run(main())
     assert os.path.exists(TEST_EXPERIMENT_OUTPUT_FILE)
     with open(TEST_EXPERIMENT_OUTPUT_FILE, 'r', encoding='utf-8') as infile:
         contents = infile.read()
     os.remove(TEST_EXPERIMENT_OUTPUT_FILE)
     assert json.loads(contents) == hyperparams
+
+
+def test_adjutant_get_hyperparams_ignores_flags() -> None:
+    """Tests that Adjutant._get_hyperparams skips flags before the
+    dictionary."""
+    assert adjutant_client.Adjutant._get_hyperparams(
+        adjutant_client.COMMAND_EXPERIMENT +
+        ' --priority 2 --slots 1 {"hello": 1}') == {"hello": 1}
+
+
+def test_adjutant_get_experiment_flags() -> None:
+    """Tests that Adjutant._get_experiment_flags finds flags with and without
+    values."""
+    assert adjutant_client.Adjutant._get_experiment_flags(
+        adjutant_client.COMMAND_EXPERIMENT +
+        ' --force --priority 2 {"hello": 1}') == {
+            'force': None, 'priority': '2'}
+
+
+def test_adjutant_get_experiment_flags_no_flags() -> None:
+    """Tests that Adjutant._get_experiment_flags returns an empty dict when
+    there are no flags."""
+    assert not adjutant_client.Adjutant._get_experiment_flags(
+        adjutant_client.COMMAND_EXPERIMENT + ' {"hello": 1}')
+
+
+def test_adjutant_get_top_args_defaults() -> None:
+    """Tests that Adjutant._get_top_args returns the defaults when no arguments
+    are given."""
+    assert adjutant_client.Adjutant._get_top_args(
+        adjutant_client.COMMAND_TOP) == (adjutant_client.DEFAULT_TOP_K, None)
+
+
+def test_adjutant_get_top_args_any_order() -> None:
+    """Tests that Adjutant._get_top_args accepts k and the metric in either
+    order."""
+    assert adjutant_client.Adjutant._get_top_args(
+        adjutant_client.COMMAND_TOP + ' 3 val_accuracy') == (3, 'val_accuracy')
+    assert adjutant_client.Adjutant._get_top_args(
+        adjutant_client.COMMAND_TOP + ' val_accuracy 3') == (3, 'val_accuracy')
+
+
+def test_adjutant_get_top_args_clamps_k() -> None:
+    """Tests that Adjutant._get_top_args limits k to between 1 and
+    MAX_TOP_K."""
+    assert adjutant_client.Adjutant._get_top_args(
+        adjutant_client.COMMAND_TOP + ' 1000')[0] == adjutant_client.MAX_TOP_K
+    assert adjutant_client.Adjutant._get_top_args(
+        adjutant_client.COMMAND_TOP + ' 0')[0] == 1
+
+
+async def _get_offline_adjutant() -> adjutant_client.Adjutant:
+    """Returns an Adjutant that uses a fake WandB project with FAKE_RUNS and
+    replies in a fake channel, after its first check of the project.
+
+    :return: The Adjutant.
+    """
+    adj = adjutant_client.Adjutant(
+        FAKE_ENTITY, FAKE_PROJECT,
+        intents=discord.Intents.default(),
+        wandb_api=FakeApi(projects={
+            f'{FAKE_ENTITY}/{FAKE_PROJECT}': list(FAKE_RUNS)}),
+        run_experiment_script=TEST_EXPERIMENT_SCRIPT,
+        default_hyperparams={'epochs': 10})
+    adj.channel = FakeChannel()
+    await adj._check_project(f'{FAKE_ENTITY}/{FAKE_PROJECT}')
+    return adj
+
+
+def test_adjutant_experiment_replies_with_existing_runs() -> None:
+    """Tests that an experiment whose hyperparameters match finished runs,
+    after filling in defaults, is answered with the best of them instead of
+    being launched."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        await adj._handle_command('$experiment {"batch_size": 64.0}')
+        assert not adj._job_scheduler.get_jobs()
+        assert '2 finished run(s)' in adj.channel.messages[-1].content
+        assert 'Best: b' in adj.channel.messages[-1].content
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_experiment_force_launches_duplicate() -> None:
+    """Tests that --force launches an experiment despite matching runs."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        await adj._handle_command('$experiment --force {"batch_size": 128}')
+        assert len(adj._job_scheduler.get_jobs()) == 1
+        await adj._job_scheduler.wait_until_idle()
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_experiment_dedupes_unfinished_jobs() -> None:
+    """Tests that an experiment matching a queued or running job is not
+    launched again."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        await adj._handle_command('$experiment {"batch_size": 16}')
+        await adj._handle_command(
+            '$experiment {"batch_size": 16, "epochs": 10}')
+        assert len(adj._job_scheduler.get_jobs()) == 1
+        assert 'Job 1 with these hyperparameters' in \
+            adj.channel.messages[-1].content
+        await adj._job_scheduler.wait_until_idle()
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_find_lists_matching_runs() -> None:
+    """Tests that $find lists the runs whose configs match the query, best
+    validation loss first."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        await adj._handle_command('$find {"batch_size": 64}')
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[0].startswith('2 matching run(s)')
+        assert lines[1].startswith('b: 0.2')
+        assert lines[2].startswith('a: 0.3')
+        await adj._handle_command('$find {"batch_size": 1}')
+        assert adj.channel.messages[-1].content == 'No finished runs match.'
+        await adj._handle_command('$find [1]')
+        assert adj.channel.messages[-1].content.startswith('Usage')
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_query_filters_sorts_and_aggregates() -> None:
+    """Tests that $query answers from the run table, including defaults that
+    the runs did not log."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        await adj._handle_command(
+            '$query batch_size>=64 epochs=10 sort:best_val_loss limit:2')
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[0] == '3 matching run(s).'
+        assert lines[1].startswith('c: batch_size=128 epochs=10 '
+                                   'best_val_loss=0.1')
+        assert lines[3] == '... 1 more'
+        await adj._handle_command('$query agg:best_val_loss by:batch_size')
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[1] == '64: n=2 mean=0.25 min=0.2 max=0.3'
+        await adj._handle_command('$query missing>1')
+        assert adj.channel.messages[-1].content.startswith(
+            'Cannot run query')
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_progress_reports_live_history(tmp_path) -> None:
+    """Tests that $progress fetches only the new history of a run and
+    describes each metric."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        adj._wandb_api.history_dir = str(tmp_path)
+        await adj._handle_command('$progress run1')
+        assert 'has not logged' in adj.channel.messages[-1].content
+        with open(os.path.join(tmp_path, 'run1.jsonl'), 'w',
+                  encoding='utf-8') as outfile:
+            outfile.write('{"_step": 0, "loss": 2, "val_loss": 3}\n'
+                          '{"_step": 1, "loss": 1}\n')
+        await adj._handle_command('$progress run1')
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[0] == (f'{FAKE_ENTITY}/{FAKE_PROJECT}/run1: running, '
+                            f'step 1: loss 1, val_loss 3')
+        assert lines[1].startswith('loss: ')
+        with open(os.path.join(tmp_path, 'run1.jsonl'), 'a',
+                  encoding='utf-8') as outfile:
+            outfile.write('{"_step": 2, "loss": 0.5}\n')
+        await adj._handle_command('$progress run1')
+        progress = adj._progress_tracker.get(
+            f'{FAKE_ENTITY}/{FAKE_PROJECT}/run1')
+        assert progress.num_rows == 3
+        await adj._handle_command('$progress 7')
+        assert adj.channel.messages[-1].content == 'There is no job 7.'
+        await adj._handle_command('$progress')
+        assert adj.channel.messages[-1].content == \
+            'No experiments are running.'
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_plot_attaches_cached_curves(tmp_path) -> None:
+    """Tests that $plot and $compare attach a PNG of the runs' curves, and
+    that repeating a request for unchanged runs reuses the image."""
+    pytest.importorskip('matplotlib')
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        adj._wandb_api.history_dir = str(tmp_path)
+        for run_id in ('run1', 'run2'):
+            with open(os.path.join(tmp_path, f'{run_id}.jsonl'), 'w',
+                      encoding='utf-8') as outfile:
+                outfile.write('{"_step": 0, "loss": 2, "acc": 0.5}\n'
+                              '{"_step": 1, "loss": 1, "acc": 0.7}\n')
+        await adj._handle_command('$plot run1')
+        message = adj.channel.messages[-1]
+        assert message.file.filename == adjutant_client.PLOT_FILENAME
+        await adj._handle_command('$plot run1')
+        assert adj._curve_renderer.num_renders == 1
+        assert adj._curve_renderer.num_cache_hits == 1
+        await adj._handle_command('$compare --metric acc run1 run2')
+        assert adj.channel.messages[-1].file is not None
+        assert adj._curve_renderer.num_renders == 2
+        await adj._handle_command('$plot missing')
+        assert adj.channel.messages[-1].content == \
+            'No history on WandB yet for: missing.'
+        await adj._handle_command('$compare')
+        assert adj.channel.messages[-1].content.startswith('Usage')
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_logs_shows_job_output() -> None:
+    """Tests that $logs shows the tail of a job's captured output, and that a
+    failed job's notification points to it."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        adj._job_scheduler._script = os.path.join('tests',
+                                                  'dummy_experiment.py')
+        await adj._handle_command(
+            '$experiment {"stdout_lines": ["epoch 1", "epoch 2"], '
+            '"stderr_lines": ["Traceback: oops"], "exit_code": 1}')
+        await adj._job_scheduler.wait_until_idle()
+        await adj._dispatcher.wait_until_empty()
+        assert '$logs 1' in adj.channel.messages[-1].content
+        await adj._handle_command('$logs 1 2')
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[0] == 'Last 2 of 3 lines of job 1 (failed):'
+        assert lines[2:4] == ['epoch 2', 'Traceback: oops']
+        await adj._handle_command('$logs 9')
+        assert adj.channel.messages[-1].content == 'There is no job 9.'
+        await adj._handle_command('$logs')
+        assert adj.channel.messages[-1].content.startswith('Usage')
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_agents_lists_agents(tmp_path) -> None:
+    """Tests that an Adjutant with an agent queue launches experiments through
+    the queue and that $agents lists the agents' heartbeats."""
+    filename = os.path.join(tmp_path, 'queue.db')
+
+    async def main() -> None:
+        adj = adjutant_client.Adjutant(
+            FAKE_ENTITY, FAKE_PROJECT,
+            intents=discord.Intents.default(),
+            wandb_api=FakeApi(projects={f'{FAKE_ENTITY}/{FAKE_PROJECT}': []}),
+            agent_queue_filename=filename)
+        adj.channel = FakeChannel()
+        await adj._handle_command('$agents')
+        assert adj.channel.messages[-1].content == 'No agents are connected.'
+        queue = JobQueue(filename)
+        queue.heartbeat('host:1', 4, 0)
+        await adj._handle_command('$experiment {"lr": 0.1}')
+        claimed = queue.claim('host:1', 4, 4)
+        assert [job.hyperparams for job in claimed] == [{'lr': 0.1}]
+        queue.heartbeat('host:1', 4, 1)
+        await adj._handle_command('$agents')
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[0] == 'Agents (1):'
+        assert lines[1].startswith('host:1: 1/4 slots used')
+        queue.close()
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_rejects_multiple_launch_methods() -> None:
+    """Tests that Adjutant.__init__ raises an error when more than one way to
+    launch experiments is provided."""
+    with pytest.raises(ValueError):
+        _ = adjutant_client.Adjutant(
+            FAKE_ENTITY, FAKE_PROJECT,
+            intents=discord.Intents.default(),
+            wandb_api=FakeApi(projects={}),
+            run_experiment_script=TEST_EXPERIMENT_SCRIPT,
+            agent_queue_filename='queue.db')
+
+
+def test_adjutant_sweep_edits_status_and_forgets_finished_sweep() -> None:
+    """Tests that a sweep's status message is edited through the dispatcher
+    and that the sweep is forgotten once it finishes."""
+
+    async def main() -> None:
+        adj = await _get_offline_adjutant()
+        await adj._handle_command('$sweep {"batch_size": [16, 32]}')
+        status = adj.channel.messages[-1]
+        await asyncio.gather(*adj._sweep_tasks.values())
+        await adj._dispatcher.wait_until_empty()
+        assert not adj._sweeps
+        assert '2 launched, 0 queued or running, 2 finished' in \
+            status.content
+        await adj._handle_command('$cancel sweep 1')
+        assert adj.channel.messages[-1].content == 'There is no sweep 1.'
+        await adj.close()
+    asyncio.run(main())
+
+
+class FlakyApi(FakeApi):
+    """A fake wandb.Api whose first query of each project in fail_paths
+    fails."""
+    fail_paths: Set[str]
+
+    def __init__(self, fail_paths: Set[str], **kwargs: Any) -> None:
+        """Instantiates the object.
+
+        :param fail_paths: The paths of the projects whose first query fails.
+        :param kwargs: The keyword arguments to FakeApi.
+        """
+        super().__init__(**kwargs)
+        self.fail_paths = set(fail_paths)
+
+    def runs(self, path: str, *args: Any, **kwargs: Any) -> List[Any]:
+        """Raises an error on the first query of a project in fail_paths, and
+        otherwise returns the project's runs like FakeApi.runs.
+
+        :param path: The project path, of the form entity/project.
+        :param args: The positional arguments to FakeApi.runs.
+        :param kwargs: The keyword arguments to FakeApi.runs.
+        :return: The matching runs.
+        """
+        if path in self.fail_paths:
+            self.fail_paths.remove(path)
+            raise ValueError(f'Could not find project {path}')
+        return super().runs(path, *args, **kwargs)
+
+
+def test_adjutant_on_ready_survives_failed_first_scan() -> None:
+    """Tests that a project whose first scan fails does not keep the other
+    projects from being scanned or the periodic checks from starting, and
+    that the project is scanned on its next check."""
+    broken_path = f'{FAKE_ENTITY}/broken'
+
+    async def main() -> None:
+        adj = adjutant_client.Adjutant(
+            FAKE_ENTITY, FAKE_PROJECT,
+            intents=discord.Intents.default(),
+            wandb_api=FlakyApi({broken_path}, projects={
+                f'{FAKE_ENTITY}/{FAKE_PROJECT}': list(FAKE_RUNS),
+                broken_path: list(FAKE_RUNS[:1])}),
+            additional_projects=[ProjectMonitor(FAKE_ENTITY, 'broken')])
+        adj._connection.user = SimpleNamespace(name='adjutant', id=1)
+        await adj.on_ready()
+        assert adj._poll_scheduler.is_running
+        assert len(adj._monitors[f'{FAKE_ENTITY}/{FAKE_PROJECT}']
+                   .reported_runs) == len(FAKE_RUNS)
+        assert not adj._monitors[broken_path].is_initialized()
+        await adj._check_project(broken_path)
+        assert adj._monitors[broken_path].is_initialized()
+        assert len(adj._monitors[broken_path].reported_runs) == 1
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_early_stopping_survives_fetch_errors(monkeypatch) -> None:
+    """Tests that an error fetching a job's history is logged rather than
+    raised, so that the next early stopping check still runs."""
+    fetched_jobs = []
+
+    def get_run_history(*args: Any) -> List[Any]:
+        fetched_jobs.append(args[1])
+        if len(fetched_jobs) == 1:
+            raise ValueError('The run was deleted.')
+        return []
+    monkeypatch.setattr(adjutant_client, 'get_run_history', get_run_history)
+
+    async def main() -> None:
+        adj = adjutant_client.Adjutant(
+            FAKE_ENTITY, FAKE_PROJECT,
+            intents=discord.Intents.default(),
+            wandb_api=FakeApi(),
+            run_experiment_script=DUMMY_EXPERIMENT_SCRIPT,
+            early_stopper=EarlyStopper())
+        # The loop waits for a login that never happens; run checks directly.
+        adj.check_early_stopping.cancel()
+        job = await adj._job_scheduler.submit(
+            {'sleep_seconds': LONG_JOB_SECONDS})
+        await adj.check_early_stopping()
+        await adj.check_early_stopping()
+        assert len(fetched_jobs) == 2
+        await adj._job_scheduler.cancel(job.id)
+        await adj._job_scheduler.wait_until_idle()
+        await adj.close()
+    asyncio.run(main())
+
+
+def test_adjutant_post_progress_survives_fetch_errors(monkeypatch) -> None:
+    """Tests that an error fetching a run's history is logged rather than
+    raised, so that progress is still posted and the next update runs."""
+    num_fetches = 0
+
+    def get_new_history(*args: Any) -> Tuple[Optional[str], List[Any]]:
+        # pylint: disable=unused-argument
+        nonlocal num_fetches
+        num_fetches += 1
+        if num_fetches == 1:
+            raise ValueError('The run was deleted.')
+        return 'running', [{'_step': 0, 'loss': 1.0}]
+    monkeypatch.setattr(adjutant_client, 'get_new_history', get_new_history)
+
+    async def main() -> None:
+        adj = adjutant_client.Adjutant(
+            FAKE_ENTITY, FAKE_PROJECT,
+            intents=discord.Intents.default(),
+            wandb_api=FakeApi(),
+            run_experiment_script=DUMMY_EXPERIMENT_SCRIPT)
+        adj.channel = FakeChannel()
+        job = await adj._job_scheduler.submit(
+            {'sleep_seconds': LONG_JOB_SECONDS})
+        await adj.post_progress()
+        await adj.post_progress()
+        await adj._dispatcher.wait_until_empty()
+        assert num_fetches == 2
+        lines = adj.channel.messages[-1].content.splitlines()
+        assert lines[-1].startswith(f'Job {job.id} ({job.run_id}): running')
+        await adj._job_scheduler.cancel(job.id)
+        await adj._job_scheduler.wait_until_idle()
+        await adj.close()
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""Tests agent.py."""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import sqlite3
+import subprocess
+from typing import List, Optional
+import pytest
+from adjutant.agent import Agent
+from adjutant.job_queue import JobQueue, AgentLauncher, LOST_EXIT_CODE
+from adjutant.job_scheduler import Job, JobScheduler, JOB_FINISHED, \
+    JOB_FAILED, JOB_CANCELLED, JOB_RUNNING
+
+DUMMY_EXPERIMENT_SCRIPT = os.path.join('tests', 'dummy_experiment.py')
+NUM_AGENTS = 2
+SLOTS_PER_AGENT = 2
+JOB_SECONDS = 1
+POLL_SECONDS = 0.1
+LONG_JOB_SECONDS = 30
+AGENT_EXIT_TIMEOUT_SECONDS = 10
+
+
+class FlakyJobQueue(JobQueue):
+    """A JobQueue whose first finish fails, as if the database were
+    locked."""
+    num_finish_calls: int
+
+    def __init__(self, filename: str) -> None:
+        """Instantiates the object.
+
+        :param filename: The path to the queue database.
+        """
+        super().__init__(filename)
+        self.num_finish_calls = 0
+
+    def finish(self, job_id: int, status: str,
+               exit_code: Optional[int]) -> None:
+        """Raises an error on the first call, and otherwise records the job's
+        final status like JobQueue.finish.
+
+        :param job_id: The job's ID.
+        :param status: The job's final status.
+        :param exit_code: The job's exit code.
+        """
+        self.num_finish_calls += 1
+        if self.num_finish_calls == 1:
+            raise sqlite3.OperationalError('database is locked')
+        super().finish(job_id, status, exit_code)
+
+
+def _start_agents(filename: str) -> List[subprocess.Popen]:
+    """Starts NUM_AGENTS agent processes on the queue, as if on separate
+    hosts.
+
+    :param filename: The path to the queue database.
+    :return: The agent processes.
+    """
+    return [subprocess.Popen([
+        sys.executable, '-m', 'adjutant.agent', '--queue', filename,
+        '--script', DUMMY_EXPERIMENT_SCRIPT, '--slots', str(SLOTS_PER_AGENT),
+        '--name', f'agent-{index}', '--poll-seconds', str(POLL_SECONDS)])
+        for index in range(NUM_AGENTS)]
+
+
+def _stop_agents(agents: List[subprocess.Popen]) -> None:
+    """Sends SIGTERM to the agent processes and waits for them to exit.
+
+    :param agents: The agent processes.
+    """
+    for agent in agents:
+        agent.send_signal(signal.SIGTERM)
+    for agent in agents:
+        assert agent.wait(AGENT_EXIT_TIMEOUT_SECONDS) == 0
+
+
+def test_agents_run_jobs_in_parallel(tmp_path) -> None:
+    """Tests that jobs launched through an AgentLauncher run on every agent at
+    once, and that their exit codes and cancellations reach the bot's
+    JobScheduler."""
+    filename = os.path.join(tmp_path, 'queue.db')
+    # Create the database before the agents open it.
+    queue = JobQueue(filename)
+    agents = _start_agents(filename)
+    num_jobs = NUM_AGENTS * SLOTS_PER_AGENT
+
+    async def main() -> List[Job]:
+        launcher = AgentLauncher(queue, poll_seconds=POLL_SECONDS)
+        scheduler = JobScheduler(launcher=launcher.launch,
+                                 max_slots=num_jobs + 1, max_log_lines=None)
+        while len(queue.get_agents()) < NUM_AGENTS:
+            await asyncio.sleep(POLL_SECONDS)
+        start = time.time()
+        jobs = [await scheduler.submit({'sleep_seconds': JOB_SECONDS})
+                for _ in range(num_jobs - 1)]
+        jobs.append(await scheduler.submit({'exit_code': 3}))
+        await asyncio.gather(*(job.wait() for job in jobs))
+        # One agent with one slot would take num_jobs - 1 times as long.
+        assert time.time() - start < JOB_SECONDS * (num_jobs - 1)
+        long_job = await scheduler.submit({'sleep_seconds': LONG_JOB_SECONDS})
+        while not queue.get_states([long_job.process.queue_id])[
+                long_job.process.queue_id][2]:
+            await asyncio.sleep(POLL_SECONDS)
+        await scheduler.cancel(long_job.id)
+        await scheduler.wait_until_idle()
+        return [*jobs, long_job]
+    try:
+        jobs = asyncio.run(main())
+        states = queue.get_states(range(1, len(jobs) + 1))
+        assert {agent for _, _, agent in states.values()} == {
+            f'agent-{index}' for index in range(NUM_AGENTS)}
+        assert len(queue.get_agents()) == NUM_AGENTS
+    finally:
+        _stop_agents(agents)
+    assert [job.status for job in jobs] == \
+        [JOB_FINISHED] * (num_jobs - 1) + [JOB_FAILED, JOB_CANCELLED]
+    assert jobs[-2].exit_code == 3
+    assert not queue.get_agents()
+    queue.close()
+
+
+def test_agent_terminates_jobs_failed_as_lost(tmp_path) -> None:
+    """Tests that an agent terminates a running job that the bot has failed
+    as lost, and that the job keeps its lost status in the queue."""
+    queue = JobQueue(os.path.join(tmp_path, 'queue.db'))
+    job_id = queue.submit({'sleep_seconds': LONG_JOB_SECONDS}, 'run-1')
+
+    async def main() -> None:
+        agent = Agent(queue, DUMMY_EXPERIMENT_SCRIPT, name='agent',
+                      max_slots=1, poll_seconds=POLL_SECONDS)
+        task = asyncio.ensure_future(agent.run())
+        while not agent.used_slots:
+            await asyncio.sleep(POLL_SECONDS)
+        assert queue.fail_lost_jobs(-1) == [job_id]
+        start = time.time()
+        while agent.used_slots:
+            assert time.time() - start < AGENT_EXIT_TIMEOUT_SECONDS
+            await asyncio.sleep(POLL_SECONDS)
+        agent.stop()
+        await task
+    asyncio.run(main())
+    assert queue.get_states([job_id])[job_id] == (
+        JOB_FAILED, LOST_EXIT_CODE, 'agent')
+    queue.close()
+
+
+def test_agent_retries_failed_finish(tmp_path) -> None:
+    """Tests that an agent whose report of a job's exit fails reports it again
+    on the next poll."""
+    queue = FlakyJobQueue(os.path.join(tmp_path, 'queue.db'))
+    job_id = queue.submit({'exit_code': 3}, 'run-1')
+
+    async def main() -> None:
+        agent = Agent(queue, DUMMY_EXPERIMENT_SCRIPT, name='agent',
+                      max_slots=1, poll_seconds=POLL_SECONDS)
+        task = asyncio.ensure_future(agent.run())
+        start = time.time()
+        while queue.get_states([job_id])[job_id][0] == JOB_RUNNING or \
+                not queue.num_finish_calls:
+            assert time.time() - start < AGENT_EXIT_TIMEOUT_SECONDS
+            await asyncio.sleep(POLL_SECONDS)
+        agent.stop()
+        await task
+    asyncio.run(main())
+    assert queue.num_finish_calls == 2
+    assert queue.get_states([job_id])[job_id] == (JOB_FAILED, 3, 'agent')
+    queue.close()
+
+
+def test_agent_init_rejects_bad_args(tmp_path) -> None:
+    """Tests that Agent.__init__ requires exactly one of script and
+    entry_point."""
+    queue = JobQueue(os.path.join(tmp_path, 'queue.db'))
+    with pytest.raises(ValueError):
+        _ = Agent(queue)
+    with pytest.raises(ValueError):
+        _ = Agent(queue, DUMMY_EXPERIMENT_SCRIPT, 'tests.dummy:main')
+    queue.close()
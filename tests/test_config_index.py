@@ -0,0 +1,84 @@
+"""Tests config_index.py."""
+
+from adjutant.config_index import ConfigIndex, canonicalize_value
+
+DEFAULTS = {'learning_rate': 0.001, 'batch_size': 32, 'epochs': 10}
+
+
+def test_canonicalize_value_normalizes_numbers_and_sequences() -> None:
+    """Tests that integral floats become ints and tuples become lists, also
+    inside nested values."""
+    assert canonicalize_value(10.0) == 10
+    assert isinstance(canonicalize_value(10.0), int)
+    assert canonicalize_value(0.5) == 0.5
+    assert canonicalize_value((1.0, 2)) == [1, 2]
+    assert canonicalize_value({1: [3.0]}) == {'1': [3]}
+
+
+def test_config_index_canonicalize_merges_defaults() -> None:
+    """Tests that ConfigIndex.canonicalize fills in defaults and drops internal
+    and ignored keys."""
+    index = ConfigIndex(DEFAULTS, ignored_keys=['output_dir'])
+    canonical = index.canonicalize({'batch_size': 64.0, '_wandb': {},
+                                    'output_dir': '/tmp/out'})
+    assert canonical == {'learning_rate': 0.001, 'batch_size': 64,
+                         'epochs': 10}
+
+
+def test_config_index_hash_ignores_order_and_defaults() -> None:
+    """Tests that configs that differ only in key order, integral float
+    formatting, or explicitly given defaults have the same hash."""
+    index = ConfigIndex(DEFAULTS)
+    assert index.get_hash({'epochs': 10.0, 'batch_size': 64}) == \
+        index.get_hash({'batch_size': 64})
+    assert index.get_hash({'batch_size': 64}) != \
+        index.get_hash({'batch_size': 128})
+
+
+def test_config_index_get_matching_runs() -> None:
+    """Tests that ConfigIndex.get_matching_runs finds the runs with an
+    equivalent config."""
+    index = ConfigIndex(DEFAULTS)
+    index.add('a', {'batch_size': 64, 'epochs': 10})
+    index.add('b', {'batch_size': 64.0})
+    index.add('c', {'batch_size': 128})
+    assert index.get_matching_runs({'batch_size': 64}) == ['a', 'b']
+    assert not index.get_matching_runs({'batch_size': 16})
+    assert len(index) == 3
+
+
+def test_config_index_add_replaces_run() -> None:
+    """Tests that adding a run again replaces its previous config."""
+    index = ConfigIndex(DEFAULTS)
+    index.add('a', {'batch_size': 64})
+    index.add('a', {'batch_size': 128})
+    assert not index.get_matching_runs({'batch_size': 64})
+    assert not index.find({'batch_size': 64})
+    assert index.get_matching_runs({'batch_size': 128}) == ['a']
+    assert len(index) == 1
+
+
+def test_config_index_remove() -> None:
+    """Tests that a removed run is no longer found."""
+    index = ConfigIndex(DEFAULTS)
+    index.add('a', {'batch_size': 64})
+    index.remove('a')
+    index.remove('missing')
+    assert not index.get_matching_runs({'batch_size': 64})
+    assert not index.find({})
+    assert not index._runs_by_item  # pylint: disable=protected-access
+
+
+def test_config_index_find_matches_subsets() -> None:
+    """Tests that ConfigIndex.find returns the runs that have every queried
+    key and value, counting defaults that the runs did not log."""
+    index = ConfigIndex(DEFAULTS)
+    index.add('a', {'batch_size': 64, 'learning_rate': 0.01})
+    index.add('b', {'batch_size': 64})
+    index.add('c', {'batch_size': 128, 'layers': [128, 64]})
+    assert index.find({'batch_size': 64}) == {'a', 'b'}
+    assert index.find({'batch_size': 64, 'learning_rate': 0.001}) == {'b'}
+    assert index.find({'epochs': 10.0}) == {'a', 'b', 'c'}
+    assert index.find({'layers': [128, 64]}) == {'c'}
+    assert not index.find({'batch_size': 64, 'missing': 1})
+    assert index.find({}) == {'a', 'b', 'c'}
@@ -0,0 +1,161 @@
+"""Tests early_stopping.py."""
+
+import os
+import asyncio
+from typing import Any, List, Tuple
+import pytest
+from adjutant.job_scheduler import Job, JobScheduler, JOB_FINISHED, \
+    JOB_STOPPED
+from adjutant.early_stopping import SuccessiveHalving, EarlyStopper, \
+    get_run_history
+from adjutant.leaderboard import MAXIMIZE
+from tests.fakes import FakeApi
+
+DUMMY_EXPERIMENT_SCRIPT = os.path.join('tests', 'dummy_experiment.py')
+CHECK_INTERVAL_SECONDS = 0.05
+
+
+def test_successive_halving_init_rejects_bad_args() -> None:
+    """Tests that SuccessiveHalving.__init__ raises an error on invalid
+    arguments."""
+    with pytest.raises(ValueError):
+        _ = SuccessiveHalving(direction='sideways')
+    with pytest.raises(ValueError):
+        _ = SuccessiveHalving(min_step=0)
+    with pytest.raises(ValueError):
+        _ = SuccessiveHalving(reduction_factor=1)
+
+
+def test_successive_halving_get_rung_step() -> None:
+    """Tests that rungs grow geometrically and stop at max_step."""
+    halving = SuccessiveHalving(min_step=2, reduction_factor=3, max_step=20)
+    assert [halving.get_rung_step(rung) for rung in range(4)] == [
+        2, 6, 18, None]
+
+
+def test_successive_halving_stops_worse_trials() -> None:
+    """Tests that a trial reaching a rung is stopped unless it is in the best
+    1 / reduction_factor of the trials at the rung so far."""
+    halving = SuccessiveHalving(min_step=1, reduction_factor=2)
+    assert not halving.report('first', 1, 0.5)
+    assert halving.report('worse', 1, 0.9)
+    assert not halving.report('better', 1, 0.1)
+
+
+def test_successive_halving_ignores_steps_before_first_rung() -> None:
+    """Tests that no trial is stopped before it reaches the first rung."""
+    halving = SuccessiveHalving(min_step=5, reduction_factor=2)
+    assert not halving.report('first', 1, 0.1)
+    assert not halving.report('second', 1, 100.0)
+
+
+def test_successive_halving_maximize() -> None:
+    """Tests that higher values are better when maximizing."""
+    halving = SuccessiveHalving(direction=MAXIMIZE, reduction_factor=2)
+    assert not halving.report('first', 1, 0.5)
+    assert halving.report('lower', 1, 0.4)
+
+
+def test_successive_halving_stops_nonfinite_values() -> None:
+    """Tests that a trial whose metric is not a finite number is stopped at
+    a rung, even if it is the first to reach it."""
+    halving = SuccessiveHalving(reduction_factor=2)
+    assert halving.report('diverged', 1, float('nan'))
+
+
+def test_successive_halving_uses_last_value_before_skipped_rung() -> None:
+    """Tests that when a trial's history skips past a rung, its value at the
+    rung is the last one logged before it."""
+    halving = SuccessiveHalving(min_step=2, reduction_factor=2)
+    assert not halving.report('first', 2, 0.5)
+    assert not halving.report('sparse', 1, 0.1)
+    # Steps 2 and 4 are rungs; the value at both is 0.1, not 9.0.
+    assert not halving.report('sparse', 5, 9.0)
+
+
+def test_get_run_history_missing_run(tmp_path) -> None:
+    """Tests that get_run_history returns no rows for a run that does not
+    exist yet."""
+    api = FakeApi(str(tmp_path))
+    assert not get_run_history(api, 'entity/project/missing', 'val_loss', 0)
+
+
+def test_get_run_history_from_min_step(tmp_path) -> None:
+    """Tests that get_run_history returns the metric values from min_step
+    onward."""
+    with open(os.path.join(tmp_path, 'run1.jsonl'), 'w',
+              encoding='utf-8') as outfile:
+        outfile.write('{"_step": 0, "val_loss": 3}\n'
+                      '{"_step": 1, "loss": 2}\n'
+                      '{"_step": 2, "val_loss": 1}\n')
+    api = FakeApi(str(tmp_path))
+    assert get_run_history(api, 'entity/project/run1', 'val_loss', 0) == [
+        (0, 3), (2, 1)]
+    assert get_run_history(api, 'entity/project/run1', 'val_loss', 1) == [
+        (2, 1)]
+
+
+def test_early_stopper_brackets_by_group() -> None:
+    """Tests that jobs in different groups are compared separately."""
+    stopper = EarlyStopper(reduction_factor=2)
+    assert not stopper.observe(Job(1, {}, group='a'), [(1, 0.1)])
+    assert not stopper.observe(Job(2, {}, group='b'), [(1, 0.9)])
+    assert stopper.observe(Job(3, {}, group='a'), [(1, 0.9)])
+
+
+def test_early_stopper_forgets_finished_jobs_and_groups() -> None:
+    """Tests that a finished job's progress is dropped on the next check while
+    its rung values still count, and that forget_group drops a group's
+    bracket."""
+    job = Job(1, {}, group='a')
+
+    async def fetch_history(job: Job, metric: str,
+                            min_step: int) -> List[Tuple[int, Any]]:
+        # pylint: disable=unused-argument
+        return []
+
+    async def main() -> None:
+        stopper = EarlyStopper(reduction_factor=2)
+        assert not stopper.observe(job, [(1, 0.1)])
+        bracket = stopper.get_bracket('a')
+        await stopper.check(JobScheduler(DUMMY_EXPERIMENT_SCRIPT),
+                            fetch_history)
+        # pylint: disable=protected-access
+        assert not bracket._next_rungs and not bracket._last_values
+        assert stopper.observe(Job(2, {}, group='a'), [(1, 0.9)])
+        stopper.forget_group('a')
+        assert stopper.get_bracket('a') is not bracket
+    asyncio.run(main())
+
+
+def test_early_stopper_stops_bottom_jobs(tmp_path) -> None:
+    """Tests end to end that an EarlyStopper watching live histories through a
+    fake WandB API terminates the worse jobs and lets the best one finish."""
+    api = FakeApi(str(tmp_path))
+    fetched_min_steps = []
+
+    async def fetch_history(job: Job, metric: str,
+                            min_step: int) -> List[Tuple[int, Any]]:
+        fetched_min_steps.append(min_step)
+        return get_run_history(api, f'entity/project/{job.run_id}', metric,
+                               min_step)
+
+    async def main() -> List[Job]:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=3)
+        stopper = EarlyStopper(min_step=2, reduction_factor=3)
+        # The best job logs fastest, so it reaches the first rung first.
+        jobs = [await scheduler.submit({
+            'history_dir': str(tmp_path),
+            'val_losses': [offset + 1 / (step + 1) for step in range(8)],
+            'step_seconds': step_seconds})
+            for offset, step_seconds in ((0, 0.05), (1, 0.3), (2, 0.3))]
+        while scheduler.get_running_jobs():
+            await stopper.check(scheduler, fetch_history)
+            await asyncio.sleep(CHECK_INTERVAL_SECONDS)
+        await scheduler.wait_until_idle()
+        return jobs
+    jobs = asyncio.run(main())
+    assert [job.status for job in jobs] == [
+        JOB_FINISHED, JOB_STOPPED, JOB_STOPPED]
+    # Histories are fetched incrementally, not from the start every time.
+    assert max(fetched_min_steps) > 0
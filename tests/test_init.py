@@ -0,0 +1,37 @@
+"""Tests __init__.py."""
+
+import subprocess
+import sys
+import pytest
+import adjutant
+from adjutant import adjutant_client
+
+
+def test_adjutant_is_loaded_on_first_access() -> None:
+    """Tests that adjutant.Adjutant is the client class and is listed by
+    dir, and that unknown attributes raise AttributeError."""
+    assert adjutant.Adjutant is adjutant_client.Adjutant
+    assert 'Adjutant' in dir(adjutant)
+    with pytest.raises(AttributeError):
+        _ = adjutant.missing
+
+
+def test_import_adjutant_skips_heavy_dependencies() -> None:
+    """Tests that importing the package and its lightweight modules does not
+    import wandb, discord.py, or numpy."""
+    code = ('import sys, adjutant, adjutant.run_store, adjutant.worker_pool\n'
+            'print(sorted({"wandb", "discord", "numpy"} & set(sys.modules)))')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_submodules_are_loaded_on_first_access() -> None:
+    """Tests that submodules such as adjutant.adjutant_client are reachable as
+    attributes after a plain import adjutant."""
+    code = ('import adjutant\n'
+            'print(adjutant.adjutant_client.Adjutant is adjutant.Adjutant)\n'
+            'print(adjutant.run_store.__name__)')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                            text=True, check=True)
+    assert result.stdout.split() == ['True', 'adjutant.run_store']
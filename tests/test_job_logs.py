@@ -0,0 +1,93 @@
+"""Tests job_logs.py."""
+
+import os
+import asyncio
+from typing import List
+import pytest
+from adjutant.job_logs import JobLog, RotatingLogFile, open_pipe_reader, \
+    TRUNCATION_MARKER
+
+
+def _read_chunks(log: JobLog, chunks: List[bytes]) -> None:
+    """Feeds the chunks to the log through a stream and waits until it has
+    read them.
+
+    :param log: The log.
+    :param chunks: The chunks of output, in order.
+    """
+    async def main() -> None:
+        stream = asyncio.StreamReader()
+        log.attach(stream)
+        for chunk in chunks:
+            stream.feed_data(chunk)
+        stream.feed_eof()
+        await log.drain()
+    asyncio.run(main())
+
+
+def test_job_log_keeps_last_lines() -> None:
+    """Tests that only the last max_lines lines are kept, including lines
+    split across reads and a final line without a line break."""
+    log = JobLog(max_lines=3)
+    _read_chunks(log, [b'one\ntw', b'o\nthree\n', b'four\nfive'])
+    assert list(log.lines) == ['three', 'four', 'five']
+    assert log.num_lines == 5
+    assert log.get_tail(2) == ['four', 'five']
+    assert log.get_tail(10) == ['three', 'four', 'five']
+    assert not log.get_tail(0)
+
+
+def test_job_log_truncates_long_lines() -> None:
+    """Tests that lines are truncated to max_line_length bytes however many
+    reads they span."""
+    log = JobLog(max_line_length=4)
+    _read_chunks(log, [b'abcdef', b'ghi\nabcd\n'])
+    assert list(log.lines) == ['abcd' + TRUNCATION_MARKER, 'abcd']
+
+
+def test_job_log_carriage_return_overwrites_line() -> None:
+    """Tests that a carriage return starts the line over, as a progress bar
+    expects, while \\r\\n line breaks keep their line."""
+    log = JobLog()
+    _read_chunks(log, [b'10%\r50%\r', b'100%\nwindows\r', b'\ndone\n'])
+    assert list(log.lines) == ['100%', 'windows', 'done']
+
+
+def test_job_log_rejects_bad_args() -> None:
+    """Tests that JobLog and RotatingLogFile raise errors on invalid
+    arguments."""
+    with pytest.raises(ValueError):
+        _ = JobLog(max_lines=0)
+    with pytest.raises(ValueError):
+        _ = JobLog(max_line_length=0)
+    with pytest.raises(ValueError):
+        _ = RotatingLogFile('unused.log', max_bytes=0)
+
+
+def test_job_log_rotates_log_file(tmp_path) -> None:
+    """Tests that the log file is rotated when it grows past max_bytes and
+    that at most backup_count backups are kept."""
+    filename = os.path.join(tmp_path, 'job.log')
+    log = JobLog(log_file=RotatingLogFile(filename, max_bytes=10,
+                                          backup_count=2))
+    _read_chunks(log, [b'line 1\nline 2\nline 3\nline 4\n'])
+    with open(filename, 'r', encoding='utf-8') as infile:
+        assert infile.read() == 'line 4\n'
+    with open(f'{filename}.1', 'r', encoding='utf-8') as infile:
+        assert infile.read() == 'line 3\n'
+    assert os.path.exists(f'{filename}.2')
+    assert not os.path.exists(f'{filename}.3')
+
+
+def test_open_pipe_reader_reads_pipe() -> None:
+    """Tests that a pipe's output reaches the log through open_pipe_reader."""
+    log = JobLog()
+
+    async def main() -> None:
+        read_fd, write_fd = os.pipe()
+        log.attach(await open_pipe_reader(read_fd))
+        os.write(write_fd, b'hello\n')
+        os.close(write_fd)
+        await log.drain()
+    asyncio.run(main())
+    assert list(log.lines) == ['hello']
@@ -0,0 +1,152 @@
+"""Tests job_queue.py."""
+
+import os
+import time
+import asyncio
+import multiprocessing
+from typing import List
+import pytest
+from adjutant.job_queue import JobQueue, AgentLauncher, LOST_EXIT_CODE, \
+    CANCELLED_EXIT_CODE
+from adjutant.job_scheduler import Job, JobScheduler, JOB_QUEUED, \
+    JOB_RUNNING, JOB_FINISHED, JOB_FAILED, JOB_CANCELLED
+
+NUM_CLAIMING_PROCESSES = 4
+NUM_CONTENDED_JOBS = 200
+POLL_SECONDS = 0.05
+
+
+def _claim_all(filename: str, agent: str) -> List[int]:
+    """Runs in a separate process. Claims jobs one at a time until the queue
+    is empty.
+
+    :param filename: The path to the queue database.
+    :param agent: The name of the claiming agent.
+    :return: The IDs of the claimed jobs.
+    """
+    queue = JobQueue(filename)
+    claimed = []
+    while True:
+        jobs = queue.claim(agent, 1, 1)
+        if not jobs:
+            break
+        claimed.extend(job.id for job in jobs)
+    queue.close()
+    return claimed
+
+
+def test_job_queue_claims_by_priority_and_slots(tmp_path) -> None:
+    """Tests that claim takes the highest-priority jobs first, stops at the
+    first job that does not fit in the free slots, and skips jobs that need
+    more slots than the agent has."""
+    queue = JobQueue(os.path.join(tmp_path, 'queue.db'))
+    low = queue.submit({'lr': 0.1}, 'run-low')
+    high = queue.submit({'lr': 0.2}, 'run-high', priority=5)
+    wide = queue.submit({'lr': 0.3}, 'run-wide', slots=2)
+    huge = queue.submit({'lr': 0.4}, 'run-huge', slots=8)
+    claimed = queue.claim('agent', 2, 4)
+    assert [job.id for job in claimed] == [high, low]
+    assert claimed[0].hyperparams == {'lr': 0.2}
+    assert claimed[0].run_id == 'run-high'
+    assert [job.id for job in queue.claim('agent', 2, 4)] == [wide]
+    assert not queue.claim('agent', 4, 4)
+    states = queue.get_states([low, wide, huge])
+    assert states[low] == (JOB_RUNNING, None, 'agent')
+    assert states[huge] == (JOB_QUEUED, None, None)
+    queue.finish(low, JOB_FINISHED, 0)
+    assert queue.get_states([low])[low] == (JOB_FINISHED, 0, 'agent')
+    queue.close()
+
+
+def test_job_queue_claims_each_job_once_across_processes(tmp_path) -> None:
+    """Tests that agents in several processes claiming at once never claim
+    the same job."""
+    filename = os.path.join(tmp_path, 'queue.db')
+    queue = JobQueue(filename)
+    for index in range(NUM_CONTENDED_JOBS):
+        queue.submit({'index': index}, f'run-{index}')
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(NUM_CLAIMING_PROCESSES) as pool:
+        results = pool.starmap(_claim_all, [
+            (filename, f'agent-{index}')
+            for index in range(NUM_CLAIMING_PROCESSES)])
+    claimed = [job_id for result in results for job_id in result]
+    assert sorted(claimed) == list(range(1, NUM_CONTENDED_JOBS + 1))
+    queue.close()
+
+
+def test_job_queue_cancels_queued_and_running_jobs(tmp_path) -> None:
+    """Tests that request_cancel cancels queued jobs immediately and asks the
+    agent to terminate running ones."""
+    queue = JobQueue(os.path.join(tmp_path, 'queue.db'))
+    running = queue.submit({}, 'run-1')
+    queued = queue.submit({}, 'run-2')
+    _ = queue.claim('agent', 1, 1)
+    queue.request_cancel([running, queued])
+    assert queue.get_states([queued])[queued] == (
+        JOB_CANCELLED, CANCELLED_EXIT_CODE, None)
+    assert queue.get_cancel_requests('agent', [running]) == [running]
+    assert not queue.claim('agent', 1, 1)
+    queue.finish(running, JOB_CANCELLED, -15)
+    assert not queue.get_cancel_requests('agent', [])
+    queue.close()
+
+
+def test_job_queue_fails_jobs_of_lost_agents(tmp_path) -> None:
+    """Tests that the running jobs of an agent whose heartbeat is too old are
+    failed, that the agent is forgotten, and that its late report of the
+    job's exit is ignored. The agent is told to terminate the job if it comes
+    back."""
+    queue = JobQueue(os.path.join(tmp_path, 'queue.db'))
+    job_id = queue.submit({}, 'run-1')
+    queue.heartbeat('lost', 1, 1)
+    queue.heartbeat('alive', 1, 0)
+    _ = queue.claim('lost', 1, 1)
+    assert not queue.get_cancel_requests('lost', [job_id])
+    time.sleep(0.1)
+    queue.heartbeat('alive', 1, 0)
+    assert queue.fail_lost_jobs(0.05) == [job_id]
+    assert [agent.name for agent in queue.get_agents()] == ['alive']
+    assert queue.get_cancel_requests('lost', [job_id]) == [job_id]
+    queue.finish(job_id, JOB_FINISHED, 0)
+    assert queue.get_states([job_id])[job_id] == (
+        JOB_FAILED, LOST_EXIT_CODE, 'lost')
+    queue.close()
+
+
+def test_agent_launcher_reports_exit_codes(tmp_path) -> None:
+    """Tests that a JobScheduler that launches through an AgentLauncher
+    records the exit codes that an agent reports, and that cancelling a job
+    that no agent has claimed cancels it in the queue."""
+    filename = os.path.join(tmp_path, 'queue.db')
+
+    async def main() -> List[Job]:
+        launcher = AgentLauncher(JobQueue(filename), poll_seconds=POLL_SECONDS)
+        scheduler = JobScheduler(launcher=launcher.launch, max_slots=3,
+                                 max_log_lines=None)
+        jobs = [await scheduler.submit({}, run_id=f'run-{index}')
+                for index in range(3)]
+        agent_queue = JobQueue(filename)
+        claimed = agent_queue.claim('agent', 2, 2)
+        assert [job.run_id for job in claimed] == ['run-0', 'run-1']
+        agent_queue.finish(claimed[0].id, JOB_FINISHED, 0)
+        agent_queue.finish(claimed[1].id, JOB_FAILED, 3)
+        await scheduler.cancel(jobs[2].id)
+        await scheduler.wait_until_idle()
+        agent_queue.close()
+        launcher.close()
+        return jobs
+    jobs = asyncio.run(main())
+    assert [(job.status, job.exit_code) for job in jobs] == [
+        (JOB_FINISHED, 0), (JOB_FAILED, 3),
+        (JOB_CANCELLED, CANCELLED_EXIT_CODE)]
+
+
+def test_agent_launcher_rejects_bad_args(tmp_path) -> None:
+    """Tests that AgentLauncher raises errors on invalid arguments."""
+    queue = JobQueue(os.path.join(tmp_path, 'queue.db'))
+    with pytest.raises(ValueError):
+        _ = AgentLauncher(queue, poll_seconds=0)
+    with pytest.raises(ValueError):
+        _ = AgentLauncher(queue, agent_timeout_seconds=0)
+    queue.close()
@@ -0,0 +1,335 @@
+"""Tests job_scheduler.py."""
+
+import os
+import json
+import asyncio
+from typing import List
+import pytest
+from adjutant.job_scheduler import Job, JobScheduler, JOB_QUEUED, \
+    JOB_RUNNING, JOB_FINISHED, JOB_FAILED, JOB_CANCELLED, JOB_STOPPED
+
+DUMMY_EXPERIMENT_SCRIPT = os.path.join('tests', 'dummy_experiment.py')
+LONG_JOB_SECONDS = 10
+
+
+def test_job_scheduler_init_rejects_zero_slots() -> None:
+    """Tests that JobScheduler.__init__ raises an error when max_slots is not
+    positive."""
+    with pytest.raises(ValueError):
+        _ = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=0)
+
+
+def test_job_scheduler_submit_runs_script(tmp_path) -> None:
+    """Tests that JobScheduler.submit runs the script with the hyperparameters
+    as a JSON-formatted argument."""
+    output_file = os.path.join(tmp_path, 'out.json')
+    hyperparams = {'hello': 1, 'output_file': output_file}
+
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        job = await scheduler.submit(hyperparams)
+        assert job.status == JOB_RUNNING
+        await scheduler.wait_until_idle()
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_FINISHED
+    assert job.exit_code == 0
+    with open(output_file, 'r', encoding='utf-8') as infile:
+        assert json.loads(infile.read()) == hyperparams
+
+
+def test_job_scheduler_records_failure() -> None:
+    """Tests that a job whose process exits with a nonzero code is marked
+    failed."""
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        job = await scheduler.submit({'exit_code': 3})
+        await scheduler.wait_until_idle()
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_FAILED
+    assert job.exit_code == 3
+
+
+def test_job_scheduler_limits_concurrency() -> None:
+    """Tests that jobs beyond max_slots wait in the queue until a running job
+    exits."""
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=2)
+        jobs = [await scheduler.submit({'sleep_seconds': 0.5})
+                for _ in range(3)]
+        assert [job.status for job in jobs] == [
+            JOB_RUNNING, JOB_RUNNING, JOB_QUEUED]
+        assert scheduler.get_queued_jobs() == [jobs[2]]
+        await scheduler.wait_until_idle()
+        assert all(job.status == JOB_FINISHED for job in jobs)
+        assert jobs[2].started_at >= min(jobs[0].finished_at,
+                                         jobs[1].finished_at)
+    asyncio.run(main())
+
+
+def test_job_scheduler_starts_higher_priority_first() -> None:
+    """Tests that queued jobs start in priority order, then submission
+    order."""
+    async def main() -> List[int]:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        await scheduler.submit({'sleep_seconds': 0.2})
+        low = await scheduler.submit({}, priority=0)
+        high = await scheduler.submit({}, priority=5)
+        also_high = await scheduler.submit({}, priority=5)
+        assert scheduler.get_queued_jobs() == [high, also_high, low]
+        await scheduler.wait_until_idle()
+        return [job.id for job in sorted(
+            (low, high, also_high), key=lambda job: job.started_at)]
+    assert asyncio.run(main()) == [3, 4, 2]
+
+
+def test_job_scheduler_respects_job_slots() -> None:
+    """Tests that a job that needs more slots than are free waits."""
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=2)
+        small = await scheduler.submit({'sleep_seconds': 0.2})
+        large = await scheduler.submit({}, slots=2)
+        assert small.status == JOB_RUNNING
+        assert large.status == JOB_QUEUED
+        await scheduler.wait_until_idle()
+        assert large.started_at >= small.finished_at
+        with pytest.raises(ValueError):
+            await scheduler.submit({}, slots=3)
+    asyncio.run(main())
+
+
+def test_job_scheduler_cancel_queued_job() -> None:
+    """Tests that cancelling a queued job removes it from the queue without
+    running it."""
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        await scheduler.submit({'sleep_seconds': 0.2})
+        queued = await scheduler.submit({})
+        assert await scheduler.cancel(queued.id)
+        assert queued.status == JOB_CANCELLED
+        assert not scheduler.get_queued_jobs()
+        await scheduler.wait_until_idle()
+        assert queued.started_at is None
+    asyncio.run(main())
+
+
+def test_job_scheduler_cancel_running_job() -> None:
+    """Tests that cancelling a running job terminates its process."""
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        job = await scheduler.submit({'sleep_seconds': LONG_JOB_SECONDS})
+        assert await scheduler.cancel(job.id)
+        await asyncio.wait_for(scheduler.wait_until_idle(), LONG_JOB_SECONDS)
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_CANCELLED
+    assert job.exit_code != 0
+
+
+def test_job_scheduler_cancel_unknown_job() -> None:
+    """Tests that cancelling a job that does not exist or is done returns
+    False."""
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        assert not await scheduler.cancel(1)
+        job = await scheduler.submit({})
+        await scheduler.wait_until_idle()
+        assert not await scheduler.cancel(job.id)
+    asyncio.run(main())
+
+
+def test_job_scheduler_calls_on_job_done() -> None:
+    """Tests that JobScheduler calls on_job_done with each completed job."""
+    done_jobs = []
+
+    async def on_job_done(job: Job) -> None:
+        done_jobs.append(job)
+
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT,
+                                 on_job_done=on_job_done)
+        await scheduler.submit({})
+        await scheduler.submit({'exit_code': 1})
+        await scheduler.wait_until_idle()
+    asyncio.run(main())
+    assert [job.status for job in done_jobs] == [JOB_FINISHED, JOB_FAILED]
+
+
+def test_job_scheduler_missing_script_fails_job() -> None:
+    """Tests that a job whose script cannot be started is marked failed and
+    frees its slot."""
+    async def main() -> None:
+        scheduler = JobScheduler(os.path.join('tests', 'does_not_exist.sh'))
+        job = await scheduler.submit({})
+        assert job.status == JOB_FAILED
+        assert job.exit_code is None
+        second = await scheduler.submit({})
+        assert second.status == JOB_FAILED
+    asyncio.run(main())
+
+
+def test_job_scheduler_forgets_old_jobs() -> None:
+    """Tests that JobScheduler only remembers job_history completed jobs."""
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, job_history=2)
+        jobs = []
+        for _ in range(3):
+            jobs.append(await scheduler.submit({}))
+            await scheduler.wait_until_idle()
+        assert scheduler.get_job(jobs[0].id) is None
+        assert scheduler.get_jobs() == jobs[1:]
+    asyncio.run(main())
+
+
+def test_job_scheduler_passes_run_id(tmp_path) -> None:
+    """Tests that each job's run ID is passed to its process in the
+    WANDB_RUN_ID environment variable."""
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        job = await scheduler.submit({'history_dir': str(tmp_path),
+                                      'val_losses': [1.0]})
+        await scheduler.wait_until_idle()
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_FINISHED
+    assert os.listdir(tmp_path) == [f'{job.run_id}.jsonl']
+
+
+def test_job_scheduler_cancel_with_status() -> None:
+    """Tests that a job cancelled with JOB_STOPPED is marked stopped once its
+    process exits."""
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        job = await scheduler.submit({'sleep_seconds': LONG_JOB_SECONDS})
+        assert await scheduler.cancel(job.id, status=JOB_STOPPED)
+        await scheduler.wait_until_idle()
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_STOPPED
+    assert job.is_done
+
+
+def test_job_scheduler_counts_launches() -> None:
+    """Tests that JobScheduler.num_launched counts started processes but not
+    jobs cancelled while queued."""
+    async def main() -> int:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT)
+        await scheduler.submit({'sleep_seconds': 0.2})
+        queued = await scheduler.submit({})
+        await scheduler.submit({})
+        await scheduler.cancel(queued.id)
+        await scheduler.wait_until_idle()
+        return scheduler.num_launched
+    assert asyncio.run(main()) == 2
+
+
+def test_job_scheduler_captures_output(tmp_path) -> None:
+    """Tests that a job's stdout and stderr are kept in its log and written
+    to the log directory rather than inherited, and that a restarted
+    scheduler does not write to the same file."""
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_log_lines=3,
+                                 log_directory=str(tmp_path))
+        job = await scheduler.submit({
+            'stdout_lines': [f'line {index}' for index in range(5)],
+            'stderr_lines': ['Traceback: error'], 'exit_code': 1})
+        await scheduler.wait_until_idle()
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_FAILED
+    assert job.log.num_lines == 6
+    assert job.log.get_tail(3)[-1] == 'Traceback: error'
+    restarted_job = asyncio.run(main())
+    assert restarted_job.id == job.id
+    for each_job in (job, restarted_job):
+        filename = f'job-{each_job.id}-{each_job.run_id}.log'
+        with open(os.path.join(tmp_path, filename), 'r',
+                  encoding='utf-8') as infile:
+            assert len(infile.read().splitlines()) == 6
+
+
+def test_job_scheduler_without_log_inherits_output() -> None:
+    """Tests that jobs have no log when output capture is disabled."""
+    async def main() -> Job:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_log_lines=None)
+        job = await scheduler.submit({})
+        await scheduler.wait_until_idle()
+        return job
+    assert asyncio.run(main()).log is None
+
+
+class _BrokenProcess:
+    """A JobProcess whose wait fails, or never returns if is_hung."""
+    returncode = None
+
+    def __init__(self, is_hung: bool) -> None:
+        """Instantiates the object.
+
+        :param is_hung: If True, wait never returns instead of failing.
+        """
+        self.is_hung = is_hung
+
+    def terminate(self) -> None:
+        """Does nothing."""
+
+    async def wait(self) -> int:
+        """Fails, or waits forever if is_hung.
+
+        :return: Never returns.
+        """
+        if self.is_hung:
+            await asyncio.Event().wait()
+        raise OSError('wait failed')
+
+
+def test_job_scheduler_reap_failure_releases_slots() -> None:
+    """Tests that a job whose process cannot be waited on, or whose reaper is
+    cancelled, is marked failed and frees its slot for the next job."""
+    # pylint: disable=protected-access
+    done_jobs = []
+
+    async def on_job_done(job: Job) -> None:
+        done_jobs.append(job.id)
+
+    async def launch(job: Job) -> _BrokenProcess:
+        return _BrokenProcess(is_hung=job.hyperparams['is_hung'])
+
+    async def main() -> List[Job]:
+        scheduler = JobScheduler(launcher=launch, on_job_done=on_job_done,
+                                 max_log_lines=None)
+        jobs = [await scheduler.submit({'is_hung': is_hung})
+                for is_hung in (False, True, False)]
+        await asyncio.sleep(0.05)
+        assert jobs[1].status == JOB_RUNNING
+        scheduler._reapers[jobs[1].id].cancel()
+        await asyncio.sleep(0.1)
+        await scheduler.wait_until_idle()
+        return jobs
+    jobs = asyncio.run(main())
+    assert [job.status for job in jobs] == [JOB_FAILED] * 3
+    assert done_jobs == [1, 2, 3]
+
+
+def test_job_scheduler_launch_error_releases_slots() -> None:
+    """Tests that a job whose launcher raises an error other than OSError is
+    marked failed and frees its slot for the next job."""
+    # pylint: disable=protected-access
+
+    async def launch(job: Job) -> _BrokenProcess:
+        if job.hyperparams['is_bad']:
+            raise RuntimeError('Could not claim the job.')
+        return _BrokenProcess(is_hung=False)
+
+    async def main() -> List[Job]:
+        scheduler = JobScheduler(launcher=launch, max_slots=1,
+                                 max_log_lines=None)
+        jobs = [await scheduler.submit({'is_bad': is_bad})
+                for is_bad in (True, False)]
+        await scheduler.wait_until_idle()
+        assert scheduler._used_slots == 0
+        return jobs
+    jobs = asyncio.run(main())
+    assert [(job.status, job.exit_code) for job in jobs] == [
+        (JOB_FAILED, None), (JOB_FAILED, None)]
+    assert jobs[1].started_at is not None
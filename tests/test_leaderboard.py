@@ -0,0 +1,95 @@
+"""Tests leaderboard.py."""
+
+import pytest
+from adjutant.leaderboard import Leaderboard, MINIMIZE, MAXIMIZE
+
+
+def test_leaderboard_init_rejects_bad_direction() -> None:
+    """Tests that Leaderboard.__init__ raises an error when the direction is
+    not MINIMIZE or MAXIMIZE."""
+    with pytest.raises(ValueError):
+        _ = Leaderboard('best_val_loss', 'lowest')
+
+
+def test_leaderboard_top_minimize() -> None:
+    """Tests that Leaderboard.top returns the runs with the lowest values first
+    when minimizing."""
+    leaderboard = Leaderboard('best_val_loss', MINIMIZE)
+    leaderboard.add('b', 0.2)
+    leaderboard.add('a', 0.1)
+    leaderboard.add('c', 0.3)
+    assert leaderboard.top(2) == [('a', 0.1), ('b', 0.2)]
+
+
+def test_leaderboard_top_maximize() -> None:
+    """Tests that Leaderboard.top returns the runs with the highest values first
+    when maximizing."""
+    leaderboard = Leaderboard('val_accuracy', MAXIMIZE)
+    leaderboard.add('b', 0.8)
+    leaderboard.add('a', 0.9)
+    leaderboard.add('c', 0.7)
+    assert leaderboard.top(2) == [('a', 0.9), ('b', 0.8)]
+
+
+def test_leaderboard_top_more_than_ranked() -> None:
+    """Tests that Leaderboard.top returns all runs when k exceeds the number of
+    ranked runs."""
+    leaderboard = Leaderboard('best_val_loss')
+    leaderboard.add('a', 0.1)
+    assert leaderboard.top(10) == [('a', 0.1)]
+
+
+def test_leaderboard_add_ignores_non_numeric_values() -> None:
+    """Tests that Leaderboard.add does not rank missing, non-numeric, or
+    non-finite values."""
+    leaderboard = Leaderboard('best_val_loss')
+    assert not leaderboard.add('a', None)
+    assert not leaderboard.add('b', 'NaN')
+    assert not leaderboard.add('c', float('nan'))
+    assert not leaderboard.add('d', float('inf'))
+    assert not leaderboard.add('e', True)
+    assert leaderboard.add('f', 1)
+    assert len(leaderboard) == 1
+
+
+def test_leaderboard_add_replaces_existing_value() -> None:
+    """Tests that adding a run that is already ranked replaces its value."""
+    leaderboard = Leaderboard('best_val_loss')
+    leaderboard.add('a', 0.1)
+    leaderboard.add('b', 0.2)
+    leaderboard.add('a', 0.3)
+    assert leaderboard.top(2) == [('b', 0.2), ('a', 0.3)]
+    assert len(leaderboard) == 2
+
+
+def test_leaderboard_remove() -> None:
+    """Tests that Leaderboard.remove unranks the run and ignores unknown
+    runs."""
+    leaderboard = Leaderboard('best_val_loss')
+    leaderboard.add('a', 0.1)
+    leaderboard.add('b', 0.1)
+    leaderboard.remove('a')
+    leaderboard.remove('unknown')
+    assert leaderboard.top(2) == [('b', 0.1)]
+
+
+def test_leaderboard_add_many_matches_add() -> None:
+    """Tests that Leaderboard.add_many produces the same ranking as calling
+    Leaderboard.add for each run."""
+    values = [('a', 0.5), ('b', 0.1), ('c', None), ('d', 0.3), ('b', 0.4)]
+    one_at_a_time = Leaderboard('best_val_loss')
+    for name, value in values:
+        one_at_a_time.add(name, value)
+    at_once = Leaderboard('best_val_loss')
+    at_once.add_many(values)
+    assert at_once.top(10) == one_at_a_time.top(10)
+
+
+def test_leaderboard_best() -> None:
+    """Tests that Leaderboard.best returns the best run, or None if there are
+    no ranked runs."""
+    leaderboard = Leaderboard('best_val_loss')
+    assert leaderboard.best() is None
+    leaderboard.add('a', 0.2)
+    leaderboard.add('b', 0.1)
+    assert leaderboard.best() == ('b', 0.1)
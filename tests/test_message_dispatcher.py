@@ -0,0 +1,291 @@
+"""Tests message_dispatcher.py."""
+
+import time
+import asyncio
+from typing import Any
+import pytest
+from adjutant.message_dispatcher import MessageDispatcher, \
+    SlidingWindowRateLimiter, split_message, MAX_MESSAGE_LENGTH
+from adjutant.metrics import MetricsRegistry
+from tests.fakes import FakeChannel, FakeMessage
+
+SHORT_WINDOW_SECONDS = 0.2
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+    # pylint: disable=too-few-public-methods
+    now: float
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Returns the current fake time.
+
+        :return: The current fake time in seconds.
+        """
+        return self.now
+
+
+class FailingChannel(FakeChannel):
+    """A channel whose sends always fail."""
+    # pylint: disable=too-few-public-methods
+
+    async def send(self, content: str, file: Any = None) -> None:
+        """Raises an error.
+
+        :param content: Ignored.
+        :param file: Ignored.
+        """
+        raise RuntimeError('Discord is down.')
+
+
+def test_split_message_short_message_unchanged() -> None:
+    """Tests that a message within the limit is not split."""
+    assert split_message('hello', 10) == ['hello']
+
+
+def test_split_message_prefers_line_breaks() -> None:
+    """Tests that long messages are split at line breaks."""
+    assert split_message('aaaa\nbbbb\ncc', 9) == ['aaaa\nbbbb', 'cc']
+
+
+def test_split_message_hard_splits_long_lines() -> None:
+    """Tests that a line longer than the limit is split mid-line."""
+    parts = split_message('a' * 25, 10)
+    assert parts == ['a' * 10, 'a' * 10, 'a' * 5]
+
+
+def test_rate_limiter_waits_once_window_is_full() -> None:
+    """Tests that the rate limiter allows max_messages sends per window."""
+    clock = FakeClock()
+    limiter = SlidingWindowRateLimiter(2, 5, clock=clock)
+    limiter.record_send()
+    clock.now = 1
+    limiter.record_send()
+    assert limiter.get_wait_seconds() == 4
+    clock.now = 5
+    assert limiter.get_wait_seconds() == 0
+    limiter.record_send()
+    assert limiter.get_wait_seconds() == 1
+
+
+def test_message_dispatcher_packs_notifications() -> None:
+    """Tests that many notifications are packed into few messages, each within
+    the length limit and in order."""
+    channel = FakeChannel()
+    notifications = [f'Run {index} finished! Best val loss: 0.123\n'
+                     f'Link to run: https://wandb.ai/entity/project/{index}'
+                     for index in range(100)]
+
+    async def main() -> MessageDispatcher:
+        dispatcher = MessageDispatcher()
+        for notification in notifications:
+            dispatcher.notify(channel, notification)
+        await dispatcher.wait_until_empty()
+        dispatcher.close()
+        return dispatcher
+    dispatcher = asyncio.run(main())
+    assert len(channel.messages) < 10
+    assert all(len(message.content) <= MAX_MESSAGE_LENGTH
+               for message in channel.messages)
+    assert '\n'.join(message.content for message in channel.messages) == \
+        '\n'.join(notifications)
+    assert dispatcher.num_items_sent == 100
+    assert dispatcher.num_messages_sent == len(channel.messages)
+    assert dispatcher.max_queue_depth == 100
+    assert dispatcher.queue_depth == 0
+
+
+def test_message_dispatcher_replies_jump_queue() -> None:
+    """Tests that a reply is sent before notifications queued earlier."""
+    channel = FakeChannel()
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher(max_message_length=10,
+                                       window_seconds=SHORT_WINDOW_SECONDS)
+        for index in range(5):
+            dispatcher.notify(channel, f'run {index}')
+        reply = await dispatcher.send(channel, 'Hello!')
+        assert reply.content == 'Hello!'
+        await dispatcher.wait_until_empty()
+        dispatcher.close()
+    asyncio.run(main())
+    contents = [message.content for message in channel.messages]
+    # The first notification may already be in flight.
+    assert contents.index('Hello!') <= 1
+    assert len(contents) == 6
+
+
+def test_message_dispatcher_respects_rate_limit() -> None:
+    """Tests that no more than max_messages_per_window messages are sent to a
+    channel in any window."""
+    channel = FakeChannel()
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher(
+            max_message_length=5, max_messages_per_window=2,
+            window_seconds=SHORT_WINDOW_SECONDS)
+        for index in range(5):
+            dispatcher.notify(channel, f'run {index}')
+        await dispatcher.wait_until_empty()
+        dispatcher.close()
+    asyncio.run(main())
+    times = channel.send_times
+    assert len(times) == 5
+    for index in range(2, len(times)):
+        assert times[index] - times[index - 2] >= SHORT_WINDOW_SECONDS * 0.9
+
+
+def test_message_dispatcher_channels_are_independent() -> None:
+    """Tests that a rate-limited channel does not delay other channels."""
+    busy_channel = FakeChannel('busy')
+    quiet_channel = FakeChannel('quiet')
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher(
+            max_message_length=5, max_messages_per_window=1,
+            window_seconds=SHORT_WINDOW_SECONDS * 5)
+        for index in range(3):
+            dispatcher.notify(busy_channel, f'run {index}')
+        await asyncio.wait_for(dispatcher.send(quiet_channel, 'Hello'),
+                               SHORT_WINDOW_SECONDS)
+        dispatcher.close()
+    asyncio.run(main())
+    assert [message.content for message in quiet_channel.messages] == \
+        ['Hello']
+
+
+def test_message_dispatcher_send_splits_long_reply() -> None:
+    """Tests that a reply longer than the limit is posted in parts."""
+    channel = FakeChannel()
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher()
+        await dispatcher.send(channel, 'a' * (MAX_MESSAGE_LENGTH + 1))
+        dispatcher.close()
+    asyncio.run(main())
+    assert [len(message.content) for message in channel.messages] == \
+        [MAX_MESSAGE_LENGTH, 1]
+
+
+def test_message_dispatcher_send_attaches_file_to_last_part() -> None:
+    """Tests that a reply's file is attached to its last part only."""
+    channel = FakeChannel()
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher()
+        message = await dispatcher.send(
+            channel, 'a' * (MAX_MESSAGE_LENGTH + 1), file='image')
+        assert message.file == 'image'
+        dispatcher.close()
+    asyncio.run(main())
+    assert [message.file for message in channel.messages] == [None, 'image']
+
+
+def test_message_dispatcher_send_propagates_errors() -> None:
+    """Tests that a failed reply raises the error in the caller, and that the
+    dispatcher keeps running."""
+    channel = FailingChannel()
+
+    async def main() -> MessageDispatcher:
+        dispatcher = MessageDispatcher()
+        with pytest.raises(RuntimeError):
+            await dispatcher.send(channel, 'Hello!')
+        dispatcher.notify(channel, 'run 0')
+        await dispatcher.wait_until_empty()
+        dispatcher.close()
+        return dispatcher
+    dispatcher = asyncio.run(main())
+    assert dispatcher.num_send_errors == 2
+
+
+def test_message_dispatcher_records_latency() -> None:
+    """Tests that send latencies are recorded."""
+    channel = FakeChannel(latency_seconds=0.01)
+
+    async def main() -> MessageDispatcher:
+        dispatcher = MessageDispatcher()
+        assert dispatcher.get_latency_percentile(50) is None
+        await dispatcher.send(channel, 'Hello!')
+        dispatcher.close()
+        return dispatcher
+    dispatcher = asyncio.run(main())
+    assert dispatcher.get_latency_percentile(50) >= 0.01
+
+
+def test_message_dispatcher_records_metrics() -> None:
+    """Tests that the dispatcher records sends in the metrics registry."""
+    channel = FakeChannel()
+    registry = MetricsRegistry()
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher(metrics=registry)
+        for index in range(3):
+            dispatcher.notify(channel, f'run {index}')
+        await dispatcher.wait_until_empty()
+        dispatcher.close()
+    asyncio.run(main())
+    assert registry.counter('adjutant_discord_messages_sent_total', '').value \
+        == 1
+    assert registry.counter('adjutant_discord_items_sent_total', '').value \
+        == 3
+    assert registry.histogram('adjutant_discord_delivery_seconds',
+                              '').count == 3
+    assert 'adjutant_discord_queue_depth 0' in registry.render_prometheus()
+
+
+class FailingMessage(FakeMessage):
+    """A message whose edits always fail."""
+    # pylint: disable=too-few-public-methods
+
+    async def edit(self, content: str) -> None:
+        """Raises an error.
+
+        :param content: Ignored.
+        """
+        raise RuntimeError('Discord is down.')
+
+
+def test_message_dispatcher_edit_is_rate_limited_and_coalesced() -> None:
+    """Tests that edits share the channel's rate limit with sends, that queued
+    edits of the same message are merged into the latest one, and that failed
+    edits are counted rather than raised."""
+    channel = FakeChannel()
+
+    async def main() -> MessageDispatcher:
+        dispatcher = MessageDispatcher(max_messages_per_window=1,
+                                       window_seconds=SHORT_WINDOW_SECONDS)
+        message = await dispatcher.send(channel, 'Sweep 1: 0/3 done')
+        start = time.monotonic()
+        for index in range(1, 4):
+            dispatcher.edit(channel, message, f'Sweep 1: {index}/3 done')
+        dispatcher.edit(channel, FailingMessage('Sweep 2'), 'Sweep 2: done')
+        await dispatcher.wait_until_empty()
+        assert time.monotonic() - start >= SHORT_WINDOW_SECONDS * 0.9
+        dispatcher.close()
+        return dispatcher
+    dispatcher = asyncio.run(main())
+    assert [message.content for message in channel.messages] == [
+        'Sweep 1: 3/3 done']
+    assert dispatcher.num_messages_sent == 2
+    assert dispatcher.num_send_errors == 1
+
+
+def test_message_dispatcher_close_drops_queued_edits() -> None:
+    """Tests that closing the dispatcher while an edit is queued drops the
+    edit without raising."""
+    channel = FakeChannel()
+
+    async def main() -> None:
+        dispatcher = MessageDispatcher(max_messages_per_window=1,
+                                       window_seconds=SHORT_WINDOW_SECONDS)
+        message = await dispatcher.send(channel, 'Sweep 1: 0/3 done')
+        dispatcher.edit(channel, message, 'Sweep 1: 1/3 done')
+        dispatcher.close()
+        await asyncio.sleep(SHORT_WINDOW_SECONDS)
+    asyncio.run(main())
+    assert [message.content for message in channel.messages] == [
+        'Sweep 1: 0/3 done']
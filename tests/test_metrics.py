@@ -0,0 +1,153 @@
+"""Tests metrics.py."""
+
+import asyncio
+from typing import Tuple
+import pytest
+from adjutant.metrics import Counter, Histogram, MetricsRegistry, \
+    MetricsServer, METRICS_PATH
+
+
+def test_counter_inc() -> None:
+    """Tests that Counter.inc adds to the count."""
+    counter = Counter()
+    counter.inc()
+    counter.inc(2)
+    assert counter.value == 3
+
+
+def test_counter_cannot_decrease() -> None:
+    """Tests that Counter.inc raises an error on negative amounts."""
+    with pytest.raises(ValueError):
+        Counter().inc(-1)
+
+
+def test_histogram_rejects_unsorted_buckets() -> None:
+    """Tests that Histogram raises an error if the buckets are not strictly
+    increasing."""
+    with pytest.raises(ValueError):
+        _ = Histogram((1, 1, 2))
+
+
+def test_histogram_observe_counts_buckets() -> None:
+    """Tests that observations fall in the first bucket whose upper bound is at
+    least the value, and that counts are cumulative."""
+    histogram = Histogram((1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.get_cumulative_counts() == [2, 3, 4]
+    assert histogram.count == 4
+    assert histogram.sum == 6
+
+
+def test_histogram_get_quantile_interpolates() -> None:
+    """Tests that quantiles are interpolated within buckets."""
+    histogram = Histogram((1, 2, 3))
+    assert histogram.get_quantile(0.5) is None
+    for value in (0.5, 1.5, 1.5, 2.5):
+        histogram.observe(value)
+    assert histogram.get_quantile(0.5) == pytest.approx(1.5)
+    assert histogram.get_quantile(1) == pytest.approx(3)
+
+
+def test_histogram_get_quantile_inf_bucket() -> None:
+    """Tests that a quantile in the +Inf bucket is reported as the largest
+    finite bound."""
+    histogram = Histogram((1, 2))
+    histogram.observe(100)
+    assert histogram.get_quantile(0.5) == 2
+
+
+def test_histogram_time_observes_duration() -> None:
+    """Tests that Histogram.time observes the time spent in its body, even if
+    the body raises."""
+    histogram = Histogram()
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError
+    assert histogram.count == 1
+
+
+def test_registry_returns_existing_metric() -> None:
+    """Tests that getting a metric twice returns the same object, and that
+    different labels give different metrics."""
+    registry = MetricsRegistry()
+    counter = registry.counter('polls_total', 'Polls.', {'project': 'a'})
+    assert registry.counter('polls_total', 'Polls.', {'project': 'a'}) is \
+        counter
+    assert registry.counter('polls_total', 'Polls.', {'project': 'b'}) is not \
+        counter
+
+
+def test_registry_rejects_kind_mismatch() -> None:
+    """Tests that a name cannot be used for metrics of different kinds."""
+    registry = MetricsRegistry()
+    registry.counter('polls', 'Polls.')
+    with pytest.raises(ValueError):
+        registry.histogram('polls', 'Polls.')
+
+
+def test_registry_render_prometheus() -> None:
+    """Tests the Prometheus text format of each kind of metric."""
+    registry = MetricsRegistry()
+    registry.counter('commands_total', 'Commands.',
+                     {'command': '$top'}).inc(2)
+    registry.gauge('queue_depth', 'Queue depth.', lambda: 3)
+    registry.histogram('poll_seconds', 'Polls.', buckets=(1,)).observe(0.5)
+    lines = registry.render_prometheus().splitlines()
+    assert '# TYPE commands_total counter' in lines
+    assert 'commands_total{command="$top"} 2' in lines
+    assert '# TYPE queue_depth gauge' in lines
+    assert 'queue_depth 3' in lines
+    assert 'poll_seconds_bucket{le="1"} 1' in lines
+    assert 'poll_seconds_bucket{le="+Inf"} 1' in lines
+    assert 'poll_seconds_sum 0.5' in lines
+    assert 'poll_seconds_count 1' in lines
+
+
+def test_registry_render_prometheus_escapes_labels() -> None:
+    """Tests that quotes in label values are escaped."""
+    registry = MetricsRegistry()
+    registry.counter('total', 'Total.', {'name': 'a"b'}).inc()
+    assert 'total{name="a\\"b"} 1' in registry.render_prometheus()
+
+
+def test_registry_summarize() -> None:
+    """Tests that summarize reports every metric."""
+    registry = MetricsRegistry()
+    registry.counter('commands_total', 'Commands.').inc()
+    registry.histogram('poll_seconds', 'Polls.').observe(0.2)
+    registry.histogram('empty_seconds', 'Nothing.')
+    lines = registry.summarize()
+    assert 'commands_total: 1' in lines
+    assert 'empty_seconds: n=0' in lines
+    assert any(line.startswith('poll_seconds: n=1 mean=0.200s')
+               for line in lines)
+
+
+def test_metrics_server_serves_metrics() -> None:
+    """Tests that the server answers GET /metrics with the registry's metrics
+    and other paths with 404."""
+    registry = MetricsRegistry()
+    registry.counter('commands_total', 'Commands.').inc()
+
+    async def get(port: int, path: str) -> Tuple[str, str]:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        await writer.drain()
+        response = (await reader.read()).decode()
+        writer.close()
+        head, body = response.split('\r\n\r\n', 1)
+        return head.splitlines()[0], body
+
+    async def main() -> Tuple[Tuple[str, str], Tuple[str, str]]:
+        server = MetricsServer(registry, 0)
+        await server.start()
+        results = (await get(server.port, METRICS_PATH),
+                   await get(server.port, '/other'))
+        server.close()
+        assert server.port is None
+        return results
+    (status, body), (missing_status, _) = asyncio.run(main())
+    assert status == 'HTTP/1.1 200 OK'
+    assert 'commands_total 1' in body
+    assert missing_status == 'HTTP/1.1 404 Not Found'
@@ -0,0 +1,86 @@
+"""Tests plotting.py."""
+
+import asyncio
+import numpy as np
+import pytest
+from adjutant.plotting import CurveRenderer, downsample_lttb, render_curves
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def test_downsample_lttb_keeps_endpoints_and_spikes() -> None:
+    """Tests that LTTB keeps at most max_points points, including the first
+    and last points and an isolated spike that every-nth sampling would
+    miss."""
+    steps = np.arange(10000, dtype=float)
+    values = np.zeros(10000)
+    values[4321] = 100.0
+    kept_steps, kept_values = downsample_lttb(steps, values, 100)
+    assert len(kept_steps) == 100
+    assert (kept_steps[0], kept_steps[-1]) == (0, 9999)
+    assert 4321 in kept_steps
+    assert kept_values.max() == 100.0
+    assert np.all(np.diff(kept_steps) > 0)
+
+
+def test_downsample_lttb_returns_short_curves_unchanged() -> None:
+    """Tests that curves with at most max_points points are not
+    downsampled."""
+    steps = np.arange(5, dtype=float)
+    kept_steps, _ = downsample_lttb(steps, steps, 10)
+    assert kept_steps is steps
+
+
+def test_render_curves_returns_png() -> None:
+    """Tests that render_curves draws every metric of every run to a PNG."""
+    pytest.importorskip('matplotlib')
+    image = render_curves(
+        {'run1': {'loss': [(0, 2.0), (1, 1.0)], 'val_loss': [(0, 3.0)]},
+         'run2': {'loss': [(step, 1 / (step + 1)) for step in range(5000)]}},
+        ('loss', 'val_loss'), max_points=100, title='run1 vs. run2')
+    assert image.startswith(PNG_SIGNATURE)
+
+
+def test_curve_renderer_caches_images() -> None:
+    """Tests that CurveRenderer renders in a worker process and serves
+    repeated and concurrent requests for the same key from one render."""
+    pytest.importorskip('matplotlib')
+    series = {'run1': {'loss': [(0, 2.0), (1, 1.0)]}}
+
+    async def main() -> None:
+        renderer = CurveRenderer(cache_size=1)
+        try:
+            first, second = await asyncio.gather(
+                renderer.render('a', series, ('loss',)),
+                renderer.render('a', series, ('loss',)))
+            assert first.startswith(PNG_SIGNATURE)
+            assert first == second
+            assert await renderer.render('a', series, ('loss',)) == first
+            assert (renderer.num_renders, renderer.num_cache_hits) == (1, 2)
+            await renderer.render('b', series, ('loss',))
+            await renderer.render('a', series, ('loss',))
+            assert renderer.num_renders == 3
+        finally:
+            renderer.close()
+    asyncio.run(main())
+
+
+def test_curve_renderer_close_cancels_renders() -> None:
+    """Tests that closing a CurveRenderer cancels the renders in progress."""
+    pytest.importorskip('matplotlib')
+    series = {'run1': {'loss': [(0, 2.0), (1, 1.0)]}}
+
+    async def main() -> None:
+        renderer = CurveRenderer()
+        task = asyncio.ensure_future(renderer.render('a', series, ('loss',)))
+        await asyncio.sleep(0)
+        renderer.close()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(main())
+
+
+def test_curve_renderer_rejects_bad_args() -> None:
+    """Tests that CurveRenderer raises an error on invalid arguments."""
+    with pytest.raises(ValueError):
+        _ = CurveRenderer(cache_size=-1)
@@ -0,0 +1,185 @@
+"""Tests poll_policy.py."""
+
+import pytest
+from adjutant.poll_policy import AdaptivePollPolicy, FixedPollPolicy, \
+    get_retry_after
+
+KEY = 'entity/project'
+INITIAL_INTERVAL = 60
+MIN_INTERVAL = 15
+MAX_INTERVAL = 600
+RECENT_ACTIVITY = 300
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+    # pylint: disable=too-few-public-methods
+    now: float
+
+    def __init__(self) -> None:
+        """Instantiates the object."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Returns the current fake time.
+
+        :return: The current fake time in seconds.
+        """
+        return self.now
+
+
+class FakeResponse:
+    """A fake requests.Response."""
+    # pylint: disable=too-few-public-methods
+    status_code: int
+    headers: dict
+
+    def __init__(self, status_code: int, headers: dict) -> None:
+        """Instantiates the object.
+
+        :param status_code: The HTTP status code.
+        :param headers: The response headers.
+        """
+        self.status_code = status_code
+        self.headers = headers
+
+
+class FakeHTTPError(Exception):
+    """A fake requests.HTTPError."""
+    response: FakeResponse
+
+    def __init__(self, status_code: int, headers: dict = None) -> None:
+        """Instantiates the object.
+
+        :param status_code: The HTTP status code.
+        :param headers: The response headers.
+        """
+        super().__init__(f'HTTP {status_code}')
+        self.response = FakeResponse(status_code, headers or {})
+
+
+def _get_policy(clock: FakeClock, jitter: float = 0.0) -> AdaptivePollPolicy:
+    """Returns an adaptive policy with the test intervals.
+
+    :param clock: The fake clock.
+    :param jitter: The backoff jitter.
+    :return: The policy.
+    """
+    return AdaptivePollPolicy(INITIAL_INTERVAL, MIN_INTERVAL, MAX_INTERVAL,
+                              recent_activity_seconds=RECENT_ACTIVITY,
+                              jitter=jitter, clock=clock, seed=0)
+
+
+def _wrap(error: Exception) -> Exception:
+    """Returns a new error raised from the given one, as WandB's CommError
+    wraps HTTP errors.
+
+    :param error: The cause.
+    :return: The wrapping error.
+    """
+    try:
+        raise RuntimeError('Could not query WandB.') from error
+    except RuntimeError as wrapper:
+        return wrapper
+
+
+def test_fixed_poll_policy_always_returns_interval() -> None:
+    """Tests that FixedPollPolicy ignores activity and errors."""
+    policy = FixedPollPolicy(30)
+    assert policy.get_delay(KEY, True) == 30
+    assert policy.get_delay(KEY, False, RuntimeError()) == 30
+
+
+def test_adaptive_poll_policy_rejects_bad_intervals() -> None:
+    """Tests that AdaptivePollPolicy raises an error if the intervals are out
+    of order."""
+    with pytest.raises(ValueError):
+        _ = AdaptivePollPolicy(10, 20, 30)
+    with pytest.raises(ValueError):
+        _ = AdaptivePollPolicy(60, 15, 600, jitter=2)
+
+
+def test_adaptive_poll_policy_busy_uses_min_interval() -> None:
+    """Tests that a busy check resets the interval to the minimum, and that it
+    stays there while activity is recent."""
+    clock = FakeClock()
+    policy = _get_policy(clock)
+    assert policy.get_delay(KEY, True) == MIN_INTERVAL
+    clock.now += RECENT_ACTIVITY / 2
+    assert policy.get_delay(KEY, False) == MIN_INTERVAL
+
+
+def test_adaptive_poll_policy_idle_grows_to_max() -> None:
+    """Tests that quiet checks lengthen the interval once activity is no longer
+    recent, up to the maximum."""
+    clock = FakeClock()
+    policy = _get_policy(clock)
+    policy.get_delay(KEY, True)
+    clock.now += RECENT_ACTIVITY
+    delays = []
+    for _ in range(20):
+        delays.append(policy.get_delay(KEY, False))
+        clock.now += delays[-1]
+    assert delays[0] > MIN_INTERVAL
+    assert delays == sorted(delays)
+    assert delays[-1] == MAX_INTERVAL
+
+
+def test_adaptive_poll_policy_keys_are_independent() -> None:
+    """Tests that each project has its own interval."""
+    clock = FakeClock()
+    policy = _get_policy(clock)
+    policy.get_delay('busy', True)
+    assert policy.get_delay('idle', False) > INITIAL_INTERVAL
+    assert policy.get_delay('busy', False) == MIN_INTERVAL
+
+
+def test_adaptive_poll_policy_errors_back_off_exponentially() -> None:
+    """Tests that consecutive failed checks double the delay, up to the
+    maximum backoff, and that a success resumes the previous interval."""
+    clock = FakeClock()
+    policy = AdaptivePollPolicy(INITIAL_INTERVAL, MIN_INTERVAL, MAX_INTERVAL,
+                                max_backoff_seconds=1000, jitter=0,
+                                clock=clock)
+    delays = [policy.get_delay(KEY, False, RuntimeError())
+              for _ in range(5)]
+    assert delays == [120, 240, 480, 960, 1000]
+    assert policy.get_delay(KEY, True) == MIN_INTERVAL
+
+
+def test_adaptive_poll_policy_jitter_stays_in_range() -> None:
+    """Tests that jittered backoff delays vary but never exceed the unjittered
+    delay or fall below its jittered fraction."""
+    clock = FakeClock()
+    delays = set()
+    for seed in range(20):
+        policy = AdaptivePollPolicy(INITIAL_INTERVAL, MIN_INTERVAL,
+                                    MAX_INTERVAL, jitter=0.5, clock=clock,
+                                    seed=seed)
+        delays.add(policy.get_delay(KEY, False, RuntimeError()))
+    assert len(delays) > 1
+    assert all(60 <= delay <= 120 for delay in delays)
+
+
+def test_adaptive_poll_policy_honors_retry_after() -> None:
+    """Tests that a rate-limited check is not retried before Retry-After."""
+    clock = FakeClock()
+    policy = _get_policy(clock)
+    error = _wrap(FakeHTTPError(429, {'Retry-After': '5000'}))
+    assert policy.get_delay(KEY, False, error) == 5000
+
+
+def test_get_retry_after_follows_causes() -> None:
+    """Tests that get_retry_after finds the 429 response behind a wrapping
+    error."""
+    assert get_retry_after(_wrap(FakeHTTPError(429, {'Retry-After': '7'}))) \
+        == 7
+    assert get_retry_after(FakeHTTPError(429)) == 0
+    assert get_retry_after(FakeHTTPError(429, {'Retry-After': 'soon'})) == 0
+
+
+def test_get_retry_after_other_errors() -> None:
+    """Tests that get_retry_after returns None for errors that are not rate
+    limits."""
+    assert get_retry_after(FakeHTTPError(500)) is None
+    assert get_retry_after(_wrap(ValueError())) is None
@@ -0,0 +1,137 @@
+"""Tests poll_scheduler.py."""
+
+import asyncio
+import time
+from typing import Dict, List
+import pytest
+from adjutant.poll_scheduler import PollScheduler
+
+INTERVAL_SECONDS = 0.2
+
+
+def test_poll_scheduler_rejects_nonpositive_interval() -> None:
+    """Tests that PollScheduler raises an error if the interval is not
+    positive."""
+    async def poll(_: str) -> None:
+        pass
+    with pytest.raises(ValueError):
+        _ = PollScheduler(poll, 0)
+
+
+def test_poll_scheduler_staggers_keys() -> None:
+    """Tests that the keys' first polls are spread across the interval."""
+    first_polls: Dict[str, float] = {}
+
+    async def main() -> None:
+        start = time.monotonic()
+
+        async def poll(key: str) -> None:
+            first_polls.setdefault(key, time.monotonic() - start)
+        scheduler = PollScheduler(poll, INTERVAL_SECONDS)
+        for key in ('a', 'b', 'c', 'd'):
+            scheduler.add(key)
+        scheduler.start()
+        await asyncio.sleep(INTERVAL_SECONDS)
+        scheduler.stop()
+    asyncio.run(main())
+    assert list(first_polls) == ['a', 'b', 'c', 'd']
+    offsets = list(first_polls.values())
+    assert offsets[0] < INTERVAL_SECONDS / 8
+    assert offsets[3] >= INTERVAL_SECONDS * 3 / 4 - 0.01
+
+
+def test_poll_scheduler_add_dedupes() -> None:
+    """Tests that a key added twice is only polled once per interval."""
+    polls: List[str] = []
+
+    async def main() -> None:
+        async def poll(key: str) -> None:
+            polls.append(key)
+        scheduler = PollScheduler(poll, INTERVAL_SECONDS)
+        scheduler.add('a')
+        scheduler.add('a')
+        scheduler.start()
+        await asyncio.sleep(INTERVAL_SECONDS / 2)
+        scheduler.stop()
+    asyncio.run(main())
+    assert polls == ['a']
+
+
+def test_poll_scheduler_does_not_overlap_polls_of_same_key() -> None:
+    """Tests that a slow poll delays the key's next poll instead of running
+    concurrently with it."""
+    active = []
+    max_active = []
+
+    async def main() -> None:
+        async def poll(_: str) -> None:
+            active.append(None)
+            max_active.append(len(active))
+            await asyncio.sleep(INTERVAL_SECONDS * 2)
+            active.pop()
+        scheduler = PollScheduler(poll, INTERVAL_SECONDS)
+        scheduler.add('a')
+        scheduler.start()
+        await asyncio.sleep(INTERVAL_SECONDS * 5)
+        scheduler.stop()
+    asyncio.run(main())
+    assert max(max_active) == 1
+    assert len(max_active) >= 2
+
+
+def test_poll_scheduler_survives_errors() -> None:
+    """Tests that an error in one poll does not stop future polls."""
+    polls: List[str] = []
+
+    async def main() -> None:
+        async def poll(key: str) -> None:
+            polls.append(key)
+            raise RuntimeError('WandB is down.')
+        scheduler = PollScheduler(poll, INTERVAL_SECONDS / 4)
+        scheduler.add('a')
+        scheduler.start()
+        assert scheduler.is_running
+        await asyncio.sleep(INTERVAL_SECONDS)
+        scheduler.stop()
+        assert not scheduler.is_running
+    asyncio.run(main())
+    assert len(polls) >= 3
+
+
+def test_poll_scheduler_uses_policy_delays() -> None:
+    """Tests that the delay after each poll comes from the policy, which is
+    told whether the poll found activity or failed."""
+    calls = []
+
+    class RecordingPolicy:
+        """Records its calls and returns a short delay."""
+        # pylint: disable=too-few-public-methods
+
+        def get_delay(self, key, is_busy, error=None) -> float:
+            """Records the call.
+
+            :param key: The key.
+            :param is_busy: Whether the poll found activity.
+            :param error: The error raised by the poll, if any.
+            :return: A short delay.
+            """
+            calls.append((key, is_busy, type(error)))
+            return INTERVAL_SECONDS / 10
+
+    results = iter([True, False, RuntimeError('WandB is down.')])
+
+    async def main() -> None:
+        async def poll(_: str) -> bool:
+            result = next(results, False)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        scheduler = PollScheduler(poll, INTERVAL_SECONDS,
+                                  policy=RecordingPolicy())
+        scheduler.add('a')
+        scheduler.start()
+        await asyncio.sleep(INTERVAL_SECONDS / 4)
+        scheduler.stop()
+    asyncio.run(main())
+    assert calls[:3] == [('a', True, type(None)), ('a', False, type(None)),
+                         ('a', False, RuntimeError)]
@@ -0,0 +1,163 @@
+"""Tests project_monitor.py."""
+
+from adjutant.project_monitor import ProjectMonitor, RUNS_PER_PAGE
+from adjutant.metrics import MetricsRegistry
+from adjutant.run_record import RunRecord
+from tests.fakes import FakeApi, FakeProjectRun
+
+WANDB_ENTITY = 'entity'
+WANDB_PROJECT_TITLE = 'project'
+PROJECT_PATH = f'{WANDB_ENTITY}/{WANDB_PROJECT_TITLE}'
+
+
+def _get_api(runs) -> FakeApi:
+    """Returns a fake API client whose only project has the given runs.
+
+    :param runs: The project's runs.
+    :return: The fake API client.
+    """
+    return FakeApi(projects={PROJECT_PATH: runs})
+
+
+def test_project_monitor_path() -> None:
+    """Tests that ProjectMonitor.path joins the entity and project."""
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    assert monitor.path == PROJECT_PATH
+    monitor.close()
+
+
+def test_project_monitor_add_channel_name_dedupes() -> None:
+    """Tests that adding a channel name twice only records it once."""
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE,
+                             channel_name='general')
+    monitor.add_channel_name('results')
+    monitor.add_channel_name('results')
+    monitor.add_channel_name('general')
+    assert monitor.channel_names == ['general', 'results']
+    monitor.close()
+
+
+def test_project_monitor_initialize_run_store_records_finished_runs() -> None:
+    """Tests that ProjectMonitor.initialize_run_store saves the project's
+    finished runs and marks the monitor initialized."""
+    api = _get_api([
+        FakeProjectRun('a', '2021-09-18T17:00:00', {'best_val_loss': 0.5}),
+        FakeProjectRun('b', '2021-09-18T18:00:00', {'best_val_loss': 0.2}),
+        FakeProjectRun('c', '2021-09-18T19:00:00', state='running')])
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    assert not monitor.is_initialized()
+    runs, latest_heartbeat = monitor.initialize_run_store(api)
+    assert set(runs) == {'a', 'b'}
+    assert latest_heartbeat == '2021-09-18T18:00:00'
+    assert monitor.is_initialized()
+    monitor.close()
+
+
+def test_project_monitor_get_new_project_runs_skips_reported() -> None:
+    """Tests that only runs that have not been reported are returned."""
+    api = _get_api([FakeProjectRun('a', '2021-09-18T17:00:00'),
+                    FakeProjectRun('b', '2021-09-18T18:00:00')])
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    new_runs, _ = monitor.get_new_project_runs(
+        api, {'a'}, monitor.get_discovery_filters())
+    assert set(new_runs) == {'b'}
+    assert isinstance(new_runs['b'], RunRecord)
+    monitor.close()
+
+
+def test_project_monitor_advance_watermark_narrows_filters() -> None:
+    """Tests that once the watermark advances, checks only match runs that
+    finished near or after it."""
+    old_run = FakeProjectRun('old', '2021-09-18T12:00:00')
+    new_run = FakeProjectRun('new', '2021-09-18T18:00:00')
+    api = _get_api([old_run, new_run])
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    monitor.advance_watermark('2021-09-18T17:00:00')
+    new_runs, _ = monitor.get_new_project_runs(
+        api, set(), monitor.get_discovery_filters())
+    assert set(new_runs) == {'new'}
+    monitor.close()
+
+
+def test_project_monitor_save_reported_run_updates_leaderboard() -> None:
+    """Tests that saved runs are reported, ranked, and persisted."""
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    run = RunRecord.from_run(
+        FakeProjectRun('a', '2021-09-18T17:00:00', {'best_val_loss': 0.3}),
+        ('best_val_loss',))
+    monitor.save_reported_run(run)
+    assert 'a' in monitor.reported_runs
+    assert monitor.leaderboards['best_val_loss'].best() == ('a', 0.3)
+    monitor.close()
+
+
+def test_project_monitor_save_reported_run_inserts_without_sort(
+        monkeypatch) -> None:
+    """Tests that saving one run inserts it into the sorted leaderboard
+    instead of re-sorting the whole leaderboard."""
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    leaderboard = monitor.leaderboards['best_val_loss']
+    leaderboard.add_many([('a', 0.3), ('c', 0.1)])
+
+    def fail_add_many(_) -> None:
+        raise AssertionError('add_many re-sorts the leaderboard.')
+    monkeypatch.setattr(leaderboard, 'add_many', fail_add_many)
+    monitor.save_reported_run(RunRecord.from_run(
+        FakeProjectRun('b', '2021-09-18T18:00:00', {'best_val_loss': 0.2}),
+        ('best_val_loss',)))
+    assert [name for name, _ in leaderboard.top(3)] == ['c', 'b', 'a']
+    assert monitor.run_table.get_name(len(monitor.run_table) - 1) == 'b'
+    monitor.close()
+
+
+def test_project_monitor_state_persists_across_instances(tmp_path) -> None:
+    """Tests that a monitor with a state file reloads its reported runs."""
+    state_filename = str(tmp_path / 'state.db')
+    api = _get_api([FakeProjectRun('a', '2021-09-18T17:00:00')])
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE,
+                             state_filename=state_filename)
+    runs, _ = monitor.initialize_run_store(api)
+    monitor.add_reported_runs(runs)
+    monitor.close()
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE,
+                             state_filename=state_filename)
+    assert monitor.is_initialized()
+    assert set(monitor.reported_runs) == {'a'}
+    monitor.close()
+
+
+def test_project_monitor_counts_fetched_runs_and_pages() -> None:
+    """Tests that queries are counted in the monitor's metrics registry."""
+    api = _get_api([FakeProjectRun(str(index), '2021-09-18T17:00:00')
+                    for index in range(RUNS_PER_PAGE + 1)])
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE)
+    monitor.metrics = MetricsRegistry()
+    monitor.get_project_runs(api)
+    labels = {'project': PROJECT_PATH}
+    assert monitor.metrics.counter('adjutant_wandb_runs_fetched_total', '',
+                                   labels).value == RUNS_PER_PAGE + 1
+    assert monitor.metrics.counter('adjutant_wandb_pages_fetched_total', '',
+                                   labels).value == 2
+    monitor.close()
+
+
+def test_project_monitor_indexes_reported_run_configs(tmp_path) -> None:
+    """Tests that reported runs are added to the config index, including those
+    reloaded from the state file."""
+    state_filename = str(tmp_path / 'state.db')
+    api = _get_api([
+        FakeProjectRun('a', '2021-09-18T17:00:00',
+                       config={'batch_size': 64, '_wandb': {}}),
+        FakeProjectRun('b', '2021-09-18T18:00:00',
+                       config={'batch_size': 32})])
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE,
+                             state_filename=state_filename,
+                             default_hyperparams={'batch_size': 32})
+    runs, _ = monitor.initialize_run_store(api)
+    monitor.add_reported_runs(runs)
+    assert monitor.config_index.get_matching_runs({}) == ['b']
+    monitor.close()
+    monitor = ProjectMonitor(WANDB_ENTITY, WANDB_PROJECT_TITLE,
+                             state_filename=state_filename)
+    assert monitor.config_index.get_matching_runs({'batch_size': 64}) == ['a']
+    monitor.close()
@@ -0,0 +1,82 @@
+"""Tests run_discovery.py."""
+
+from datetime import datetime
+from adjutant.run_discovery import RunDiscovery, parse_wandb_timestamp, \
+    format_wandb_timestamp, get_latest_timestamp, FINISHED_STATE, \
+    HEARTBEAT_FILTER_KEY
+
+
+def test_parse_wandb_timestamp_handles_utc_suffix() -> None:
+    """Tests that parse_wandb_timestamp accepts timestamps with and without the
+    trailing Z."""
+    expected = datetime(2021, 9, 18, 17, 7, 44)
+    assert parse_wandb_timestamp('2021-09-18T17:07:44') == expected
+    assert parse_wandb_timestamp('2021-09-18T17:07:44Z') == expected
+
+
+def test_format_wandb_timestamp_inverts_parse() -> None:
+    """Tests that format_wandb_timestamp produces a string that
+    parse_wandb_timestamp reads back."""
+    timestamp = '2021-09-18T17:07:44'
+    assert format_wandb_timestamp(parse_wandb_timestamp(timestamp)) == \
+        timestamp
+
+
+def test_get_latest_timestamp_finds_latest() -> None:
+    """Tests that get_latest_timestamp returns the latest timestamp and ignores
+    missing values."""
+    assert get_latest_timestamp([
+        '2021-09-18T17:07:44',
+        None,
+        '2021-10-01T00:00:00Z',
+        '2021-09-30T23:59:59']) == '2021-10-01T00:00:00Z'
+
+
+def test_get_latest_timestamp_empty_input() -> None:
+    """Tests that get_latest_timestamp returns None when there are no
+    timestamps."""
+    assert get_latest_timestamp([]) is None
+    assert get_latest_timestamp([None]) is None
+
+
+def test_run_discovery_get_filters_no_watermark() -> None:
+    """Tests that RunDiscovery.get_filters matches all finished runs before any
+    runs have been seen."""
+    discovery = RunDiscovery()
+    assert discovery.get_filters() == {'state': FINISHED_STATE}
+
+
+def test_run_discovery_get_filters_with_watermark() -> None:
+    """Tests that RunDiscovery.get_filters only matches runs whose heartbeat is
+    after the watermark minus the overlap."""
+    discovery = RunDiscovery(
+        overlap_seconds=60, watermark='2021-09-18T17:07:44')
+    assert discovery.get_filters() == {'$and': [
+        {'state': FINISHED_STATE},
+        {HEARTBEAT_FILTER_KEY: {'$gt': '2021-09-18T17:06:44'}}]}
+
+
+def test_run_discovery_get_filters_not_incremental() -> None:
+    """Tests that RunDiscovery.get_filters matches all finished runs when
+    incremental discovery is disabled."""
+    discovery = RunDiscovery(
+        incremental=False, watermark='2021-09-18T17:07:44')
+    assert discovery.get_filters() == {'state': FINISHED_STATE}
+
+
+def test_run_discovery_advance_moves_watermark_forward() -> None:
+    """Tests that RunDiscovery.advance sets the watermark to the latest
+    heartbeat."""
+    discovery = RunDiscovery()
+    discovery.advance(['2021-09-18T17:07:44', '2021-09-19T00:00:00'])
+    assert discovery.watermark == '2021-09-19T00:00:00'
+
+
+def test_run_discovery_advance_never_moves_backward() -> None:
+    """Tests that RunDiscovery.advance ignores heartbeats before the current
+    watermark."""
+    discovery = RunDiscovery(watermark='2021-09-19T00:00:00')
+    discovery.advance(['2021-09-18T17:07:44'])
+    assert discovery.watermark == '2021-09-19T00:00:00'
+    discovery.advance([None])
+    assert discovery.watermark == '2021-09-19T00:00:00'
@@ -0,0 +1,159 @@
+"""Tests run_progress.py."""
+
+import os
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import pytest
+from adjutant.run_progress import MetricHistory, RunProgress, \
+    ProgressTracker, get_new_history, get_sparkline, SPARKLINE_CHARS
+from tests.fakes import FakeApi
+
+
+def _write_history(directory: str, run_id: str, rows: str) -> None:
+    """Appends rows to a fake run's history file.
+
+    :param directory: The directory holding the history files.
+    :param run_id: The ID of the run.
+    :param rows: The JSON Lines rows to append.
+    """
+    with open(os.path.join(directory, f'{run_id}.jsonl'), 'a',
+              encoding='utf-8') as outfile:
+        outfile.write(rows)
+
+
+def test_get_new_history_keeps_metrics_from_min_step(tmp_path) -> None:
+    """Tests that get_new_history returns the run's state and the requested
+    metrics of the rows from min_step onward, including rows that log only
+    some of them."""
+    _write_history(tmp_path, 'run1', '{"_step": 0, "loss": 3, "lr": 1, '
+                                     '"_runtime": 5}\n'
+                                     '{"_step": 1, "val_loss": 2}\n'
+                                     '{"_step": 2, "loss": 1}\n')
+    api = FakeApi(str(tmp_path))
+    state, rows = get_new_history(api, 'entity/project/run1',
+                                  ('loss', 'val_loss'), 1)
+    assert state == 'running'
+    assert rows == [{'_step': 1, 'val_loss': 2}, {'_step': 2, 'loss': 1}]
+    assert get_new_history(api, 'entity/project/missing', ('loss',), 0) == \
+        (None, [])
+    _, rows = get_new_history(api, 'entity/project/run1', None, 0)
+    assert rows[0] == {'_step': 0, 'loss': 3, 'lr': 1}
+
+
+def test_get_sparkline() -> None:
+    """Tests that sparklines span the block characters and average values
+    into at most width buckets."""
+    assert not get_sparkline([])
+    assert get_sparkline([1, 1, 1]) == SPARKLINE_CHARS[0] * 3
+    assert get_sparkline([0, 7]) == SPARKLINE_CHARS[0] + SPARKLINE_CHARS[-1]
+    assert len(get_sparkline(list(range(100)), width=10)) == 10
+
+
+def test_metric_history_downsamples_evenly() -> None:
+    """Tests that MetricHistory keeps at most max_points values spread evenly
+    over the run while tracking the latest value and extremes exactly."""
+    history = MetricHistory(max_points=8)
+    for step in range(100):
+        history.append(step, float(step))
+    assert len(history.values) <= 8
+    assert history.steps == list(range(0, 100, history.stride))
+    assert history.num_values == 100
+    assert history.last == (99, 99.0)
+    assert (history.minimum, history.maximum) == (0.0, 99.0)
+    assert history.get_points()[-1] == (99, 99.0)
+
+
+def test_metric_history_ignores_nonfinite_values() -> None:
+    """Tests that values that are not finite numbers are not recorded."""
+    history = MetricHistory()
+    assert not history.append(0, float('nan'))
+    assert not history.append(1, 'text')
+    assert not history.append(2, True)
+    assert history.append(3, 1)
+    assert history.num_values == 1
+
+
+def test_metric_history_rejects_bad_args() -> None:
+    """Tests that MetricHistory raises an error on invalid arguments."""
+    with pytest.raises(ValueError):
+        _ = MetricHistory(max_points=1)
+    with pytest.raises(ValueError):
+        _ = ProgressTracker(max_runs=0)
+
+
+def test_run_progress_add_rows_advances_cursor() -> None:
+    """Tests that RunProgress records each metric, advances past the last
+    step, and skips rows it has already seen."""
+    progress = RunProgress('entity/project/run1')
+    progress.add_rows([{'_step': 0, 'loss': 3}, {'_step': 1, 'loss': 2,
+                                                  'val_loss': 2.5}])
+    progress.add_rows([{'_step': 1, 'loss': 2}, {'_step': 2, 'loss': 1}])
+    assert progress.next_step == 3
+    assert progress.num_rows == 3
+    assert progress.histories['loss'].values == [3, 2, 1]
+    assert progress.histories['val_loss'].last == (1, 2.5)
+    assert progress.summarize() == 'unknown, step 2: loss 1, val_loss 2.5'
+    assert 'loss: ' in progress.describe()
+
+
+def test_progress_tracker_fetches_only_new_rows() -> None:
+    """Tests that each update asks only for the steps after the previous
+    update, including concurrent updates of the same run."""
+    requested_steps = []
+    history = [{'_step': step, 'loss': 1 / (step + 1)} for step in range(10)]
+
+    async def fetch(run_path: str, metrics: Sequence[str], min_step: int
+                    ) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        # pylint: disable=unused-argument
+        requested_steps.append(min_step)
+        await asyncio.sleep(0)
+        rows = [row for row in history if row['_step'] >= min_step]
+        return 'running', rows
+
+    async def main() -> None:
+        tracker = ProgressTracker()
+        await asyncio.gather(tracker.update('run1', fetch),
+                             tracker.update('run1', fetch))
+        history.append({'_step': 10, 'loss': 0.01})
+        progress = await tracker.update('run1', fetch)
+        assert progress.num_rows == 11
+        assert progress.state == 'running'
+    asyncio.run(main())
+    assert requested_steps == [0, 10, 10]
+
+
+def test_progress_tracker_evicts_least_recent_run() -> None:
+    """Tests that at most max_runs runs are cached."""
+
+    async def fetch(run_path: str, metrics: Sequence[str], min_step: int
+                    ) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        # pylint: disable=unused-argument
+        return None, []
+
+    async def main() -> None:
+        tracker = ProgressTracker(max_runs=2)
+        for run_path in ('a', 'b', 'a', 'c'):
+            await tracker.update(run_path, fetch)
+        assert len(tracker) == 2
+        assert tracker.get('b') is None
+        assert tracker.get('a') is not None
+    asyncio.run(main())
+
+
+def test_progress_tracker_stops_fetching_finished_runs() -> None:
+    """Tests that runs in a final state are not fetched again."""
+    requested_steps = []
+
+    async def fetch(run_path: str, metrics: Sequence[str], min_step: int
+                    ) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        # pylint: disable=unused-argument
+        requested_steps.append(min_step)
+        return 'finished', [{'_step': 0, 'loss': 1}]
+
+    async def main() -> None:
+        tracker = ProgressTracker()
+        await tracker.update('run1', fetch)
+        progress = await tracker.update('run1', fetch)
+        assert progress.num_rows == 1
+    asyncio.run(main())
+    assert requested_steps == [0]
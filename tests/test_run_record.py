@@ -0,0 +1,75 @@
+"""Tests run_record.py."""
+
+from types import SimpleNamespace
+import pytest
+from adjutant.run_record import RunRecord
+
+
+def _make_run(**kwargs) -> SimpleNamespace:
+    """Returns an object with the attributes of a WandB run that RunRecord
+    reads.
+
+    :param kwargs: Attributes that override the defaults.
+    :return: The run-like object.
+    """
+    attributes = {
+        'name': 'run-0',
+        'id': 'id0',
+        'url': 'https://wandb.ai/entity/project/runs/id0',
+        'state': 'finished',
+        'created_at': '2021-09-18T17:07:44',
+        'heartbeat_at': '2021-09-18T18:00:00',
+        'summary': {'best_val_loss': 0.1, 'loss': 0.05},
+        'config': {'batch_size': 32, '_wandb': {'cli_version': '0.12.2'}}}
+    return SimpleNamespace(**{**attributes, **kwargs})
+
+
+def test_run_record_from_run_keeps_requested_summary_keys() -> None:
+    """Tests that RunRecord.from_run copies the run's fields and only the
+    requested summary metrics."""
+    record = RunRecord.from_run(_make_run(), ('best_val_loss', 'val_accuracy'))
+    assert record.name == 'run-0'
+    assert record.id == 'id0'
+    assert record.url == 'https://wandb.ai/entity/project/runs/id0'
+    assert record.state == 'finished'
+    assert record.created_at == '2021-09-18T17:07:44'
+    assert record.heartbeat_at == '2021-09-18T18:00:00'
+    assert record.summary == {'best_val_loss': 0.1}
+    assert record.config == {'batch_size': 32}
+
+
+def test_run_record_from_run_missing_timestamps() -> None:
+    """Tests that RunRecord.from_run succeeds when the run has no
+    timestamps."""
+    run = SimpleNamespace(
+        name='run-0', id='id0', url='', state='finished', summary={})
+    record = RunRecord.from_run(run, ('best_val_loss',))
+    assert record.created_at is None
+    assert record.heartbeat_at is None
+    assert record.config == {}
+
+
+def test_run_record_has_no_instance_dict() -> None:
+    """Tests that RunRecord does not allocate a per-instance __dict__."""
+    record = RunRecord.from_run(_make_run(), ('best_val_loss',))
+    assert not hasattr(record, '__dict__')
+    with pytest.raises(AttributeError):
+        setattr(record, 'system_metrics', {})
+
+
+def test_run_record_shares_state_strings() -> None:
+    """Tests that records with the same state share one state string."""
+    first = RunRecord.from_run(_make_run(state=''.join('finished')),
+                               ('best_val_loss',))
+    second = RunRecord.from_run(_make_run(state=''.join(['fin', 'ished'])),
+                                ('best_val_loss',))
+    assert first.state is second.state
+
+
+def test_run_record_eq_compares_fields() -> None:
+    """Tests that RunRecords are equal exactly when their fields are equal."""
+    first = RunRecord.from_run(_make_run(), ('best_val_loss',))
+    second = RunRecord.from_run(_make_run(), ('best_val_loss',))
+    assert first == second
+    second.summary = {}
+    assert first != second
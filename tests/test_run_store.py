@@ -0,0 +1,107 @@
+"""Tests run_store.py."""
+
+import os
+import sqlite3
+from adjutant.run_record import RunRecord
+from adjutant.run_store import RunStore
+
+STORE_FILENAME = 'adjutant_state.sqlite'
+
+
+def _make_run_record(index: int) -> RunRecord:
+    """Returns a RunRecord with fields derived from index.
+
+    :param index: The index of the run.
+    :return: The RunRecord.
+    """
+    return RunRecord(
+        name=f'run-{index}',
+        run_id=f'id{index}',
+        url=f'https://wandb.ai/entity/project/runs/id{index}',
+        state='finished',
+        created_at='2021-09-18T17:07:44',
+        heartbeat_at=f'2021-09-18T18:{index:02d}:00',
+        summary={'best_val_loss': index / 10},
+        config={'batch_size': 2 ** index})
+
+
+def test_run_store_empty_on_creation() -> None:
+    """Tests that a new RunStore has no runs, no watermark, and is not
+    initialized."""
+    store = RunStore()
+    assert not store.load_runs()
+    assert store.get_watermark() is None
+    assert not store.is_initialized()
+    store.close()
+
+
+def test_run_store_save_runs_round_trip() -> None:
+    """Tests that RunStore.load_runs returns the runs saved with
+    RunStore.save_runs."""
+    store = RunStore()
+    runs = [_make_run_record(index) for index in range(3)]
+    store.save_runs(runs)
+    assert store.load_runs() == {run.name: run for run in runs}
+    store.close()
+
+
+def test_run_store_save_runs_replaces_existing() -> None:
+    """Tests that saving a run with an existing name replaces the stored
+    run."""
+    store = RunStore()
+    run = _make_run_record(0)
+    store.save_runs([run])
+    updated_run = _make_run_record(0)
+    updated_run.summary = {'best_val_loss': 0.01}
+    store.save_runs([updated_run])
+    assert store.load_runs() == {run.name: updated_run}
+    store.close()
+
+
+def test_run_store_watermark_and_initialized() -> None:
+    """Tests that RunStore stores the watermark and initialization flag."""
+    store = RunStore()
+    store.set_watermark('2021-09-18T18:00:00')
+    store.mark_initialized()
+    assert store.get_watermark() == '2021-09-18T18:00:00'
+    assert store.is_initialized()
+    store.close()
+
+
+def test_run_store_persists_across_instances(tmp_path) -> None:
+    """Tests that a RunStore backed by a file sees the state saved by a previous
+    instance."""
+    filename = os.path.join(tmp_path, STORE_FILENAME)
+    store = RunStore(filename)
+    run = _make_run_record(0)
+    store.save_runs([run])
+    store.set_watermark(run.heartbeat_at)
+    store.mark_initialized()
+    store.close()
+    store = RunStore(filename)
+    assert store.load_runs() == {run.name: run}
+    assert store.get_watermark() == run.heartbeat_at
+    assert store.is_initialized()
+    store.close()
+
+
+def test_run_store_migrates_stores_without_config(tmp_path) -> None:
+    """Tests that a store created before runs had configs gains the config
+    column, and that its existing runs load with empty configs."""
+    filename = os.path.join(tmp_path, STORE_FILENAME)
+    connection = sqlite3.connect(filename)
+    with connection:
+        connection.execute(
+            'CREATE TABLE runs (name TEXT PRIMARY KEY, id TEXT, url TEXT, '
+            'state TEXT, created_at TEXT, heartbeat_at TEXT, '
+            'summary TEXT NOT NULL)')
+        connection.execute(
+            'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ('run-0', 'id0', '', 'finished', None, None, '{}'))
+    connection.close()
+    store = RunStore(filename)
+    assert store.load_runs()['run-0'].config == {}
+    run = _make_run_record(1)
+    store.save_runs([run])
+    assert store.load_runs()[run.name] == run
+    store.close()
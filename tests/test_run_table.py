@@ -0,0 +1,125 @@
+"""Tests run_table.py."""
+
+import pytest
+from adjutant.run_table import RunTable, RunQuery, DEFAULT_QUERY_LIMIT, \
+    MAX_QUERY_LIMIT
+
+RUNS = (
+    ('a', {'config.batch_size': 64, 'config.optimizer': 'sgd',
+           'summary.best_val_loss': 0.09}),
+    ('b', {'config.batch_size': 32, 'config.optimizer': 'adam',
+           'summary.best_val_loss': 0.2}),
+    ('c', {'config.batch_size': 128, 'config.optimizer': 'sgd',
+           'summary.best_val_loss': 0.05}),
+    ('d', {'config.batch_size': 128, 'config.optimizer': True}))
+
+
+def _get_table() -> RunTable:
+    """Returns a table holding RUNS, with a small initial capacity so that
+    adding them grows the arrays.
+
+    :return: The table.
+    """
+    table = RunTable(capacity=1)
+    table.add_many(RUNS)
+    return table
+
+
+def _select(table: RunTable, text: str) -> list:
+    """Returns the names of the runs that the query selects, in order.
+
+    :param table: The table.
+    :param text: The query.
+    :return: The names of the selected runs.
+    """
+    return [table.get_name(row) for row in table.select(RunQuery(text))]
+
+
+def test_run_query_parses_conditions_and_options() -> None:
+    """Tests that RunQuery separates conditions from options and parses
+    values as JSON where possible."""
+    query = RunQuery('batch_size>=64 optimizer=sgd layers==[1,2] '
+                     'sort:-best_val_loss limit:100')
+    assert query.conditions == [('batch_size', '>=', 64),
+                                ('optimizer', '=', 'sgd'),
+                                ('layers', '==', [1, 2])]
+    assert query.sort_field == 'best_val_loss'
+    assert query.descending
+    assert query.limit == MAX_QUERY_LIMIT
+    assert not query.is_aggregate
+    assert RunQuery('').limit == DEFAULT_QUERY_LIMIT
+    assert RunQuery('agg:best_val_loss').is_aggregate
+
+
+def test_run_query_rejects_malformed_args() -> None:
+    """Tests that RunQuery raises ValueError on malformed arguments."""
+    for text in ('batch_size', '>=64', 'batch_size>=', 'limit:ten', 'sort:'):
+        with pytest.raises(ValueError):
+            RunQuery(text)
+
+
+def test_run_table_filters_numbers_and_categories() -> None:
+    """Tests that conditions compare numbers numerically, match categories
+    exactly, and never match runs without a value."""
+    table = _get_table()
+    assert _select(table, 'batch_size>=64') == ['a', 'c', 'd']
+    assert _select(table, 'batch_size>=64 best_val_loss<0.1') == ['a', 'c']
+    assert _select(table, 'optimizer=sgd') == ['a', 'c']
+    assert _select(table, 'optimizer=true') == ['d']
+    assert _select(table, 'optimizer!=sgd') == ['b', 'd']
+    assert _select(table, 'best_val_loss!=0.2') == ['a', 'c']
+    assert _select(table, 'optimizer=rmsprop') == []
+
+
+def test_run_table_sorts_with_missing_values_last() -> None:
+    """Tests that sorting orders numbers in either direction and categories
+    lexicographically, with missing values last."""
+    table = _get_table()
+    assert _select(table, 'sort:best_val_loss') == ['c', 'a', 'b', 'd']
+    assert _select(table, 'sort:-best_val_loss') == ['b', 'a', 'c', 'd']
+    assert _select(table, 'sort:optimizer') == ['b', 'a', 'c', 'd']
+
+
+def test_run_table_resolves_prefixes() -> None:
+    """Tests that fields may be named with or without their prefix, and that
+    unknown or ambiguous names raise ValueError."""
+    table = _get_table()
+    table.add('e', {'summary.batch_size': 1})
+    assert table.resolve_field('config.batch_size') == 'config.batch_size'
+    assert table.resolve_field('optimizer') == 'config.optimizer'
+    with pytest.raises(ValueError):
+        table.resolve_field('batch_size')
+    with pytest.raises(ValueError):
+        table.resolve_field('missing')
+
+
+def test_run_table_rejects_ordering_categories() -> None:
+    """Tests that ordered comparisons with non-numeric values raise
+    ValueError."""
+    with pytest.raises(ValueError):
+        _get_table().select(RunQuery('optimizer>sgd'))
+
+
+def test_run_table_add_replaces_run() -> None:
+    """Tests that adding a run again replaces all of its fields."""
+    table = _get_table()
+    table.add('a', {'config.batch_size': 16})
+    assert len(table) == len(RUNS)
+    assert _select(table, 'batch_size=16') == ['a']
+    assert _select(table, 'optimizer=sgd') == ['c']
+    assert table.format(0, 'best_val_loss') == 'n/a'
+
+
+def test_run_table_aggregates_groups() -> None:
+    """Tests that aggregate counts runs and summarizes the aggregate field per
+    group, leaving out runs without values."""
+    table = _get_table()
+    query = RunQuery('agg:best_val_loss by:optimizer')
+    groups = table.aggregate(query, table.select(query))
+    assert groups == [('sgd', 2, pytest.approx(0.07), 0.05, 0.09),
+                      ('adam', 1, 0.2, 0.2, 0.2)]
+    query = RunQuery('by:batch_size')
+    assert table.aggregate(query, table.select(query))[0] == \
+        ('128', 2, None, None, None)
+    query = RunQuery('batch_size>=1000 agg:best_val_loss')
+    assert not table.aggregate(query, table.select(query))
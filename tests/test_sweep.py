@@ -0,0 +1,175 @@
+"""Tests sweep.py."""
+
+import os
+import asyncio
+from typing import List
+import pytest
+from adjutant.job_scheduler import JobScheduler, JOB_FINISHED, JOB_CANCELLED
+from adjutant.sweep import InclusiveRange, Sweep, parse_sweep_spec, \
+    count_grid, iter_grid, iter_random, SWEEP_GRID, SWEEP_RANDOM, SWEEP_DONE, \
+    SWEEP_CANCELLED
+
+DUMMY_EXPERIMENT_SCRIPT = os.path.join('tests', 'dummy_experiment.py')
+LONG_JOB_SECONDS = 10
+
+
+def test_inclusive_range_includes_stop() -> None:
+    """Tests that InclusiveRange includes its stop value for ints and
+    floats."""
+    assert list(InclusiveRange(1, 3)) == [1, 2, 3]
+    values = list(InclusiveRange(0.1, 0.3, 0.1))
+    assert len(values) == 3
+    assert values[-1] == pytest.approx(0.3)
+
+
+def test_inclusive_range_indexing() -> None:
+    """Tests that InclusiveRange supports negative indices and rejects
+    out-of-range ones."""
+    values = InclusiveRange(0, 10, 5)
+    assert values[-1] == 10
+    with pytest.raises(IndexError):
+        _ = values[3]
+
+
+def test_inclusive_range_rejects_bad_bounds() -> None:
+    """Tests that InclusiveRange raises an error on a nonpositive step or a
+    stop below start."""
+    with pytest.raises(ValueError):
+        _ = InclusiveRange(0, 1, 0)
+    with pytest.raises(ValueError):
+        _ = InclusiveRange(1, 0)
+
+
+def test_inclusive_range_is_lazy() -> None:
+    """Tests that a huge InclusiveRange does not materialize its values."""
+    values = InclusiveRange(0, 10 ** 12)
+    assert len(values) == 10 ** 12 + 1
+    assert values[10 ** 12] == 10 ** 12
+
+
+def test_parse_sweep_spec() -> None:
+    """Tests that parse_sweep_spec handles lists, ranges, and fixed values."""
+    candidates = parse_sweep_spec({
+        'lr': [0.1, 0.01],
+        'layers': {'range': [1, 3]},
+        'epochs': 5})
+    assert candidates['lr'] == [0.1, 0.01]
+    assert list(candidates['layers']) == [1, 2, 3]
+    assert candidates['epochs'] == [5]
+
+
+@pytest.mark.parametrize('spec', [
+    {}, [], {'lr': []}, {'layers': {'range': [1]}},
+    {'layers': {'range': [1, 'a']}}])
+def test_parse_sweep_spec_rejects_bad_spec(spec) -> None:
+    """Tests that parse_sweep_spec raises an error on invalid specs."""
+    with pytest.raises(ValueError):
+        _ = parse_sweep_spec(spec)
+
+
+def test_iter_grid_yields_every_combination() -> None:
+    """Tests that iter_grid yields every combination exactly once."""
+    candidates = parse_sweep_spec({'a': [1, 2], 'b': {'range': [0, 2]}})
+    trials = list(iter_grid(candidates))
+    assert len(trials) == count_grid(candidates) == 6
+    assert {(trial['a'], trial['b']) for trial in trials} == {
+        (a, b) for a in (1, 2) for b in (0, 1, 2)}
+
+
+def test_iter_random_is_seeded() -> None:
+    """Tests that iter_random yields the requested number of trials and is
+    reproducible with a seed."""
+    candidates = parse_sweep_spec({'a': {'range': [0, 1000]}, 'b': [1, 2]})
+    first = list(iter_random(candidates, 5, seed=1))
+    second = list(iter_random(candidates, 5, seed=1))
+    assert len(first) == 5
+    assert first == second
+    assert all(0 <= trial['a'] <= 1000 for trial in first)
+
+
+def test_sweep_init_counts_trials() -> None:
+    """Tests that Sweep.__init__ counts grid and random trials without
+    expanding them."""
+    spec = {'a': {'range': [1, 10 ** 6]}, 'b': [1, 2]}
+    assert Sweep(1, spec, SWEEP_GRID).num_trials == 2 * 10 ** 6
+    assert Sweep(2, spec, SWEEP_RANDOM, 7).num_trials == 7
+    with pytest.raises(ValueError):
+        _ = Sweep(3, spec, SWEEP_RANDOM)
+    with pytest.raises(ValueError):
+        _ = Sweep(4, spec, 'bayes')
+
+
+def test_sweep_run_limits_outstanding_trials() -> None:
+    """Tests that a sweep never has more trials submitted but incomplete than
+    the scheduler has slots, so it never floods the job queue."""
+    async def main() -> Sweep:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=2)
+        sweep = Sweep(1, {'sleep_seconds': 0.2, 'x': {'range': [1, 5]}},
+                      launch_interval_seconds=0)
+        task = asyncio.ensure_future(sweep.run(scheduler))
+        while not task.done():
+            assert len(scheduler.get_queued_jobs()) == 0
+            assert sum(not job.is_done for job in sweep.jobs) <= 2
+            await asyncio.sleep(0.05)
+        return sweep
+    sweep = asyncio.run(main())
+    assert sweep.status == SWEEP_DONE
+    assert len(sweep.jobs) == 5
+    assert sweep.count_jobs(JOB_FINISHED) == 5
+    assert sorted(job.hyperparams['x'] for job in sweep.jobs) == [1, 2, 3, 4, 5]
+    assert all(job.group == sweep.group for job in sweep.jobs)
+
+
+def test_sweep_run_respects_launch_interval() -> None:
+    """Tests that consecutive trials are launched at least the launch interval
+    apart."""
+    async def main() -> Sweep:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=3)
+        sweep = Sweep(1, {'x': [1, 2, 3]}, launch_interval_seconds=0.2)
+        await sweep.run(scheduler)
+        return sweep
+    sweep = asyncio.run(main())
+    submit_times = [job.submitted_at for job in sweep.jobs]
+    assert all(later - earlier >= 0.15 for earlier, later in
+               zip(submit_times, submit_times[1:]))
+
+
+def test_sweep_run_throttles_updates() -> None:
+    """Tests that a sweep coalesces progress updates and always sends a final
+    update."""
+    updates: List[str] = []
+
+    async def on_update(sweep: Sweep) -> None:
+        updates.append(sweep.describe())
+
+    async def main() -> None:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=4)
+        sweep = Sweep(1, {'x': {'range': [1, 8]}},
+                      launch_interval_seconds=0,
+                      update_interval_seconds=LONG_JOB_SECONDS,
+                      on_update=on_update)
+        await sweep.run(scheduler)
+    asyncio.run(main())
+    # One immediate update on the first launch, then the final update; the
+    # rest are merged into a pending update that the final one replaces.
+    assert len(updates) == 2
+    assert '8 finished' in updates[-1]
+
+
+def test_sweep_cancel_stops_launching() -> None:
+    """Tests that cancelling a sweep cancels its running trials and launches
+    no more."""
+    async def main() -> Sweep:
+        scheduler = JobScheduler(DUMMY_EXPERIMENT_SCRIPT, max_slots=1)
+        sweep = Sweep(1, {'sleep_seconds': LONG_JOB_SECONDS,
+                          'x': {'range': [1, 100]}},
+                      launch_interval_seconds=0)
+        task = asyncio.ensure_future(sweep.run(scheduler))
+        await asyncio.sleep(0.2)
+        await sweep.cancel(scheduler)
+        await task
+        return sweep
+    sweep = asyncio.run(main())
+    assert sweep.status == SWEEP_CANCELLED
+    assert len(sweep.jobs) == 1
+    assert sweep.jobs[0].status == JOB_CANCELLED
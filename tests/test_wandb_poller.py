@@ -0,0 +1,123 @@
+"""Tests wandb_poller.py."""
+
+import asyncio
+import time
+import pytest
+from adjutant.wandb_poller import WandbPoller
+
+BLOCKING_CALL_SECONDS = 0.2
+
+
+def _blocking_call(value: int) -> int:
+    """Simulates a slow WandB API query.
+
+    :param value: The value to return.
+    :return: value.
+    """
+    time.sleep(BLOCKING_CALL_SECONDS)
+    return value
+
+
+def _failing_call() -> None:
+    """Simulates a WandB API query that raises an error."""
+    raise RuntimeError('WandB is down.')
+
+
+def test_wandb_poller_run_returns_result() -> None:
+    """Tests that WandbPoller.run returns the result of the function."""
+    async def main() -> int:
+        poller = WandbPoller()
+        result = await poller.run(_blocking_call, 3)
+        poller.shutdown()
+        return result
+    assert asyncio.run(main()) == 3
+
+
+def test_wandb_poller_run_propagates_errors() -> None:
+    """Tests that WandbPoller.run raises the error raised by the function."""
+    async def main() -> None:
+        poller = WandbPoller()
+        try:
+            await poller.run(_failing_call)
+        finally:
+            poller.shutdown()
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+
+def test_wandb_poller_run_does_not_block_event_loop() -> None:
+    """Tests that the event loop keeps running other coroutines while a
+    blocking query is in progress."""
+    ticks = []
+
+    async def ticker() -> None:
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def main() -> None:
+        poller = WandbPoller()
+        ticker_task = asyncio.ensure_future(ticker())
+        await poller.run(_blocking_call, 0)
+        ticker_task.cancel()
+        poller.shutdown()
+    asyncio.run(main())
+    assert len(ticks) >= 5
+
+
+def test_wandb_poller_run_times_out() -> None:
+    """Tests that WandbPoller.run raises a TimeoutError when the query takes
+    longer than the timeout."""
+    async def main() -> None:
+        poller = WandbPoller(timeout_seconds=BLOCKING_CALL_SECONDS / 4)
+        try:
+            await poller.run(_blocking_call, 0)
+        finally:
+            poller.shutdown()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main())
+
+
+def test_wandb_poller_timed_out_query_keeps_slot() -> None:
+    """Tests that a query whose caller timed out keeps its slot until its worker
+    thread returns."""
+    async def main() -> None:
+        poller = WandbPoller(
+            max_workers=1, timeout_seconds=BLOCKING_CALL_SECONDS / 4)
+        with pytest.raises(asyncio.TimeoutError):
+            await poller.run(_blocking_call, 0)
+        assert poller.in_flight == 1
+        await asyncio.sleep(BLOCKING_CALL_SECONDS)
+        assert poller.in_flight == 0
+        poller.shutdown()
+    asyncio.run(main())
+
+
+def test_wandb_poller_limits_concurrency() -> None:
+    """Tests that no more than max_workers queries run at the same time."""
+    async def main() -> float:
+        poller = WandbPoller(max_workers=1, timeout_seconds=None)
+        start = time.monotonic()
+        await asyncio.gather(poller.run(_blocking_call, 0),
+                             poller.run(_blocking_call, 1))
+        poller.shutdown()
+        return time.monotonic() - start
+    assert asyncio.run(main()) >= 2 * BLOCKING_CALL_SECONDS
+
+
+def test_wandb_poller_init_rejects_zero_workers() -> None:
+    """Tests that WandbPoller.__init__ raises an error when max_workers is not
+    positive."""
+    with pytest.raises(ValueError):
+        _ = WandbPoller(max_workers=0)
+
+
+def test_wandb_poller_run_with_timeout_overrides_default() -> None:
+    """Tests that WandbPoller.run_with_timeout uses the given timeout instead of
+    the default."""
+    async def main() -> int:
+        poller = WandbPoller(timeout_seconds=BLOCKING_CALL_SECONDS / 4)
+        result = await poller.run_with_timeout(None, _blocking_call, 3)
+        poller.shutdown()
+        return result
+    assert asyncio.run(main()) == 3
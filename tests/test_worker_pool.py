@@ -0,0 +1,172 @@
+"""Tests worker_pool.py."""
+
+import os
+import errno
+import json
+import time
+import asyncio
+import concurrent.futures
+import pytest
+from adjutant.job_scheduler import Job, JobScheduler, JOB_FINISHED, \
+    JOB_FAILED, JOB_CANCELLED
+from adjutant import worker_pool
+from adjutant.worker_pool import WorkerPool, load_entry_point, \
+    split_entry_point
+from tests.dummy_experiment import run_experiment
+
+DUMMY_ENTRY_POINT = 'tests.dummy_experiment:run_experiment'
+LONG_JOB_SECONDS = 10
+SHORT_JOB_SECONDS = 2
+
+
+def test_split_entry_point_rejects_bad_entry_point() -> None:
+    """Tests that split_entry_point raises an error if the entry point does not
+    have the form module:function."""
+    for entry_point in ('tests.dummy_experiment', ':run_experiment',
+                        'tests.dummy_experiment:'):
+        with pytest.raises(ValueError):
+            _ = split_entry_point(entry_point)
+
+
+def test_load_entry_point() -> None:
+    """Tests that load_entry_point returns the named function."""
+    assert load_entry_point(DUMMY_ENTRY_POINT) is run_experiment
+
+
+def test_worker_pool_init_rejects_zero_workers() -> None:
+    """Tests that WorkerPool.__init__ raises an error when num_workers is not
+    positive."""
+    with pytest.raises(ValueError):
+        _ = WorkerPool(DUMMY_ENTRY_POINT, num_workers=0)
+
+
+def test_job_scheduler_init_needs_script_or_launcher() -> None:
+    """Tests that JobScheduler.__init__ raises an error unless exactly one of
+    script and launcher is given."""
+    pool = WorkerPool(DUMMY_ENTRY_POINT)
+    with pytest.raises(ValueError):
+        _ = JobScheduler()
+    with pytest.raises(ValueError):
+        _ = JobScheduler('script.sh', launcher=pool.launch)
+
+
+def test_worker_pool_runs_experiments(tmp_path) -> None:
+    """Tests that jobs launched through a WorkerPool run the entry point with
+    their hyperparameters and run IDs, and that the pool stays warm."""
+    async def main() -> Job:
+        pool = WorkerPool(DUMMY_ENTRY_POINT, num_workers=2)
+        pool.start()
+        await pool.wait_until_warm()
+        scheduler = JobScheduler(launcher=pool.launch, max_slots=2)
+        job = await scheduler.submit({
+            'output_file': os.path.join(tmp_path, 'out.json'),
+            'history_dir': str(tmp_path),
+            'val_losses': [1.0]})
+        assert pool.num_idle == 2
+        await scheduler.wait_until_idle()
+        pool.close()
+        assert pool.num_idle == 0
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_FINISHED
+    assert job.exit_code == 0
+    with open(os.path.join(tmp_path, 'out.json'), 'r',
+              encoding='utf-8') as infile:
+        assert json.loads(infile.read())['val_losses'] == [1.0]
+    assert os.path.exists(os.path.join(tmp_path, f'{job.run_id}.jsonl'))
+
+
+def test_worker_pool_captures_output() -> None:
+    """Tests that a worker's stdout and stderr, including the traceback of an
+    uncaught exception, are piped into its job's log."""
+    async def main() -> None:
+        pool = WorkerPool(DUMMY_ENTRY_POINT, num_workers=2)
+        pool.start()
+        scheduler = JobScheduler(launcher=pool.launch, max_slots=2)
+        printing = await scheduler.submit({'stdout_lines': ['hello'],
+                                           'stderr_lines': ['warning']})
+        raising = await scheduler.submit({'history_dir': '/does/not/exist'})
+        await scheduler.wait_until_idle()
+        pool.close()
+        assert list(printing.log.lines) == ['hello', 'warning']
+        assert raising.status == JOB_FAILED
+        assert raising.log.get_tail(1)[0].startswith('FileNotFoundError')
+    asyncio.run(main())
+
+
+def test_worker_pool_records_exit_codes() -> None:
+    """Tests that a worker's exit code becomes its job's exit code, and that
+    cancelling a job terminates its worker."""
+    async def main() -> None:
+        pool = WorkerPool(DUMMY_ENTRY_POINT, num_workers=2)
+        pool.start()
+        scheduler = JobScheduler(launcher=pool.launch, max_slots=2)
+        failed = await scheduler.submit({'exit_code': 3})
+        cancelled = await scheduler.submit({'sleep_seconds': LONG_JOB_SECONDS})
+        await scheduler.cancel(cancelled.id)
+        await scheduler.wait_until_idle()
+        pool.close()
+        assert failed.status == JOB_FAILED
+        assert failed.exit_code == 3
+        assert cancelled.status == JOB_CANCELLED
+    asyncio.run(main())
+
+
+def test_worker_pool_bad_module_fails_job() -> None:
+    """Tests that a job fails if its worker cannot import the entry point."""
+    async def main() -> Job:
+        pool = WorkerPool('tests.does_not_exist:run_experiment')
+        scheduler = JobScheduler(launcher=pool.launch)
+        job = await scheduler.submit({})
+        await scheduler.wait_until_idle()
+        pool.close()
+        return job
+    job = asyncio.run(main())
+    assert job.status == JOB_FAILED
+    assert job.exit_code is None
+
+
+def test_worker_pool_running_jobs_hold_no_executor_threads() -> None:
+    """Tests that waiting on running experiments does not occupy the default
+    executor's threads, so other background calls still run promptly."""
+    async def main() -> float:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        pool = WorkerPool(DUMMY_ENTRY_POINT, num_workers=2)
+        pool.start()
+        scheduler = JobScheduler(launcher=pool.launch, max_slots=2)
+        for _ in range(2):
+            await scheduler.submit({'sleep_seconds': SHORT_JOB_SECONDS})
+        start = time.monotonic()
+        await loop.run_in_executor(None, time.sleep, 0)
+        wait_seconds = time.monotonic() - start
+        await scheduler.wait_until_idle()
+        pool.close()
+        return wait_seconds
+    assert asyncio.run(main()) < SHORT_JOB_SECONDS / 2
+
+
+def test_worker_pool_output_pipe_failure_fails_job(monkeypatch) -> None:
+    """Tests that a failure to hand the output pipe to a worker fails the job
+    promptly, stops the worker, and leaves the pool able to run the next
+    job."""
+    def fail_send_handle(*_) -> None:
+        raise OSError(errno.EMFILE, 'Too many open files')
+
+    async def main() -> None:
+        pool = WorkerPool(DUMMY_ENTRY_POINT)
+        pool.start()
+        scheduler = JobScheduler(launcher=pool.launch)
+        with monkeypatch.context() as patch:
+            patch.setattr(worker_pool.reduction, 'send_handle',
+                          fail_send_handle)
+            failed = await asyncio.wait_for(scheduler.submit({}),
+                                            LONG_JOB_SECONDS)
+        assert failed.status == JOB_FAILED
+        assert failed.exit_code is None
+        finished = await scheduler.submit({})
+        await scheduler.wait_until_idle()
+        pool.close()
+        assert finished.status == JOB_FINISHED
+    asyncio.run(main())